@@ -1,3 +1,56 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
 
-# Register your models here.
+from .importacao import ErroImportacao, importar, ler_arquivo, resumo_diff
+
+
+class ImportacaoAdminMixin:
+    """
+    Botão "Importar" na listagem do admin, com a importação em lote de
+    api/importacao.py: "Simular" mostra o diff, "Importar" grava.
+    """
+    tipo_importacao = None
+    change_list_template = "admin/change_list_importacao.html"
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return [
+            path(
+                "importar/",
+                self.admin_site.admin_view(self.importar_view),
+                name="%s_%s_importar" % info,
+            ),
+        ] + super().get_urls()
+
+    def importar_view(self, request):
+        if not (self.has_add_permission(request) and self.has_change_permission(request)):
+            raise PermissionDenied
+
+        opts = self.model._meta
+        contexto = {
+            **self.admin_site.each_context(request),
+            "opts": opts,
+            "title": f"Importar {opts.verbose_name_plural}",
+            "tipo": self.tipo_importacao,
+        }
+
+        arquivo = request.FILES.get("arquivo")
+        if request.method == "POST" and arquivo:
+            simular = "importar" not in request.POST
+            try:
+                dados = ler_arquivo(arquivo.read(), arquivo.name, self.tipo_importacao)
+                diff = importar(dados, simular=simular)
+            except ErroImportacao as e:
+                contexto["erros"] = e.erros
+            else:
+                if not simular:
+                    for linha in resumo_diff(diff):
+                        messages.success(request, linha)
+                    return redirect(f"admin:{opts.app_label}_{opts.model_name}_changelist")
+                contexto["resumo"] = resumo_diff(diff)
+                contexto["diff"] = diff
+
+        return TemplateResponse(request, "admin/importar_cadastros.html", contexto)
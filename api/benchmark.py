@@ -0,0 +1,231 @@
+# api/benchmark.py
+"""
+Carga concorrente sobre a API e as telas, com MQTT e câmera simulados.
+
+Cada worker repete o ciclo de um colaborador no quiosque:
+
+  toque (nfc_tap) -> status_frontend -> painel -> retirar ->
+  registrar_retirada -> retirar_confirmar + confirmar_retirada_gaveta
+  (gaveta a gaveta) -> toque -> devolver -> registrar_devolucao ->
+  confirmar_devolucao_gaveta (gaveta a gaveta) -> home
+
+As requisições passam pelo django.test.Client (pilha completa de
+middlewares e views, sem rede), com publish_run_command, capture_frame e
+process_frame trocados por stubs que só esperam `latencia_hardware_ms`.
+Cada worker usa cartões e ferramentas só dele, para as sessões não
+disputarem as mesmas ferramentas; todos tocam no leitor de uma caixa
+(--reader-id, padrão READER_ID) e usam as ferramentas dela. Rode contra
+uma base semeada ("python manage.py semear_dados"); o benchmark grava
+sessões de verdade.
+No SQLite, com mais de um worker, use OPTIONS {"transaction_mode":
+"IMMEDIATE"} no DATABASES para não cair em "database is locked".
+
+    python manage.py benchmark_api --workers 8 --ciclos 20 -o bench.json
+"""
+
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from unittest import mock
+
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from inventario.models import Ferramenta
+from operacoes.models import MovimentacaoFerramenta, SessaoUso
+from usuarios.models import CartaoNFC
+
+from .views import _percentil
+
+
+class _Medidas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencias = defaultdict(list)
+        self.consultas = defaultdict(list)
+        self.erros = defaultdict(int)
+
+    def registrar(self, nome, segundos, consultas, ok):
+        with self._lock:
+            self.latencias[nome].append(segundos * 1000)
+            self.consultas[nome].append(consultas)
+            if not ok:
+                self.erros[nome] += 1
+
+
+class _Worker:
+    def __init__(self, medidas, cartoes, ferramentas, rnd, reader_id):
+        # 500 conta como erro do endpoint em vez de derrubar o worker
+        self.client = Client(raise_request_exception=False)
+        self.reader_id = reader_id
+        self.medidas = medidas
+        self.cartoes = cartoes
+        self.ferramentas = ferramentas
+        self.rnd = rnd
+
+    def _req(self, nome, metodo, url, corpo=None, esperado=(200,)):
+        with CaptureQueriesContext(connection) as consultas:
+            inicio = time.perf_counter()
+            if metodo == "post":
+                resp = self.client.post(url, data=corpo or {}, content_type="application/json")
+            else:
+                resp = self.client.get(url)
+            duracao = time.perf_counter() - inicio
+        self.medidas.registrar(nome, duracao, len(consultas), resp.status_code in esperado)
+        return resp
+
+    def _tocar(self, uid):
+        resp = self._req("nfc_tap", "post", reverse("nfc_tap"), {"uid": uid, "reader_id": self.reader_id}, (201,))
+        return resp.json().get("session_id") if resp.status_code == 201 else None
+
+    def _confirmar(self, nome, sessao_id, gaveta):
+        while gaveta is not None:
+            if nome == "confirmar_retirada_gaveta":
+                self._req("retirar_confirmar", "get", reverse("retirar_confirmar", args=[sessao_id]))
+            resp = self._req(nome, "post", reverse(nome, args=[sessao_id, gaveta]))
+            if resp.status_code != 200:
+                return
+            gaveta = resp.json().get("proxima_gaveta")
+
+    def ciclo(self):
+        uid = self.rnd.choice(self.cartoes)
+        itens = self.rnd.sample(self.ferramentas, min(len(self.ferramentas), self.rnd.choice((1, 2, 3))))
+
+        sessao_id = self._tocar(uid)
+        if sessao_id is None:
+            return
+        self._req("status_frontend", "get", reverse("status_frontend") + f"?reader_id={self.reader_id}")
+        self._req("painel", "get", reverse("painel", args=[sessao_id]))
+        self._req("retirar", "get", reverse("retirar", args=[sessao_id]))
+        resp = self._req(
+            "registrar_retirada", "post", reverse("registrar_retirada", args=[sessao_id]),
+            {"ferramentas_ids": itens}, (201,),
+        )
+        if resp.status_code != 201:
+            return
+        self._confirmar("confirmar_retirada_gaveta", sessao_id, resp.json().get("primeira_gaveta"))
+
+        sessao_id = self._tocar(uid)
+        if sessao_id is None:
+            return
+        self._req("devolver", "get", reverse("devolver", args=[sessao_id]))
+        resp = self._req(
+            "registrar_devolucao", "post", reverse("registrar_devolucao", args=[sessao_id]),
+            {"ferramentas_ids": itens}, (201,),
+        )
+        if resp.status_code == 201:
+            self._confirmar("confirmar_devolucao_gaveta", sessao_id, resp.json().get("primeira_gaveta"))
+        self._req("home", "get", reverse("home"))
+
+    def rodar(self, ciclos):
+        try:
+            for _ in range(ciclos):
+                self.ciclo()
+        finally:
+            # cada thread abriu a própria conexão
+            connection.close()
+
+
+def _stubs(latencia_s):
+    def esperar(retorno):
+        def stub(*args, **kwargs):
+            if latencia_s:
+                time.sleep(latencia_s)
+            return retorno
+        return stub
+
+    mqtt = esperar({"ok": True, "simulado": True})
+    return {
+        "api.views.publish_run_command": mqtt,
+        "api.confirmacao.publish_run_command": mqtt,
+        "web.views.publish_run_command": mqtt,
+        "api.confirmacao.capture_frame": esperar(("sessoes/benchmark.jpg", {})),
+        "api.confirmacao.process_frame": esperar((True, {"ok": True, "raw": {"json": {"retiradas": []}}})),
+    }
+
+
+def rodar(workers=4, ciclos=10, latencia_hardware_ms=0, semente=None, reader_id=None):
+    """
+    Roda o benchmark e devolve o relatório (dicionário serializável).
+    """
+    rnd = random.Random(semente)
+    reader_id = reader_id or settings.READER_ID
+    cartoes = list(CartaoNFC.objects.filter(ativo=True, colaborador__ativo=True).values_list("uid", flat=True))
+    ferramentas = list(
+        Ferramenta.objects
+        .filter(ativa=True, gaveta__ativa=True, gaveta__caixa__reader_id=reader_id)
+        .values_list("id", flat=True)
+    )
+    if len(cartoes) < workers or len(ferramentas) < workers:
+        raise ValueError(
+            f"São precisos ao menos {workers} cartões ativos e {workers} ferramentas ativas "
+            f"na caixa {reader_id} (python manage.py semear_dados)."
+        )
+    rnd.shuffle(cartoes)
+    rnd.shuffle(ferramentas)
+
+    base = {
+        "sessoes": SessaoUso.objects.count(),
+        "movimentacoes": MovimentacaoFerramenta.objects.count(),
+        "ferramentas": len(ferramentas),
+        "cartoes": len(cartoes),
+    }
+
+    medidas = _Medidas()
+    lista = [
+        _Worker(medidas, cartoes[i::workers], ferramentas[i::workers], random.Random(rnd.random()), reader_id)
+        for i in range(workers)
+    ]
+
+    with ExitStack() as pilha:
+        pilha.enter_context(override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+            CONFIRMACAO_ASSINCRONA=False,
+        ))
+        for alvo, stub in _stubs(latencia_hardware_ms / 1000).items():
+            pilha.enter_context(mock.patch(alvo, stub))
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bench") as pool:
+            for futuro in [pool.submit(w.rodar, ciclos) for w in lista]:
+                futuro.result()
+        duracao = time.perf_counter() - inicio
+
+    endpoints = {}
+    for nome, latencias in sorted(medidas.latencias.items()):
+        ordenadas = sorted(latencias)
+        consultas = medidas.consultas[nome]
+        endpoints[nome] = {
+            "requisicoes": len(ordenadas),
+            "erros": medidas.erros[nome],
+            "rps": round(len(ordenadas) / duracao, 2),
+            "p50_ms": round(_percentil(ordenadas, 50), 2),
+            "p90_ms": round(_percentil(ordenadas, 90), 2),
+            "p99_ms": round(_percentil(ordenadas, 99), 2),
+            "max_ms": round(ordenadas[-1], 2),
+            "consultas_media": round(sum(consultas) / len(consultas), 2),
+            "consultas_max": max(consultas),
+        }
+
+    total = sum(e["requisicoes"] for e in endpoints.values())
+    return {
+        "config": {
+            "workers": workers,
+            "ciclos": ciclos,
+            "latencia_hardware_ms": latencia_hardware_ms,
+            "semente": semente,
+            "banco": connection.vendor,
+        },
+        "base": base,
+        "duracao_s": round(duracao, 3),
+        "requisicoes": total,
+        "erros": sum(e["erros"] for e in endpoints.values()),
+        "rps": round(total / duracao, 2),
+        "endpoints": endpoints,
+    }
@@ -0,0 +1,513 @@
+# api/confirmacao.py
+"""
+Pipeline de confirmação de uma gaveta (retirada ou devolução):
+
+  LED on -> captura do frame -> LED off -> fecha a gaveta ->
+  grava as movimentações / avança a sessão -> abre a próxima gaveta
+                 \
+                  +-> visão (em paralelo) -> reconcilia as movimentações
+
+A visão só precisa do frame salvo, então ela roda num pool de threads
+enquanto a gaveta fecha e a próxima abre; o colaborador espera só o tempo
+mecânico entre gavetas. O resultado da visão é gravado depois em
+MovimentacaoFerramenta.visao_confere (VISAO_EM_PARALELO=False roda a visão
+antes de responder, mas só depois de fechar a gaveta e abrir a próxima,
+que não dependem dela).
+
+Os comandos MQTT (LED, fechar, abrir a próxima) seguem em sequência: o
+runner da Rock Pi executa um por vez, só uma gaveta fica aberta de cada
+vez e a próxima só é conhecida depois que o banco avança a sessão.
+
+Usado tanto pelas views síncronas (confirmar_*_gaveta) quanto pelo worker
+de jobs (manage.py worker_confirmacoes). A reserva da gaveta
+(fluxo.iniciar_confirmacao) é feita por quem chama.
+
+executar_confirmacao_async() é o mesmo pipeline para as views assíncronas
+(api/views_assincronas.py), servidas pelo ASGI: MQTT pela conexão asyncio,
+visão como subprocesso asyncio (em paralelo, numa tarefa do próprio loop)
+e o ORM por sync_to_async.
+"""
+
+import asyncio
+import contextvars
+import logging
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.urls import reverse
+
+from caixa import rastreio
+from hardware.mqtt_client import publish_run_command, publish_run_command_async
+from hardware.camera_vision import capture_frame, capture_frame_async, process_frame, process_frame_async
+from operacoes import fluxo, registro
+from operacoes.models import MovimentacaoFerramenta
+
+from .models import TempoEtapa
+
+logger = logging.getLogger(__name__)
+
+_pool_visao = ThreadPoolExecutor(
+    max_workers=getattr(settings, "VISAO_THREADS", 2),
+    thread_name_prefix="visao",
+)
+
+# versão asyncio do pool: tarefas de visão do loop (referência forte até
+# terminarem) e um semáforo por loop com o mesmo limite de VISAO_THREADS
+_tarefas_visao = set()
+_limites_visao = weakref.WeakKeyDictionary()
+
+
+class FalhaCaptura(Exception):
+    """
+    A captura da imagem falhou. O LED já foi apagado; quem
+    chamou decide se devolve a gaveta ao colaborador ou tenta de novo.
+    """
+
+
+class Cronometro:
+    """
+    Mede a duração (ms, relógio monotônico) de cada etapa do pipeline.
+    Cada etapa também vira um span (caixa/rastreio.py).
+    """
+
+    def __init__(self):
+        self.tempos = {}
+
+    @contextmanager
+    def etapa(self, nome):
+        inicio = time.monotonic()
+        try:
+            with rastreio.span(f"confirmacao.{nome}"):
+                yield
+        finally:
+            self.tempos[nome] = round((time.monotonic() - inicio) * 1000, 1)
+
+    def subetapas(self, etapa, tempos):
+        """
+        Junta os tempos medidos dentro de uma etapa (ex.: meta["tempos_ms"]
+        da captura) como "etapa.subetapa".
+        """
+        for nome, ms in (tempos or {}).items():
+            self.tempos[f"{etapa}.{nome}"] = ms
+
+
+def gravar_tempos(sessao_id, tipo, gaveta_numero, tempos):
+    """
+    Grava os tempos de uma confirmação em TempoEtapa (um INSERT). Falha
+    aqui só vai para o log: não pode derrubar a confirmação.
+    """
+    if not tempos:
+        return
+    try:
+        TempoEtapa.objects.bulk_create([
+            TempoEtapa(
+                sessao_id=sessao_id,
+                operacao=tipo,
+                gaveta_numero=gaveta_numero,
+                etapa=etapa,
+                duracao_ms=ms,
+            )
+            for etapa, ms in tempos.items()
+        ])
+    except Exception:
+        logger.exception("Falha ao gravar os tempos da sessão %s gaveta %s.", sessao_id, gaveta_numero)
+
+
+def reader_id_da_sessao(sessao):
+    """
+    Runner da Rock Pi que recebe os comandos desta sessão: o da caixa onde
+    o cartão foi passado.
+    """
+    return registro.reader_da_sessao(sessao)
+
+
+def _comando(reader_id, alias):
+    """
+    publish_run_command que não deixa exceção escapar (vira {"error": ...}).
+    """
+    try:
+        return publish_run_command(
+            reader_id=reader_id,
+            alias=alias,
+            args=[],
+            mode="fg",
+            timeout_s=10.0,
+        )
+    except Exception as e:
+        logger.exception("Falha ao enviar comando MQTT %s.", alias)
+        return {"error": str(e)}
+
+
+async def _comando_async(reader_id, alias):
+    """
+    _comando pela conexão MQTT asyncio.
+    """
+    try:
+        return await publish_run_command_async(
+            reader_id=reader_id,
+            alias=alias,
+            args=[],
+            mode="fg",
+            timeout_s=10.0,
+        )
+    except Exception as e:
+        logger.exception("Falha ao enviar comando MQTT %s.", alias)
+        return {"error": str(e)}
+
+
+def _detectadas(visao_raw):
+    """
+    Nomes que o gaveta_detect.py reportou (lista vazia se não veio nada).
+    """
+    raw = visao_raw.get("raw") if isinstance(visao_raw, dict) else None
+    if isinstance(raw, dict):
+        visao_json = raw.get("json")
+        if isinstance(visao_json, dict):
+            # devolução também usa 'retiradas': é o que o script de visão retorna hoje
+            return visao_json.get("retiradas", []) or []
+    return []
+
+
+def reconciliar_visao(sessao_id, tipo, gaveta_numero, meta, mov_ids, em_thread=False):
+    """
+    Roda a visão sobre o frame já salvo e grava o resultado em
+    visao_confere de cada movimentação da gaveta.
+
+    Retorna {"visao_ok", "visao_raw", "detectadas", "tempos_ms"} (visao_ok
+    é None se a visão falhou). Na thread do pool, os tempos já são gravados
+    aqui; fora dela, quem chamou junta no próprio Cronometro.
+    """
+    cron = Cronometro()
+    try:
+        inicio = time.monotonic()
+        try:
+            with cron.etapa("visao"):
+                _visao_ok, visao_raw = process_frame(sessao_id, gaveta_numero, meta)
+        except Exception as e:
+            logger.exception(
+                "Erro na visão da gaveta %s (sessão %s): %s", gaveta_numero, sessao_id, e
+            )
+            if em_thread:
+                gravar_tempos(sessao_id, tipo, gaveta_numero, cron.tempos)
+            return {
+                "visao_ok": None,
+                "visao_raw": {"ok": False, "error": str(e)},
+                "detectadas": [],
+                "tempos_ms": cron.tempos,
+            }
+        cron.subetapas("visao", visao_raw.pop("tempos_ms", None) if isinstance(visao_raw, dict) else None)
+
+        visao_ok, detectadas = _aplicar_visao(sessao_id, tipo, gaveta_numero, visao_raw, mov_ids, cron)
+        logger.info(
+            "Sessão %s gaveta %s: visão reconciliada em %.1f ms",
+            sessao_id, gaveta_numero, (time.monotonic() - inicio) * 1000,
+        )
+        if em_thread:
+            gravar_tempos(sessao_id, tipo, gaveta_numero, cron.tempos)
+        return {
+            "visao_ok": visao_ok,
+            "visao_raw": visao_raw,
+            "detectadas": detectadas,
+            "tempos_ms": cron.tempos,
+        }
+    finally:
+        if em_thread:
+            # a thread do pool não passa pelo ciclo de request do Django
+            connection.close()
+
+
+def _aplicar_visao(sessao_id, tipo, gaveta_numero, visao_raw, mov_ids, cron):
+    """
+    Grava visao_confere das movimentações da gaveta conforme o que a visão
+    detectou. Retorna (visao_ok, detectadas).
+    """
+    detectadas = _detectadas(visao_raw)
+    movs = list(
+        MovimentacaoFerramenta.objects
+        .filter(id__in=mov_ids)
+        .select_related("ferramenta")
+    )
+    with cron.etapa("visao.banco"):
+        for m in movs:
+            if tipo == "R":
+                m.visao_confere = m.ferramenta.nome in detectadas
+            else:
+                m.visao_confere = bool(detectadas)
+        MovimentacaoFerramenta.objects.bulk_update(movs, ["visao_confere"])
+
+    # se ao menos uma bateu com a visão, consideramos a gaveta OK
+    visao_ok = any(m.visao_confere for m in movs)
+    if not visao_ok:
+        logger.warning(
+            "Sessão %s gaveta %s: visão não confere (esperadas=%s detectadas=%s)",
+            sessao_id, gaveta_numero, [m.ferramenta.nome for m in movs], detectadas,
+        )
+    return visao_ok, detectadas
+
+
+async def reconciliar_visao_async(sessao_id, tipo, gaveta_numero, meta, mov_ids):
+    """
+    reconciliar_visao com a visão como subprocesso asyncio. Mesmo retorno;
+    os tempos ficam para quem chamou gravar.
+    """
+    cron = Cronometro()
+    inicio = time.monotonic()
+    try:
+        with cron.etapa("visao"):
+            _visao_ok, visao_raw = await process_frame_async(sessao_id, gaveta_numero, meta)
+    except Exception as e:
+        logger.exception(
+            "Erro na visão da gaveta %s (sessão %s): %s", gaveta_numero, sessao_id, e
+        )
+        return {
+            "visao_ok": None,
+            "visao_raw": {"ok": False, "error": str(e)},
+            "detectadas": [],
+            "tempos_ms": cron.tempos,
+        }
+    cron.subetapas("visao", visao_raw.pop("tempos_ms", None) if isinstance(visao_raw, dict) else None)
+
+    visao_ok, detectadas = await sync_to_async(_aplicar_visao)(
+        sessao_id, tipo, gaveta_numero, visao_raw, mov_ids, cron
+    )
+    logger.info(
+        "Sessão %s gaveta %s: visão reconciliada em %.1f ms",
+        sessao_id, gaveta_numero, (time.monotonic() - inicio) * 1000,
+    )
+    return {
+        "visao_ok": visao_ok,
+        "visao_raw": visao_raw,
+        "detectadas": detectadas,
+        "tempos_ms": cron.tempos,
+    }
+
+
+def _limite_visao():
+    loop = asyncio.get_running_loop()
+    limite = _limites_visao.get(loop)
+    if limite is None:
+        limite = _limites_visao[loop] = asyncio.Semaphore(getattr(settings, "VISAO_THREADS", 2))
+    return limite
+
+
+async def _visao_em_tarefa(sessao_id, tipo, gaveta_numero, meta, mov_ids):
+    # no máximo VISAO_THREADS visões ao mesmo tempo, como no pool síncrono
+    async with _limite_visao():
+        visao = await reconciliar_visao_async(sessao_id, tipo, gaveta_numero, meta, mov_ids)
+    await sync_to_async(gravar_tempos)(sessao_id, tipo, gaveta_numero, visao["tempos_ms"])
+
+
+def executar_confirmacao(sessao, movs, cron=None):
+    """
+    Roda o pipeline para a gaveta atual da sessão (já reservada, etapa V).
+    Retorna o dicionário de resposta; levanta FalhaCaptura se a câmera
+    falhar. Os tempos de cada etapa vão em "tempos_ms" e para TempoEtapa.
+    """
+    cron = cron or Cronometro()
+    tipo = sessao.operacao
+    gaveta_numero = sessao.gaveta_atual
+    reader_id = reader_id_da_sessao(sessao)
+    em_paralelo = getattr(settings, "VISAO_EM_PARALELO", True)
+
+    # 1) Acende LED na Rock Pi
+    with cron.etapa("led_on"):
+        led_on_result = _comando(reader_id, "led_on")
+
+    # 2) Captura o frame (no PC)
+    try:
+        with cron.etapa("captura"):
+            imagem_rel, meta = capture_frame(sessao.id, gaveta_numero)
+    except Exception as e:
+        logger.exception(
+            "Erro na captura de imagem da gaveta %s: %s",
+            gaveta_numero,
+            e,
+        )
+        # Mesmo se falhar, apaga o LED
+        _comando(reader_id, "led_off")
+        gravar_tempos(sessao.id, tipo, gaveta_numero, cron.tempos)
+        raise FalhaCaptura(str(e)) from e
+    cron.subetapas("captura", meta.get("tempos_ms") if isinstance(meta, dict) else None)
+
+    # 3) Visão: em paralelo com o resto do pipeline, ou no fim (passo 7)
+    args_visao = (sessao.id, tipo, gaveta_numero, meta, [m.id for m in movs])
+    visao = None
+    if em_paralelo:
+        # contexto copiado: a visão continua no trace da confirmação
+        ctx = contextvars.copy_context()
+        _pool_visao.submit(ctx.run, reconciliar_visao, *args_visao, em_thread=True)
+
+    # 4) Apaga LED e fecha a gaveta via MQTT (fechar_gaveta_X)
+    with cron.etapa("led_off"):
+        led_off_result = _comando(reader_id, "led_off")
+    with cron.etapa("fechar_gaveta"):
+        fechar_result = _comando(reader_id, f"fechar_gaveta_{int(gaveta_numero)}")
+
+    # 5) Marca TODAS como confirmadas (independente da visão, para o fluxo
+    #    andar) e avança a sessão para a próxima gaveta ou encerra
+    with cron.etapa("banco"):
+        sessao, proxima_gaveta = fluxo.concluir_confirmacao(sessao.id, movs, imagem_rel)
+
+    # 6) Retirada: se ainda houver gaveta, ABRIMOS a próxima via MQTT.
+    #    Devolução: a tela devolver_confirmar abre a gaveta ao ser carregada.
+    mqtt_abrir_proxima = None
+    if tipo == "R" and proxima_gaveta is not None:
+        with cron.etapa("abrir_proxima"):
+            mqtt_abrir_proxima = _comando(reader_id, f"abrir_gaveta_{int(proxima_gaveta)}")
+
+    # 7) Visão antes de responder (VISAO_EM_PARALELO=False): só depois da
+    #    parte mecânica, que não depende dela
+    if not em_paralelo:
+        with cron.etapa("visao"):
+            visao = reconciliar_visao(*args_visao)
+        cron.tempos.update({k: v for k, v in visao["tempos_ms"].items() if k != "visao"})
+
+    response = _resposta(
+        sessao, tipo, gaveta_numero, movs, imagem_rel, visao, proxima_gaveta,
+        led_on_result, led_off_result, fechar_result, mqtt_abrir_proxima,
+    )
+    response["tempos_ms"] = cron.tempos
+    gravar_tempos(sessao.id, tipo, gaveta_numero, cron.tempos)
+    return response
+
+
+def _resposta(sessao, tipo, gaveta_numero, movs, imagem_rel, visao, proxima_gaveta,
+              led_on_result, led_off_result, fechar_result, mqtt_abrir_proxima):
+    """
+    Corpo da resposta da confirmação (sem "tempos_ms", que quem chama
+    junta por último).
+    """
+    esperadas = [m.ferramenta.nome for m in movs]
+    sessao_encerrada = proxima_gaveta is None
+
+    movs_data = [
+        {
+            "id": m.id,
+            "ferramenta_id": m.ferramenta.id,
+            "ferramenta_nome": m.ferramenta.nome,
+            "gaveta_numero": m.gaveta_numero,
+            "quantidade": m.quantidade,
+            "imagem_path": m.imagem_path,
+            "confirmado_visao": m.confirmado_visao,
+        }
+        for m in movs
+    ]
+
+    response = {
+        "detail": (
+            "Retirada confirmada com captura de imagem."
+            if tipo == "R" else
+            "Devolução confirmada com captura de imagem."
+        ),
+        "sessao_id": sessao.id,
+        "gaveta_numero": gaveta_numero,
+        "imagem": imagem_rel,
+        # com a visão em paralelo o resultado ainda não existe aqui;
+        # ele fica em visao_confere das movimentações
+        "visao_pendente": visao is None,
+        "visao_ok": visao["visao_ok"] if visao else None,
+        "visao_raw": visao["visao_raw"] if visao else None,
+        "match_visao": {
+            "esperadas": esperadas,
+            "detectadas": visao["detectadas"] if visao else None,
+        },
+        "movimentacoes_atualizadas": movs_data,
+        "led": {
+            "on": led_on_result,
+            "off": led_off_result,
+        },
+        "fechar_gaveta": fechar_result,
+        "proxima_gaveta": proxima_gaveta,
+        "sessao_encerrada": sessao_encerrada,
+    }
+
+    if tipo == "R":
+        response["abrir_proxima_gaveta"] = mqtt_abrir_proxima
+
+    # 7) Define redirect_url para o front
+    if sessao_encerrada:
+        response["redirect_url"] = reverse("home")  # volta para a tela principal, esperando novo cartão
+    elif tipo == "R":
+        response["redirect_url"] = reverse("retirar_confirmar", args=[sessao.id])
+    else:
+        response["redirect_url"] = reverse("devolver_confirmar", args=[sessao.id, proxima_gaveta])
+    return response
+
+
+async def executar_confirmacao_async(sessao, movs, cron=None):
+    """
+    executar_confirmacao para as views assíncronas: mesmas etapas, mesma
+    resposta e mesmos tempos, mas cada espera (MQTT, câmera, visão, banco)
+    é um await e não prende thread nenhuma.
+    """
+    cron = cron or Cronometro()
+    tipo = sessao.operacao
+    gaveta_numero = sessao.gaveta_atual
+    reader_id = reader_id_da_sessao(sessao)
+    em_paralelo = getattr(settings, "VISAO_EM_PARALELO", True)
+
+    # 1) Acende LED na Rock Pi
+    with cron.etapa("led_on"):
+        led_on_result = await _comando_async(reader_id, "led_on")
+
+    # 2) Captura o frame (no PC)
+    try:
+        with cron.etapa("captura"):
+            imagem_rel, meta = await capture_frame_async(sessao.id, gaveta_numero)
+    except Exception as e:
+        logger.exception(
+            "Erro na captura de imagem da gaveta %s: %s",
+            gaveta_numero,
+            e,
+        )
+        # Mesmo se falhar, apaga o LED
+        await _comando_async(reader_id, "led_off")
+        await sync_to_async(gravar_tempos)(sessao.id, tipo, gaveta_numero, cron.tempos)
+        raise FalhaCaptura(str(e)) from e
+    cron.subetapas("captura", meta.get("tempos_ms") if isinstance(meta, dict) else None)
+
+    # 3) Visão: numa tarefa do loop, em paralelo com o resto, ou no fim
+    args_visao = (sessao.id, tipo, gaveta_numero, meta, [m.id for m in movs])
+    visao = None
+    if em_paralelo:
+        # a tarefa herda o contexto: a visão continua no trace da confirmação
+        tarefa = asyncio.create_task(_visao_em_tarefa(*args_visao))
+        _tarefas_visao.add(tarefa)
+        tarefa.add_done_callback(_tarefas_visao.discard)
+
+    # 4) Apaga LED e fecha a gaveta via MQTT (fechar_gaveta_X)
+    with cron.etapa("led_off"):
+        led_off_result = await _comando_async(reader_id, "led_off")
+    with cron.etapa("fechar_gaveta"):
+        fechar_result = await _comando_async(reader_id, f"fechar_gaveta_{int(gaveta_numero)}")
+
+    # 5) Confirma as movimentações e avança a sessão
+    with cron.etapa("banco"):
+        sessao, proxima_gaveta = await sync_to_async(fluxo.concluir_confirmacao)(
+            sessao.id, movs, imagem_rel
+        )
+
+    # 6) Retirada: abre a próxima gaveta
+    mqtt_abrir_proxima = None
+    if tipo == "R" and proxima_gaveta is not None:
+        with cron.etapa("abrir_proxima"):
+            mqtt_abrir_proxima = await _comando_async(reader_id, f"abrir_gaveta_{int(proxima_gaveta)}")
+
+    # 7) Visão antes de responder, depois da parte mecânica
+    if not em_paralelo:
+        with cron.etapa("visao"):
+            visao = await reconciliar_visao_async(*args_visao)
+        cron.tempos.update({k: v for k, v in visao["tempos_ms"].items() if k != "visao"})
+
+    response = _resposta(
+        sessao, tipo, gaveta_numero, movs, imagem_rel, visao, proxima_gaveta,
+        led_on_result, led_off_result, fechar_result, mqtt_abrir_proxima,
+    )
+    response["tempos_ms"] = cron.tempos
+    await sync_to_async(gravar_tempos)(sessao.id, tipo, gaveta_numero, cron.tempos)
+    return response
@@ -0,0 +1,219 @@
+# api/evidencias.py
+"""
+Pacote de evidências (ZIP) de uma sessão ou de um período.
+
+As imagens de cada confirmação ficam em media/sessoes/<id>/: o frame da
+câmera (MovimentacaoFerramenta.imagem_path), a saída anotada da visão
+(*_saida.jpg) e o JSON que o gaveta_detect.py grava ao lado dela
+(*_saida.json). O ZIP leva esses arquivos e um manifesto por sessão
+(sessoes/<id>/manifesto.json) montado das movimentações e do JSON da
+visão, mais um manifesto.json geral no fim.
+
+O ZIP é escrito num objeto que só acumula o que foi gerado desde o
+último pedaço entregue (o zipfile usa data descriptors quando a saída
+não tem seek): nada do pacote fica inteiro em memória ou em disco.
+Sessões são lidas em páginas por id, das tabelas quentes e do arquivo.
+"""
+
+import json
+import os
+import zipfile
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from operacoes.models import MovimentacaoFerramenta, SessaoArquivada, SessaoUso
+
+PAGINA = 100
+BLOCO = 64 * 1024
+
+
+class _Saida:
+    """
+    Destino do zipfile sem seek/tell: guarda os bytes até serem retirados.
+    """
+
+    def __init__(self):
+        self._pedacos = []
+
+    def write(self, dados):
+        self._pedacos.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def retirar(self):
+        dados = b"".join(self._pedacos)
+        self._pedacos = []
+        return dados
+
+
+def _drenar(saida):
+    dados = saida.retirar()
+    if dados:
+        yield dados
+
+
+def _dict_sessao(s):
+    # mesmo formato de SessaoArquivada.como_dict()
+    return {
+        "id": s.id,
+        "colaborador": {
+            "id": s.colaborador_id,
+            "nome": s.colaborador.nome,
+            "matricula": s.colaborador.matricula,
+        },
+        "cartao_uid": s.cartao.uid if s.cartao else "",
+        "status": s.status,
+        "iniciado_em": s.iniciado_em.isoformat(),
+        "finalizado_em": s.finalizado_em.isoformat() if s.finalizado_em else None,
+        "arquivado_em": None,
+        "movimentacoes": [
+            {
+                "id": m.id,
+                "ferramenta_id": m.ferramenta_id,
+                "ferramenta_nome": m.ferramenta.nome,
+                "tipo": m.tipo,
+                "gaveta_numero": m.gaveta_numero,
+                "quantidade": m.quantidade,
+                "imagem_path": m.imagem_path,
+                "confirmado_visao": m.confirmado_visao,
+                "visao_confere": m.visao_confere,
+                "criado_em": m.criado_em.isoformat(),
+            }
+            for m in s.movimentacoes.all()
+        ],
+    }
+
+
+def _paginas(qs, como_dict):
+    ultimo_id = 0
+    while True:
+        pagina = list(qs.filter(id__gt=ultimo_id).order_by("id")[:PAGINA])
+        for s in pagina:
+            yield como_dict(s)
+        if len(pagina) < PAGINA:
+            return
+        ultimo_id = pagina[-1].id
+
+
+def sessoes(sessao_id=None, desde=None, ate=None):
+    """
+    Sessões (dicionários no formato do arquivo, com movimentações) da
+    sessão pedida ou iniciadas no período [desde, ate).
+    """
+    filtros = {}
+    if sessao_id is not None:
+        filtros["id"] = sessao_id
+    if desde is not None:
+        filtros["iniciado_em__gte"] = desde
+    if ate is not None:
+        filtros["iniciado_em__lt"] = ate
+
+    quentes = (
+        SessaoUso.objects.filter(**filtros)
+        .select_related("colaborador", "cartao")
+        .prefetch_related(
+            Prefetch(
+                "movimentacoes",
+                queryset=MovimentacaoFerramenta.objects.select_related("ferramenta").order_by("criado_em", "id"),
+            )
+        )
+    )
+    yield from _paginas(quentes, _dict_sessao)
+
+    arquivadas = SessaoArquivada.objects.filter(**filtros).prefetch_related("movimentacoes")
+    yield from _paginas(arquivadas, lambda s: s.como_dict())
+
+
+def _caminho_media(relativo):
+    """
+    Caminho absoluto dentro de MEDIA_ROOT, ou None se sair dele.
+    """
+    raiz = os.path.realpath(settings.MEDIA_ROOT)
+    absoluto = os.path.realpath(os.path.join(raiz, relativo))
+    if os.path.commonpath([raiz, absoluto]) != raiz:
+        return None
+    return absoluto
+
+
+def _arquivos_da_gaveta(imagem_path):
+    """
+    [(tipo, caminho relativo)] da captura e das saídas da visão.
+    """
+    base, ext = os.path.splitext(imagem_path)
+    return [
+        ("captura", imagem_path),
+        ("saida", f"{base}_saida{ext}"),
+        ("visao_json", f"{base}_saida.json"),
+    ]
+
+
+def _gravar_arquivo(zf, saida, absoluto, nome):
+    info = zipfile.ZipInfo.from_file(absoluto, nome)
+    info.compress_type = zipfile.ZIP_STORED   # JPEG já é comprimido
+    with open(absoluto, "rb") as origem, zf.open(info, "w") as destino:
+        while True:
+            bloco = origem.read(BLOCO)
+            if not bloco:
+                break
+            destino.write(bloco)
+            yield from _drenar(saida)
+
+
+def _json(dados):
+    return json.dumps(dados, cls=DjangoJSONEncoder, ensure_ascii=False, indent=2)
+
+
+def gerar_zip(sessoes_):
+    """
+    Gera os bytes do ZIP aos poucos, sessão por sessão.
+    """
+    saida = _Saida()
+    resumo = {"gerado_em": timezone.now(), "sessoes": [], "arquivos": 0, "ausentes": 0}
+
+    with zipfile.ZipFile(saida, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for sessao in sessoes_:
+            pasta = f"sessoes/{sessao['id']}"
+            gavetas = {}
+
+            for m in sessao["movimentacoes"]:
+                if not m["imagem_path"] or m["imagem_path"] in gavetas:
+                    continue
+                arquivos = []
+                for tipo, relativo in _arquivos_da_gaveta(m["imagem_path"]):
+                    absoluto = _caminho_media(relativo)
+                    existe = absoluto is not None and os.path.isfile(absoluto)
+                    nome = f"{pasta}/{os.path.basename(relativo)}"
+                    arquivos.append({"tipo": tipo, "origem": relativo, "zip": nome if existe else None})
+                    if not existe:
+                        resumo["ausentes"] += 1
+                        continue
+                    yield from _gravar_arquivo(zf, saida, absoluto, nome)
+                    resumo["arquivos"] += 1
+                    if tipo == "visao_json":
+                        try:
+                            with open(absoluto, encoding="utf-8") as f:
+                                arquivos[-1]["conteudo"] = json.load(f)
+                        except ValueError:
+                            arquivos[-1]["conteudo"] = None
+                gavetas[m["imagem_path"]] = {"gaveta_numero": m["gaveta_numero"], "arquivos": arquivos}
+
+            manifesto = {**sessao, "evidencias": list(gavetas.values())}
+            zf.writestr(f"{pasta}/manifesto.json", _json(manifesto))
+            yield from _drenar(saida)
+
+            resumo["sessoes"].append({
+                "id": sessao["id"],
+                "colaborador": sessao["colaborador"]["nome"],
+                "iniciado_em": sessao["iniciado_em"],
+                "movimentacoes": len(sessao["movimentacoes"]),
+            })
+
+        zf.writestr("manifesto.json", _json(resumo))
+
+    # diretório central, escrito no close()
+    yield from _drenar(saida)
@@ -0,0 +1,127 @@
+# api/exportacao.py
+"""
+Exportação do histórico (SessaoUso / MovimentacaoFerramenta) em CSV ou
+JSONL, gerada aos poucos para StreamingHttpResponse.
+
+O queryset é lido em páginas por chave (id > último id lido, ordenado por
+id), nunca com OFFSET e nunca inteiro: cada página é uma consulta curta
+com `.iterator()`, então a memória fica do tamanho de uma página, seja
+qual for o total exportado. (O MySQLdb não usa cursor do lado do servidor
+com o Django; é a paginação por chave que segura a memória.)
+"""
+
+import csv
+import io
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from operacoes.models import MovimentacaoFerramenta, SessaoUso
+
+PAGINA = 2000
+
+# coluna exportada -> campo lido com values()
+CAMPOS_SESSAO = [
+    ("sessao_id", "id"),
+    ("status", "status"),
+    ("iniciado_em", "iniciado_em"),
+    ("finalizado_em", "finalizado_em"),
+    ("colaborador_id", "colaborador_id"),
+    ("colaborador_nome", "colaborador__nome"),
+    ("colaborador_matricula", "colaborador__matricula"),
+    ("cartao_uid", "cartao__uid"),
+]
+
+CAMPOS_MOVIMENTACAO = [
+    ("movimentacao_id", "id"),
+    ("criado_em", "criado_em"),
+    ("tipo", "tipo"),
+    ("gaveta_numero", "gaveta_numero"),
+    ("quantidade", "quantidade"),
+    ("confirmado_visao", "confirmado_visao"),
+    ("visao_confere", "visao_confere"),
+    ("imagem_path", "imagem_path"),
+    ("sessao_id", "sessao_id"),
+    ("sessao_status", "sessao__status"),
+    ("colaborador_id", "sessao__colaborador_id"),
+    ("colaborador_nome", "sessao__colaborador__nome"),
+    ("colaborador_matricula", "sessao__colaborador__matricula"),
+    ("ferramenta_id", "ferramenta_id"),
+    ("ferramenta_nome", "ferramenta__nome"),
+    ("ferramenta_codigo", "ferramenta__codigo"),
+]
+
+EXPORTACOES = {
+    "sessoes": (SessaoUso, CAMPOS_SESSAO),
+    "movimentacoes": (MovimentacaoFerramenta, CAMPOS_MOVIMENTACAO),
+}
+
+
+def linhas(qs, campos, pagina=None):
+    """
+    Gera um dicionário por linha de `qs` (coluna -> valor), página a
+    página por id.
+    """
+    pagina = pagina or PAGINA
+    lookups = [lookup for _, lookup in campos]
+    ultimo_id = 0
+    while True:
+        lidas = 0
+        for valores in (
+            qs.filter(id__gt=ultimo_id)
+            .order_by("id")
+            .values_list(*lookups)[:pagina]
+            .iterator(chunk_size=pagina)
+        ):
+            lidas += 1
+            ultimo_id = valores[0]
+            yield dict(zip((coluna for coluna, _ in campos), valores))
+        if lidas < pagina:
+            return
+
+
+def _em_blocos(pedacos, tamanho=64 * 1024):
+    # junta linhas curtas em blocos, para não mandar um write por linha
+    bloco, total = [], 0
+    for pedaco in pedacos:
+        bloco.append(pedaco)
+        total += len(pedaco)
+        if total >= tamanho:
+            yield "".join(bloco)
+            bloco, total = [], 0
+    if bloco:
+        yield "".join(bloco)
+
+
+def _csv(linhas_, campos):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def linha_csv(valores):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(valores)
+        return buffer.getvalue()
+
+    yield linha_csv([coluna for coluna, _ in campos])
+    for linha in linhas_:
+        yield linha_csv([
+            v.isoformat() if hasattr(v, "isoformat") else ("" if v is None else v)
+            for v in linha.values()
+        ])
+
+
+def _jsonl(linhas_):
+    for linha in linhas_:
+        yield json.dumps(linha, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+def gerar(qs, campos, formato):
+    """
+    Corpo da exportação em pedaços de texto (formato "csv" ou "jsonl").
+    """
+    if formato == "csv":
+        pedacos = _csv(linhas(qs, campos), campos)
+    else:
+        pedacos = _jsonl(linhas(qs, campos))
+    return _em_blocos(pedacos)
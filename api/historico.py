@@ -0,0 +1,101 @@
+# api/historico.py
+"""
+Listagem do histórico (/api/sessoes/, /api/movimentacoes/) paginada por
+chave: mais recentes primeiro, por (data, id), e o cursor da próxima
+página é a chave da última linha entregue. Cada página é uma consulta
+por índice que começa onde a anterior parou, sem OFFSET e sem COUNT, e
+custa o mesmo na primeira página e na milésima.
+
+Os campos disponíveis (e os joins que eles pedem) são os mesmos da
+exportação (api/exportacao.py); `campos=` escolhe quais ler.
+"""
+
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .exportacao import CAMPOS_MOVIMENTACAO, CAMPOS_SESSAO
+
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 500
+
+# tipo -> (campos, coluna da data, coluna do id)
+LISTAGENS = {
+    "sessoes": (CAMPOS_SESSAO, "iniciado_em", "sessao_id"),
+    "movimentacoes": (CAMPOS_MOVIMENTACAO, "criado_em", "movimentacao_id"),
+}
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def codificar_cursor(data, id_):
+    bruto = json.dumps([data.isoformat(), id_]).encode("utf-8")
+    return base64.urlsafe_b64encode(bruto).decode("ascii").rstrip("=")
+
+
+def decodificar_cursor(cursor):
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data_iso, id_ = json.loads(bruto)
+        data = parse_datetime(data_iso)
+    except (ValueError, TypeError):
+        raise CursorInvalido(cursor)
+    if data is None or not isinstance(id_, int):
+        raise CursorInvalido(cursor)
+    return data, id_
+
+
+def escolher_campos(tipo, pedidos=None):
+    """
+    [(coluna, lookup)] pedidos em `pedidos` (nomes separados por vírgula),
+    ou todos. Levanta ValueError com os nomes desconhecidos.
+    """
+    campos = LISTAGENS[tipo][0]
+    if not pedidos:
+        return campos
+    por_nome = dict(campos)
+    nomes = [n.strip() for n in pedidos.split(",") if n.strip()]
+    desconhecidos = [n for n in nomes if n not in por_nome]
+    if desconhecidos:
+        raise ValueError(", ".join(desconhecidos))
+    return [(n, por_nome[n]) for n in nomes]
+
+
+def pagina(tipo, qs, campos, cursor=None, limite=LIMITE_PADRAO):
+    """
+    Uma página de `qs`: {"resultados": [...], "proximo": cursor ou None}.
+    """
+    todos, coluna_data, coluna_id = LISTAGENS[tipo]
+    campo_data = dict(todos)[coluna_data]
+
+    if cursor:
+        data, id_ = decodificar_cursor(cursor)
+        qs = qs.filter(Q(**{f"{campo_data}__lt": data}) | Q(**{campo_data: data, "id__lt": id_}))
+
+    # a chave sempre é lida, mesmo fora dos campos pedidos
+    lookups = dict(campos)
+    lookups.setdefault(coluna_data, campo_data)
+    lookups.setdefault(coluna_id, "id")
+    colunas = list(lookups)
+
+    linhas = [
+        dict(zip(colunas, valores))
+        for valores in qs.order_by(f"-{campo_data}", "-id").values_list(*lookups.values())[:limite + 1]
+    ]
+
+    proximo = None
+    if len(linhas) > limite:
+        linhas = linhas[:limite]
+        ultima = linhas[-1]
+        proximo = codificar_cursor(ultima[coluna_data], ultima[coluna_id])
+
+    pedidas = [coluna for coluna, _ in campos]
+    return {
+        "resultados": [{c: linha[c] for c in pedidas} for linha in linhas],
+        "proximo": proximo,
+    }
+
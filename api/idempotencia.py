@@ -0,0 +1,268 @@
+# api/idempotencia.py
+"""
+Suporte ao header Idempotency-Key nos endpoints POST da API.
+
+- primeira requisição com a chave: reserva a chave (status "P"), executa
+  a view e guarda a resposta (status "C") por IDEMPOTENCIA_TTL_S segundos;
+- repetição com a mesma chave: devolve a resposta guardada;
+- repetição concorrente (a primeira ainda rodando): espera a primeira
+  terminar, até IDEMPOTENCIA_ESPERA_S, em vez de rodar o pipeline de novo;
+- a reserva só é liberada por tempo depois de IDEMPOTENCIA_RESERVA_S, bem
+  mais que o pipeline mais lento (captura + visão), para uma repetição
+  nunca rodar de novo uma confirmação que ainda está em andamento;
+- mesma chave com outro corpo: 422.
+
+Respostas 5xx não são guardadas, para que o cliente possa tentar de novo.
+
+Views assíncronas (api/views_assincronas.py) recebem um wrapper assíncrono:
+o banco vai por sync_to_async e a espera pela original é um asyncio.sleep.
+"""
+
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from datetime import timedelta
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import ChaveIdempotencia
+
+logger = logging.getLogger(__name__)
+
+HEADER = "Idempotency-Key"
+INTERVALO_ESPERA_S = 0.2
+
+# chaves sendo processadas neste processo -> evento liberado ao terminar;
+# duplicatas no mesmo processo esperam no evento em vez de consultar o banco
+_em_andamento = {}
+_em_andamento_lock = threading.Lock()
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, "IDEMPOTENCIA_TTL_S", 24 * 3600))
+
+
+def _espera_max():
+    return getattr(settings, "IDEMPOTENCIA_ESPERA_S", 60)
+
+
+def _reserva_max():
+    return getattr(settings, "IDEMPOTENCIA_RESERVA_S", 15 * 60)
+
+
+def _reservar(chave, rota, hash_corpo):
+    """
+    Tenta reservar a chave. Retorna (registro, criado).
+    Chaves expiradas são apagadas antes, o que mantém a tabela limitada.
+    """
+    agora = timezone.now()
+    ChaveIdempotencia.objects.filter(expira_em__lt=agora).delete()
+
+    for tentativa in (1, 2, 3):
+        try:
+            with transaction.atomic():
+                registro = ChaveIdempotencia.objects.create(
+                    chave=chave,
+                    rota=rota,
+                    hash_corpo=hash_corpo,
+                    # se o processo morrer, a chave é liberada sozinha, mas só
+                    # depois de qualquer pipeline ainda rodando ter terminado
+                    expira_em=agora + timedelta(seconds=_reserva_max()),
+                )
+            return registro, True
+        except IntegrityError:
+            try:
+                return ChaveIdempotencia.objects.get(chave=chave, rota=rota), False
+            except ChaveIdempotencia.DoesNotExist:
+                # a original liberou a chave (5xx) entre o INSERT e o SELECT
+                if tentativa == 3:
+                    raise
+
+
+def _aguardar(registro):
+    """
+    Espera a requisição original terminar. Retorna o registro concluído
+    ou None se o tempo de espera acabar (ou a original falhar).
+    """
+    limite = time.monotonic() + _espera_max()
+
+    with _em_andamento_lock:
+        evento = _em_andamento.get((registro.chave, registro.rota))
+    if evento is not None:
+        evento.wait(timeout=_espera_max())
+
+    while True:
+        try:
+            registro.refresh_from_db()
+        except ChaveIdempotencia.DoesNotExist:
+            return None
+        if registro.status == "C":
+            return registro
+        if time.monotonic() >= limite:
+            return None
+        time.sleep(INTERVALO_ESPERA_S)
+
+
+async def _aguardar_async(registro):
+    """
+    _aguardar sem prender thread: o evento (threading.Event, a original
+    pode ser uma view síncrona) é consultado entre um sleep e outro.
+    """
+    limite = time.monotonic() + _espera_max()
+
+    with _em_andamento_lock:
+        evento = _em_andamento.get((registro.chave, registro.rota))
+    while evento is not None and not evento.is_set() and time.monotonic() < limite:
+        await asyncio.sleep(INTERVALO_ESPERA_S)
+
+    while True:
+        try:
+            await sync_to_async(registro.refresh_from_db)()
+        except ChaveIdempotencia.DoesNotExist:
+            return None
+        if registro.status == "C":
+            return registro
+        if time.monotonic() >= limite:
+            return None
+        await asyncio.sleep(INTERVALO_ESPERA_S)
+
+
+def _resposta_guardada(registro):
+    resp = HttpResponse(
+        bytes(registro.resposta_corpo),
+        status=registro.resposta_status,
+        content_type=registro.resposta_tipo or "application/json",
+    )
+    resp["Idempotent-Replay"] = "true"
+    return resp
+
+
+def _repeticao(registro, hash_corpo, concluido):
+    """
+    Resposta a uma repetição da chave: 422 (outro corpo), 409 (original
+    ainda rodando) ou a resposta guardada.
+    """
+    if registro.hash_corpo != hash_corpo:
+        return JsonResponse(
+            {"detail": f"{HEADER} já usada com outro corpo de requisição."},
+            status=422,
+        )
+    if concluido is None:
+        return JsonResponse(
+            {"detail": f"Requisição com esta {HEADER} ainda em processamento."},
+            status=409,
+        )
+    logger.info("Idempotency-Key %s em %s: devolvendo resposta guardada.", registro.chave, registro.rota)
+    return _resposta_guardada(concluido)
+
+
+def _guardar(registro, response):
+    """
+    Guarda a resposta da original (ou libera a chave, se for 5xx/stream).
+    """
+    if response.status_code >= 500 or response.streaming:
+        registro.delete()
+        return
+
+    # UPDATE filtrado: se a reserva sumiu no meio tempo, não há o que
+    # guardar, mas a resposta da original segue para o cliente
+    atualizados = ChaveIdempotencia.objects.filter(pk=registro.pk).update(
+        status="C",
+        resposta_status=response.status_code,
+        resposta_tipo=response.get("Content-Type", ""),
+        resposta_corpo=response.content,
+        expira_em=timezone.now() + _ttl(),
+    )
+    if not atualizados:
+        logger.warning(
+            "Reserva da Idempotency-Key %s em %s sumiu antes de guardar a resposta.",
+            registro.chave, registro.rota,
+        )
+
+
+def idempotente(view):
+    """
+    Decorator para views POST. Sem o header Idempotency-Key a view roda
+    normalmente.
+    """
+    if iscoroutinefunction(view):
+        return _idempotente_async(view)
+
+    @wraps(view)
+    def _wrapped(request, *args, **kwargs):
+        chave = request.headers.get(HEADER)
+        if request.method != "POST" or not chave:
+            return view(request, *args, **kwargs)
+
+        chave = chave[:100]
+        rota = request.path[:255]
+        hash_corpo = hashlib.sha256(request.body).hexdigest()
+
+        registro, criado = _reservar(chave, rota, hash_corpo)
+
+        if not criado:
+            concluido = _aguardar(registro) if registro.hash_corpo == hash_corpo else None
+            return _repeticao(registro, hash_corpo, concluido)
+
+        evento = threading.Event()
+        with _em_andamento_lock:
+            _em_andamento[(chave, rota)] = evento
+
+        try:
+            response = view(request, *args, **kwargs)
+            _guardar(registro, response)
+            return response
+        except Exception:
+            registro.delete()
+            raise
+        finally:
+            with _em_andamento_lock:
+                _em_andamento.pop((chave, rota), None)
+            evento.set()
+
+    return _wrapped
+
+
+def _idempotente_async(view):
+    @wraps(view)
+    async def _wrapped(request, *args, **kwargs):
+        chave = request.headers.get(HEADER)
+        if request.method != "POST" or not chave:
+            return await view(request, *args, **kwargs)
+
+        chave = chave[:100]
+        rota = request.path[:255]
+        hash_corpo = hashlib.sha256(request.body).hexdigest()
+
+        registro, criado = await sync_to_async(_reservar)(chave, rota, hash_corpo)
+
+        if not criado:
+            concluido = await _aguardar_async(registro) if registro.hash_corpo == hash_corpo else None
+            return _repeticao(registro, hash_corpo, concluido)
+
+        evento = threading.Event()
+        with _em_andamento_lock:
+            _em_andamento[(chave, rota)] = evento
+
+        try:
+            response = await view(request, *args, **kwargs)
+            await sync_to_async(_guardar)(registro, response)
+            return response
+        except BaseException:
+            # inclusive CancelledError (cliente desconectou): a chave é
+            # liberada para a repetição rodar de novo
+            await asyncio.shield(sync_to_async(registro.delete)())
+            raise
+        finally:
+            with _em_andamento_lock:
+                _em_andamento.pop((chave, rota), None)
+            evento.set()
+
+    return _wrapped
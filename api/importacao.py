@@ -0,0 +1,360 @@
+# api/importacao.py
+"""
+Importação em lote de cadastros (Colaborador, CartaoNFC, Ferramenta) a
+partir de CSV ou JSON, para implantar uma caixa nova sem digitar tudo no
+admin.
+
+O arquivo inteiro é validado antes de qualquer escrita (gaveta existente,
+(gaveta, posicao) e UID sem repetição, matrícula do cartão conhecida,
+tamanhos dos campos); havendo erro, nada é gravado e todos os erros voltam
+juntos. Depois, cada tipo vira um bulk_create dos novos e um bulk_update
+só dos campos que mudaram, em lotes, numa transação só. Com simular=True
+só o diff é devolvido.
+
+Chaves: matricula (colaboradores), uid (cartões) e (gaveta, posicao)
+(ferramentas). Registro existente com a mesma chave é atualizado. A
+gaveta de uma ferramenta é procurada na caixa do campo opcional "caixa"
+(reader_id do leitor; vazio = leitor padrão).
+
+Formatos:
+  - CSV: um tipo por arquivo, com cabeçalho (o tipo é informado à parte);
+  - JSON: uma lista (tipo informado à parte) ou um objeto
+    {"colaboradores": [...], "cartoes": [...], "ferramentas": [...]}.
+
+bulk_* não dispara signals: o cache de autorização e o catálogo são
+invalidados aqui, no commit.
+
+    python manage.py importar_cadastros arquivo.json [--simular]
+"""
+
+import csv
+import io
+import json
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction
+from django.utils import timezone
+
+from inventario import caixas, catalogo
+from inventario.models import Ferramenta, Gaveta
+from usuarios import autorizacao
+from usuarios.models import CartaoNFC, Colaborador
+
+LOTE = 1000
+
+# ordem de gravação: cartões dependem dos colaboradores
+TIPOS = ("colaboradores", "cartoes", "ferramentas")
+
+_VERDADEIROS = {"1", "true", "t", "sim", "s", "yes", "y", "x"}
+_FALSOS = {"0", "false", "f", "nao", "não", "n", "no"}
+
+
+class ErroImportacao(Exception):
+    def __init__(self, erros):
+        self.erros = erros
+        super().__init__(f"{len(erros)} erro(s) na importação")
+
+
+def ler_arquivo(conteudo, nome, tipo=None):
+    """
+    {tipo: [registros]} a partir do conteúdo (bytes ou str) do arquivo.
+    """
+    if isinstance(conteudo, bytes):
+        conteudo = conteudo.decode("utf-8-sig")
+
+    if nome.lower().endswith(".json"):
+        try:
+            dados = json.loads(conteudo)
+        except ValueError as e:
+            raise ErroImportacao([f"JSON inválido: {e}"])
+        if isinstance(dados, dict):
+            desconhecidos = set(dados) - set(TIPOS)
+            if desconhecidos:
+                raise ErroImportacao([f"Tipos desconhecidos: {', '.join(sorted(desconhecidos))}"])
+            return dados
+        registros = dados
+    else:
+        registros = list(csv.DictReader(io.StringIO(conteudo)))
+
+    if tipo not in TIPOS:
+        raise ErroImportacao([f"Informe o tipo do arquivo ({', '.join(TIPOS)})."])
+    return {tipo: registros}
+
+
+class _Validador:
+    """
+    Lê os campos de um registro acumulando os erros com a posição dele.
+    """
+
+    def __init__(self, modelo, erros):
+        self.modelo = modelo
+        self.erros = erros
+
+    def registro(self, tipo, n, dados):
+        self.onde = f"{tipo} #{n}"
+        self.dados = dados if isinstance(dados, dict) else {}
+        if not isinstance(dados, dict):
+            self.erros.append(f"{self.onde}: registro deve ser um objeto.")
+        return self
+
+    def erro(self, msg):
+        self.erros.append(f"{self.onde}: {msg}")
+
+    def texto(self, campo, obrigatorio=False):
+        valor = self.dados.get(campo)
+        valor = "" if valor is None else str(valor).strip()
+        if obrigatorio and not valor:
+            self.erro(f"'{campo}' é obrigatório.")
+        try:
+            limite = self.modelo._meta.get_field(campo).max_length
+        except FieldDoesNotExist:
+            limite = None   # ex.: matrícula do cartão, conferida à parte
+        if limite and len(valor) > limite:
+            self.erro(f"'{campo}' passa de {limite} caracteres.")
+        return valor
+
+    def inteiro(self, campo, padrao=None, maximo=32767):
+        valor = self.dados.get(campo)
+        if valor in (None, ""):
+            if padrao is None:
+                self.erro(f"'{campo}' é obrigatório.")
+            return padrao
+        try:
+            valor = int(valor)
+        except (TypeError, ValueError):
+            self.erro(f"'{campo}' deve ser um número inteiro.")
+            return padrao
+        if not 0 <= valor <= maximo:
+            self.erro(f"'{campo}' fora do intervalo 0..{maximo}.")
+        return valor
+
+    def booleano(self, campo, padrao=True):
+        valor = self.dados.get(campo)
+        if valor in (None, ""):
+            return padrao
+        if isinstance(valor, bool):
+            return valor
+        texto = str(valor).strip().lower()
+        if texto in _VERDADEIROS:
+            return True
+        if texto in _FALSOS:
+            return False
+        self.erro(f"'{campo}' deve ser verdadeiro/falso.")
+        return padrao
+
+
+def _aplicar(obj, valores, agora):
+    """
+    Copia `valores` para `obj`; retorna {campo: [antes, depois]} do que mudou.
+    """
+    mudou = {}
+    for campo, novo in valores.items():
+        antigo = getattr(obj, campo)
+        if antigo != novo:
+            mudou[campo] = [antigo, novo]
+            setattr(obj, campo, novo)
+    if mudou:
+        obj.atualizado_em = agora
+    return mudou
+
+
+def _plano():
+    return {"criar": [], "atualizar": [], "campos": set(), "diff": {"criar": [], "atualizar": [], "inalterados": 0}}
+
+
+def _registrar(plano, chave, obj, existente, mudou):
+    if existente is None:
+        plano["criar"].append(obj)
+        plano["diff"]["criar"].append(chave)
+    elif mudou:
+        plano["atualizar"].append(obj)
+        plano["campos"].update(mudou)
+        plano["diff"]["atualizar"].append({"chave": chave, "campos": mudou})
+    else:
+        plano["diff"]["inalterados"] += 1
+
+
+def _planejar_colaboradores(registros, erros, agora):
+    plano = _plano()
+    existentes = {c.matricula: c for c in Colaborador.objects.all()}
+    vistos = set()
+    v = _Validador(Colaborador, erros)
+
+    for n, dados in enumerate(registros, start=1):
+        v.registro("colaboradores", n, dados)
+        matricula = v.texto("matricula", obrigatorio=True)
+        valores = {
+            "nome": v.texto("nome", obrigatorio=True),
+            "email": v.texto("email") or None,
+            "ativo": v.booleano("ativo"),
+        }
+        if matricula in vistos:
+            v.erro(f"matrícula {matricula} repetida no arquivo.")
+        vistos.add(matricula)
+
+        existente = existentes.get(matricula)
+        obj = existente or Colaborador(matricula=matricula, **valores)
+        mudou = _aplicar(existente, valores, agora) if existente else None
+        _registrar(plano, matricula, obj, existente, mudou)
+
+    plano["matriculas"] = set(existentes) | vistos
+    return plano
+
+
+def _planejar_cartoes(registros, erros, agora, matriculas):
+    plano = _plano()
+    existentes = {c.uid: c for c in CartaoNFC.objects.select_related("colaborador")}
+    vistos = set()
+    v = _Validador(CartaoNFC, erros)
+    plano["matricula_de"] = {}
+
+    for n, dados in enumerate(registros, start=1):
+        v.registro("cartoes", n, dados)
+        uid = v.texto("uid", obrigatorio=True)
+        matricula = v.texto("matricula", obrigatorio=True)
+        if matricula and matricula not in matriculas:
+            v.erro(f"colaborador de matrícula {matricula} não existe.")
+        valores = {
+            "apelido": v.texto("apelido"),
+            "ativo": v.booleano("ativo"),
+        }
+        if uid in vistos:
+            v.erro(f"UID {uid} repetido no arquivo.")
+        vistos.add(uid)
+
+        existente = existentes.get(uid)
+        if existente is None:
+            obj = CartaoNFC(uid=uid, **valores)
+            mudou = None
+        else:
+            obj = existente
+            mudou = _aplicar(existente, valores, agora)
+            if existente.colaborador.matricula != matricula:
+                mudou["colaborador"] = [existente.colaborador.matricula, matricula]
+                existente.atualizado_em = agora
+        plano["matricula_de"][uid] = matricula
+        _registrar(plano, uid, obj, existente, mudou)
+
+    if "colaborador" in plano["campos"]:
+        plano["campos"].discard("colaborador")
+        plano["campos"].add("colaborador_id")
+    return plano
+
+
+def _planejar_ferramentas(registros, erros, agora):
+    plano = _plano()
+    gavetas = {(g.caixa.reader_id, g.numero): g for g in Gaveta.objects.select_related("caixa")}
+    existentes = {(f.gaveta_id, f.posicao): f for f in Ferramenta.objects.all()}
+    vistos = set()
+    v = _Validador(Ferramenta, erros)
+
+    for n, dados in enumerate(registros, start=1):
+        v.registro("ferramentas", n, dados)
+        caixa = v.texto("caixa")
+        numero = v.inteiro("gaveta")
+        posicao = v.inteiro("posicao")
+        valores = {
+            "nome": v.texto("nome", obrigatorio=True),
+            "codigo": v.texto("codigo"),
+            "descricao": v.texto("descricao"),
+            "quantidade": v.inteiro("quantidade", padrao=1, maximo=2**31 - 1),
+            "ativa": v.booleano("ativa"),
+        }
+
+        gaveta = gavetas.get((caixa or caixas.leitor_padrao(), numero))
+        if numero is not None and gaveta is None:
+            v.erro(f"gaveta {numero} não existe" + (f" na caixa {caixa}." if caixa else "."))
+            continue
+        if gaveta is None or posicao is None:
+            continue
+        if (gaveta.id, posicao) in vistos:
+            v.erro(f"posição {posicao} da gaveta {numero} repetida no arquivo.")
+        vistos.add((gaveta.id, posicao))
+
+        existente = existentes.get((gaveta.id, posicao))
+        obj = existente or Ferramenta(gaveta=gaveta, posicao=posicao, **valores)
+        mudou = _aplicar(existente, valores, agora) if existente else None
+        _registrar(plano, f"gaveta {numero} / posição {posicao}", obj, existente, mudou)
+
+    return plano
+
+
+def _gravar(modelo, plano):
+    modelo.objects.bulk_create(plano["criar"], batch_size=LOTE)
+    if plano["atualizar"]:
+        modelo.objects.bulk_update(
+            plano["atualizar"],
+            sorted(plano["campos"] | {"atualizado_em"}),
+            batch_size=LOTE,
+        )
+
+
+def importar(dados, simular=False):
+    """
+    Importa {tipo: [registros]}. Retorna o diff por tipo:
+    {"criar": [chaves], "atualizar": [{"chave", "campos"}], "inalterados": n}.
+    Levanta ErroImportacao (sem gravar nada) se algum registro for inválido.
+    """
+    erros = []
+    agora = timezone.now()
+    planos = {}
+
+    for tipo in TIPOS:
+        registros = dados.get(tipo)
+        if registros is None:
+            continue
+        if not isinstance(registros, list):
+            erros.append(f"{tipo}: esperava uma lista de registros.")
+            continue
+        if tipo == "colaboradores":
+            planos[tipo] = _planejar_colaboradores(registros, erros, agora)
+        elif tipo == "cartoes":
+            matriculas = (
+                planos["colaboradores"]["matriculas"] if "colaboradores" in planos
+                else set(Colaborador.objects.values_list("matricula", flat=True))
+            )
+            planos[tipo] = _planejar_cartoes(registros, erros, agora, matriculas)
+        else:
+            planos[tipo] = _planejar_ferramentas(registros, erros, agora)
+
+    if erros:
+        raise ErroImportacao(erros)
+
+    diff = {tipo: plano["diff"] for tipo, plano in planos.items()}
+    if simular:
+        return diff
+
+    with transaction.atomic():
+        if "colaboradores" in planos:
+            _gravar(Colaborador, planos["colaboradores"])
+
+        if "cartoes" in planos:
+            plano = planos["cartoes"]
+            # ids relidos: nem todo banco devolve o pk no bulk_create
+            ids = dict(
+                Colaborador.objects
+                .filter(matricula__in=set(plano["matricula_de"].values()))
+                .values_list("matricula", "id")
+            )
+            for cartao in plano["criar"] + plano["atualizar"]:
+                cartao.colaborador_id = ids[plano["matricula_de"][cartao.uid]]
+            _gravar(CartaoNFC, plano)
+
+        if "ferramentas" in planos:
+            _gravar(Ferramenta, planos["ferramentas"])
+
+        transaction.on_commit(autorizacao.invalidar)
+        transaction.on_commit(catalogo.invalidar)
+
+    return diff
+
+
+def resumo_diff(diff):
+    """
+    Uma linha por tipo: "tipo: N novo(s), N alterado(s), N sem mudança".
+    """
+    return [
+        f"{tipo}: {len(d['criar'])} novo(s), {len(d['atualizar'])} alterado(s), "
+        f"{d['inalterados']} sem mudança"
+        for tipo, d in diff.items()
+    ]
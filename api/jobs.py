@@ -0,0 +1,178 @@
+# api/jobs.py
+"""
+Fila de confirmações de gaveta no banco (JobConfirmacao), consumida pelo
+worker dedicado:
+
+    python manage.py worker_confirmacoes
+
+Cada job roda o mesmo pipeline da view síncrona (api/confirmacao.py).
+Qualquer falha no pipeline (captura, visão, MQTT, disco, banco) volta o
+job para a fila com backoff exponencial; esgotadas as tentativas, o job
+falha e a gaveta é devolvida ao colaborador (etapa V -> G).
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from caixa import rastreio
+from operacoes import fluxo
+from operacoes.models import SessaoUso
+
+from .confirmacao import Cronometro, FalhaCaptura, executar_confirmacao
+from .models import JobConfirmacao
+
+logger = logging.getLogger(__name__)
+
+BACKOFF_BASE_S = 2
+
+
+def enfileirar_confirmacao(sessao, tipo, gaveta_numero):
+    """
+    Cria o job. Deve ser chamada na mesma transação que reservou a gaveta
+    (fluxo.iniciar_confirmacao).
+    """
+    return JobConfirmacao.objects.create(
+        sessao=sessao,
+        tipo=tipo,
+        gaveta_numero=gaveta_numero,
+        max_tentativas=getattr(settings, "CONFIRMACAO_MAX_TENTATIVAS", 3),
+        disponivel_em=timezone.now(),
+    )
+
+
+def _pegar_proximo():
+    """
+    Tira o próximo job disponível da fila. skip_locked deixa vários
+    workers consumirem a fila sem pegar o mesmo job.
+    """
+    with transaction.atomic():
+        job = (
+            JobConfirmacao.objects
+            .select_for_update(skip_locked=True)
+            .filter(status="P", disponivel_em__lte=timezone.now())
+            .order_by("disponivel_em", "id")
+            .first()
+        )
+        if job is None:
+            return None
+
+        job.status = "E"
+        job.tentativas += 1
+        job.iniciado_em = timezone.now()
+        job.save(update_fields=["status", "tentativas", "iniciado_em"])
+    return job
+
+
+def executar_job(job):
+    """
+    Roda o pipeline de um job já marcado como "E" e grava o resultado.
+    """
+    cron = Cronometro()
+    trace_id = (
+        SessaoUso.objects.filter(id=job.sessao_id).values_list("trace_id", flat=True).first()
+        or None
+    )
+    with rastreio.span("job.confirmacao", trace_id=trace_id, job_id=job.id, sessao_id=job.sessao_id):
+        return _executar_job(job, cron)
+
+
+def _executar_job(job, cron):
+    try:
+        sessao, movs = fluxo.carregar_confirmacao(job.sessao_id, job.tipo, job.gaveta_numero)
+        with cron.etapa("total"):
+            resultado = executar_confirmacao(sessao, movs, cron)
+    except (fluxo.TransicaoInvalida, SessaoUso.DoesNotExist) as e:
+        # a sessão mudou de etapa (expirou, foi cancelada...): não adianta repetir
+        job.status = "F"
+        job.resposta_status = getattr(e, "status", 404)
+        job.erro = str(e)
+        job.resultado = {"detail": str(e)}
+    except Exception as e:
+        # captura, visão, MQTT, disco ou banco: o job não pode ficar em "E"
+        # nem a sessão presa em V
+        if not isinstance(e, FalhaCaptura):
+            logger.exception("Job %s: erro no pipeline de confirmação.", job.id)
+        job.tempos = cron.tempos
+        job.erro = str(e)
+
+        if job.tentativas < job.max_tentativas:
+            espera = BACKOFF_BASE_S ** job.tentativas
+            job.status = "P"
+            job.disponivel_em = timezone.now() + timedelta(seconds=espera)
+            logger.warning(
+                "Job %s: falha na tentativa %s/%s (%s); nova tentativa em %ss.",
+                job.id, job.tentativas, job.max_tentativas, e, espera,
+            )
+            job.save(update_fields=["status", "disponivel_em", "erro", "tempos"])
+            return job
+
+        # esgotou: libera a gaveta para o colaborador tentar de novo
+        fluxo.abortar_confirmacao(job.sessao_id)
+        job.status = "F"
+        job.resposta_status = 500
+        job.resultado = {
+            "detail": (
+                "Erro ao capturar/processar imagem da gaveta."
+                if isinstance(e, FalhaCaptura) else
+                "Erro ao confirmar a gaveta."
+            ),
+            "error": str(e),
+        }
+    else:
+        job.status = "C"
+        job.resposta_status = 200
+        job.resultado = resultado
+        job.erro = ""
+
+    job.tempos = cron.tempos
+    job.concluido_em = timezone.now()
+    job.save(update_fields=[
+        "status", "resposta_status", "resultado", "erro", "tempos", "concluido_em",
+    ])
+    logger.info("Job %s terminou com status %s em %s.", job.id, job.status, job.tempos)
+    return job
+
+
+def processar_proximo_job():
+    """
+    Pega e executa um job. Retorna o job processado ou None se a fila
+    estiver vazia.
+    """
+    job = _pegar_proximo()
+    if job is None:
+        return None
+    return executar_job(job)
+
+
+def recuperar_jobs_travados(limite_s=300):
+    """
+    Jobs "executando" há mais de limite_s segundos (worker que morreu no
+    meio) voltam para a fila. Os que já gastaram todas as tentativas (o
+    job pode ser o que derruba o worker) falham e a gaveta é devolvida ao
+    colaborador. Retorna quantos foram recuperados (os dois casos).
+    """
+    agora = timezone.now()
+    travados = JobConfirmacao.objects.filter(status="E", iniciado_em__lt=agora - timedelta(seconds=limite_s))
+
+    esgotados = list(travados.filter(tentativas__gte=F("max_tentativas")))
+    for job in esgotados:
+        fluxo.abortar_confirmacao(job.sessao_id)
+        job.status = "F"
+        job.resposta_status = 500
+        job.erro = job.erro or "Worker interrompido durante a confirmação."
+        job.resultado = {"detail": "Erro ao confirmar a gaveta.", "error": job.erro}
+        job.concluido_em = agora
+        job.save(update_fields=["status", "resposta_status", "erro", "resultado", "concluido_em"])
+        logger.warning("Job %s travado sem tentativas restantes: falhou.", job.id)
+
+    reenfileirados = (
+        travados
+        .filter(tentativas__lt=F("max_tentativas"))
+        .update(status="P", disponivel_em=agora)
+    )
+    return len(esgotados) + reenfileirados
@@ -0,0 +1,55 @@
+# api/management/commands/benchmark_api.py
+"""
+Benchmark concorrente da API/telas com hardware simulado (api/benchmark.py).
+
+    python manage.py benchmark_api --workers 8 --ciclos 20 -o bench.json
+    python manage.py benchmark_api --latencia-hardware-ms 150
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import benchmark
+
+
+class Command(BaseCommand):
+    help = "Mede vazão, latência (p50/p99) e consultas por endpoint sob carga concorrente."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Sessões simultâneas (padrão: 4).")
+        parser.add_argument("--ciclos", type=int, default=10, help="Retirada+devolução por worker.")
+        parser.add_argument(
+            "--latencia-hardware-ms",
+            type=float,
+            default=0,
+            help="Espera simulada de cada comando MQTT/captura/visão.",
+        )
+        parser.add_argument("--semente", type=int)
+        parser.add_argument("--reader-id", help="Leitor da caixa usada (padrão: READER_ID).")
+        parser.add_argument("-o", "--saida", help="Grava o relatório JSON neste arquivo.")
+
+    def handle(self, *args, **options):
+        if options["workers"] < 1 or options["ciclos"] < 1:
+            raise CommandError("--workers e --ciclos precisam ser >= 1.")
+        try:
+            relatorio = benchmark.rodar(
+                workers=options["workers"],
+                ciclos=options["ciclos"],
+                latencia_hardware_ms=options["latencia_hardware_ms"],
+                semente=options["semente"],
+                reader_id=options["reader_id"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e)) from e
+
+        texto = json.dumps(relatorio, ensure_ascii=False, indent=2)
+        if options["saida"]:
+            with open(options["saida"], "w", encoding="utf-8") as f:
+                f.write(texto + "\n")
+            self.stdout.write(
+                f"{relatorio['requisicoes']} requisições em {relatorio['duracao_s']} s "
+                f"({relatorio['rps']} req/s, {relatorio['erros']} erro(s)) -> {options['saida']}"
+            )
+        else:
+            self.stdout.write(texto)
@@ -0,0 +1,73 @@
+# api/management/commands/coletor_rastros.py
+"""
+Coletor local de spans (caixa/rastreio.py): recebe OTLP/HTTP JSON em
+POST /v1/traces, como um coletor OpenTelemetry, e grava cada span numa
+linha do JSONL, no mesmo formato de RASTREIO_JSONL.
+
+    python manage.py coletor_rastros                       # 127.0.0.1:4318
+    python manage.py coletor_rastros --porta 4318 -o /var/log/caixa/rastros.jsonl
+
+No Django: RASTREIO_OTLP_URL=http://127.0.0.1:4318/v1/traces
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+from caixa import rastreio
+
+
+class Command(BaseCommand):
+    help = "Recebe spans OTLP/HTTP JSON e grava em um arquivo JSONL."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--porta", type=int, default=4318)
+        parser.add_argument(
+            "-o", "--saida",
+            default="rastros.jsonl",
+            help="Arquivo JSONL de saída (padrão: rastros.jsonl).",
+        )
+
+    def handle(self, *args, **options):
+        saida = options["saida"]
+        lock = threading.Lock()
+        stdout = self.stdout
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path.rstrip("/") != "/v1/traces":
+                    self.send_error(404)
+                    return
+                try:
+                    tamanho = int(self.headers.get("Content-Length") or 0)
+                    spans = rastreio.de_otlp(json.loads(self.rfile.read(tamanho)))
+                except (ValueError, KeyError, TypeError) as e:
+                    self.send_error(400, str(e))
+                    return
+
+                with lock, open(saida, "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(s, ensure_ascii=False) + "\n" for s in spans)
+
+                corpo = b"{}"
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def log_message(self, formato, *args):
+                pass
+
+        servidor = ThreadingHTTPServer((options["host"], options["porta"]), Handler)
+        stdout.write(
+            f"[RASTROS] Recebendo em http://{options['host']}:{options['porta']}/v1/traces -> {saida}"
+        )
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.server_close()
@@ -0,0 +1,42 @@
+# api/management/commands/exportar_evidencias.py
+"""
+Grava o pacote de evidências (api/evidencias.py) de uma sessão ou de um
+período num arquivo ZIP, em streaming.
+
+    python manage.py exportar_evidencias --sessao 42 -o sessao42.zip
+    python manage.py exportar_evidencias --desde 2025-03-01 --ate 2025-04-01 -o marco.zip
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date, parse_datetime
+
+from api.evidencias import gerar_zip, sessoes
+
+
+def _data(valor):
+    data = parse_datetime(valor) or parse_date(valor)
+    if data is None:
+        raise CommandError(f"Data inválida: {valor}")
+    return data
+
+
+class Command(BaseCommand):
+    help = "Gera um ZIP com as imagens, o JSON da visão e o manifesto das sessões pedidas."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sessao", type=int, help="Id da sessão.")
+        parser.add_argument("--desde", type=_data, help="Início do período (data ISO).")
+        parser.add_argument("--ate", type=_data, help="Fim do período, exclusivo (data ISO).")
+        parser.add_argument("-o", "--saida", required=True, help="Arquivo ZIP de saída.")
+
+    def handle(self, *args, **options):
+        if options["sessao"] is None and not (options["desde"] or options["ate"]):
+            raise CommandError("Informe --sessao ou um período (--desde/--ate).")
+
+        total = 0
+        with open(options["saida"], "wb") as f:
+            for pedaco in gerar_zip(sessoes(options["sessao"], options["desde"], options["ate"])):
+                f.write(pedaco)
+                total += len(pedaco)
+
+        self.stdout.write(f"[EVIDENCIAS] {options['saida']}: {total} bytes")
@@ -0,0 +1,53 @@
+# api/management/commands/importar_cadastros.py
+"""
+Importa colaboradores, cartões NFC e ferramentas em lote (api/importacao.py).
+
+    python manage.py importar_cadastros cadastros.json
+    python manage.py importar_cadastros ferramentas.csv --tipo ferramentas --simular
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.importacao import TIPOS, ErroImportacao, importar, ler_arquivo, resumo_diff
+
+
+class Command(BaseCommand):
+    help = "Importa Colaborador/CartaoNFC/Ferramenta de um CSV ou JSON, validando tudo antes de gravar."
+
+    def add_arguments(self, parser):
+        parser.add_argument("arquivo", help="Arquivo .csv ou .json.")
+        parser.add_argument(
+            "--tipo",
+            choices=TIPOS,
+            help="Tipo dos registros (obrigatório para CSV e para JSON em lista).",
+        )
+        parser.add_argument(
+            "--simular",
+            action="store_true",
+            help="Só mostra o que mudaria, sem gravar.",
+        )
+        parser.add_argument(
+            "--diff",
+            action="store_true",
+            help="Mostra o diff completo (JSON) em vez do resumo.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["arquivo"], "rb") as f:
+                dados = ler_arquivo(f.read(), options["arquivo"], options["tipo"])
+            diff = importar(dados, simular=options["simular"])
+        except OSError as e:
+            raise CommandError(str(e))
+        except ErroImportacao as e:
+            for erro in e.erros:
+                self.stderr.write(erro)
+            raise CommandError(f"{e}; nada foi gravado.")
+
+        prefixo = "[IMPORTACAO] (simulação) " if options["simular"] else "[IMPORTACAO] "
+        if options["diff"]:
+            self.stdout.write(json.dumps(diff, ensure_ascii=False, indent=2, default=str))
+        for linha in resumo_diff(diff):
+            self.stdout.write(prefixo + linha)
@@ -0,0 +1,54 @@
+# api/management/commands/perfis.py
+"""
+Lista e apaga os perfis de requisição gravados em PERFIL_DIR
+(caixa/perfil.py).
+
+    python manage.py perfis                     # lista
+    python manage.py perfis --dias 7 --apagar   # apaga os de mais de 7 dias
+    python manage.py perfis --manter 20 --apagar
+"""
+
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from caixa import perfil
+
+
+class Command(BaseCommand):
+    help = "Lista e apaga perfis de requisição gravados."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dias", type=float, help="Seleciona os perfis mais velhos que isso.")
+        parser.add_argument("--manter", type=int, help="Seleciona todos menos os N mais novos.")
+        parser.add_argument("--apagar", action="store_true", help="Apaga os selecionados.")
+
+    def handle(self, *args, **options):
+        if options["apagar"] and options["manter"] is None and options["dias"] is None:
+            raise CommandError("Use --dias e/ou --manter com --apagar.")
+
+        selecionados = perfil.listar()
+        if options["manter"] is not None:
+            if options["manter"] < 0:
+                raise CommandError("--manter precisa ser >= 0.")
+            selecionados = selecionados[options["manter"]:]
+        if options["dias"] is not None:
+            corte = time.time() - options["dias"] * 86400
+            selecionados = [p for p in selecionados if p["modificado_em"] < corte]
+
+        if options["apagar"]:
+            for p in selecionados:
+                perfil.apagar(p["nome"])
+            self.stdout.write(f"{len(selecionados)} perfil(is) apagado(s) de {perfil.diretorio()}.")
+            return
+
+        for p in selecionados:
+            criado = datetime.fromtimestamp(p["modificado_em"]).strftime("%Y-%m-%d %H:%M:%S")
+            sessao = p.get("sessao_id")
+            self.stdout.write(
+                f"{criado}  {p.get('duracao_ms', 0):>9.1f} ms  {p.get('status', '')}  "
+                f"{p.get('metodo', '')} {p.get('caminho', '')}"
+                f"{f'  sessão {sessao}' if sessao is not None else ''}  {p['nome']}"
+            )
+        self.stdout.write(f"{len(selecionados)} perfil(is) em {perfil.diretorio()}.")
@@ -0,0 +1,53 @@
+# api/management/commands/ver_rastro.py
+"""
+Mostra a cascata de um trace (caixa/rastreio.py) a partir do JSONL.
+
+    python manage.py ver_rastro <trace_id>
+    python manage.py ver_rastro --sessao 123 -a rastros.jsonl
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from caixa import rastreio
+from operacoes.models import SessaoUso
+
+
+class Command(BaseCommand):
+    help = "Mostra os spans de um trace como cascata."
+
+    def add_arguments(self, parser):
+        parser.add_argument("trace_id", nargs="?")
+        parser.add_argument("--sessao", type=int, help="Usa o trace da sessão.")
+        parser.add_argument(
+            "-a", "--arquivo",
+            help="JSONL com os spans (padrão: RASTREIO_JSONL).",
+        )
+        parser.add_argument("--largura", type=int, default=40)
+
+    def handle(self, *args, **options):
+        trace_id = options["trace_id"]
+        if options["sessao"] is not None:
+            trace_id = (
+                SessaoUso.objects.filter(id=options["sessao"])
+                .values_list("trace_id", flat=True).first()
+            )
+            if not trace_id:
+                raise CommandError(f"Sessão {options['sessao']} sem trace registrado.")
+        if not trace_id:
+            raise CommandError("Informe o trace_id ou --sessao.")
+
+        arquivo = options["arquivo"] or getattr(settings, "RASTREIO_JSONL", "")
+        if not arquivo:
+            raise CommandError("Informe -a/--arquivo (RASTREIO_JSONL está vazio).")
+
+        try:
+            spans = rastreio.ler_spans(arquivo, trace_id)
+        except OSError as e:
+            raise CommandError(str(e)) from e
+        if not spans:
+            raise CommandError(f"Nenhum span do trace {trace_id} em {arquivo}.")
+
+        self.stdout.write(f"trace {trace_id}: {len(spans)} span(s)")
+        for linha in rastreio.cascata(spans, options["largura"]):
+            self.stdout.write(linha)
@@ -0,0 +1,76 @@
+# api/management/commands/worker_confirmacoes.py
+"""
+Worker que consome a fila de confirmações de gaveta (JobConfirmacao).
+
+    python manage.py worker_confirmacoes
+    python manage.py worker_confirmacoes --uma-vez   # esvazia a fila e sai
+"""
+
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.jobs import processar_proximo_job, recuperar_jobs_travados
+from caixa import metricas
+
+logger = logging.getLogger(__name__)
+
+# de quanto em quanto tempo o worker procura jobs de outro worker que morreu
+RECUPERAR_A_CADA_S = 60
+
+
+class Command(BaseCommand):
+    help = "Executa os jobs de confirmação de gaveta enfileirados pela API."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--intervalo",
+            type=float,
+            default=0.5,
+            help="Segundos de espera quando a fila está vazia (padrão: 0.5).",
+        )
+        parser.add_argument(
+            "--uma-vez",
+            action="store_true",
+            help="Processa os jobs disponíveis e termina.",
+        )
+
+    def handle(self, *args, **options):
+        metricas.servir()
+        recuperados = recuperar_jobs_travados()
+        if recuperados:
+            self.stdout.write(f"[WORKER] {recuperados} job(s) travado(s) devolvido(s) à fila.")
+
+        self.stdout.write("[WORKER] Aguardando jobs de confirmação...")
+        ultima_recuperacao = time.monotonic()
+
+        while True:
+            close_old_connections()
+            try:
+                if time.monotonic() - ultima_recuperacao >= RECUPERAR_A_CADA_S:
+                    ultima_recuperacao = time.monotonic()
+                    recuperar_jobs_travados()
+                job = processar_proximo_job()
+            except Exception:
+                # banco fora do ar, por exemplo: o worker não morre; um job que
+                # ficou em "E" volta para a fila pelo recuperar_jobs_travados
+                logger.exception("Erro ao processar a fila de confirmações.")
+                if options["uma_vez"]:
+                    raise
+                time.sleep(options["intervalo"])
+                continue
+            metricas.descarregar()
+
+            if job is not None:
+                self.stdout.write(
+                    f"[WORKER] Job #{job.id} ({job.get_status_display()}) "
+                    f"tentativa {job.tentativas}/{job.max_tentativas} tempos={job.tempos}"
+                )
+                continue
+
+            if options["uma_vez"]:
+                break
+
+            time.sleep(options["intervalo"])
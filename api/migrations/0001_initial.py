@@ -0,0 +1,34 @@
+# Generated by Django 5.1.15 on 2026-10-19 16:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChaveIdempotencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chave', models.CharField(max_length=100)),
+                ('rota', models.CharField(help_text='Caminho da requisição (a chave vale por endpoint)', max_length=255)),
+                ('hash_corpo', models.CharField(help_text='SHA-256 do corpo; a mesma chave com outro corpo é recusada', max_length=64)),
+                ('status', models.CharField(choices=[('P', 'Em processamento'), ('C', 'Concluída')], default='P', max_length=1)),
+                ('resposta_status', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('resposta_tipo', models.CharField(blank=True, max_length=100)),
+                ('resposta_corpo', models.BinaryField(blank=True, default=b'')),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('expira_em', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Chave de idempotência',
+                'verbose_name_plural': 'Chaves de idempotência',
+                'unique_together': {('chave', 'rota')},
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.15 on 2026-10-19 16:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+        ('operacoes', '0002_sessaouso_fluxo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobConfirmacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('R', 'Retirada'), ('D', 'Devolução')], max_length=1)),
+                ('gaveta_numero', models.PositiveSmallIntegerField()),
+                ('status', models.CharField(choices=[('P', 'Na fila'), ('E', 'Executando'), ('C', 'Concluído'), ('F', 'Falhou')], default='P', max_length=1)),
+                ('tentativas', models.PositiveSmallIntegerField(default=0)),
+                ('max_tentativas', models.PositiveSmallIntegerField(default=3)),
+                ('disponivel_em', models.DateTimeField(help_text='O worker só pega o job a partir deste instante (backoff entre tentativas)')),
+                ('erro', models.TextField(blank=True)),
+                ('resposta_status', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('resultado', models.JSONField(blank=True, null=True)),
+                ('tempos', models.JSONField(blank=True, default=dict)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True)),
+                ('concluido_em', models.DateTimeField(blank=True, null=True)),
+                ('sessao', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs_confirmacao', to='operacoes.sessaouso')),
+            ],
+            options={
+                'verbose_name': 'Job de confirmação',
+                'verbose_name_plural': 'Jobs de confirmação',
+                'indexes': [models.Index(fields=['status', 'disponivel_em'], name='api_jobconf_status_5e41b1_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.15 on 2026-10-19 17:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_jobconfirmacao'),
+        ('operacoes', '0007_historico_keyset_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TempoEtapa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('operacao', models.CharField(choices=[('R', 'Retirada'), ('D', 'Devolução')], max_length=1)),
+                ('gaveta_numero', models.PositiveSmallIntegerField()),
+                ('etapa', models.CharField(help_text='Nome da etapa; subetapas usam ponto (ex.: captura.camera_warmup)', max_length=50)),
+                ('duracao_ms', models.FloatField()),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('sessao', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='tempos_etapas', to='operacoes.sessaouso')),
+            ],
+            options={
+                'verbose_name': 'Tempo de etapa',
+                'verbose_name_plural': 'Tempos de etapa',
+                'indexes': [models.Index(fields=['criado_em', 'etapa'], name='api_tempoet_criado__76c2c6_idx')],
+            },
+        ),
+    ]
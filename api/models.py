@@ -1,3 +1,160 @@
 from django.db import models
 
-# Create your models here.
+
+class ChaveIdempotencia(models.Model):
+    """
+    Resposta guardada para um POST enviado com o header Idempotency-Key.
+    Reenvios com a mesma chave (ex.: retry do navegador do quiosque)
+    recebem esta resposta em vez de repetir captura, visão e MQTT.
+    """
+    STATUS_CHOICES = [
+        ("P", "Em processamento"),
+        ("C", "Concluída"),
+    ]
+
+    chave = models.CharField(max_length=100)
+    rota = models.CharField(
+        max_length=255,
+        help_text="Caminho da requisição (a chave vale por endpoint)"
+    )
+    hash_corpo = models.CharField(
+        max_length=64,
+        help_text="SHA-256 do corpo; a mesma chave com outro corpo é recusada"
+    )
+
+    status = models.CharField(
+        max_length=1,
+        choices=STATUS_CHOICES,
+        default="P"
+    )
+    resposta_status = models.PositiveSmallIntegerField(blank=True, null=True)
+    resposta_tipo = models.CharField(max_length=100, blank=True)
+    resposta_corpo = models.BinaryField(blank=True, default=b"")
+
+    criado_em = models.DateTimeField(auto_now_add=True)
+    expira_em = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ("chave", "rota")
+        verbose_name = "Chave de idempotência"
+        verbose_name_plural = "Chaves de idempotência"
+
+    def __str__(self):
+        return f"{self.chave} {self.rota} ({self.get_status_display()})"
+
+
+class JobConfirmacao(models.Model):
+    """
+    Confirmação de gaveta enfileirada para o worker
+    (manage.py worker_confirmacoes), quando CONFIRMACAO_ASSINCRONA=True.
+    O endpoint responde 202 com o id do job e o front consulta
+    /api/jobs/<id>/ até o job terminar.
+    """
+    STATUS_CHOICES = [
+        ("P", "Na fila"),
+        ("E", "Executando"),
+        ("C", "Concluído"),
+        ("F", "Falhou"),
+    ]
+
+    TIPO_CHOICES = [
+        ("R", "Retirada"),
+        ("D", "Devolução"),
+    ]
+
+    sessao = models.ForeignKey(
+        "operacoes.SessaoUso",
+        on_delete=models.CASCADE,
+        related_name="jobs_confirmacao"
+    )
+    tipo = models.CharField(max_length=1, choices=TIPO_CHOICES)
+    gaveta_numero = models.PositiveSmallIntegerField()
+
+    status = models.CharField(
+        max_length=1,
+        choices=STATUS_CHOICES,
+        default="P"
+    )
+
+    # Controle de novas tentativas
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    max_tentativas = models.PositiveSmallIntegerField(default=3)
+    disponivel_em = models.DateTimeField(
+        help_text="O worker só pega o job a partir deste instante (backoff entre tentativas)"
+    )
+    erro = models.TextField(blank=True)
+
+    # Resultado: mesmo corpo/status que a view síncrona devolveria
+    resposta_status = models.PositiveSmallIntegerField(blank=True, null=True)
+    resultado = models.JSONField(blank=True, null=True)
+
+    # Duração de cada etapa da última tentativa, em ms
+    tempos = models.JSONField(default=dict, blank=True)
+
+    criado_em = models.DateTimeField(auto_now_add=True)
+    iniciado_em = models.DateTimeField(blank=True, null=True)
+    concluido_em = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "disponivel_em"]),
+        ]
+        verbose_name = "Job de confirmação"
+        verbose_name_plural = "Jobs de confirmação"
+
+    def __str__(self):
+        return f"Job #{self.id} - sessão {self.sessao_id} gaveta {self.gaveta_numero} ({self.get_status_display()})"
+
+    def como_dict(self):
+        return {
+            "id": self.id,
+            "sessao_id": self.sessao_id,
+            "tipo": self.tipo,
+            "gaveta_numero": self.gaveta_numero,
+            "status": self.status,
+            "status_display": self.get_status_display(),
+            "tentativas": self.tentativas,
+            "max_tentativas": self.max_tentativas,
+            "erro": self.erro,
+            "tempos_ms": self.tempos,
+            "resposta_status": self.resposta_status,
+            "resultado": self.resultado,
+            "criado_em": self.criado_em.isoformat() if self.criado_em else None,
+            "iniciado_em": self.iniciado_em.isoformat() if self.iniciado_em else None,
+            "concluido_em": self.concluido_em.isoformat() if self.concluido_em else None,
+        }
+
+
+class TempoEtapa(models.Model):
+    """
+    Duração de uma etapa da confirmação de uma gaveta (api/confirmacao.py):
+    LED, câmera, JPEG, visão, comandos MQTT, banco. Uma linha por etapa por
+    confirmação; /api/tempos/etapas/ resume p50/p95 por etapa.
+
+    A ligação com a sessão não tem constraint no banco: os tempos ficam
+    mesmo depois que a sessão vai para o arquivo.
+    """
+    sessao = models.ForeignKey(
+        "operacoes.SessaoUso",
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="tempos_etapas"
+    )
+    operacao = models.CharField(max_length=1, choices=JobConfirmacao.TIPO_CHOICES)
+    gaveta_numero = models.PositiveSmallIntegerField()
+    etapa = models.CharField(
+        max_length=50,
+        help_text="Nome da etapa; subetapas usam ponto (ex.: captura.camera_warmup)"
+    )
+    duracao_ms = models.FloatField()
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["criado_em", "etapa"]),
+        ]
+        verbose_name = "Tempo de etapa"
+        verbose_name_plural = "Tempos de etapa"
+
+    def __str__(self):
+        return f"Sessão {self.sessao_id} gaveta {self.gaveta_numero}: {self.etapa} {self.duracao_ms} ms"
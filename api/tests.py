@@ -1,3 +1,1485 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.db import connection, transaction
+from asgiref.sync import sync_to_async
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from caixa import metricas, rastreio
+from inventario import caixas
+from inventario.models import Caixa, Gaveta, Ferramenta
+from operacoes.models import MovimentacaoArquivada, MovimentacaoFerramenta, SessaoArquivada, SessaoUso
+from operacoes import eventos, fluxo, registro, rollups, semeadura
+from usuarios import autorizacao
+from usuarios.models import Colaborador, CartaoNFC
+
+from . import benchmark, confirmacao, views_assincronas
+from .importacao import ErroImportacao, importar, ler_arquivo
+from .jobs import processar_proximo_job
+from .models import ChaveIdempotencia, JobConfirmacao, TempoEtapa
+from .views import DIMENSOES_RELATORIO
+
+
+MQTT_OK = {"ok": True}
+CAPTURA_OK = ("sessoes/1/img.jpg", {})
+
+
+def visao_detectando(*nomes):
+    return (True, {"ok": True, "raw": {"json": {"retiradas": list(nomes)}}})
+
+
+def criar_inventario(n_ferramentas, n_gavetas=3):
+    """
+    Cria gavetas e distribui n_ferramentas entre elas.
+    """
+    gavetas = [
+        Gaveta.objects.create(numero=i, nome=f"Gaveta {i}")
+        for i in range(1, n_gavetas + 1)
+    ]
+    return [
+        Ferramenta.objects.create(
+            nome=f"Ferramenta {i}",
+            gaveta=gavetas[i % n_gavetas],
+            posicao=i,
+        )
+        for i in range(n_ferramentas)
+    ]
+
+
+def criar_sessao(matricula="123"):
+    colaborador = Colaborador.objects.create(nome="Fulano", matricula=matricula)
+    cartao = CartaoNFC.objects.create(uid=f"UID{matricula}", colaborador=colaborador)
+    return SessaoUso.objects.create(
+        colaborador=colaborador,
+        cartao=cartao,
+        payload_inicial={"reader_id": "rasp-01"},
+    )
+
+
+def limpar_banco():
+    registro.limpar()
+    MovimentacaoFerramenta.objects.all().delete()
+    SessaoUso.objects.all().delete()
+    CartaoNFC.objects.all().delete()
+    Colaborador.objects.all().delete()
+    Ferramenta.objects.all().delete()
+    Gaveta.objects.all().delete()
+
+
+class HardwareSimuladoMixin:
+    """
+    Troca os comandos MQTT e a visão por mocks. A visão "paralela" roda
+    na hora em que é submetida, para os testes serem determinísticos.
+    """
+
+    def setUp(self):
+        super().setUp()
+        registro.limpar()
+        self.publish = mock.MagicMock(return_value=MQTT_OK)
+        for alvo in ("api.views.publish_run_command", "api.confirmacao.publish_run_command"):
+            patcher = mock.patch(alvo, self.publish)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        patcher = mock.patch("api.confirmacao.process_frame", return_value=visao_detectando())
+        self.visao = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch("api.confirmacao._pool_visao")
+        self.pool_visao = patcher.start()
+        self.pool_visao.submit.side_effect = lambda fn, *a, **kw: fn(*a, **kw)
+        self.addCleanup(patcher.stop)
+
+
+def post_json(client, url, body=None):
+    return client.post(
+        url,
+        data=json.dumps(body or {}),
+        content_type="application/json",
+    )
+
+
+@mock.patch("api.confirmacao.capture_frame", return_value=CAPTURA_OK)
+class EscritaEmLoteTests(HardwareSimuladoMixin, TestCase):
+    """
+    Registrar/confirmar retirada e devolução devem fazer um número
+    constante de queries, independente da quantidade de ferramentas.
+    """
+
+    def _contar_registro(self, nome_url, n_ferramentas, tipo_anterior=None):
+        limpar_banco()
+        ferramentas = criar_inventario(n_ferramentas)
+        sessao = criar_sessao()
+        if tipo_anterior:
+            MovimentacaoFerramenta.objects.bulk_create([
+                MovimentacaoFerramenta(
+                    sessao=sessao,
+                    ferramenta=f,
+                    tipo=tipo_anterior,
+                    gaveta_numero=f.gaveta.numero,
+                    confirmado_visao=True,
+                )
+                for f in ferramentas
+            ])
+
+        url = reverse(nome_url, args=[sessao.id])
+        body = {"ferramentas_ids": [f.id for f in ferramentas]}
+        with CaptureQueriesContext(connection) as ctx:
+            resp = post_json(self.client, url, body)
+
+        self.assertEqual(resp.status_code, 201, resp.content)
+        return len(ctx.captured_queries), sessao
+
+    def _contar_confirmacao(self, nome_url, tipo, n_ferramentas):
+        limpar_banco()
+        ferramentas = criar_inventario(n_ferramentas, n_gavetas=1)
+        sessao = criar_sessao()
+        fluxo.iniciar_operacao(sessao.id, tipo, ferramentas)
+
+        url = reverse(nome_url, args=[sessao.id, 1])
+        with CaptureQueriesContext(connection) as ctx:
+            resp = post_json(self.client, url)
+
+        self.assertEqual(resp.status_code, 200, resp.content)
+        return len(ctx.captured_queries), sessao
+
+    def test_registrar_retirada_queries_constantes(self, *_mocks):
+        poucas, _ = self._contar_registro("registrar_retirada", 1)
+        muitas, sessao = self._contar_registro("registrar_retirada", 30)
+
+        self.assertEqual(poucas, muitas)
+        self.assertEqual(
+            MovimentacaoFerramenta.objects.filter(sessao=sessao, tipo="R").count(),
+            30,
+        )
+
+    def test_registrar_retirada_limpa_pendentes(self, *_mocks):
+        ferramentas = criar_inventario(2)
+        sessao = criar_sessao()
+        url = reverse("registrar_retirada", args=[sessao.id])
+
+        post_json(self.client, url, {"ferramentas_ids": [ferramentas[0].id]})
+        post_json(self.client, url, {"ferramentas_ids": [ferramentas[1].id]})
+
+        pendentes = MovimentacaoFerramenta.objects.filter(
+            sessao=sessao, tipo="R", confirmado_visao=False
+        )
+        self.assertEqual(
+            list(pendentes.values_list("ferramenta_id", flat=True)),
+            [ferramentas[1].id],
+        )
+
+    def test_registrar_devolucao_queries_constantes(self, *_mocks):
+        poucas, _ = self._contar_registro("registrar_devolucao", 1, tipo_anterior="R")
+        muitas, sessao = self._contar_registro("registrar_devolucao", 30, tipo_anterior="R")
+
+        self.assertEqual(poucas, muitas)
+        self.assertEqual(
+            MovimentacaoFerramenta.objects.filter(sessao=sessao, tipo="D").count(),
+            30,
+        )
+
+    def test_confirmar_gaveta_queries_constantes(self, *_mocks):
+        for nome_url, tipo in (
+            ("confirmar_retirada_gaveta", "R"),
+            ("confirmar_devolucao_gaveta", "D"),
+        ):
+            with self.subTest(nome_url):
+                poucas, _ = self._contar_confirmacao(nome_url, tipo, 1)
+                muitas, sessao = self._contar_confirmacao(nome_url, tipo, 30)
+
+                self.assertEqual(poucas, muitas)
+                sessao.refresh_from_db()
+                self.assertEqual(sessao.status, "F")
+                self.assertIsNotNone(sessao.finalizado_em)
+                self.assertFalse(
+                    MovimentacaoFerramenta.objects.filter(confirmado_visao=False).exists()
+                )
+
+
+class FluxoConfirmacaoTests(HardwareSimuladoMixin, TestCase):
+    """
+    Confirmação gaveta a gaveta seguindo o ponteiro guardado na sessão.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.ferramentas = criar_inventario(3)   # uma ferramenta por gaveta
+        self.sessao = criar_sessao()
+        post_json(
+            self.client,
+            reverse("registrar_retirada", args=[self.sessao.id]),
+            {"ferramentas_ids": [f.id for f in self.ferramentas]},
+        )
+
+    def _confirmar(self, gaveta):
+        return post_json(
+            self.client,
+            reverse("confirmar_retirada_gaveta", args=[self.sessao.id, gaveta]),
+        )
+
+    @mock.patch("api.confirmacao.capture_frame", return_value=CAPTURA_OK)
+    def test_percorre_gavetas_em_ordem(self, *_mocks):
+        respostas = [self._confirmar(g).json() for g in (1, 2, 3)]
+
+        self.assertEqual([r["proxima_gaveta"] for r in respostas], [2, 3, None])
+        self.assertTrue(respostas[-1]["sessao_encerrada"])
+
+        self.sessao.refresh_from_db()
+        self.assertEqual((self.sessao.status, self.sessao.etapa), ("F", "X"))
+
+    @mock.patch("api.confirmacao.capture_frame", return_value=CAPTURA_OK)
+    def test_gaveta_fora_de_ordem_recusada(self, *_mocks):
+        resp = self._confirmar(2)
+        self.assertEqual(resp.status_code, 400)
+
+    @mock.patch("api.confirmacao.capture_frame", return_value=CAPTURA_OK)
+    def test_confirmacao_repetida_nao_reabre_gaveta(self, *_mocks):
+        self._confirmar(1)
+        chamadas = self.publish.call_count
+
+        resp = self._confirmar(1)
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(self.publish.call_count, chamadas)
+
+    @mock.patch("api.confirmacao.capture_frame", side_effect=RuntimeError("câmera"))
+    def test_falha_na_captura_libera_gaveta(self, *_mocks):
+        resp = self._confirmar(1)
+        self.assertEqual(resp.status_code, 500)
+
+        self.sessao.refresh_from_db()
+        self.assertEqual((self.sessao.etapa, self.sessao.gaveta_atual), ("G", 1))
+
+    @mock.patch("api.confirmacao.fluxo.concluir_confirmacao", side_effect=OSError("disco cheio"))
+    @mock.patch("api.confirmacao.capture_frame", return_value=CAPTURA_OK)
+    def test_qualquer_erro_no_pipeline_libera_gaveta(self, *_mocks):
+        resp = self._confirmar(1)
+        self.assertEqual(resp.status_code, 500)
+        self.assertEqual(resp.json()["error"], "disco cheio")
+
+        self.sessao.refresh_from_db()
+        self.assertEqual((self.sessao.etapa, self.sessao.gaveta_atual), ("G", 1))
+
+    @mock.patch("api.confirmacao.capture_frame", return_value=CAPTURA_OK)
+    def test_proxima_gaveta_abre_sem_esperar_visao(self, *_mocks):
+        self.pool_visao.submit.side_effect = None
+
+        resp = self._confirmar(1).json()
+
+        self.assertTrue(resp["visao_pendente"])
+        self.assertIsNone(resp["visao_ok"])
+        self.visao.assert_not_called()
+        aliases = [c.kwargs["alias"] for c in self.publish.call_args_list]
+        self.assertEqual(aliases[-2:], ["fechar_gaveta_1", "abrir_gaveta_2"])
+
+        # a visão termina depois e reconcilia a movimentação da gaveta 1
+        self.visao.return_value = visao_detectando(self.ferramentas[0].nome)
+        fn, *args = self.pool_visao.submit.call_args.args
+        resultado = fn(*args)
+
+        self.assertTrue(resultado["visao_ok"])
+        mov = MovimentacaoFerramenta.objects.get(sessao=self.sessao, gaveta_numero=1)
+        self.assertTrue(mov.visao_confere)
+
+    @mock.patch("api.confirmacao.capture_frame", return_value=CAPTURA_OK)
+    def test_visao_que_nao_confere_fica_registrada(self, *_mocks):
+        self.visao.return_value = visao_detectando("Outra ferramenta")
+
+        self._confirmar(1)
+
+        mov = MovimentacaoFerramenta.objects.get(sessao=self.sessao, gaveta_numero=1)
+        self.assertTrue(mov.confirmado_visao)    # o fluxo anda mesmo assim
+        self.assertIs(mov.visao_confere, False)
+
+    @mock.patch(
+        "api.confirmacao.capture_frame",
+        return_value=("sessoes/1/img.jpg", {"tempos_ms": {"camera_warmup": 120.0}}),
+    )
+    def test_tempos_por_etapa_gravados_e_resumidos(self, *_mocks):
+        resp = self._confirmar(1).json()
+
+        self.assertEqual(resp["tempos_ms"]["captura.camera_warmup"], 120.0)
+        etapas = set(
+            TempoEtapa.objects.filter(sessao=self.sessao, gaveta_numero=1).values_list("etapa", flat=True)
+        )
+        # pipeline + subetapas da câmera + visão (gravada pela thread do pool)
+        self.assertTrue({"led_on", "captura", "captura.camera_warmup", "fechar_gaveta",
+                         "banco", "abrir_proxima", "visao", "visao.banco"} <= etapas)
+
+        url = reverse("resumo_tempos_etapas")
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(User.objects.create_user("equipe", password="x", is_staff=True))
+        resumo = {e["etapa"]: e for e in self.client.get(url, {"operacao": "R"}).json()["etapas"]}
+        self.assertEqual(
+            (resumo["captura.camera_warmup"]["n"], resumo["captura.camera_warmup"]["p95_ms"]), (1, 120.0)
+        )
+
+    @override_settings(VISAO_EM_PARALELO=False)
+    @mock.patch("api.confirmacao.capture_frame", return_value=CAPTURA_OK)
+    def test_visao_sequencial_responde_com_resultado(self, *_mocks):
+        comandos_antes_da_visao = []
+
+        def visao(*_args):
+            comandos_antes_da_visao.extend(c.kwargs["alias"] for c in self.publish.call_args_list)
+            return visao_detectando(self.ferramentas[0].nome)
+
+        self.visao.side_effect = visao
+
+        resp = self._confirmar(1).json()
+
+        self.pool_visao.submit.assert_not_called()
+        # a gaveta fecha e a próxima abre sem esperar a visão
+        self.assertEqual(comandos_antes_da_visao[-2:], ["fechar_gaveta_1", "abrir_gaveta_2"])
+        self.assertFalse(resp["visao_pendente"])
+        self.assertTrue(resp["visao_ok"])
+        self.assertEqual(resp["match_visao"]["detectadas"], [self.ferramentas[0].nome])
+
+
+class IdempotenciaTests(HardwareSimuladoMixin, TestCase):
+    """
+    POSTs repetidos com a mesma Idempotency-Key não repetem o pipeline.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.ferramentas = criar_inventario(2, n_gavetas=1)
+        self.sessao = criar_sessao()
+        fluxo.iniciar_operacao(self.sessao.id, "R", self.ferramentas)
+        self.url = reverse("confirmar_retirada_gaveta", args=[self.sessao.id, 1])
+
+    def _post(self, chave, body=None):
+        return self.client.post(
+            self.url,
+            data=json.dumps(body or {}),
+            content_type="application/json",
+            HTTP_IDEMPOTENCY_KEY=chave,
+        )
+
+    @mock.patch("api.confirmacao.capture_frame", return_value=CAPTURA_OK)
+    def test_repeticao_devolve_resposta_guardada(self, capture):
+        primeira = self._post("abc")
+        segunda = self._post("abc")
+
+        self.assertEqual(primeira.status_code, 200)
+        self.assertEqual(segunda.status_code, 200)
+        self.assertEqual(segunda.content, primeira.content)
+        self.assertEqual(segunda["Idempotent-Replay"], "true")
+        self.assertEqual(capture.call_count, 1)
+
+    @mock.patch("api.confirmacao.capture_frame", return_value=CAPTURA_OK)
+    def test_mesma_chave_outro_corpo(self, _capture):
+        self._post("abc")
+        resp = self._post("abc", {"outro": 1})
+        self.assertEqual(resp.status_code, 422)
+
+    @mock.patch("api.confirmacao.capture_frame", side_effect=RuntimeError("câmera"))
+    def test_erro_5xx_nao_fica_guardado(self, capture):
+        self._post("abc")
+        self._post("abc")
+        self.assertEqual(capture.call_count, 2)
+        self.assertFalse(ChaveIdempotencia.objects.exists())
+
+    @mock.patch("api.confirmacao.capture_frame", return_value=CAPTURA_OK)
+    def test_chave_expirada_e_apagada(self, capture):
+        self._post("abc")
+        ChaveIdempotencia.objects.update(expira_em=timezone.now() - timedelta(seconds=1))
+
+        self._post("outra")
+
+        self.assertEqual(ChaveIdempotencia.objects.filter(chave="abc").count(), 0)
+
+    @override_settings(IDEMPOTENCIA_ESPERA_S=0)
+    @mock.patch("api.confirmacao.capture_frame", return_value=CAPTURA_OK)
+    def test_duplicata_em_andamento(self, capture):
+        ChaveIdempotencia.objects.create(
+            chave="abc",
+            rota=self.url,
+            hash_corpo=hashlib.sha256(b"{}").hexdigest(),
+            expira_em=timezone.now() + timedelta(minutes=1),
+        )
+
+        resp = self._post("abc")
+
+        self.assertEqual(resp.status_code, 409)
+        capture.assert_not_called()
+
+    @override_settings(IDEMPOTENCIA_ESPERA_S=1, IDEMPOTENCIA_RESERVA_S=900)
+    @mock.patch("api.confirmacao.capture_frame")
+    def test_reserva_vale_mais_que_o_pipeline(self, capture):
+        reservas = []
+
+        def capturar(*_args):
+            reservas.append(ChaveIdempotencia.objects.get(chave="abc").expira_em)
+            return CAPTURA_OK
+
+        capture.side_effect = capturar
+        self._post("abc")
+
+        # uma repetição depois do tempo de espera não apaga a reserva em voo
+        self.assertGreater(reservas[0], timezone.now() + timedelta(minutes=10))
+
+    @mock.patch("api.confirmacao.capture_frame")
+    def test_reserva_apagada_no_meio_nao_derruba_a_original(self, capture):
+        def capturar(*_args):
+            ChaveIdempotencia.objects.all().delete()
+            return CAPTURA_OK
+
+        capture.side_effect = capturar
+        resp = self._post("abc")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse(ChaveIdempotencia.objects.exists())
+
+
+@override_settings(CONFIRMACAO_ASSINCRONA=True, CONFIRMACAO_MAX_TENTATIVAS=2)
+class JobConfirmacaoTests(HardwareSimuladoMixin, TestCase):
+    """
+    Confirmação enfileirada: 202 + job, executado pelo worker.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.ferramentas = criar_inventario(2, n_gavetas=2)
+        self.sessao = criar_sessao()
+        fluxo.iniciar_operacao(self.sessao.id, "R", self.ferramentas)
+
+    def _confirmar(self, gaveta=1):
+        return post_json(
+            self.client,
+            reverse("confirmar_retirada_gaveta", args=[self.sessao.id, gaveta]),
+        )
+
+    @mock.patch("api.confirmacao.capture_frame", return_value=CAPTURA_OK)
+    def test_enfileira_e_worker_conclui(self, capture):
+        resp = self._confirmar()
+
+        self.assertEqual(resp.status_code, 202)
+        capture.assert_not_called()
+        self.publish.assert_not_called()
+
+        job = processar_proximo_job()
+
+        self.assertEqual(job.id, resp.json()["job_id"])
+        self.assertEqual((job.status, job.tentativas, job.resposta_status), ("C", 1, 200))
+        self.assertEqual(job.resultado["proxima_gaveta"], 2)
+        self.assertIn("captura", job.tempos)
+
+        status = self.client.get(resp.json()["status_url"]).json()
+        self.assertEqual(status["status"], "C")
+        self.assertEqual(status["resultado"]["redirect_url"], job.resultado["redirect_url"])
+
+        self.assertIsNone(processar_proximo_job())
+
+    @mock.patch("api.confirmacao.capture_frame", return_value=CAPTURA_OK)
+    def test_segundo_post_recusado_enquanto_na_fila(self, _capture):
+        self._confirmar()
+        resp = self._confirmar()
+
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(JobConfirmacao.objects.count(), 1)
+
+    @mock.patch("api.confirmacao.capture_frame", side_effect=RuntimeError("câmera"))
+    def test_falha_reagenda_e_depois_desiste(self, _capture):
+        self._confirmar()
+
+        job = processar_proximo_job()
+        self.assertEqual((job.status, job.tentativas), ("P", 1))
+        self.assertGreater(job.disponivel_em, timezone.now())
+        self.assertIn("câmera", job.erro)
+
+        # backoff: só fica disponível depois; antecipamos para o teste
+        JobConfirmacao.objects.update(disponivel_em=timezone.now())
+        job = processar_proximo_job()
+        self.assertEqual((job.status, job.tentativas, job.resposta_status), ("F", 2, 500))
+
+        self.sessao.refresh_from_db()
+        self.assertEqual((self.sessao.etapa, self.sessao.gaveta_atual), ("G", 1))
+
+    @mock.patch("api.confirmacao.fluxo.concluir_confirmacao", side_effect=OSError("disco cheio"))
+    @mock.patch("api.confirmacao.capture_frame", return_value=CAPTURA_OK)
+    def test_qualquer_erro_reagenda_e_libera_gaveta(self, *_mocks):
+        self._confirmar()
+
+        job = processar_proximo_job()
+        self.assertEqual((job.status, job.erro), ("P", "disco cheio"))
+
+        JobConfirmacao.objects.update(disponivel_em=timezone.now())
+        job = processar_proximo_job()
+        self.assertEqual((job.status, job.resposta_status), ("F", 500))
+        self.assertEqual(job.resultado["error"], "disco cheio")
+
+        self.sessao.refresh_from_db()
+        self.assertEqual(self.sessao.etapa, "G")
+
+    @mock.patch("api.confirmacao.capture_frame", return_value=CAPTURA_OK)
+    def test_job_travado_volta_para_a_fila(self, _capture):
+        self._confirmar()
+        JobConfirmacao.objects.update(status="E", iniciado_em=timezone.now() - timedelta(minutes=10))
+
+        call_command("worker_confirmacoes", "--uma-vez", stdout=io.StringIO())
+
+        job = JobConfirmacao.objects.get()
+        self.assertEqual((job.status, job.resposta_status), ("C", 200))
+
+    @mock.patch("api.confirmacao.capture_frame", return_value=CAPTURA_OK)
+    def test_job_travado_sem_tentativas_falha_e_libera_gaveta(self, capture):
+        self._confirmar()
+        JobConfirmacao.objects.update(
+            status="E", tentativas=2, iniciado_em=timezone.now() - timedelta(minutes=10),
+        )
+
+        call_command("worker_confirmacoes", "--uma-vez", stdout=io.StringIO())
+
+        job = JobConfirmacao.objects.get()
+        self.assertEqual((job.status, job.resposta_status), ("F", 500))
+        capture.assert_not_called()
+        self.sessao.refresh_from_db()
+        self.assertEqual(self.sessao.etapa, "G")
+
+
+class EventosSessaoTests(TestCase):
+    """
+    Canal SSE que substitui o polling do home.js.
+    """
+
+    def setUp(self):
+        registro.limpar()
+
+    def _passar_cartao(self):
+        colaborador = Colaborador.objects.create(nome="Fulano", matricula="9")
+        with self.captureOnCommitCallbacks(execute=True):
+            return fluxo.abrir_sessao(colaborador, None, {})
+
+    async def _proximo(self, stream):
+        return (await anext(stream)).decode()
+
+    @override_settings(EVENTOS_HEARTBEAT_S=0.05)
+    async def test_tap_chega_pelo_canal_sem_polling(self):
+        resp = await self.async_client.get(reverse("eventos_sessao"))
+        self.assertEqual(resp["Content-Type"], "text/event-stream")
+        stream = aiter(resp.streaming_content)
+
+        try:
+            inicial = await self._proximo(stream)
+            self.assertIn('"sessao_ativa": false', inicial)
+
+            # sem nada acontecendo: só ping, sem voltar ao banco
+            with mock.patch("api.views._status_atual") as status_atual:
+                self.assertEqual(await self._proximo(stream), ": ping\n\n")
+            status_atual.assert_not_called()
+
+            sessao = await sync_to_async(self._passar_cartao)()
+
+            evento = await self._proximo(stream)
+            while evento.startswith(":"):
+                evento = await self._proximo(stream)
+            self.assertTrue(evento.startswith("event: sessao\n"))
+            self.assertIn(f'"sessao_id": {sessao.id}', evento)
+        finally:
+            await stream.aclose()
+
+    def test_wsgi_responde_503(self):
+        resp = self.client.get(reverse("eventos_sessao"))
+        self.assertEqual(resp.status_code, 503)
+
+    def _mensagem(self, origem):
+        payload = {"origem": origem, "tipo": "gaveta", "dados": {"sessao_id": 7, "gaveta_numero": 2}}
+        return mock.Mock(topic="tcc/caixa/eventos", payload=json.dumps(payload).encode())
+
+    async def test_evento_de_outro_processo_chega_pelo_mqtt(self):
+        # ex.: gaveta confirmada pelo worker_confirmacoes
+        assinatura = eventos.assinar()
+        try:
+            eventos._on_message(None, None, self._mensagem(eventos.ORIGEM))   # eco do próprio processo
+            eventos._on_message(None, None, self._mensagem("worker"))
+
+            self.assertEqual(
+                await assinatura.proximo(1), ("gaveta", {"sessao_id": 7, "gaveta_numero": 2}),
+            )
+            self.assertIsNone(await assinatura.proximo(0.05))
+        finally:
+            eventos.cancelar(assinatura)
+
+    @override_settings(EVENTOS_MQTT=True)
+    def test_publicar_repassa_pelo_mqtt(self):
+        with mock.patch("operacoes.eventos._mqtt") as cliente:
+            eventos.publicar("gaveta", {"sessao_id": 7})
+
+        topico, mensagem = cliente.publish.call_args.args
+        self.assertEqual(topico, "tcc/caixa/eventos")
+        self.assertEqual(
+            json.loads(mensagem), {"origem": eventos.ORIGEM, "tipo": "gaveta", "dados": {"sessao_id": 7}},
+        )
+
+
+class ViewsAssincronasTests(TestCase):
+    """
+    Sessão pelo ASGI (AsyncClient): as mesmas respostas das views
+    síncronas, com MQTT, captura e visão aguardadas sem prender thread.
+    """
+
+    def setUp(self):
+        registro.limpar()
+        self.ferramentas = criar_inventario(3)   # uma ferramenta por gaveta
+        self.sessao = criar_sessao()
+
+        self.publish = mock.AsyncMock(return_value=MQTT_OK)
+        for alvo in ("api.views_assincronas.publish_run_command_async",
+                     "api.confirmacao.publish_run_command_async"):
+            patcher = mock.patch(alvo, self.publish)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        patcher = mock.patch("api.confirmacao.capture_frame_async", return_value=CAPTURA_OK)
+        self.captura = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch(
+            "api.confirmacao.process_frame_async",
+            return_value=visao_detectando(*[f.nome for f in self.ferramentas]),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def _post(self, nome, *args, body=None, **headers):
+        return await self.async_client.post(
+            reverse(nome, args=args), data=json.dumps(body or {}),
+            content_type="application/json", headers=headers,
+        )
+
+    async def _retirar_tudo(self):
+        return await self._post(
+            "registrar_retirada", self.sessao.id,
+            body={"ferramentas_ids": [f.id for f in self.ferramentas]},
+        )
+
+    async def test_retirada_completa_com_visao_em_paralelo(self):
+        resp = await self._retirar_tudo()
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.json()["primeira_gaveta"], 1)
+        self.assertEqual(self.publish.await_args.kwargs["alias"], "abrir_gaveta_1")
+
+        respostas = [
+            (await self._post("confirmar_retirada_gaveta", self.sessao.id, g)).json()
+            for g in (1, 2, 3)
+        ]
+        self.assertEqual([r["proxima_gaveta"] for r in respostas], [2, 3, None])
+        self.assertTrue(all(r["visao_pendente"] for r in respostas))
+        self.assertEqual(respostas[0]["abrir_proxima_gaveta"], MQTT_OK)
+
+        # as visões seguem em tarefas do loop depois das respostas
+        await asyncio.gather(*confirmacao._tarefas_visao)
+        movs = MovimentacaoFerramenta.objects.filter(sessao=self.sessao)
+        self.assertEqual(await movs.filter(visao_confere=True).acount(), 3)
+        sessao = await SessaoUso.objects.aget(id=self.sessao.id)
+        self.assertEqual((sessao.status, sessao.etapa), ("F", "X"))
+
+    @override_settings(VISAO_EM_PARALELO=False)
+    async def test_visao_antes_de_responder(self):
+        await self._retirar_tudo()
+
+        resp = (await self._post("confirmar_retirada_gaveta", self.sessao.id, 1)).json()
+
+        self.assertFalse(resp["visao_pendente"])
+        self.assertTrue(resp["visao_ok"])
+        self.assertIn("visao.banco", resp["tempos_ms"])
+
+    async def test_confirmacoes_de_caixas_diferentes_nao_esperam_uma_pela_outra(self):
+        outra = await sync_to_async(criar_sessao)("456")
+        for sessao, ferramenta in ((self.sessao, self.ferramentas[0]), (outra, self.ferramentas[1])):
+            await self._post("registrar_retirada", sessao.id, body={"ferramentas_ids": [ferramenta.id]})
+
+        async def captura_lenta(*args):
+            await asyncio.sleep(0.3)
+            return CAPTURA_OK
+
+        self.captura.side_effect = captura_lenta
+        inicio = time.monotonic()
+        respostas = await asyncio.gather(*[
+            self._post("confirmar_retirada_gaveta", s.id, g) for s, g in ((self.sessao, 1), (outra, 2))
+        ])
+
+        self.assertEqual([r.status_code for r in respostas], [200, 200])
+        self.assertLess(time.monotonic() - inicio, 0.55)
+
+    async def test_falha_na_captura_libera_gaveta(self):
+        await self._retirar_tudo()
+        self.captura.side_effect = RuntimeError("câmera")
+
+        resp = await self._post("confirmar_retirada_gaveta", self.sessao.id, 1)
+
+        self.assertEqual(resp.status_code, 500)
+        sessao = await SessaoUso.objects.aget(id=self.sessao.id)
+        self.assertEqual((sessao.etapa, sessao.gaveta_atual), ("G", 1))
+        self.assertEqual(self.publish.await_args.kwargs["alias"], "led_off")
+
+    async def test_qualquer_erro_libera_gaveta(self):
+        await self._retirar_tudo()
+
+        with mock.patch("api.confirmacao.fluxo.concluir_confirmacao", side_effect=OSError("disco cheio")):
+            resp = await self._post("confirmar_retirada_gaveta", self.sessao.id, 1)
+
+        self.assertEqual(resp.status_code, 500)
+        sessao = await SessaoUso.objects.aget(id=self.sessao.id)
+        self.assertEqual((sessao.etapa, sessao.gaveta_atual), ("G", 1))
+
+    async def test_requisicao_cancelada_libera_gaveta_e_chave(self):
+        await self._retirar_tudo()
+        self.captura.side_effect = asyncio.CancelledError
+        request = AsyncRequestFactory().post(
+            reverse("confirmar_retirada_gaveta", args=[self.sessao.id, 1]),
+            data="{}", content_type="application/json", headers={"Idempotency-Key": "abc"},
+        )
+
+        with self.assertRaises(asyncio.CancelledError):
+            await views_assincronas.confirmar_retirada_gaveta(request, self.sessao.id, 1)
+
+        sessao = await SessaoUso.objects.aget(id=self.sessao.id)
+        self.assertEqual((sessao.etapa, sessao.gaveta_atual), ("G", 1))
+        self.assertFalse(await ChaveIdempotencia.objects.aexists())
+
+    async def test_perfil_da_requisicao_assincrona(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        staff = await sync_to_async(User.objects.create_user)("admin", password="x", is_staff=True)
+        await self.async_client.aforce_login(staff)
+        await self._retirar_tudo()
+
+        with override_settings(PERFIL_ATIVO=True, PERFIL_DIR=diretorio.name, PERFIL_INTERVALO_MS=1):
+            resp = await self.async_client.post(
+                reverse("confirmar_retirada_gaveta", args=[self.sessao.id, 1]) + "?perfil=1"
+            )
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(resp["X-Perfil"] + ".prof", os.listdir(diretorio.name))
+
+    async def test_idempotency_key_devolve_resposta_guardada(self):
+        body = {"ferramentas_ids": [self.ferramentas[0].id]}
+        primeira = await self._post("registrar_retirada", self.sessao.id, body=body, **{"Idempotency-Key": "k1"})
+        repetida = await self._post("registrar_retirada", self.sessao.id, body=body, **{"Idempotency-Key": "k1"})
+
+        self.assertEqual(repetida["Idempotent-Replay"], "true")
+        self.assertEqual(repetida.content, primeira.content)
+        self.assertEqual(self.publish.await_count, 1)
+
+
+class ExportacaoTests(TestCase):
+    def setUp(self):
+        self.ferramentas = criar_inventario(5)
+        self.sessao = criar_sessao()
+        for f in self.ferramentas:
+            MovimentacaoFerramenta.objects.create(
+                sessao=self.sessao, ferramenta=f, tipo="R",
+                gaveta_numero=f.gaveta.numero, confirmado_visao=True,
+            )
+        self.client.force_login(User.objects.create_user("equipe", password="x", is_staff=True))
+
+    def _corpo(self, tipo, **params):
+        resp = self.client.get(reverse("exportar_historico", args=[tipo]), params)
+        self.assertTrue(resp.streaming)
+        return b"".join(resp.streaming_content).decode("utf-8")
+
+    def test_csv_percorre_todas_as_paginas(self):
+        with mock.patch("api.exportacao.PAGINA", 2):
+            with self.assertNumQueries(2 + 3):  # sessão/usuário + 3 páginas
+                linhas = self._corpo("movimentacoes").splitlines()
+
+        self.assertTrue(linhas[0].startswith("movimentacao_id,criado_em,tipo"))
+        self.assertEqual(len(linhas), 1 + 5)
+        self.assertIn("Ferramenta 4", linhas[-1])
+        self.assertIn("Fulano", linhas[-1])
+
+    def test_jsonl_com_filtros(self):
+        linhas = self._corpo("movimentacoes", formato="jsonl", gaveta=2).splitlines()
+        self.assertEqual(
+            sorted(json.loads(l)["ferramenta_nome"] for l in linhas),
+            ["Ferramenta 1", "Ferramenta 4"],
+        )
+
+        sessoes = self._corpo("sessoes", formato="jsonl", gaveta=2).splitlines()
+        self.assertEqual(json.loads(sessoes[0])["cartao_uid"], "UID123")
+        self.assertEqual(self._corpo("sessoes", formato="jsonl", gaveta=9), "")
+
+    def test_restrito_e_validado(self):
+        url = reverse("exportar_historico", args=["movimentacoes"])
+        self.assertEqual(self.client.get(url, {"formato": "xlsx"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"desde": "ontem"}).status_code, 400)
+
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+class EvidenciasTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        patcher = override_settings(MEDIA_ROOT=media.name)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+
+        ferramenta = criar_inventario(1)[0]
+        self.sessao = criar_sessao()
+        imagem = f"sessoes/{self.sessao.id}/sessao{self.sessao.id}_gaveta2.jpg"
+        MovimentacaoFerramenta.objects.create(
+            sessao=self.sessao, ferramenta=ferramenta, tipo="R", gaveta_numero=2,
+            imagem_path=imagem, confirmado_visao=True, visao_confere=True,
+        )
+
+        pasta = os.path.join(media.name, "sessoes", str(self.sessao.id))
+        os.makedirs(pasta)
+        self.jpeg = os.urandom(200 * 1024)
+        with open(os.path.join(media.name, imagem), "wb") as f:
+            f.write(self.jpeg)
+        with open(os.path.join(pasta, f"sessao{self.sessao.id}_gaveta2_saida.json"), "w") as f:
+            json.dump({"retiradas": ["Ferramenta 0"]}, f)
+        # sem *_saida.jpg: a visão não gerou a imagem anotada
+
+        self.client.force_login(User.objects.create_user("equipe", password="x", is_staff=True))
+
+    def test_zip_da_sessao_com_manifesto(self):
+        resp = self.client.get(reverse("evidencias_zip"), {"sessao_id": self.sessao.id})
+        pedacos = list(resp.streaming_content)
+        self.assertGreater(len(pedacos), 2)   # saiu aos poucos, não num bloco só
+
+        zf = zipfile.ZipFile(io.BytesIO(b"".join(pedacos)))
+        pasta = f"sessoes/{self.sessao.id}"
+        self.assertEqual(zf.read(f"{pasta}/sessao{self.sessao.id}_gaveta2.jpg"), self.jpeg)
+
+        manifesto = json.loads(zf.read(f"{pasta}/manifesto.json"))
+        arquivos = {a["tipo"]: a for a in manifesto["evidencias"][0]["arquivos"]}
+        self.assertEqual(arquivos["visao_json"]["conteudo"], {"retiradas": ["Ferramenta 0"]})
+        self.assertIsNone(arquivos["saida"]["zip"])
+        self.assertTrue(manifesto["movimentacoes"][0]["visao_confere"])
+
+        geral = json.loads(zf.read("manifesto.json"))
+        self.assertEqual((geral["arquivos"], geral["ausentes"]), (2, 1))
+
+    def test_exige_filtro(self):
+        self.assertEqual(self.client.get(reverse("evidencias_zip")).status_code, 400)
+
+
+class HistoricoTests(TestCase):
+    def setUp(self):
+        ferramentas = criar_inventario(7)
+        self.sessao = criar_sessao()
+        agora = timezone.now()
+        for i, f in enumerate(ferramentas):
+            mov = MovimentacaoFerramenta.objects.create(
+                sessao=self.sessao, ferramenta=f, tipo="R" if i % 2 else "D",
+                gaveta_numero=f.gaveta.numero, confirmado_visao=True,
+            )
+            # empates de criado_em, para o id desempatar
+            MovimentacaoFerramenta.objects.filter(id=mov.id).update(
+                criado_em=agora - timedelta(minutes=i // 3)
+            )
+        self.client.force_login(User.objects.create_user("equipe", password="x", is_staff=True))
+
+    def test_percorre_por_cursor_sem_repetir(self):
+        url = reverse("listar_movimentacoes")
+        vistos, cursor = [], None
+        while True:
+            params = {"limite": 3, "campos": "movimentacao_id,ferramenta_nome"}
+            if cursor:
+                params["cursor"] = cursor
+            with self.assertNumQueries(3):  # sessão, usuário, página
+                dados = self.client.get(url, params).json()
+            self.assertEqual(set(dados["resultados"][0]), {"movimentacao_id", "ferramenta_nome"})
+            vistos += [r["movimentacao_id"] for r in dados["resultados"]]
+            cursor = dados["proximo"]
+            if not cursor:
+                break
+
+        esperado = list(
+            MovimentacaoFerramenta.objects.order_by("-criado_em", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual(vistos, esperado)
+
+    def test_filtros_e_erros(self):
+        dados = self.client.get(reverse("listar_movimentacoes"), {"tipo": "R", "gaveta": 2}).json()
+        self.assertEqual(
+            {(r["tipo"], r["gaveta_numero"]) for r in dados["resultados"]}, {("R", 2)}
+        )
+
+        sessoes = self.client.get(reverse("listar_sessoes"), {"ferramenta_id": 999}).json()
+        self.assertEqual(sessoes["resultados"], [])
+
+        url = reverse("listar_sessoes")
+        self.assertEqual(self.client.get(url, {"cursor": "xyz"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"campos": "senha"}).status_code, 400)
+
+
+class ImportacaoTests(TestCase):
+    def setUp(self):
+        for i in (1, 2):
+            Gaveta.objects.create(numero=i)
+        fulano = Colaborador.objects.create(nome="Fulano", matricula="1")
+        CartaoNFC.objects.create(uid="AAA", colaborador=fulano)
+
+    def test_importa_tudo_e_invalida_caches(self):
+        dados = {
+            "colaboradores": [
+                {"matricula": "1", "nome": "Fulano de Tal"},
+                {"matricula": "2", "nome": "Beltrano", "ativo": "não"},
+            ],
+            "cartoes": [
+                {"uid": "AAA", "matricula": "2"},
+                {"uid": "BBB", "matricula": "2", "apelido": "Reserva"},
+            ],
+            "ferramentas": [
+                {"gaveta": 1, "posicao": p, "nome": f"Chave {p}"} for p in range(3000)
+            ],
+        }
+
+        with mock.patch("api.importacao.autorizacao.invalidar") as invalidar, \
+                self.captureOnCommitCallbacks(execute=True):
+            diff = importar(dados)
+
+        invalidar.assert_called_once()
+        self.assertEqual(diff["colaboradores"]["criar"], ["2"])
+        self.assertEqual(diff["colaboradores"]["atualizar"][0]["campos"], {"nome": ["Fulano", "Fulano de Tal"]})
+        self.assertEqual(diff["cartoes"]["atualizar"][0]["campos"], {"colaborador": ["1", "2"]})
+        self.assertEqual(CartaoNFC.objects.get(uid="BBB").colaborador.matricula, "2")
+        self.assertFalse(Colaborador.objects.get(matricula="2").ativo)
+        self.assertEqual(Ferramenta.objects.count(), 3000)
+
+        # de novo: nada muda
+        diff = importar(dados, simular=True)
+        self.assertEqual(diff["ferramentas"]["inalterados"], 3000)
+
+    def test_valida_tudo_antes_de_gravar(self):
+        dados = ler_arquivo(
+            "gaveta,posicao,nome\n1,1,Martelo\n1,1,Alicate\n9,1,Serrote\n2,x,\n",
+            "ferramentas.csv", "ferramentas",
+        )
+        dados["cartoes"] = [{"uid": "CCC", "matricula": "1"}, {"uid": "CCC", "matricula": "404"}]
+
+        with self.assertRaises(ErroImportacao) as ctx:
+            importar(dados)
+
+        self.assertEqual(len(ctx.exception.erros), 6)
+        self.assertIn("ferramentas #2: posição 1 da gaveta 1 repetida no arquivo.", ctx.exception.erros)
+        self.assertIn("ferramentas #3: gaveta 9 não existe.", ctx.exception.erros)
+        self.assertFalse(Ferramenta.objects.exists())
+        self.assertFalse(CartaoNFC.objects.filter(uid="CCC").exists())
+
+    def test_admin_simula_e_importa(self):
+        self.client.force_login(User.objects.create_superuser("admin", password="x"))
+        url = reverse("admin:inventario_ferramenta_importar")
+        csv_ = b"gaveta,posicao,nome\n2,1,Alicate\n"
+
+        resp = self.client.post(url, {"arquivo": SimpleUploadedFile("f.csv", csv_), "simular": "1"})
+        self.assertContains(resp, "ferramentas: 1 novo(s)")
+        self.assertFalse(Ferramenta.objects.exists())
+
+        resp = self.client.post(url, {"arquivo": SimpleUploadedFile("f.csv", csv_), "importar": "1"})
+        self.assertRedirects(resp, reverse("admin:inventario_ferramenta_changelist"))
+        self.assertTrue(Ferramenta.objects.filter(nome="Alicate", gaveta__numero=2).exists())
+
+
+@mock.patch("usuarios.autorizacao._garantir_writer")
+class CaixasTests(HardwareSimuladoMixin, TestCase):
+    """
+    Várias caixas no mesmo servidor: cada leitor abre sessão na sua caixa
+    e só vê (e só retira) as ferramentas das gavetas dela.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        autorizacao.invalidar()
+        caixas.invalidar()
+        self.ferramentas = criar_inventario(3)   # caixa do leitor padrão (rasp-01)
+        self.outra = Caixa.objects.create(reader_id="rasp-02", nome="Oficina")
+        gaveta = Gaveta.objects.create(caixa=self.outra, numero=1, nome="Gaveta 1")
+        self.da_outra = Ferramenta.objects.create(nome="Torquímetro", gaveta=gaveta, posicao=1)
+        colaborador = Colaborador.objects.create(nome="Fulano", matricula="123")
+        CartaoNFC.objects.create(uid="UID123", colaborador=colaborador)
+
+    def _tap(self, reader_id):
+        return post_json(self.client, reverse("nfc_tap"), {"uid": "UID123", "reader_id": reader_id})
+
+    def test_toque_abre_sessao_na_caixa_do_leitor(self, _writer):
+        resp = self._tap("rasp-02")
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual((resp.json()["reader_id"], resp.json()["caixa_id"]), ("rasp-02", self.outra.id))
+        self.assertEqual(SessaoUso.objects.get(id=resp.json()["session_id"]).caixa_id, self.outra.id)
+
+        status = self.client.get(reverse("status_frontend"), {"reader_id": "rasp-01"}).json()
+        self.assertFalse(status["sessao_ativa"])
+        status = self.client.get(reverse("status_frontend"), {"reader_id": "rasp-02"}).json()
+        self.assertTrue(status["sessao_ativa"])
+
+    def test_leitor_nao_cadastrado_recusado(self, _writer):
+        resp = self._tap("rasp-99")
+
+        self.assertEqual(resp.status_code, 403)
+        self.assertFalse(SessaoUso.objects.exists())
+
+    def test_catalogo_por_leitor(self, _writer):
+        url = reverse("ferramentas_disponiveis")
+
+        nomes = [
+            f["nome"]
+            for g in self.client.get(url, {"reader_id": "rasp-02"}).json()["gavetas"]
+            for f in g["ferramentas"]
+        ]
+        self.assertEqual(nomes, ["Torquímetro"])
+        self.assertEqual(len(self.client.get(url).json()["gavetas"]), 3)
+        self.assertEqual(self.client.get(url, {"reader_id": "rasp-99"}).status_code, 404)
+
+    def test_retirada_so_da_propria_caixa_e_comando_no_leitor_dela(self, _writer):
+        sessao_id = self._tap("rasp-02").json()["session_id"]
+        url = reverse("registrar_retirada", args=[sessao_id])
+
+        resp = post_json(self.client, url, {"ferramentas_ids": [self.ferramentas[0].id]})
+        self.assertEqual(resp.status_code, 400)
+
+        resp = post_json(self.client, url, {"ferramentas_ids": [self.da_outra.id]})
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(self.publish.call_args.kwargs["reader_id"], "rasp-02")
+
+
+class MetricasTests(TestCase):
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.dir = diretorio.name
+        patcher = override_settings(METRICAS_DIR=self.dir, METRICAS_AMOSTRAGEM=1.0)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+        metricas.limpar()
+        self.addCleanup(metricas.limpar)
+        registro.limpar()
+
+    def test_soma_os_processos_no_metrics(self):
+        # retrato de outro worker (vivo: o processo pai dos testes)
+        with open(os.path.join(self.dir, f"{os.getppid()}.json"), "w") as f:
+            json.dump({
+                "contadores": [
+                    ["caixa_http_requisicoes_total",
+                     [["metodo", "GET"], ["status", "200"], ["view", "status_frontend"]], 5],
+                    ["caixa_mqtt_publicacoes_total", [["comando", "abrir_gaveta"], ["resultado", "ok"]], 3],
+                ],
+                "histogramas": [],
+            }, f)
+
+        for _ in range(2):
+            self.client.get(reverse("status_frontend"))
+        texto = self.client.get("/metrics").content.decode()
+
+        self.assertIn(
+            'caixa_http_requisicoes_total{metodo="GET",status="200",view="status_frontend"} 7', texto
+        )
+        self.assertIn('caixa_mqtt_publicacoes_total{comando="abrir_gaveta",resultado="ok"} 3', texto)
+        self.assertIn('caixa_http_latencia_segundos_count{view="status_frontend"} 2', texto)
+        self.assertIn('caixa_http_amostradas_total{view="status_frontend"} 2', texto)
+        self.assertIn("# TYPE caixa_db_consultas_total counter", texto)
+
+    def test_retrato_de_processo_morto_e_apagado(self):
+        morto = subprocess.Popen([sys.executable, "-c", "pass"])
+        morto.wait()
+        with open(os.path.join(self.dir, f"{morto.pid}.json"), "w") as f:
+            json.dump({
+                "contadores": [["caixa_expiracao_execucoes_total", [], 4]],
+                "histogramas": [],
+            }, f)
+
+        texto = self.client.get("/metrics").content.decode()
+
+        self.assertNotIn("caixa_expiracao_execucoes_total", texto)
+        self.assertNotIn(f"{morto.pid}.json", os.listdir(self.dir))
+
+    def test_comando_avulso_nao_grava_retrato(self):
+        with mock.patch("caixa.metricas._servindo", False):
+            metricas.incrementar("caixa_expiracao_execucoes_total")
+            metricas.descarregar(forcar=True)
+        self.assertEqual(os.listdir(self.dir), [])
+
+    @override_settings(METRICAS_LENTO_MS=0.001)
+    def test_requisicao_lenta_loga_o_sql(self):
+        with self.assertLogs("caixa.metricas", "WARNING") as logs:
+            self.client.get(reverse("status_frontend"))
+        self.assertIn("SELECT", "\n".join(logs.output))
+
+    @override_settings(METRICAS_TOKEN="segredo")
+    def test_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        resp = self.client.get("/metrics", headers={"Authorization": "Bearer segredo"})
+        self.assertEqual(resp.status_code, 200)
+
+
+class RastreioTests(HardwareSimuladoMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.jsonl = os.path.join(diretorio.name, "rastros.jsonl")
+        patcher = override_settings(RASTREIO_JSONL=self.jsonl)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+        # exporta na mão (rastreio.descarregar), sem a thread
+        patcher = mock.patch("caixa.rastreio._garantir_exportador")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(rastreio.descarregar)
+
+    def _spans(self):
+        rastreio.descarregar()
+        with open(self.jsonl, encoding="utf-8") as f:
+            return [json.loads(linha) for linha in f]
+
+    @mock.patch("api.confirmacao.capture_frame", return_value=CAPTURA_OK)
+    def test_retirada_inteira_no_trace_do_toque(self, *_mocks):
+        ferramentas = criar_inventario(2)
+        colaborador = Colaborador.objects.create(nome="Fulano", matricula="123")
+        CartaoNFC.objects.create(uid="UID123", colaborador=colaborador)
+
+        toque = post_json(self.client, reverse("nfc_tap"), {"uid": "UID123", "reader_id": "rasp-01"}).json()
+        sessao = SessaoUso.objects.get(id=toque["session_id"])
+        self.assertEqual(len(sessao.trace_id), 32)
+        self.assertEqual(toque["trace_id"], sessao.trace_id)
+
+        post_json(
+            self.client,
+            reverse("registrar_retirada", args=[sessao.id]),
+            {"ferramentas_ids": [ferramentas[1].id]},
+        )
+        resp = post_json(self.client, reverse("confirmar_retirada_gaveta", args=[sessao.id, 2]))
+        self.assertTrue(resp["traceparent"].startswith(f"00-{sessao.trace_id}-"))
+
+        spans = self._spans()
+        self.assertEqual({s["trace_id"] for s in spans}, {sessao.trace_id})
+        por_nome = {s["nome"]: s for s in spans}
+        self.assertIn("nfc.toque", por_nome)
+        http = por_nome["http confirmar_retirada_gaveta"]
+        self.assertEqual(por_nome["confirmacao.captura"]["parent_id"], http["span_id"])
+        self.assertEqual(por_nome["confirmacao.visao"]["parent_id"], http["span_id"])
+
+        saida = io.StringIO()
+        call_command("ver_rastro", "--sessao", str(sessao.id), stdout=saida)
+        self.assertIn("  confirmacao.captura", saida.getvalue())
+
+    @mock.patch("hardware.mqtt_client.mqtt.Client")
+    def test_payload_mqtt_continua_o_trace(self, client):
+        from hardware.mqtt_client import publish_run_command
+
+        with rastreio.span("teste") as pai:
+            resultado = publish_run_command("rasp-01", "led_on")
+
+        payload = json.loads(client.return_value.publish.call_args.args[1])
+        trace_id, span_id = rastreio.ler_traceparent(payload["traceparent"])
+        self.assertEqual(trace_id, pai.trace_id)
+        self.assertEqual(payload["req_id"], f"{trace_id}-{span_id}")
+        self.assertTrue(resultado["ok"])
+
+        span = next(s for s in self._spans() if s["nome"] == "mqtt.run")
+        self.assertEqual((span["span_id"], span["parent_id"]), (span_id, pai.span_id))
+
+    def test_otlp_ida_e_volta(self):
+        with rastreio.span("raiz", sessao_id=7):
+            with self.assertRaises(RuntimeError), rastreio.span("filho"):
+                raise RuntimeError("falhou")
+        spans = self._spans()
+
+        self.assertEqual(rastreio.de_otlp(rastreio._otlp(spans)), spans)
+        filho = next(s for s in spans if s["nome"] == "filho")
+        self.assertEqual(filho["status"], "erro")
+
+
+class PerfilTests(HardwareSimuladoMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.dir = diretorio.name
+        patcher = override_settings(PERFIL_ATIVO=True, PERFIL_DIR=self.dir, PERFIL_INTERVALO_MS=1)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+
+        self.ferramentas = criar_inventario(1, n_gavetas=1)
+        self.sessao = criar_sessao()
+        post_json(
+            self.client,
+            reverse("registrar_retirada", args=[self.sessao.id]),
+            {"ferramentas_ids": [self.ferramentas[0].id]},
+        )
+        self.url = reverse("confirmar_retirada_gaveta", args=[self.sessao.id, 1]) + "?perfil=1"
+
+    @mock.patch("api.confirmacao.capture_frame", return_value=CAPTURA_OK)
+    def test_staff_grava_perfil_da_requisicao(self, _captura):
+        staff = User.objects.create_user("admin", password="x", is_staff=True)
+        self.client.force_login(staff)
+
+        resp = post_json(self.client, self.url)
+
+        base = resp["X-Perfil"]
+        self.assertIn(f"_sessao{self.sessao.id}", base)
+        self.assertEqual(
+            sorted(os.listdir(self.dir)),
+            [base + ".folded", base + ".json", base + ".prof"],
+        )
+        with open(os.path.join(self.dir, base + ".json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.assertEqual((meta["sessao_id"], meta["status"]), (self.sessao.id, 200))
+
+        saida = io.StringIO()
+        call_command("perfis", stdout=saida)
+        self.assertIn(base, saida.getvalue())
+        call_command("perfis", "--manter", "0", "--apagar", stdout=io.StringIO())
+        self.assertEqual(os.listdir(self.dir), [])
+
+    @mock.patch("api.confirmacao.capture_frame", return_value=CAPTURA_OK)
+    def test_sem_staff_nao_perfila(self, _captura):
+        resp = post_json(self.client, self.url)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn("X-Perfil", resp)
+        self.assertEqual(os.listdir(self.dir), [])
+
+
+class BenchmarkTests(TransactionTestCase):
+    """
+    TransactionTestCase: os workers do benchmark usam as próprias conexões.
+    """
+
+    # visão inline: o SQLite em memória dos testes não aguenta escrita concorrente
+    @override_settings(VISAO_EM_PARALELO=False)
+    def test_relatorio_por_endpoint(self):
+        semeadura.semear(anos=0.01, sessoes_por_dia=2, ferramentas=6, colaboradores=2, semente=1)
+        # grava o ultimo_uso_em dos toques enquanto o banco de teste existe
+        self.addCleanup(autorizacao.descarregar)
+
+        relatorio = benchmark.rodar(workers=1, ciclos=2, semente=1)
+
+        self.assertEqual(relatorio["erros"], 0)
+        endpoints = relatorio["endpoints"]
+        self.assertEqual(endpoints["nfc_tap"]["requisicoes"], 4)
+        for nome in ("registrar_retirada", "confirmar_retirada_gaveta", "confirmar_devolucao_gaveta", "home"):
+            self.assertIn(nome, endpoints)
+        self.assertEqual(
+            set(endpoints["status_frontend"]),
+            {"requisicoes", "erros", "rps", "p50_ms", "p90_ms", "p99_ms", "max_ms",
+             "consultas_media", "consultas_max"},
+        )
+        self.assertFalse(SessaoUso.objects.filter(status="A").exists())
+
+
+TAMANHOS = (1, 10, 100)
+
+
+def cenario_consultas(n):
+    """
+    Base dos orçamentos de consultas, com 2n ferramentas em 3 gavetas: o
+    colaborador da sessão ativa está com n delas (n sessões antigas com uma
+    retirada cada) e as outras n estão livres. Mais n sessões no arquivo,
+    n tempos de etapa, um job e os rollups em dia.
+    """
+    ferramentas = criar_inventario(2 * n)
+    com, livres = ferramentas[:n], ferramentas[n:]
+    caixa = ferramentas[0].gaveta.caixa
+    colaborador = Colaborador.objects.create(nome="Fulano", matricula="123")
+    cartao = CartaoNFC.objects.create(uid="UID123", colaborador=colaborador)
+
+    SessaoUso.objects.bulk_create([
+        SessaoUso(
+            colaborador=colaborador, cartao=cartao, caixa=caixa, status="F", etapa="X", operacao="R",
+            finalizado_em=timezone.now(), payload_inicial={"reader_id": "rasp-01"},
+        )
+        for _ in com
+    ])
+    antigas = list(SessaoUso.objects.filter(status="F").order_by("id"))
+    MovimentacaoFerramenta.objects.bulk_create([
+        MovimentacaoFerramenta(
+            sessao=s, ferramenta=f, tipo="R", gaveta_numero=f.gaveta.numero,
+            confirmado_visao=True, visao_confere=True,
+        )
+        for s, f in zip(antigas, com)
+    ])
+
+    arquivada = SessaoArquivada.objects.create(
+        id=10 ** 9, colaborador_id=colaborador.id, colaborador_nome=colaborador.nome,
+        colaborador_matricula=colaborador.matricula, status="F", iniciado_em=timezone.now(),
+    )
+    SessaoArquivada.objects.bulk_create([
+        SessaoArquivada(
+            id=10 ** 9 + i, colaborador_id=colaborador.id, colaborador_nome=colaborador.nome,
+            colaborador_matricula=colaborador.matricula, status="F", iniciado_em=timezone.now(),
+        )
+        for i in range(1, n)
+    ])
+    MovimentacaoArquivada.objects.bulk_create([
+        MovimentacaoArquivada(
+            id=10 ** 9 + i, sessao=arquivada, ferramenta_id=f.id, ferramenta_nome=f.nome,
+            tipo="R", gaveta_numero=f.gaveta.numero, criado_em=timezone.now(),
+        )
+        for i, f in enumerate(livres)
+    ])
+
+    sessao = SessaoUso.objects.create(
+        colaborador=colaborador, cartao=cartao, caixa=caixa, payload_inicial={"reader_id": "rasp-01"},
+    )
+    registro.atualizar(sessao, itens={})
+    TempoEtapa.objects.bulk_create([
+        TempoEtapa(sessao=antigas[i % n], operacao="R", gaveta_numero=1, etapa=f"etapa{i % 5}", duracao_ms=i)
+        for i in range(n)
+    ])
+    job = JobConfirmacao.objects.create(
+        sessao=sessao, tipo="R", gaveta_numero=1, disponivel_em=timezone.now(),
+    )
+    rollups.atualizar_rollups()
+    return {
+        "sessao": sessao,
+        "antigas": antigas,
+        "arquivada": arquivada,
+        "com": com,
+        "livres": livres,
+        "job": job,
+        "uid": cartao.uid,
+    }
+
+
+class OrcamentoConsultasMixin:
+    """
+    Mede as consultas de uma requisição com bases de 1, 10 e 100
+    ferramentas (cenario_consultas): a contagem não pode crescer com o
+    tamanho e tem de caber no orçamento. Cada tamanho roda num savepoint
+    desfeito no fim, com os caches vazios.
+    """
+
+    def assertOrcamento(self, orcamento, requisicao, preparar=None):
+        contagens = {}
+        for n in TAMANHOS:
+            with transaction.atomic():
+                cache.clear()
+                registro.limpar()
+                autorizacao.invalidar()
+                caixas.invalidar()
+                dados = cenario_consultas(n)
+                if preparar:
+                    preparar(dados)
+                with CaptureQueriesContext(connection) as ctx:
+                    resp = requisicao(dados)
+                    if resp.streaming:
+                        b"".join(resp.streaming_content)
+                self.assertLess(resp.status_code, 400, (n, resp.content[:200] if not resp.streaming else ""))
+                contagens[n] = len(ctx.captured_queries)
+                transaction.set_rollback(True)
+
+        self.assertEqual(len(set(contagens.values())), 1, f"consultas crescem com o tamanho: {contagens}")
+        self.assertLessEqual(contagens[TAMANHOS[-1]], orcamento, contagens)
+
+
+def preparar_operacao(tipo):
+    """
+    preparar= do assertOrcamento: inicia a retirada (das livres) ou a
+    devolução (das que estão com o colaborador) e guarda a gaveta atual.
+    """
+    def preparar(dados):
+        ferramentas = dados["livres"] if tipo == "R" else dados["com"]
+        sessao, _ = fluxo.iniciar_operacao(dados["sessao"].id, tipo, ferramentas)
+        dados["gaveta"] = sessao.gaveta_atual
+    return preparar
+
+
+@mock.patch("api.confirmacao.capture_frame", return_value=CAPTURA_OK)
+class OrcamentoConsultasApiTests(OrcamentoConsultasMixin, HardwareSimuladoMixin, TestCase):
+    """
+    Teto de consultas por endpoint de api/views.py. eventos_sessao (SSE,
+    stream sem fim) fica de fora; ele só lê o registro de sessões.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_user("admin", password="x", is_staff=True))
+        # autorizacao.registrar_uso só anota; sem a thread de gravação
+        patcher = mock.patch("usuarios.autorizacao._garantir_writer")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _get(self, nome, *args, **params):
+        return lambda dados: self.client.get(reverse(nome, args=args), params)
+
+    def test_nfc_tap(self, _captura):
+        # + o cadastro de caixas, frio como os outros caches
+        self.assertOrcamento(
+            3, lambda d: post_json(self.client, reverse("nfc_tap"), {"uid": d["uid"], "reader_id": "rasp-01"})
+        )
+
+    def test_status_frontend(self, _captura):
+        self.assertOrcamento(2, self._get("status_frontend"))
+
+    def test_ferramentas_disponiveis(self, _captura):
+        self.assertOrcamento(3, self._get("ferramentas_disponiveis"))   # caixas + catálogo
+
+    def test_registrar_retirada(self, _captura):
+        self.assertOrcamento(10, lambda d: post_json(
+            self.client, reverse("registrar_retirada", args=[d["sessao"].id]),
+            {"ferramentas_ids": [f.id for f in d["livres"]]},
+        ))
+
+    def test_registrar_devolucao(self, _captura):
+        self.assertOrcamento(10, lambda d: post_json(
+            self.client, reverse("registrar_devolucao", args=[d["sessao"].id]),
+            {"ferramentas_ids": [f.id for f in d["com"]]},
+        ))
+
+    def test_confirmar_retirada_gaveta(self, _captura):
+        self.assertOrcamento(18, lambda d: post_json(
+            self.client, reverse("confirmar_retirada_gaveta", args=[d["sessao"].id, d["gaveta"]]),
+        ), preparar=preparar_operacao("R"))
+
+    def test_confirmar_devolucao_gaveta(self, _captura):
+        self.assertOrcamento(18, lambda d: post_json(
+            self.client, reverse("confirmar_devolucao_gaveta", args=[d["sessao"].id, d["gaveta"]]),
+        ), preparar=preparar_operacao("D"))
+
+    def test_job_confirmacao(self, _captura):
+        self.assertOrcamento(1, lambda d: self.client.get(reverse("job_confirmacao", args=[d["job"].id])))
+
+    def test_listar_sessoes(self, _captura):
+        self.assertOrcamento(3, self._get("listar_sessoes", limite=200))
+
+    def test_listar_movimentacoes(self, _captura):
+        self.assertOrcamento(3, self._get("listar_movimentacoes", limite=200))
+
+    def test_arquivo_sessoes(self, _captura):
+        self.assertOrcamento(4, self._get("arquivo_sessoes"))
+
+    def test_arquivo_sessao(self, _captura):
+        self.assertOrcamento(5, lambda d: self.client.get(reverse("arquivo_sessao", args=[d["arquivada"].id])))
+
+    def test_exportar_historico(self, _captura):
+        for tipo in ("sessoes", "movimentacoes"):
+            with self.subTest(tipo):
+                self.assertOrcamento(3, self._get("exportar_historico", tipo))
+
+    def test_evidencias_zip(self, _captura):
+        hoje = timezone.localdate().isoformat()
+        self.assertOrcamento(4, self._get("evidencias_zip", desde=hoje, ate=hoje))
+
+    def test_relatorio_uso(self, _captura):
+        for dimensao in DIMENSOES_RELATORIO:
+            with self.subTest(dimensao):
+                self.assertOrcamento(4, self._get("relatorio_uso", dimensao))
+
+    def test_resumo_tempos_etapas(self, _captura):
+        self.assertOrcamento(3, self._get("resumo_tempos_etapas"))
@@ -1,6 +1,7 @@
 # api/urls.py
 from django.urls import path
-from . import views
+from . import views, views_assincronas
+from .views_assincronas import conforme_servidor
 
 urlpatterns = [
     path("nfc-tap/", views.nfc_tap, name="nfc_tap"),
@@ -11,19 +12,50 @@ urlpatterns = [
     # OPCIONAL: alias pra compatibilidade, se algum lugar ainda chamar /api/status
     path("status/", views.status_frontend, name="status"),
 
+    # canal SSE (ASGI) que substitui o polling do home.js
+    path("eventos/", views.eventos_sessao, name="eventos_sessao"),
+
+    # catálogo de ferramentas por gaveta (cache + ETag/Last-Modified)
+    path("ferramentas/", views.ferramentas_disponiveis, name="ferramentas_disponiveis"),
+
+    # histórico paginado por cursor (api/historico.py), só equipe
+    path("sessoes/", views.listar_sessoes, name="listar_sessoes"),
+    path("movimentacoes/", views.listar_movimentacoes, name="listar_movimentacoes"),
+
+    # sessão + hardware: assíncronas no ASGI, síncronas no WSGI
+    # (api/views_assincronas.py)
     path("sessoes/<int:sessao_id>/retiradas/",
-         views.registrar_retirada,
+         conforme_servidor(views.registrar_retirada, views_assincronas.registrar_retirada),
          name="registrar_retirada"),
 
     path("sessoes/<int:sessao_id>/gaveta/<int:gaveta_numero>/confirmar-retirada/",
-         views.confirmar_retirada_gaveta,
+         conforme_servidor(views.confirmar_retirada_gaveta, views_assincronas.confirmar_retirada_gaveta),
          name="confirmar_retirada_gaveta"),
 
     path("sessoes/<int:sessao_id>/devolucoes/",
-         views.registrar_devolucao,
+         conforme_servidor(views.registrar_devolucao, views_assincronas.registrar_devolucao),
          name="registrar_devolucao"),
 
     path("sessoes/<int:sessao_id>/gaveta/<int:gaveta_numero>/confirmar-devolucao/",
-         views.confirmar_devolucao_gaveta,
+         conforme_servidor(views.confirmar_devolucao_gaveta, views_assincronas.confirmar_devolucao_gaveta),
          name="confirmar_devolucao_gaveta"),
+
+    # histórico arquivado (operacoes/arquivo.py), só equipe
+    path("arquivo/sessoes/", views.arquivo_sessoes, name="arquivo_sessoes"),
+    path("arquivo/sessoes/<int:sessao_id>/", views.arquivo_sessao, name="arquivo_sessao"),
+
+    # exportação em streaming (CSV/JSONL) do histórico, só equipe
+    path("exportar/<str:tipo>/", views.exportar_historico, name="exportar_historico"),
+
+    # pacote ZIP de evidências (imagens + JSON da visão), só equipe
+    path("evidencias/", views.evidencias_zip, name="evidencias_zip"),
+
+    # relatórios de uso a partir dos rollups diários, só equipe
+    path("relatorios/<str:dimensao>/", views.relatorio_uso, name="relatorio_uso"),
+
+    # p50/p95 por etapa da confirmação de gaveta (TempoEtapa), só equipe
+    path("tempos/etapas/", views.resumo_tempos_etapas, name="resumo_tempos_etapas"),
+
+    # situação de um job de confirmação (CONFIRMACAO_ASSINCRONA=True)
+    path("jobs/<int:job_id>/", views.job_confirmacao, name="job_confirmacao"),
 ]
@@ -4,26 +4,39 @@ import json
 import logging
 from datetime import timedelta   # <-- garante isso
 
-from django.http import JsonResponse, HttpResponseNotAllowed
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, HttpResponseNotAllowed, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.conf import settings
-from django.db.models import Subquery, OuterRef
+from django.db.models import Exists, Subquery, OuterRef
 
-from usuarios.models import CartaoNFC
-from operacoes.models import SessaoUso, MovimentacaoFerramenta
-from inventario.models import Gaveta, Ferramenta
+from caixa import rastreio
+from usuarios import autorizacao
+from operacoes.models import SessaoUso, MovimentacaoFerramenta, SessaoArquivada, UsoDiario
+from operacoes import eventos, fluxo, registro, rollups
+from inventario import caixas, catalogo
+from inventario.models import Ferramenta
 
 from hardware.mqtt_client import publish_run_command
-from hardware.camera_vision import capture_and_process
-from django.views.decorators.http import require_GET
+from django.views.decorators.http import condition, require_GET
 from django.urls import reverse
+from django.db import transaction
+
+from . import evidencias, exportacao, historico
+from .confirmacao import FalhaCaptura, executar_confirmacao, reader_id_da_sessao
+from .idempotencia import idempotente
+from .jobs import enfileirar_confirmacao
+from .models import JobConfirmacao, TempoEtapa
 
 logger = logging.getLogger(__name__)
 
 
 
 @csrf_exempt
+@idempotente
 def nfc_tap(request):
     """
     Endpoint chamado se, em vez de MQTT, a Rock enviar o UID via HTTP.
@@ -59,29 +72,37 @@ def process_nfc_payload(data: dict) -> dict:
     if not uid:
         raise ValueError("Campo 'uid' é obrigatório.")
 
-    # Tenta localizar o cartão
-    try:
-        cartao = CartaoNFC.objects.select_related("colaborador").get(uid=uid, ativo=True)
-    except CartaoNFC.DoesNotExist:
+    # Caixa do leitor (cadastro em cache, ver inventario/caixas.py); sem
+    # reader_id no payload, a do leitor padrão
+    caixa = caixas.resolver(reader_id)
+    if caixa is None:
+        logger.warning("Toque no leitor %s, que não tem caixa ativa cadastrada.", reader_id)
+        return {
+            "authorized": False,
+            "reason": "Leitor não cadastrado.",
+            "reader_id": reader_id,
+        }
+
+    # Tenta localizar o cartão (em cache, ver usuarios/autorizacao.py)
+    aut = autorizacao.autorizar(uid)
+    if aut is None:
         logger.warning("Cartão UID=%s não autorizado ou não cadastrado.", uid)
         return {
             "authorized": False,
             "reason": "Cartão não autorizado ou não cadastrado.",
         }
 
-    colaborador = cartao.colaborador
+    colaborador, cartao = autorizacao.instancias(aut)
 
-    # Atualiza último uso
-    cartao.ultimo_uso_em = timezone.now()
-    cartao.save(update_fields=["ultimo_uso_em"])
+    # Atualiza último uso (gravado em lote pela thread de write-behind)
+    autorizacao.registrar_uso(cartao.id, timezone.now())
 
-    # Cria sessão de uso em andamento
-    sessao = SessaoUso.objects.create(
-        colaborador=colaborador,
-        cartao=cartao,
-        status="A",
-        payload_inicial=data,
-    )
+    # Cria sessão de uso em andamento; o toque abre o trace da sessão
+    # (caixa/rastreio.py), continuado em todo o resto do fluxo
+    with rastreio.span("nfc.toque", reader_id=caixa.reader_id) as span:
+        sessao = fluxo.abrir_sessao(colaborador, cartao, data, caixa=caixa)
+        if span is not None:
+            span.atributos["sessao_id"] = sessao.id
 
     logger.info(
         "Sessão criada via NFC: sessao_id=%s, colaborador=%s, uid=%s",
@@ -96,52 +117,60 @@ def process_nfc_payload(data: dict) -> dict:
             "nome": colaborador.nome,
             "matricula": colaborador.matricula,
         },
-        "reader_id": reader_id,
+        "reader_id": caixa.reader_id,
+        "caixa_id": caixa.id,
         "status": sessao.get_status_display(),
         "started_at": sessao.iniciado_em.isoformat(),
+        "trace_id": sessao.trace_id,
     }
     return response_data
 
 
 
+def _catalogo_do_pedido(request):
+    caixa = caixas.resolver(request.GET.get("reader_id"))
+    return catalogo.obter(caixa.id) if caixa else None
+
+
+def _etag_catalogo(request):
+    cat = _catalogo_do_pedido(request)
+    return cat["etag"] if cat else None
+
+
+def _modificado_catalogo(request):
+    cat = _catalogo_do_pedido(request)
+    return cat["modificado_em"] if cat else None
+
+
+@require_GET
+@condition(etag_func=_etag_catalogo, last_modified_func=_modificado_catalogo)
 def ferramentas_disponiveis(request):
     """
-    Lista todas as ferramentas ativas organizadas por gaveta.
-    """
-    if request.method != "GET":
-        return JsonResponse({"detail": "Método não permitido. Use GET."}, status=405)
+    GET /api/ferramentas/?reader_id=rasp-01
 
-    gavetas = Gaveta.objects.filter(ativa=True).order_by("numero")
+    Lista as ferramentas ativas da caixa do leitor (sem reader_id, a do
+    leitor padrão) organizadas por gaveta. Vem do catálogo em cache
+    (inventario/catalogo.py) e responde 304 para If-None-Match /
+    If-Modified-Since ainda válidos.
+    """
+    cat = _catalogo_do_pedido(request)
+    if cat is None:
+        return JsonResponse({"detail": "Leitor não cadastrado."}, status=404)
+    return JsonResponse({"gavetas": cat["gavetas"]}, status=200)
 
-    gavetas_data = []
-    for gaveta in gavetas:
-        ferramentas = gaveta.ferramentas.filter(ativa=True).order_by("posicao", "nome")
-        ferramentas_data = [
-            {
-                "id": f.id,
-                "nome": f.nome,
-                "codigo": f.codigo,
-                "posicao": f.posicao,
-                "quantidade": f.quantidade,
-                "descricao": f.descricao,
-            }
-            for f in ferramentas
-        ]
-
-        gavetas_data.append(
-            {
-                "id": gaveta.id,
-                "numero": gaveta.numero,
-                "nome": gaveta.nome,
-                "descricao": gaveta.descricao,
-                "ferramentas": ferramentas_data,
-            }
-        )
 
-    return JsonResponse({"gavetas": gavetas_data}, status=200)
+def _da_caixa(ferramentas, sessao):
+    """
+    Restringe as ferramentas às gavetas da caixa da sessão (sessões
+    anteriores ao cadastro de caixas não têm caixa e veem todas).
+    """
+    if sessao.caixa_id is None:
+        return ferramentas
+    return ferramentas.filter(gaveta__caixa_id=sessao.caixa_id)
 
 
 @csrf_exempt
+@idempotente
 def registrar_retirada(request, sessao_id):
     """
     Endpoint chamado pelo front em:
@@ -157,11 +186,38 @@ def registrar_retirada(request, sessao_id):
     if request.method != "POST":
         return JsonResponse({"error": "Método não permitido"}, status=405)
 
+    erro, preparado = preparar_operacao(request, sessao_id, "R")
+    if erro:
+        return erro
+    sessao, ferramentas, gavetas_ordenadas = preparado
+
+    # abre a primeira gaveta (1, 2, 3...) no leitor da caixa da sessão
+    mqtt_result = None
+    if sessao.gaveta_atual is not None:
+        try:
+            mqtt_result = publish_run_command(**comando_abrir_primeira(sessao))
+            logar_abertura(sessao, mqtt_result)
+        except Exception as e:
+            logger.exception("Falha ao enviar comando MQTT para abrir gaveta.")
+            mqtt_result = {"error": str(e)}
+
+    return resposta_operacao(sessao, ferramentas, gavetas_ordenadas, mqtt_result)
+
+
+def preparar_operacao(request, sessao_id, tipo):
+    """
+    Parte de registrar_retirada / registrar_devolucao (e das versões
+    assíncronas) que só mexe no banco: valida o corpo e a sessão, escolhe
+    as ferramentas e inicia a operação (fluxo.iniciar_operacao).
+
+    Retorna (JsonResponse de erro, None) ou (None, (sessao, ferramentas,
+    gavetas_ordenadas)).
+    """
     # 1) tenta ler o JSON enviado
     try:
         payload = json.loads(request.body.decode("utf-8"))
     except json.JSONDecodeError:
-        return JsonResponse({"error": "JSON inválido"}, status=400)
+        return JsonResponse({"error": "JSON inválido"}, status=400), None
 
     # aceita tanto 'ferramentas_ids' quanto 'ferramentas'
     ids = payload.get("ferramentas_ids") or payload.get("ferramentas") or []
@@ -170,95 +226,97 @@ def registrar_retirada(request, sessao_id):
         return JsonResponse(
             {"error": "Campo 'ferramentas_ids' deve ser uma lista com pelo menos 1 id."},
             status=400,
-        )
+        ), None
 
     # 2) valida sessão
     try:
-        sessao = SessaoUso.objects.select_related("colaborador", "cartao").get(id=sessao_id)
+        sessao = SessaoUso.objects.get(id=sessao_id)
     except SessaoUso.DoesNotExist:
-        return JsonResponse({"error": "Sessão não encontrada."}, status=404)
+        return JsonResponse({"error": "Sessão não encontrada."}, status=404), None
 
     if sessao.status != "A":
         return JsonResponse(
             {"error": "Sessão não está em andamento."},
             status=400,
-        )
-
-    # 2.1) LIMPA retiradas pendentes anteriores desta sessão
-    MovimentacaoFerramenta.objects.filter(
-        sessao=sessao,
-        tipo="R",
-        confirmado_visao=False,
-    ).delete()
+        ), None
 
-    # 3) busca as ferramentas ativas correspondentes
+    # 3) busca as ferramentas ativas correspondentes, só das gavetas da
+    #    caixa da sessão (uma única query)
     qs = (
-        Ferramenta.objects
+        _da_caixa(Ferramenta.objects, sessao)
         .select_related("gaveta")
         .filter(id__in=ids, ativa=True)
     )
+    if tipo == "D":
+        # Garante que essas ferramentas estão em posse desse colaborador
+        last_mov_colab_qs = (
+            MovimentacaoFerramenta.objects
+            .filter(
+                ferramenta=OuterRef("pk"),
+                sessao__colaborador_id=sessao.colaborador_id,
+                confirmado_visao=True,
+            )
+            .order_by("-criado_em")
+        )
+        qs = (
+            qs
+            .annotate(last_tipo=Subquery(last_mov_colab_qs.values("tipo")[:1]))
+            .filter(last_tipo="R")  # só as que estão com ele
+        )
 
-    if not qs.exists():
+    ferramentas = list(qs)
+
+    if not ferramentas:
         return JsonResponse(
-            {"error": "Nenhuma ferramenta válida encontrada para os IDs enviados."},
+            {
+                "error": (
+                    "Nenhuma ferramenta válida encontrada para os IDs enviados."
+                    if tipo == "R" else
+                    "Nenhuma ferramenta válida para devolução encontrada."
+                )
+            },
             status=400,
-        )
+        ), None
 
-    # 4) cria movimentações de retirada no banco
-    movimentacoes = []
-    gavetas_env = {}  # numero_gaveta -> lista de ferramentas
+    # 4) LIMPA pendentes anteriores desta sessão, cria as novas movimentações
+    #    em lote e aponta a sessão para a primeira gaveta (com a sessão travada)
+    try:
+        sessao, gavetas_ordenadas = fluxo.iniciar_operacao(sessao_id, tipo, ferramentas)
+    except fluxo.TransicaoInvalida as e:
+        return JsonResponse({"error": str(e)}, status=e.status), None
 
-    for f in qs:
-        numero_gaveta = f.gaveta.numero if f.gaveta else None
+    return None, (sessao, ferramentas, gavetas_ordenadas)
 
-        mov = MovimentacaoFerramenta.objects.create(
-            sessao=sessao,
-            ferramenta=f,
-            tipo="R",                 # R = retirada
-            gaveta_numero=numero_gaveta,
-            quantidade=1,             # por enquanto 1 unidade por ferramenta
-        )
-        movimentacoes.append(mov)
 
-        if numero_gaveta not in gavetas_env:
-            gavetas_env[numero_gaveta] = []
-        gavetas_env[numero_gaveta].append(f)
+def comando_abrir_primeira(sessao):
+    """
+    Argumentos de publish_run_command para abrir a gaveta atual da sessão.
+    A Rock Pi espera alias no formato: abrir_gaveta_1, abrir_gaveta_2...
+    """
+    return {
+        "reader_id": reader_id_da_sessao(sessao),
+        "alias": f"abrir_gaveta_{int(sessao.gaveta_atual)}",
+        "args": [],
+        "mode": "fg",
+        "timeout_s": 10.0,
+    }
 
-    # 5) define ordem das gavetas envolvidas (1, 2, 3...)
-    gavetas_ordenadas = sorted([g for g in gavetas_env.keys() if g is not None])
-    primeira_gaveta = gavetas_ordenadas[0] if gavetas_ordenadas else None
 
-    # 6) tenta descobrir o reader_id (igual ao confirmar_retirada_gaveta)
-    reader_id = getattr(settings, "READER_ID", None) or sessao.payload_inicial.get(
-        "reader_id", "rockpi-01"
+def logar_abertura(sessao, mqtt_result):
+    logger.info(
+        "MQTT abrir gaveta%s: sessao=%s gaveta=%s reader_id=%s resp=%s",
+        " (devolucao)" if sessao.operacao == "D" else "",
+        sessao.id,
+        sessao.gaveta_atual,
+        reader_id_da_sessao(sessao),
+        mqtt_result,
     )
 
-    mqtt_result = None
-    if primeira_gaveta is not None:
-        try:
-            # Rock Pi espera alias no formato: abrir_gaveta_1, abrir_gaveta_2, abrir_gaveta_3...
-            alias = f"abrir_gaveta_{int(primeira_gaveta)}"
-
-            mqtt_result = publish_run_command(
-                reader_id=reader_id,
-                alias=alias,
-                args=[],
-                mode="fg",
-                timeout_s=10.0,
-            )
-            logger.info(
-                "MQTT abrir gaveta: sessao=%s gaveta=%s reader_id=%s alias=%s resp=%s",
-                sessao.id,
-                primeira_gaveta,
-                reader_id,
-                alias,
-                mqtt_result,
-            )
-        except Exception as e:
-            logger.exception("Falha ao enviar comando MQTT para abrir gaveta.")
-            mqtt_result = {"error": str(e)}
 
-    # 7) monta resposta
+def resposta_operacao(sessao, ferramentas, gavetas_ordenadas, mqtt_result):
+    """
+    Resposta 201 de registrar_retirada / registrar_devolucao.
+    """
     ferramentas_data = [
         {
             "id": f.id,
@@ -266,22 +324,23 @@ def registrar_retirada(request, sessao_id):
             "gaveta_numero": f.gaveta.numero if f.gaveta else None,
             "gaveta_nome": f.gaveta.nome if f.gaveta else None,
         }
-        for f in qs
+        for f in ferramentas
     ]
 
     return JsonResponse(
         {
             "ok": True,
             "sessao_id": sessao.id,
-            "ferramentas_selecionadas": ferramentas_data,
+            "ferramentas_selecionadas" if sessao.operacao == "R" else "ferramentas_devolucao": ferramentas_data,
             "gavetas_envolvidas": gavetas_ordenadas,
-            "primeira_gaveta": primeira_gaveta,
+            "primeira_gaveta": sessao.gaveta_atual,
             "mqtt": mqtt_result,
         },
         status=201,
     )
 
 @csrf_exempt
+@idempotente
 def confirmar_retirada_gaveta(request, sessao_id, gaveta_numero):
     """
     Após a gaveta ser aberta e o usuário retirar a ferramenta, o front chama
@@ -293,247 +352,198 @@ def confirmar_retirada_gaveta(request, sessao_id, gaveta_numero):
       - fechar a gaveta atual
       - ABRIR a próxima gaveta (se houver)
       - ENCERRAR a sessão quando não houver mais gavetas pendentes
+
+    Com CONFIRMACAO_ASSINCRONA=True o pipeline vai para a fila do worker e
+    a resposta é 202 com o id do job (ver api/confirmacao.py).
     """
     if request.method != "POST":
         return JsonResponse({"detail": "Método não permitido. Use POST."}, status=405)
 
-    # Busca a sessão
-    try:
-        sessao = SessaoUso.objects.select_related("colaborador").get(id=sessao_id)
-    except SessaoUso.DoesNotExist:
-        return JsonResponse({"detail": "Sessão não encontrada."}, status=404)
+    return _confirmar_gaveta(sessao_id, "R", gaveta_numero)
 
-    if sessao.status != "A":
-        return JsonResponse(
-            {"detail": "Sessão não está em andamento."},
-            status=400,
-        )
 
-    # Movimentações de retirada dessa gaveta, ainda não confirmadas
-    movs = list(
-        MovimentacaoFerramenta.objects.filter(
-            sessao=sessao,
-            tipo="R",
-            gaveta_numero=gaveta_numero,
-            confirmado_visao=False,
-        ).select_related("ferramenta")
-    )
+def _confirmar_gaveta(sessao_id, tipo, gaveta_numero):
+    """
+    Parte comum de confirmar_retirada_gaveta / confirmar_devolucao_gaveta.
+    """
+    resposta, sessao, movs = reservar_confirmacao(sessao_id, tipo, gaveta_numero)
+    if resposta:
+        return resposta
 
-    if not movs:
-        return JsonResponse(
-            {
-                "detail": (
-                    "Não há movimentações de retirada pendentes para "
-                    f"a gaveta {gaveta_numero} nesta sessão."
-                )
-            },
-            status=400,
-        )
+    try:
+        response = executar_confirmacao(sessao, movs)
+    except Exception as e:
+        return falha_confirmacao(sessao.id, e)
 
-    # Descobre o reader_id (mesma lógica do nfc_tap)
-    reader_id = getattr(settings, "READER_ID", None) or sessao.payload_inicial.get(
-        "reader_id", "rockpi-01"
-    )
+    return JsonResponse(response, status=200)
 
-    # 1) Acende LED na Rock Pi
-    led_on_result = publish_run_command(
-        reader_id=reader_id,
-        alias="led_on",
-        args=[],
-        mode="fg",
-        timeout_s=10.0,
-    )
 
-    # 2) Captura imagem + roda visão (no PC)
-    try:
-        imagem_rel, visao_ok, visao_raw = capture_and_process(sessao.id, gaveta_numero)
-    except Exception as e:
-        logger.exception(
-            "Erro na captura/processamento de imagem da gaveta %s: %s",
-            gaveta_numero,
-            e,
-        )
-        # Mesmo se falhar, apaga o LED e retorna erro
-        publish_run_command(
-            reader_id=reader_id,
-            alias="led_off",
-            args=[],
-            mode="fg",
-            timeout_s=10.0,
-        )
-        return JsonResponse(
-            {"detail": "Erro ao capturar/processar imagem da gaveta.", "error": str(e)},
-            status=500,
-        )
+def reservar_confirmacao(sessao_id, tipo, gaveta_numero):
+    """
+    Reserva a confirmação da gaveta atual (sessão travada): um segundo
+    POST concorrente para a mesma gaveta é recusado aqui. Com
+    CONFIRMACAO_ASSINCRONA=True já enfileira o job.
 
-    # 3) Apaga LED na Rock Pi
-    led_off_result = publish_run_command(
-        reader_id=reader_id,
-        alias="led_off",
-        args=[],
-        mode="fg",
-        timeout_s=10.0,
-    )
+    Retorna (resposta, sessao, movs); com resposta (erro ou 202 do job)
+    não há pipeline a rodar.
+    """
+    assincrona = getattr(settings, "CONFIRMACAO_ASSINCRONA", False)
 
-    # 3.1) Fecha a gaveta via MQTT (fechar_gaveta_X)
     try:
-        alias_fechar = f"fechar_gaveta_{int(gaveta_numero)}"
-        fechar_result = publish_run_command(
-            reader_id=reader_id,
-            alias=alias_fechar,
-            args=[],
-            mode="fg",
-            timeout_s=10.0,
-        )
-    except Exception as e:
-        logger.exception("Falha ao enviar comando MQTT para fechar gaveta.")
-        fechar_result = {"error": str(e)}
+        with transaction.atomic():
+            sessao, movs = fluxo.iniciar_confirmacao(sessao_id, tipo, gaveta_numero)
+            if assincrona:
+                job = enfileirar_confirmacao(sessao, tipo, gaveta_numero)
+    except SessaoUso.DoesNotExist:
+        return JsonResponse({"detail": "Sessão não encontrada."}, status=404), None, None
+    except fluxo.TransicaoInvalida as e:
+        return JsonResponse({"detail": str(e)}, status=e.status), None, None
 
-    # 4) Interpreta o resultado da visão (se vier algo, beleza; se não vier, OK também)
-    visao_json = None
-    detectadas = []
+    if assincrona:
+        return JsonResponse(
+            {
+                "detail": "Confirmação enfileirada.",
+                "job_id": job.id,
+                "status": job.status,
+                "status_url": reverse("job_confirmacao", args=[job.id]),
+            },
+            status=202,
+        ), None, None
 
-    raw = visao_raw.get("raw") if isinstance(visao_raw, dict) else None
-    if isinstance(raw, dict):
-        visao_json = raw.get("json")
-        if isinstance(visao_json, dict):
-            detectadas = visao_json.get("retiradas", []) or []
+    return None, sessao, movs
 
-    esperadas = [m.ferramenta.nome for m in movs]
 
-    # 5) Atualiza movimentações dessa gaveta com a imagem.
-    #    IMPORTANTE: aqui vamos considerar TODAS como confirmadas,
-    #    independente do resultado da visão, para o fluxo andar.
-    visao_matches = []
+def resposta_falha_captura(erro):
+    return JsonResponse(
+        {"detail": "Erro ao capturar/processar imagem da gaveta.", "error": str(erro)},
+        status=500,
+    )
 
-    for mov in movs:
-        match_visao = mov.ferramenta.nome in detectadas
-        visao_matches.append(match_visao)
 
-        mov.imagem_path = imagem_rel
-        mov.confirmado_visao = True  # <-- chave pra próxima gaveta ser liberada
-        mov.save(update_fields=["imagem_path", "confirmado_visao"])
+def liberar_gaveta(sessao_id):
+    """
+    Devolve a gaveta ao colaborador (V -> G) depois que o pipeline falhou
+    ou foi interrompido. Se nem isso der certo, a sessão fica em V até a
+    limpeza de sessões expiradas.
+    """
+    try:
+        fluxo.abortar_confirmacao(sessao_id)
+    except Exception:
+        logger.exception("Falha ao liberar a confirmação da sessão %s.", sessao_id)
 
-    # se ao menos uma bateu com a visão, marcamos visao_ok_final = True
-    visao_ok_final = any(visao_matches) if visao_matches else False
 
-    movs_data = [
-        {
-            "id": m.id,
-            "ferramenta_id": m.ferramenta.id,
-            "ferramenta_nome": m.ferramenta.nome,
-            "gaveta_numero": m.gaveta_numero,
-            "quantidade": m.quantidade,
-            "imagem_path": m.imagem_path,
-            "confirmado_visao": m.confirmado_visao,
-        }
-        for m in movs
-    ]
+def falha_confirmacao(sessao_id, erro):
+    """
+    Resposta a qualquer erro no pipeline de confirmação: libera a gaveta
+    para o colaborador tentar de novo e responde 500.
+    """
+    liberar_gaveta(sessao_id)
+    if isinstance(erro, FalhaCaptura):
+        return resposta_falha_captura(erro)
 
-    # 6) Verifica se ainda existe outra gaveta com retirada pendente
-    proxima_gaveta = (
-        MovimentacaoFerramenta.objects
-        .filter(
-            sessao=sessao,
-            tipo="R",
-            confirmado_visao=False,
-        )
-        .order_by("gaveta_numero")
-        .values_list("gaveta_numero", flat=True)
-        .first()
+    logger.error(
+        "Erro na confirmação da sessão %s: %s", sessao_id, erro,
+        exc_info=(type(erro), erro, erro.__traceback__),
+    )
+    return JsonResponse(
+        {"detail": "Erro ao confirmar a gaveta.", "error": str(erro)},
+        status=500,
     )
 
-    sessao_encerrada = proxima_gaveta is None
 
-    # 6.1) Se ainda houver gaveta, ABRIMOS a próxima via MQTT
-    mqtt_abrir_proxima = None
-    if proxima_gaveta is not None:
-        try:
-            alias_abrir = f"abrir_gaveta_{int(proxima_gaveta)}"
-            mqtt_abrir_proxima = publish_run_command(
-                reader_id=reader_id,
-                alias=alias_abrir,
-                args=[],
-                mode="fg",
-                timeout_s=10.0,
-            )
-        except Exception as e:
-            logger.exception("Falha ao enviar comando MQTT para abrir próxima gaveta.")
-            mqtt_abrir_proxima = {"error": str(e)}
-
-    # 7) Se acabou tudo, marcamos a sessão como finalizada
-    if sessao_encerrada and sessao.status == "A":
-        sessao.status = "F"
-        # se o model tiver campo finalizado_em, atualiza também
-        if hasattr(sessao, "finalizado_em"):
-            sessao.finalizado_em = timezone.now()
-            sessao.save(update_fields=["status", "finalizado_em"])
-        else:
-            sessao.save(update_fields=["status"])
+@require_GET
+def job_confirmacao(request, job_id):
+    """
+    GET /api/jobs/<job_id>/
+    Situação de um job de confirmação (fila, tentativas, tempos por etapa
+    e, quando concluído, o mesmo corpo que a confirmação síncrona devolve).
+    """
+    try:
+        job = JobConfirmacao.objects.get(id=job_id)
+    except JobConfirmacao.DoesNotExist:
+        return JsonResponse({"detail": "Job não encontrado."}, status=404)
 
-    # 8) Define redirect_url para o front
-    if sessao_encerrada:
-        redirect_url = reverse("home")  # volta para a tela principal, esperando novo cartão
-    else:
-        redirect_url = reverse("retirar_confirmar", args=[sessao.id])
-
-    response = {
-        "detail": "Retirada confirmada com captura de imagem e visão.",
-        "sessao_id": sessao.id,
-        "gaveta_numero": gaveta_numero,
-        "imagem": imagem_rel,
-        "visao_ok": visao_ok_final,
-        "visao_raw": visao_raw,
-        "match_visao": {
-            "esperadas": esperadas,
-            "detectadas": detectadas,
-        },
-        "movimentacoes_atualizadas": movs_data,
-        "led": {
-            "on": led_on_result,
-            "off": led_off_result,
-        },
-        "fechar_gaveta": fechar_result,
-        "abrir_proxima_gaveta": mqtt_abrir_proxima,
-        "proxima_gaveta": proxima_gaveta,
-        "sessao_encerrada": sessao_encerrada,
-        "redirect_url": redirect_url,
-    }
+    return JsonResponse(job.como_dict(), status=200)
 
-    return JsonResponse(response, status=200)
+
+def _status_atual(reader_id=None):
+    """
+    Sessão em andamento mais recente, no formato de status_frontend.
+    Vem do registro em cache (operacoes/registro.py); só vai ao banco
+    com o cache frio.
+    """
+    return eventos.status_sessao(registro.sessao_ativa(reader_id))
 
 
 @require_GET
 def status_frontend(request):
     """
-    Endpoint chamado periodicamente pelo front (home.js)
-    para saber se existe alguma sessão em andamento.
+    Endpoint chamado pelo front (home.js) para saber se existe alguma
+    sessão em andamento (?reader_id= restringe a um leitor). Com o
+    servidor ASGI o home.js usa /api/eventos/ e só cai neste polling se o
+    canal de eventos não estiver disponível.
     """
-    agora = timezone.now()
-    limite = agora - timedelta(minutes=30)  # evita sessão velha
+    return JsonResponse(_status_atual(request.GET.get("reader_id")))
 
-    sessao = (
-        SessaoUso.objects
-        .filter(status="A", iniciado_em__gte=limite)
-        .select_related("colaborador")
-        .order_by("-iniciado_em")
-        .first()
-    )
 
-    if not sessao:
-        return JsonResponse({
-            "ok": True,
-            "sessao_ativa": False,
-        })
+def _evento_sse(tipo, dados):
+    return f"event: {tipo}\ndata: {json.dumps(dados)}\n\n"
 
-    return JsonResponse({
-        "ok": True,
-        "sessao_ativa": True,
-        "sessao_id": sessao.id,
-        "colaborador": sessao.colaborador.nome,
-    })
+
+async def _stream_eventos(reader_id=None):
+    # assina antes de ler o estado atual: nada que aconteça entre a
+    # consulta e o primeiro evento se perde
+    assinatura = eventos.assinar()
+    heartbeat_s = getattr(settings, "EVENTOS_HEARTBEAT_S", 15)
+    try:
+        yield _evento_sse("sessao", await sync_to_async(_status_atual)(reader_id))
+        while True:
+            evento = await assinatura.proximo(heartbeat_s)
+            if evento is None:
+                # comentário SSE: mantém proxies e o navegador sabendo que a conexão vive
+                yield ": ping\n\n"
+            elif reader_id and evento[0] == "sessao" and evento[1].get("reader_id", reader_id) != reader_id:
+                # sessão de outra caixa
+                continue
+            else:
+                yield _evento_sse(*evento)
+    finally:
+        eventos.cancelar(assinatura)
+
+
+async def eventos_sessao(request):
+    """
+    GET /api/eventos/  (text/event-stream)
+
+    Canal Server-Sent Events para as telas do quiosque. Envia o estado
+    atual ao conectar (evento "sessao", mesmo corpo de status_frontend) e
+    depois cada evento do ciclo de vida da sessão (operacoes/eventos.py),
+    sem consultar o banco enquanto nada acontece. Com ?reader_id=, só as
+    sessões da caixa desse leitor.
+
+    Só funciona servido pelo ASGI (caixa.asgi); no WSGI responde 503 e o
+    front volta para o polling.
+    """
+    if request.method != "GET":
+        return JsonResponse({"detail": "Método não permitido. Use GET."}, status=405)
+
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {"detail": "Eventos em tempo real exigem o servidor ASGI."},
+            status=503,
+        )
+
+    return StreamingHttpResponse(
+        _stream_eventos(request.GET.get("reader_id")),
+        content_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",   # nginx: não segurar o stream em buffer
+        },
+    )
 
 @csrf_exempt
+@idempotente
 def registrar_devolucao(request, sessao_id):
     """
     POST /api/sessoes/<sessao_id>/devolucoes/
@@ -546,125 +556,24 @@ def registrar_devolucao(request, sessao_id):
     if request.method != "POST":
         return JsonResponse({"error": "Método não permitido"}, status=405)
 
-    try:
-        payload = json.loads(request.body.decode("utf-8"))
-    except json.JSONDecodeError:
-        return JsonResponse({"error": "JSON inválido"}, status=400)
-
-    ids = payload.get("ferramentas_ids") or payload.get("ferramentas") or []
-    if not isinstance(ids, list) or not ids:
-        return JsonResponse(
-            {"error": "Campo 'ferramentas_ids' deve ser uma lista com pelo menos 1 id."},
-            status=400,
-        )
-
-    try:
-        sessao = SessaoUso.objects.select_related("colaborador", "cartao").get(id=sessao_id)
-    except SessaoUso.DoesNotExist:
-        return JsonResponse({"error": "Sessão não encontrada."}, status=404)
-
-    if sessao.status != "A":
-        return JsonResponse({"error": "Sessão não está em andamento."}, status=400)
-
-    colaborador = sessao.colaborador
-
-    # Garante que essas ferramentas estão em posse desse colaborador
-    last_mov_colab_qs = (
-        MovimentacaoFerramenta.objects
-        .filter(
-            ferramenta=OuterRef("pk"),
-            sessao__colaborador=colaborador,
-            confirmado_visao=True,
-        )
-        .order_by("-criado_em")
-    )
-
-    qs = (
-        Ferramenta.objects
-        .select_related("gaveta")
-        .filter(id__in=ids, ativa=True)
-        .annotate(last_tipo=Subquery(last_mov_colab_qs.values("tipo")[:1]))
-        .filter(last_tipo="R")  # só as que estão com ele
-    )
-
-    if not qs.exists():
-        return JsonResponse(
-            {"error": "Nenhuma ferramenta válida para devolução encontrada."},
-            status=400,
-        )
-
-    movimentacoes = []
-    gavetas_env = {}
-
-    for f in qs:
-        numero_gaveta = f.gaveta.numero if f.gaveta else None
-
-        mov = MovimentacaoFerramenta.objects.create(
-            sessao=sessao,
-            ferramenta=f,
-            tipo="D",  # devolução
-            gaveta_numero=numero_gaveta,
-            quantidade=1,
-            confirmado_visao=False,
-        )
-        movimentacoes.append(mov)
-
-        if numero_gaveta not in gavetas_env:
-            gavetas_env[numero_gaveta] = []
-        gavetas_env[numero_gaveta].append(f)
-
-    gavetas_ordenadas = sorted([g for g in gavetas_env.keys() if g is not None])
-    primeira_gaveta = gavetas_ordenadas[0] if gavetas_ordenadas else None
-
-    reader_id = getattr(settings, "READER_ID", None) or sessao.payload_inicial.get(
-        "reader_id", "rockpi-01"
-    )
+    erro, preparado = preparar_operacao(request, sessao_id, "D")
+    if erro:
+        return erro
+    sessao, ferramentas, gavetas_ordenadas = preparado
 
     mqtt_result = None
-    if primeira_gaveta is not None:
+    if sessao.gaveta_atual is not None:
         try:
-            alias = f"abrir_gaveta_{int(primeira_gaveta)}"
-            mqtt_result = publish_run_command(
-                reader_id=reader_id,
-                alias=alias,
-                args=[],
-                mode="fg",
-                timeout_s=10.0,
-            )
-            logger.info(
-                "MQTT abrir gaveta (devolucao): sessao=%s gaveta=%s reader_id=%s alias=%s resp=%s",
-                sessao.id,
-                primeira_gaveta,
-                reader_id,
-                alias,
-                mqtt_result,
-            )
+            mqtt_result = publish_run_command(**comando_abrir_primeira(sessao))
+            logar_abertura(sessao, mqtt_result)
         except Exception as e:
             logger.exception("Falha ao enviar comando MQTT para abrir gaveta (devolução).")
             mqtt_result = {"error": str(e)}
 
-    ferramentas_data = [
-        {
-            "id": f.id,
-            "nome": f.nome,
-            "gaveta_numero": f.gaveta.numero if f.gaveta else None,
-            "gaveta_nome": f.gaveta.nome if f.gaveta else None,
-        }
-        for f in qs
-    ]
+    return resposta_operacao(sessao, ferramentas, gavetas_ordenadas, mqtt_result)
 
-    return JsonResponse(
-        {
-            "ok": True,
-            "sessao_id": sessao.id,
-            "ferramentas_devolucao": ferramentas_data,
-            "gavetas_envolvidas": gavetas_ordenadas,
-            "primeira_gaveta": primeira_gaveta,
-            "mqtt": mqtt_result,
-        },
-        status=201,
-    )
 @csrf_exempt
+@idempotente
 def confirmar_devolucao_gaveta(request, sessao_id, gaveta_numero):
     """
     Confirma DEVOLUÇÃO da gaveta <gaveta_numero>:
@@ -679,168 +588,372 @@ def confirmar_devolucao_gaveta(request, sessao_id, gaveta_numero):
     if request.method != "POST":
         return JsonResponse({"detail": "Método não permitido. Use POST."}, status=405)
 
+    return _confirmar_gaveta(sessao_id, "D", gaveta_numero)
+
+
+def _exigir_staff(request):
+    """
+    Histórico e relatórios: só para usuários da equipe (login do admin).
+    """
+    if not (request.user.is_authenticated and request.user.is_staff):
+        return JsonResponse({"detail": "Acesso restrito à equipe."}, status=403)
+    return None
+
+
+@require_GET
+def arquivo_sessoes(request):
+    """
+    GET /api/arquivo/sessoes/
+
+    Sessões arquivadas (operacoes/arquivo.py), mais recentes primeiro.
+    Filtros: colaborador_id, matricula, ferramenta_id, desde, ate
+    (datas ISO, sobre iniciado_em) e limite (padrão 50, máx. 500).
+    """
+    negado = _exigir_staff(request)
+    if negado:
+        return negado
+
+    qs = SessaoArquivada.objects.all()
+    params = request.GET
+
+    if params.get("colaborador_id"):
+        qs = qs.filter(colaborador_id=params["colaborador_id"])
+    if params.get("matricula"):
+        qs = qs.filter(colaborador_matricula=params["matricula"])
+    if params.get("ferramenta_id"):
+        qs = qs.filter(movimentacoes__ferramenta_id=params["ferramenta_id"]).distinct()
+
+    for campo, lookup in (("desde", "iniciado_em__gte"), ("ate", "iniciado_em__lt")):
+        if params.get(campo):
+            data = parse_datetime(params[campo]) or parse_date(params[campo])
+            if data is None:
+                return JsonResponse({"detail": f"Data inválida em '{campo}'."}, status=400)
+            qs = qs.filter(**{lookup: data})
+
     try:
-        sessao = SessaoUso.objects.select_related("colaborador").get(id=sessao_id)
-    except SessaoUso.DoesNotExist:
-        return JsonResponse({"detail": "Sessão não encontrada."}, status=404)
+        limite = min(int(params.get("limite", 50)), 500)
+    except ValueError:
+        return JsonResponse({"detail": "'limite' deve ser um número."}, status=400)
 
-    if sessao.status != "A":
-        return JsonResponse(
-            {"detail": "Sessão não está em andamento."},
-            status=400,
-        )
+    sessoes = qs.order_by("-iniciado_em", "-id").prefetch_related("movimentacoes")[:limite]
+    return JsonResponse({"sessoes": [s.como_dict() for s in sessoes]})
 
-    movs = list(
-        MovimentacaoFerramenta.objects.filter(
-            sessao=sessao,
-            tipo="D",
-            gaveta_numero=gaveta_numero,
-            confirmado_visao=False,
-        ).select_related("ferramenta")
-    )
 
-    if not movs:
-        return JsonResponse(
-            {
-                "detail": (
-                    "Não há movimentações de devolução pendentes para "
-                    f"a gaveta {gaveta_numero} nesta sessão."
-                )
-            },
-            status=400,
-        )
+@require_GET
+def arquivo_sessao(request, sessao_id):
+    """
+    GET /api/arquivo/sessoes/<sessao_id>/
+    """
+    negado = _exigir_staff(request)
+    if negado:
+        return negado
+
+    try:
+        sessao = SessaoArquivada.objects.prefetch_related("movimentacoes").get(id=sessao_id)
+    except SessaoArquivada.DoesNotExist:
+        return JsonResponse({"detail": "Sessão não encontrada no arquivo."}, status=404)
+    return JsonResponse(sessao.como_dict())
+
+
+# dimensão do relatório -> campos agrupados em UsoDiario
+DIMENSOES_RELATORIO = {
+    "ferramentas": ("ferramenta_id", "ferramenta__nome"),
+    "colaboradores": ("colaborador_id", "colaborador__nome", "colaborador__matricula"),
+    "gavetas": ("gaveta_numero",),
+    "dias": ("dia",),
+}
 
-    reader_id = getattr(settings, "READER_ID", None) or sessao.payload_inicial.get(
-        "reader_id", "rasp-01"
+
+@require_GET
+def relatorio_uso(request, dimensao):
+    """
+    GET /api/relatorios/<ferramentas|colaboradores|gavetas|dias>/
+
+    Retiradas, devoluções e tempo fora da caixa agregados pela dimensão,
+    lidos só dos rollups diários (operacoes/rollups.py). Filtros: desde,
+    ate (datas ISO, inclusivas), ferramenta_id, colaborador_id e gaveta.
+    """
+    negado = _exigir_staff(request)
+    if negado:
+        return negado
+
+    agrupar = DIMENSOES_RELATORIO.get(dimensao)
+    if agrupar is None:
+        return JsonResponse({"detail": f"Relatório desconhecido: {dimensao}."}, status=404)
+
+    qs = UsoDiario.objects.all()
+    params = request.GET
+
+    for campo, lookup in (("desde", "dia__gte"), ("ate", "dia__lte")):
+        if params.get(campo):
+            data = parse_date(params[campo])
+            if data is None:
+                return JsonResponse({"detail": f"Data inválida em '{campo}'."}, status=400)
+            qs = qs.filter(**{lookup: data})
+
+    for campo, lookup in (
+        ("ferramenta_id", "ferramenta_id"),
+        ("colaborador_id", "colaborador_id"),
+        ("gaveta", "gaveta_numero"),
+    ):
+        if params.get(campo):
+            try:
+                qs = qs.filter(**{lookup: int(params[campo])})
+            except ValueError:
+                return JsonResponse({"detail": f"'{campo}' deve ser um número."}, status=400)
+
+    return JsonResponse({
+        "dimensao": dimensao,
+        "atualizado_ate_movimentacao": rollups.marca_atual(),
+        "linhas": rollups.resumir(qs, *agrupar),
+    })
+
+
+def _filtrar_historico(modelo, params):
+    """
+    Filtros comuns da exportação e da listagem do histórico.
+    Retorna (queryset, None) ou (None, mensagem de erro).
+    """
+    qs = modelo.objects.all()
+    sessoes = modelo is SessaoUso
+    prefixo = "" if sessoes else "sessao__"
+    campo_data = "iniciado_em" if sessoes else "criado_em"
+
+    for campo, lookup in (("desde", "gte"), ("ate", "lt")):
+        if params.get(campo):
+            data = parse_datetime(params[campo]) or parse_date(params[campo])
+            if data is None:
+                return None, f"Data inválida em '{campo}'."
+            qs = qs.filter(**{f"{campo_data}__{lookup}": data})
+
+    if params.get("matricula"):
+        qs = qs.filter(**{f"{prefixo}colaborador__matricula": params["matricula"]})
+    if params.get("tipo") and params["tipo"] not in ("R", "D"):
+        return None, "'tipo' deve ser R ou D."
+
+    # filtros sobre a movimentação; nas sessões, "tem alguma movimentação com..."
+    filtros_mov = {}
+    for campo, lookup in (
+        ("colaborador_id", None),
+        ("ferramenta_id", "ferramenta_id"),
+        ("gaveta", "gaveta_numero"),
+    ):
+        if not params.get(campo):
+            continue
+        try:
+            valor = int(params[campo])
+        except ValueError:
+            return None, f"'{campo}' deve ser um número."
+        if lookup is None:
+            qs = qs.filter(**{f"{prefixo}colaborador_id": valor})
+        else:
+            filtros_mov[lookup] = valor
+    if params.get("tipo"):
+        filtros_mov["tipo"] = params["tipo"]
+
+    if filtros_mov:
+        if sessoes:
+            qs = qs.filter(Exists(
+                MovimentacaoFerramenta.objects.filter(sessao=OuterRef("pk"), **filtros_mov)
+            ))
+        else:
+            qs = qs.filter(**filtros_mov)
+    return qs, None
+
+
+@require_GET
+def exportar_historico(request, tipo):
+    """
+    GET /api/exportar/<sessoes|movimentacoes>/?formato=csv|jsonl
+
+    Histórico completo em streaming (api/exportacao.py), com colaborador,
+    cartão e ferramenta já juntados. Filtros: desde, ate (datas ISO, sobre
+    iniciado_em / criado_em), colaborador_id, matricula, ferramenta_id,
+    gaveta e tipo (R/D).
+    """
+    negado = _exigir_staff(request)
+    if negado:
+        return negado
+
+    if tipo not in exportacao.EXPORTACOES:
+        return JsonResponse({"detail": f"Exportação desconhecida: {tipo}."}, status=404)
+    modelo, campos = exportacao.EXPORTACOES[tipo]
+
+    params = request.GET
+    formato = params.get("formato", "csv")
+    if formato not in ("csv", "jsonl"):
+        return JsonResponse({"detail": "'formato' deve ser csv ou jsonl."}, status=400)
+
+    qs, erro = _filtrar_historico(modelo, params)
+    if erro:
+        return JsonResponse({"detail": erro}, status=400)
+
+    resposta = StreamingHttpResponse(
+        exportacao.gerar(qs, campos, formato),
+        content_type="text/csv; charset=utf-8" if formato == "csv" else "application/x-ndjson; charset=utf-8",
     )
+    nome = f"{tipo}_{timezone.localdate():%Y%m%d}.{formato}"
+    resposta["Content-Disposition"] = f'attachment; filename="{nome}"'
+    return resposta
+
+
+@require_GET
+def evidencias_zip(request):
+    """
+    GET /api/evidencias/?sessao_id=N  ou  ?desde=...&ate=...
 
-    led_on_result = publish_run_command(
-        reader_id=reader_id,
-        alias="led_on",
-        args=[],
-        mode="fg",
-        timeout_s=10.0,
+    ZIP em streaming com as imagens e o JSON da visão de cada gaveta
+    confirmada, mais os manifestos (api/evidencias.py).
+    """
+    negado = _exigir_staff(request)
+    if negado:
+        return negado
+
+    params = request.GET
+    filtros = {}
+    if params.get("sessao_id"):
+        try:
+            filtros["sessao_id"] = int(params["sessao_id"])
+        except ValueError:
+            return JsonResponse({"detail": "'sessao_id' deve ser um número."}, status=400)
+    for campo in ("desde", "ate"):
+        if params.get(campo):
+            data = parse_datetime(params[campo]) or parse_date(params[campo])
+            if data is None:
+                return JsonResponse({"detail": f"Data inválida em '{campo}'."}, status=400)
+            filtros[campo] = data
+    if not filtros:
+        return JsonResponse({"detail": "Informe 'sessao_id' ou um período ('desde'/'ate')."}, status=400)
+
+    resposta = StreamingHttpResponse(
+        evidencias.gerar_zip(evidencias.sessoes(**filtros)),
+        content_type="application/zip",
     )
+    nome = f"evidencias_sessao{filtros['sessao_id']}" if "sessao_id" in filtros else "evidencias"
+    resposta["Content-Disposition"] = f'attachment; filename="{nome}.zip"'
+    return resposta
+
+
+def _listar_historico(request, tipo):
+    negado = _exigir_staff(request)
+    if negado:
+        return negado
+
+    params = request.GET
+    qs, erro = _filtrar_historico(exportacao.EXPORTACOES[tipo][0], params)
+    if erro:
+        return JsonResponse({"detail": erro}, status=400)
 
     try:
-        imagem_rel, visao_ok, visao_raw = capture_and_process(sessao.id, gaveta_numero)
-    except Exception as e:
-        logger.exception(
-            "Erro na captura/processamento de imagem da gaveta %s (devolução): %s",
-            gaveta_numero,
-            e,
-        )
-        publish_run_command(
-            reader_id=reader_id,
-            alias="led_off",
-            args=[],
-            mode="fg",
-            timeout_s=10.0,
-        )
-        return JsonResponse(
-            {"detail": "Erro ao capturar/processar imagem da gaveta.", "error": str(e)},
-            status=500,
-        )
+        campos = historico.escolher_campos(tipo, params.get("campos"))
+    except ValueError as e:
+        return JsonResponse({"detail": f"Campos desconhecidos: {e}."}, status=400)
 
-    led_off_result = publish_run_command(
-        reader_id=reader_id,
-        alias="led_off",
-        args=[],
-        mode="fg",
-        timeout_s=10.0,
-    )
+    try:
+        limite = min(int(params.get("limite", historico.LIMITE_PADRAO)), historico.LIMITE_MAXIMO)
+    except ValueError:
+        return JsonResponse({"detail": "'limite' deve ser um número."}, status=400)
+    if limite < 1:
+        return JsonResponse({"detail": "'limite' deve ser positivo."}, status=400)
 
     try:
-        alias_fechar = f"fechar_gaveta_{int(gaveta_numero)}"
-        fechar_result = publish_run_command(
-            reader_id=reader_id,
-            alias=alias_fechar,
-            args=[],
-            mode="fg",
-            timeout_s=10.0,
-        )
-    except Exception as e:
-        logger.exception("Falha ao enviar comando MQTT para fechar gaveta (devolução).")
-        fechar_result = {"error": str(e)}
+        dados = historico.pagina(tipo, qs, campos, params.get("cursor"), limite)
+    except historico.CursorInvalido:
+        return JsonResponse({"detail": "Cursor inválido."}, status=400)
+    return JsonResponse(dados)
 
-    visao_json = None
-    detectadas = []
 
-    raw = visao_raw.get("raw") if isinstance(visao_raw, dict) else None
-    if isinstance(raw, dict):
-        visao_json = raw.get("json")
-        if isinstance(visao_json, dict):
-            # ainda uso 'retiradas' porque é o que o script de visão retorna hoje
-            detectadas = visao_json.get("retiradas", []) or []
+@require_GET
+def listar_sessoes(request):
+    """
+    GET /api/sessoes/
 
-    esperadas = [m.ferramenta.nome for m in movs]
+    Sessões, mais recentes primeiro, paginadas por cursor (api/historico.py):
+    a resposta traz "proximo", que vai em ?cursor= na página seguinte.
+    Filtros da exportação (desde, ate, colaborador_id, matricula,
+    ferramenta_id, gaveta, tipo), limite (padrão 50, máx. 500) e
+    campos=sessao_id,status,... para ler só o necessário.
+    """
+    return _listar_historico(request, "sessoes")
 
-    # >>> AQUI: marca todas como confirmadas pra fluxo andar entre gavetas
-    for mov in movs:
-        mov.imagem_path = imagem_rel
-        mov.confirmado_visao = True
-        mov.save(update_fields=["imagem_path", "confirmado_visao"])
 
-    visao_ok_final = bool(detectadas)  # se quiser usar como flag geral
+@require_GET
+def listar_movimentacoes(request):
+    """
+    GET /api/movimentacoes/
 
-    movs_data = [
-        {
-            "id": m.id,
-            "ferramenta_id": m.ferramenta.id,
-            "ferramenta_nome": m.ferramenta.nome,
-            "gaveta_numero": m.gaveta_numero,
-            "quantidade": m.quantidade,
-            "imagem_path": m.imagem_path,
-            "confirmado_visao": m.confirmado_visao,
-        }
-        for m in movs
-    ]
+    Mesmo formato de /api/sessoes/, por movimentação (criado_em, id).
+    """
+    return _listar_historico(request, "movimentacoes")
 
-    # Próxima gaveta com devolução pendente
-    proxima_gaveta = (
-        MovimentacaoFerramenta.objects
-        .filter(
-            sessao=sessao,
-            tipo="D",
-            confirmado_visao=False,
-        )
-        .order_by("gaveta_numero")
-        .values_list("gaveta_numero", flat=True)
-        .first()
-    )
 
-    sessao_encerrada = proxima_gaveta is None
+def _percentil(ordenados, p):
+    # nearest-rank sobre uma lista já ordenada
+    if not ordenados:
+        return None
+    indice = max(int(-(-p * len(ordenados) // 100)) - 1, 0)
+    return ordenados[indice]
 
-    if sessao_encerrada and sessao.status == "A":
-        sessao.status = "F"
-        sessao.save(update_fields=["status"])
 
-    # >>> AQUI: se tiver próxima gaveta, manda já a URL dela
-    if sessao_encerrada:
-        redirect_url = reverse("home")
+@require_GET
+def resumo_tempos_etapas(request):
+    """
+    GET /api/tempos/etapas/
+
+    p50/p95/máximo/média de cada etapa da confirmação de gaveta
+    (TempoEtapa, api/confirmacao.py) numa janela: horas (padrão 24, máx.
+    24*90) ou desde/ate (datas ISO). Filtros: operacao (R/D) e gaveta.
+    """
+    negado = _exigir_staff(request)
+    if negado:
+        return negado
+
+    params = request.GET
+    if params.get("desde") or params.get("ate"):
+        desde = parse_datetime(params.get("desde", "")) or parse_date(params.get("desde", ""))
+        ate = parse_datetime(params.get("ate", "")) or parse_date(params.get("ate", ""))
+        if (params.get("desde") and desde is None) or (params.get("ate") and ate is None):
+            return JsonResponse({"detail": "Data inválida em 'desde'/'ate'."}, status=400)
     else:
-        redirect_url = reverse("devolver_confirmar", args=[sessao.id, proxima_gaveta])
-
-    response = {
-        "detail": "Devolução confirmada com captura de imagem e visão.",
-        "sessao_id": sessao.id,
-        "gaveta_numero": gaveta_numero,
-        "imagem": imagem_rel,
-        "visao_ok": visao_ok_final,
-        "visao_raw": visao_raw,
-        "match_visao": {
-            "esperadas": esperadas,
-            "detectadas": detectadas,
-        },
-        "movimentacoes_atualizadas": movs_data,
-        "led": {
-            "on": led_on_result,
-            "off": led_off_result,
-        },
-        "fechar_gaveta": fechar_result,
-        "proxima_gaveta": proxima_gaveta,
-        "sessao_encerrada": sessao_encerrada,
-        "redirect_url": redirect_url,
-    }
+        try:
+            horas = min(float(params.get("horas", 24)), 24 * 90)
+        except ValueError:
+            return JsonResponse({"detail": "'horas' deve ser um número."}, status=400)
+        desde, ate = timezone.now() - timedelta(hours=horas), None
+
+    qs = TempoEtapa.objects.all()
+    if desde:
+        qs = qs.filter(criado_em__gte=desde)
+    if ate:
+        qs = qs.filter(criado_em__lt=ate)
+    if params.get("operacao"):
+        qs = qs.filter(operacao=params["operacao"])
+    if params.get("gaveta"):
+        try:
+            qs = qs.filter(gaveta_numero=int(params["gaveta"]))
+        except ValueError:
+            return JsonResponse({"detail": "'gaveta' deve ser um número."}, status=400)
 
-    return JsonResponse(response, status=200)
+    duracoes = {}
+    for etapa, ms in qs.order_by("etapa", "duracao_ms").values_list("etapa", "duracao_ms").iterator():
+        duracoes.setdefault(etapa, []).append(ms)
+
+    etapas = [
+        {
+            "etapa": etapa,
+            "n": len(lista),
+            "p50_ms": _percentil(lista, 50),
+            "p95_ms": _percentil(lista, 95),
+            "max_ms": lista[-1],
+            "media_ms": round(sum(lista) / len(lista), 1),
+        }
+        for etapa, lista in duracoes.items()
+    ]
+    # as que mais pesam na cauda primeiro
+    etapas.sort(key=lambda e: e["p95_ms"], reverse=True)
+
+    return JsonResponse({
+        "desde": desde.isoformat() if desde else None,
+        "ate": ate.isoformat() if ate else None,
+        "etapas": etapas,
+    })
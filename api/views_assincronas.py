@@ -0,0 +1,126 @@
+# api/views_assincronas.py
+"""
+Versões assíncronas das views de sessão que esperam pelo hardware
+(registrar_retirada/devolucao e confirmar_*_gaveta), para o servidor ASGI
+(caixa/asgi.py).
+
+As síncronas passam quase todo o tempo esperando (conexão MQTT com sleep
+fixo, câmera, subprocesso de visão) com uma thread do worker presa. Aqui
+cada espera é um await: MQTT pela conexão asyncio
+(hardware/mqtt_assincrono.py), captura numa thread do executor, visão
+como subprocesso asyncio (executar_confirmacao_async) e o ORM por
+sync_to_async. Um processo atende várias caixas sem um pool grande de
+threads.
+
+As rotas (api/urls.py) passam por conforme_servidor(): no ASGI respondem
+as assíncronas; no WSGI (runserver, testes com Client) continuam as
+síncronas de api/views.py, com o mesmo corpo de resposta.
+"""
+
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from hardware.mqtt_client import publish_run_command_async
+
+from . import views
+from .confirmacao import executar_confirmacao_async
+from .idempotencia import idempotente
+
+logger = logging.getLogger(__name__)
+
+
+def conforme_servidor(sincrona, assincrona):
+    """
+    View que responde com `assincrona` quando a requisição veio pelo ASGI
+    e com `sincrona` (na thread da requisição, por sync_to_async) no WSGI.
+    """
+    sincrona_em_thread = sync_to_async(sincrona)
+
+    async def view(request, *args, **kwargs):
+        if isinstance(request, ASGIRequest):
+            return await assincrona(request, *args, **kwargs)
+        return await sincrona_em_thread(request, *args, **kwargs)
+
+    view.__name__ = sincrona.__name__
+    view.__doc__ = sincrona.__doc__
+    return csrf_exempt(view)
+
+
+async def _registrar(request, sessao_id, tipo):
+    if request.method != "POST":
+        return JsonResponse({"error": "Método não permitido"}, status=405)
+
+    erro, preparado = await sync_to_async(views.preparar_operacao)(request, sessao_id, tipo)
+    if erro:
+        return erro
+    sessao, ferramentas, gavetas_ordenadas = preparado
+
+    mqtt_result = None
+    if sessao.gaveta_atual is not None:
+        try:
+            mqtt_result = await publish_run_command_async(**views.comando_abrir_primeira(sessao))
+            views.logar_abertura(sessao, mqtt_result)
+        except Exception as e:
+            logger.exception("Falha ao enviar comando MQTT para abrir gaveta.")
+            mqtt_result = {"error": str(e)}
+
+    return views.resposta_operacao(sessao, ferramentas, gavetas_ordenadas, mqtt_result)
+
+
+@idempotente
+async def registrar_retirada(request, sessao_id):
+    """
+    POST /api/sessoes/<sessao_id>/retiradas/ (ver views.registrar_retirada).
+    """
+    return await _registrar(request, sessao_id, "R")
+
+
+@idempotente
+async def registrar_devolucao(request, sessao_id):
+    """
+    POST /api/sessoes/<sessao_id>/devolucoes/ (ver views.registrar_devolucao).
+    """
+    return await _registrar(request, sessao_id, "D")
+
+
+async def _confirmar_gaveta(request, sessao_id, tipo, gaveta_numero):
+    if request.method != "POST":
+        return JsonResponse({"detail": "Método não permitido. Use POST."}, status=405)
+
+    resposta, sessao, movs = await sync_to_async(views.reservar_confirmacao)(
+        sessao_id, tipo, gaveta_numero
+    )
+    if resposta:
+        return resposta
+
+    try:
+        response = await executar_confirmacao_async(sessao, movs)
+    except Exception as e:
+        return await sync_to_async(views.falha_confirmacao)(sessao.id, e)
+    except asyncio.CancelledError:
+        # cliente desconectou no meio: a gaveta não pode ficar presa em V
+        await asyncio.shield(sync_to_async(views.liberar_gaveta)(sessao.id))
+        raise
+
+    return JsonResponse(response, status=200)
+
+
+@idempotente
+async def confirmar_retirada_gaveta(request, sessao_id, gaveta_numero):
+    """
+    Confirmação de uma gaveta da retirada (ver views.confirmar_retirada_gaveta).
+    """
+    return await _confirmar_gaveta(request, sessao_id, "R", gaveta_numero)
+
+
+@idempotente
+async def confirmar_devolucao_gaveta(request, sessao_id, gaveta_numero):
+    """
+    Confirmação de uma gaveta da devolução (ver views.confirmar_devolucao_gaveta).
+    """
+    return await _confirmar_gaveta(request, sessao_id, "D", gaveta_numero)
@@ -5,6 +5,12 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+
+Servido por um servidor ASGI (ex.: uvicorn caixa.asgi:application), o
+quiosque ganha o canal de eventos (/api/eventos/) e as views de sessão
+assíncronas (api/views_assincronas.py): MQTT, câmera e visão aguardados no
+event loop, então um processo atende várias caixas sem um pool grande de
+threads. No WSGI (runserver) tudo continua síncrono.
 """
 
 import os
@@ -0,0 +1,343 @@
+# caixa/metricas.py
+"""
+Métricas de requisição, banco e MQTT em formato Prometheus.
+
+MetricasMiddleware registra, por nome de rota (url_name):
+
+  - caixa_http_requisicoes_total{view, metodo, status};
+  - caixa_http_latencia_segundos (histograma) {view};
+  - numa amostra de METRICAS_AMOSTRAGEM das requisições: quantas
+    consultas e quanto tempo de banco cada uma gastou
+    (caixa_db_consultas_total, caixa_db_segundos_total e
+    caixa_http_amostradas_total, para tirar a média).
+
+publish_run_command (hardware/mqtt_client.py) soma em
+caixa_mqtt_publicacoes_total e caixa_mqtt_publicacao_segundos, e a
+expiração (operacoes/expiracao.py) nos contadores caixa_expiracao_*.
+
+Sem amostragem, o custo por requisição é um perf_counter e um dicionário
+sob lock; o wrapper de SQL só entra nas requisições amostradas. Requisição
+mais lenta que METRICAS_LENTO_MS vai para o log, com o SQL quando ela
+foi amostrada.
+
+Cada processo guarda os números em memória. Os que atendem de fato
+(workers web, pelo MetricasMiddleware, worker_confirmacoes e
+expirar_sessoes) chamam servir() e passam a gravar, a cada
+METRICAS_FLUSH_S e ao sair, um retrato em METRICAS_DIR/<pid>.json;
+comandos avulsos (check, migrate, shell...) não gravam nada. /metrics
+soma os retratos dos processos vivos e apaga os de pid que já morreu, para
+o diretório não crescer: os contadores de um processo que saiu deixam a
+soma, o que o Prometheus trata como reinício do contador.
+"""
+
+import atexit
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+_contadores = defaultdict(float)     # (nome, labels) -> valor
+_histogramas = {}                    # (nome, labels) -> [contagens por bucket..., soma, total]
+_descarregado_em = 0.0
+_servindo = False
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def incrementar(nome, valor=1, **labels):
+    with _lock:
+        _contadores[(nome, _labels(labels))] += valor
+
+
+def observar(nome, segundos, **labels):
+    chave = (nome, _labels(labels))
+    with _lock:
+        h = _histogramas.get(chave)
+        if h is None:
+            h = _histogramas[chave] = [0] * (len(BUCKETS_S) + 1) + [0.0, 0]
+        h[bisect_left(BUCKETS_S, segundos)] += 1
+        h[-2] += segundos
+        h[-1] += 1
+
+
+def limpar():
+    """
+    Zera as métricas deste processo (testes).
+    """
+    with _lock:
+        _contadores.clear()
+        _histogramas.clear()
+
+
+def _diretorio():
+    return getattr(settings, "METRICAS_DIR", None)
+
+
+def _retrato():
+    with _lock:
+        return {
+            "contadores": [[n, list(l), v] for (n, l), v in _contadores.items()],
+            "histogramas": [[n, list(l), list(h)] for (n, l), h in _histogramas.items()],
+        }
+
+
+def servir():
+    """
+    Marca este processo como um dos que atendem: a partir daqui ele grava
+    o retrato em METRICAS_DIR (e uma última vez ao sair).
+    """
+    global _servindo
+    if _servindo:
+        return
+    _servindo = True
+    atexit.register(descarregar, forcar=True)
+
+
+def descarregar(forcar=False):
+    """
+    Grava o retrato deste processo em METRICAS_DIR (no máximo a cada
+    METRICAS_FLUSH_S, a não ser com forcar=True). Só nos processos que
+    chamaram servir().
+    """
+    global _descarregado_em
+
+    diretorio = _diretorio()
+    if not diretorio or not _servindo:
+        return
+    agora = time.monotonic()
+    if not forcar and agora - _descarregado_em < getattr(settings, "METRICAS_FLUSH_S", 5):
+        return
+    _descarregado_em = agora
+
+    try:
+        os.makedirs(diretorio, exist_ok=True)
+        destino = os.path.join(diretorio, f"{os.getpid()}.json")
+        with tempfile.NamedTemporaryFile("w", dir=diretorio, suffix=".tmp", delete=False) as f:
+            json.dump(_retrato(), f)
+        os.replace(f.name, destino)
+    except OSError:
+        logger.exception("Falha ao gravar as métricas em %s", diretorio)
+
+
+def _vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True    # existe, mas é de outro usuário
+    return True
+
+
+def agregar():
+    """
+    Soma dos retratos dos processos vivos (o deste processo vem direto da
+    memória): (contadores, histogramas) no mesmo formato dos dicionários
+    deste módulo. Retratos de processos mortos são apagados.
+    """
+    retratos = [_retrato()]
+    diretorio = _diretorio()
+    if diretorio and os.path.isdir(diretorio):
+        for nome in os.listdir(diretorio):
+            pid, extensao = os.path.splitext(nome)
+            if extensao != ".json" or not pid.isdigit() or int(pid) == os.getpid():
+                continue
+            caminho = os.path.join(diretorio, nome)
+            if not _vivo(int(pid)):
+                try:
+                    os.remove(caminho)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(caminho) as f:
+                    retratos.append(json.load(f))
+            except (OSError, ValueError):
+                continue   # processo regravando o arquivo agora
+
+    contadores = defaultdict(float)
+    histogramas = {}
+    for r in retratos:
+        for nome, labels, valor in r["contadores"]:
+            contadores[(nome, tuple(map(tuple, labels)))] += valor
+        for nome, labels, h in r["histogramas"]:
+            chave = (nome, tuple(map(tuple, labels)))
+            if chave not in histogramas:
+                histogramas[chave] = list(h)
+            else:
+                histogramas[chave] = [a + b for a, b in zip(histogramas[chave], h)]
+    return contadores, histogramas
+
+
+def _fmt_labels(labels, extra=()):
+    pares = list(labels) + list(extra)
+    if not pares:
+        return ""
+    texto = ",".join(
+        '%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pares
+    )
+    return "{" + texto + "}"
+
+
+def _num(v):
+    return repr(float(v)) if isinstance(v, float) and not float(v).is_integer() else str(int(v))
+
+
+def exposicao():
+    """
+    Texto no formato de exposição do Prometheus (versão 0.0.4).
+    """
+    contadores, histogramas = agregar()
+    linhas = []
+
+    for nome in sorted({n for n, _ in contadores}):
+        linhas.append(f"# TYPE {nome} counter")
+        for (n, labels), valor in sorted(contadores.items()):
+            if n == nome:
+                linhas.append(f"{nome}{_fmt_labels(labels)} {_num(valor)}")
+
+    for nome in sorted({n for n, _ in histogramas}):
+        linhas.append(f"# TYPE {nome} histogram")
+        for (n, labels), h in sorted(histogramas.items()):
+            if n != nome:
+                continue
+            acumulado = 0
+            for limite, contagem in zip(BUCKETS_S + (None,), h[:-2]):
+                acumulado += contagem
+                le = "+Inf" if limite is None else repr(limite)
+                linhas.append(f"{nome}_bucket{_fmt_labels(labels, [('le', le)])} {acumulado}")
+            linhas.append(f"{nome}_sum{_fmt_labels(labels)} {_num(h[-2])}")
+            linhas.append(f"{nome}_count{_fmt_labels(labels)} {int(h[-1])}")
+
+    return "\n".join(linhas) + "\n"
+
+
+def metrics(request):
+    """
+    GET /metrics
+
+    Com METRICAS_TOKEN definido, exige "Authorization: Bearer <token>".
+    """
+    token = getattr(settings, "METRICAS_TOKEN", "")
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponse("não autorizado\n", status=401, content_type="text/plain")
+    return HttpResponse(exposicao(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class _ConsultasAmostradas:
+    """
+    execute_wrapper que conta consultas e tempo de banco (e guarda o SQL
+    para o log de requisição lenta).
+    """
+
+    MAX_SQL = 50
+
+    def __init__(self, guardar_sql):
+        self.total = 0
+        self.segundos = 0.0
+        self.sql = [] if guardar_sql else None
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracao = time.perf_counter() - inicio
+            self.total += 1
+            self.segundos += duracao
+            if self.sql is not None and len(self.sql) < self.MAX_SQL:
+                self.sql.append(f"{duracao * 1000:.1f} ms  {sql}")
+
+
+def _nome_view(request):
+    match = getattr(request, "resolver_match", None)
+    return (match.view_name if match else None) or "sem_rota"
+
+
+class MetricasMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.ativas = getattr(settings, "METRICAS_ATIVAS", True)
+        self.amostragem = getattr(settings, "METRICAS_AMOSTRAGEM", 0.0)
+        self.lento_s = getattr(settings, "METRICAS_LENTO_MS", 0) / 1000
+        if self.ativas:
+            # o middleware só é montado pelos handlers WSGI/ASGI
+            servir()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.ativas:
+            return self.get_response(request)
+
+        inicio = time.perf_counter()
+        consultas = None
+        if self.amostragem and random.random() < self.amostragem:
+            consultas = _ConsultasAmostradas(guardar_sql=bool(self.lento_s))
+            with connection.execute_wrapper(consultas):
+                response = self.get_response(request)
+        else:
+            response = self.get_response(request)
+
+        self._registrar(request, response, time.perf_counter() - inicio, consultas)
+        return response
+
+    async def __acall__(self, request):
+        # sem amostragem de SQL: o ORM roda em outras threads (sync_to_async)
+        if not self.ativas:
+            return await self.get_response(request)
+        inicio = time.perf_counter()
+        response = await self.get_response(request)
+        self._registrar(request, response, time.perf_counter() - inicio, None)
+        return response
+
+    def _registrar(self, request, response, duracao, consultas):
+        view = _nome_view(request)
+        incrementar(
+            "caixa_http_requisicoes_total",
+            view=view, metodo=request.method, status=response.status_code,
+        )
+        observar("caixa_http_latencia_segundos", duracao, view=view)
+
+        if consultas is not None:
+            incrementar("caixa_http_amostradas_total", view=view)
+            incrementar("caixa_db_consultas_total", consultas.total, view=view)
+            incrementar("caixa_db_segundos_total", consultas.segundos, view=view)
+
+        if self.lento_s and duracao >= self.lento_s:
+            if consultas is not None and consultas.sql is not None:
+                logger.warning(
+                    "Requisição lenta: %s %s (%s) em %.0f ms, %s consulta(s) / %.0f ms de banco:\n%s",
+                    request.method, request.path, view, duracao * 1000,
+                    consultas.total, consultas.segundos * 1000, "\n".join(consultas.sql),
+                )
+            else:
+                logger.warning(
+                    "Requisição lenta: %s %s (%s) em %.0f ms (não amostrada, sem SQL)",
+                    request.method, request.path, view, duracao * 1000,
+                )
+
+        descarregar()
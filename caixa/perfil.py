@@ -0,0 +1,245 @@
+# caixa/perfil.py
+"""
+Perfil de uma requisição, sob demanda, para reproduzir lentidão no próprio
+quiosque ("o botão de confirmar demora 8 s").
+
+Com PERFIL_ATIVO=True, uma requisição de um usuário staff com o header
+"X-Perfil: 1" (ou ?perfil=1 na URL) roda sob cProfile e, ao mesmo tempo,
+uma thread amostra a pilha da requisição a cada PERFIL_INTERVALO_MS. Em
+PERFIL_DIR (padrão MEDIA_ROOT/perfis) ficam, com o mesmo nome-base:
+
+  - <base>.prof    estatísticas do cProfile (pstats, snakeviz...);
+  - <base>.folded  pilhas colapsadas ("a;b;c N"), prontas para
+                   flamegraph.pl / speedscope;
+  - <base>.json    metadados: caminho, sessão, status, duração, trace.
+
+O nome-base leva a hora, o caminho e a sessão; a resposta volta com
+"X-Perfil: <base>". Para listar/apagar: "python manage.py perfis".
+
+Sob o ASGI o perfil é da thread do event loop, onde a view assíncrona
+roda: o ORM (sync_to_async) aparece como espera, e o que outras
+requisições fizerem no loop ao mesmo tempo entra junto.
+"""
+
+import cProfile
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from . import rastreio
+
+logger = logging.getLogger(__name__)
+
+EXTENSOES = (".prof", ".folded", ".json")
+
+# um profiler por processo de cada vez (o cProfile não aceita dois ativos)
+_em_uso = threading.Lock()
+
+
+def diretorio():
+    return str(getattr(settings, "PERFIL_DIR", "") or os.path.join(settings.MEDIA_ROOT, "perfis"))
+
+
+def _quer_perfil(request):
+    if not getattr(settings, "PERFIL_ATIVO", False):
+        return False
+    return request.headers.get("X-Perfil") == "1" or request.GET.get("perfil") == "1"
+
+
+def pedido(request):
+    """
+    True se a requisição pediu perfil e pode tê-lo.
+    """
+    if not _quer_perfil(request):
+        return False
+    usuario = getattr(request, "user", None)
+    return bool(usuario and usuario.is_authenticated and usuario.is_staff)
+
+
+class Amostrador:
+    """
+    Thread que amostra a pilha de outra thread e conta as pilhas colapsadas.
+    """
+
+    def __init__(self, thread_id, intervalo_s):
+        self.thread_id = thread_id
+        self.intervalo_s = intervalo_s
+        self.pilhas = Counter()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="perfil-amostrador")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._thread.join()
+
+    def _loop(self):
+        while not self._parar.wait(self.intervalo_s):
+            frame = sys._current_frames().get(self.thread_id)
+            quadros = []
+            while frame is not None:
+                codigo = frame.f_code
+                modulo = frame.f_globals.get("__name__", "?")
+                quadros.append(f"{modulo}:{codigo.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if quadros:
+                self.pilhas[";".join(reversed(quadros))] += 1
+
+    def colapsado(self):
+        return "".join(f"{pilha} {n}\n" for pilha, n in self.pilhas.most_common())
+
+
+def _nome_base(request, sessao_id, agora):
+    caminho = re.sub(r"[^A-Za-z0-9]+", "-", request.path).strip("-")[:60] or "raiz"
+    sessao = f"_sessao{sessao_id}" if sessao_id is not None else ""
+    return f"{agora:%Y%m%d-%H%M%S}-{agora.microsecond // 1000:03d}_{caminho}{sessao}"
+
+
+def perfilar(request, get_response):
+    """
+    Roda get_response(request) sob o profiler e grava os arquivos.
+    """
+    intervalo_s = getattr(settings, "PERFIL_INTERVALO_MS", 5) / 1000
+    perfil = cProfile.Profile()
+    inicio = time.perf_counter()
+    with Amostrador(threading.get_ident(), intervalo_s) as amostrador:
+        perfil.enable()
+        try:
+            response = get_response(request)
+        finally:
+            perfil.disable()
+    duracao_ms = round((time.perf_counter() - inicio) * 1000, 1)
+    return _gravar(request, response, perfil, amostrador, intervalo_s, duracao_ms)
+
+
+async def perfilar_async(request, get_response):
+    """
+    perfilar para o ASGI: perfila a thread do event loop enquanto espera
+    a resposta; os arquivos são gravados numa thread.
+    """
+    intervalo_s = getattr(settings, "PERFIL_INTERVALO_MS", 5) / 1000
+    perfil = cProfile.Profile()
+    inicio = time.perf_counter()
+    with Amostrador(threading.get_ident(), intervalo_s) as amostrador:
+        perfil.enable()
+        try:
+            response = await get_response(request)
+        finally:
+            perfil.disable()
+    duracao_ms = round((time.perf_counter() - inicio) * 1000, 1)
+    return await sync_to_async(_gravar)(request, response, perfil, amostrador, intervalo_s, duracao_ms)
+
+
+def _gravar(request, response, perfil, amostrador, intervalo_s, duracao_ms):
+    match = getattr(request, "resolver_match", None)
+    sessao_id = match.kwargs.get("sessao_id") if match else None
+    agora = timezone.localtime()
+    base = _nome_base(request, sessao_id, agora)
+    pasta = diretorio()
+    try:
+        os.makedirs(pasta, exist_ok=True)
+        caminho = os.path.join(pasta, base)
+        perfil.dump_stats(caminho + ".prof")
+        with open(caminho + ".folded", "w", encoding="utf-8") as f:
+            f.write(amostrador.colapsado())
+        with open(caminho + ".json", "w", encoding="utf-8") as f:
+            json.dump({
+                "nome": base,
+                "metodo": request.method,
+                "caminho": request.path,
+                "view": match.view_name if match else None,
+                "sessao_id": sessao_id,
+                "status": response.status_code,
+                "duracao_ms": duracao_ms,
+                "amostras": sum(amostrador.pilhas.values()),
+                "intervalo_ms": intervalo_s * 1000,
+                "usuario": request.user.get_username(),
+                "trace_id": rastreio.trace_id_atual(),
+                "criado_em": agora.isoformat(),
+            }, f, ensure_ascii=False, indent=2)
+    except OSError:
+        logger.exception("Falha ao gravar o perfil de %s em %s", request.path, pasta)
+        return response
+
+    logger.info("Perfil de %s %s (%.0f ms) gravado em %s", request.method, request.path, duracao_ms, caminho)
+    response["X-Perfil"] = base
+    return response
+
+
+def listar():
+    """
+    Metadados dos perfis gravados, do mais novo para o mais antigo.
+    """
+    pasta = diretorio()
+    if not os.path.isdir(pasta):
+        return []
+    perfis = []
+    for nome in os.listdir(pasta):
+        if not nome.endswith(".json"):
+            continue
+        caminho = os.path.join(pasta, nome)
+        try:
+            with open(caminho, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        meta["modificado_em"] = os.path.getmtime(caminho)
+        perfis.append(meta)
+    return sorted(perfis, key=lambda p: p["nome"], reverse=True)
+
+
+def apagar(nome):
+    """
+    Apaga os arquivos de um perfil. Retorna quantos arquivos saíram.
+    """
+    n = 0
+    for ext in EXTENSOES:
+        caminho = os.path.join(diretorio(), os.path.basename(nome) + ext)
+        if os.path.exists(caminho):
+            os.remove(caminho)
+            n += 1
+    return n
+
+
+class PerfilMiddleware:
+    """
+    Fica depois do AuthenticationMiddleware (precisa de request.user).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if pedido(request) and _em_uso.acquire(blocking=False):
+            try:
+                return perfilar(request, self.get_response)
+            finally:
+                _em_uso.release()
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        # request.user vai ao banco: só para quem pediu perfil
+        if _quer_perfil(request) and await sync_to_async(pedido)(request) and _em_uso.acquire(blocking=False):
+            try:
+                return await perfilar_async(request, self.get_response)
+            finally:
+                _em_uso.release()
+        return await self.get_response(request)
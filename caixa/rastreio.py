@@ -0,0 +1,425 @@
+# caixa/rastreio.py
+"""
+Rastreio de ponta a ponta de uma sessão: toque do cartão -> telas/API ->
+comandos MQTT -> captura -> visão, tudo com o mesmo trace_id.
+
+  - o toque (api.views.process_nfc_payload) abre o trace e o id fica em
+    SessaoUso.trace_id (e no retrato do registro de sessões);
+  - RastreioMiddleware continua esse trace em toda requisição com
+    sessao_id na rota (ou com header W3C "traceparent");
+  - publish_run_command manda "traceparent" no payload MQTT (e o req_id
+    passa a ser trace_id-span_id);
+  - a visão roda no pool com o contexto copiado e passa TRACEPARENT ao
+    gaveta_detect.py; o worker de jobs retoma o trace da sessão;
+  - os logs ganham %(trace_id)s e %(span_id)s (FiltroRastreio).
+
+Cada span terminado vai para uma fila; uma thread grava em lote no JSONL
+de RASTREIO_JSONL e/ou envia como OTLP/HTTP JSON para RASTREIO_OTLP_URL
+(ex.: "python manage.py coletor_rastros", que faz o papel do coletor).
+"python manage.py ver_rastro <trace_id>" mostra a cascata de um trace.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_atual = ContextVar("caixa_span", default=None)
+
+_fila = queue.SimpleQueue()
+_exportador = None
+_exportador_lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "nome", "atributos", "inicio_ns", "fim_ns", "status")
+
+    def __init__(self, nome, trace_id, parent_id, atributos):
+        self.nome = nome
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.atributos = atributos
+        self.inicio_ns = time.time_ns()
+        self.fim_ns = None
+        self.status = "ok"
+
+    def como_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "nome": self.nome,
+            "inicio_ns": self.inicio_ns,
+            "fim_ns": self.fim_ns,
+            "duracao_ms": round((self.fim_ns - self.inicio_ns) / 1e6, 3),
+            "status": self.status,
+            "atributos": self.atributos,
+            "servico": getattr(settings, "RASTREIO_SERVICO", "caixa"),
+            "pid": os.getpid(),
+        }
+
+
+def novo_trace_id():
+    return secrets.token_hex(16)
+
+
+def atual():
+    """
+    Span em andamento neste contexto, ou None.
+    """
+    return _atual.get()
+
+
+def trace_id_atual():
+    s = _atual.get()
+    return s.trace_id if s else None
+
+
+def traceparent():
+    """
+    Header W3C do span atual ("00-<trace>-<span>-01"), ou None.
+    """
+    s = _atual.get()
+    return f"00-{s.trace_id}-{s.span_id}-01" if s else None
+
+
+def ler_traceparent(valor):
+    """
+    (trace_id, span_id) de um header W3C, ou (None, None).
+    """
+    partes = (valor or "").strip().split("-")
+    if len(partes) != 4 or len(partes[1]) != 32 or len(partes[2]) != 16:
+        return None, None
+    try:
+        int(partes[1], 16), int(partes[2], 16)
+    except ValueError:
+        return None, None
+    return partes[1], partes[2]
+
+
+def _ativo():
+    return getattr(settings, "RASTREIO_ATIVO", True)
+
+
+@contextmanager
+def span(nome, trace_id=None, parent_id=None, **atributos):
+    """
+    Abre um span filho do atual (ou, com trace_id, no trace indicado;
+    sem nenhum dos dois, num trace novo).
+    """
+    if not _ativo():
+        yield None
+        return
+
+    pai = _atual.get()
+    if trace_id is None:
+        trace_id = pai.trace_id if pai else novo_trace_id()
+    if parent_id is None and pai is not None and pai.trace_id == trace_id:
+        parent_id = pai.span_id
+
+    s = Span(nome, trace_id, parent_id, atributos)
+    token = _atual.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.status = "erro"
+        s.atributos["erro"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        try:
+            _atual.reset(token)
+        except ValueError:
+            # encerrado em outro contexto (middleware síncrono sob ASGI)
+            _atual.set(pai)
+        s.fim_ns = time.time_ns()
+        _enfileirar(s)
+
+
+def _enfileirar(s):
+    if not (getattr(settings, "RASTREIO_JSONL", "") or getattr(settings, "RASTREIO_OTLP_URL", "")):
+        return
+    _fila.put(s.como_dict())
+    _garantir_exportador()
+
+
+# ---------- exportação ----------
+
+def _otlp(spans):
+    """
+    Corpo OTLP/HTTP JSON (ExportTraceServiceRequest) com os spans.
+    """
+    def atributo(chave, valor):
+        if isinstance(valor, bool):
+            v = {"boolValue": valor}
+        elif isinstance(valor, int):
+            v = {"intValue": str(valor)}
+        elif isinstance(valor, float):
+            v = {"doubleValue": valor}
+        else:
+            v = {"stringValue": str(valor)}
+        return {"key": chave, "value": v}
+
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [
+                atributo("service.name", getattr(settings, "RASTREIO_SERVICO", "caixa")),
+            ]},
+            "scopeSpans": [{
+                "scope": {"name": "caixa.rastreio"},
+                "spans": [
+                    {
+                        "traceId": s["trace_id"],
+                        "spanId": s["span_id"],
+                        "parentSpanId": s["parent_id"] or "",
+                        "name": s["nome"],
+                        "kind": 1,
+                        "startTimeUnixNano": str(s["inicio_ns"]),
+                        "endTimeUnixNano": str(s["fim_ns"]),
+                        "attributes": [atributo(k, v) for k, v in s["atributos"].items()]
+                                      + [atributo("process.pid", s["pid"])],
+                        "status": {"code": 2 if s["status"] == "erro" else 1},
+                    }
+                    for s in spans
+                ],
+            }],
+        }],
+    }
+
+
+def descarregar():
+    """
+    Exporta o que está na fila. Retorna quantos spans saíram.
+    """
+    spans = []
+    while True:
+        try:
+            spans.append(_fila.get_nowait())
+        except queue.Empty:
+            break
+    if not spans:
+        return 0
+
+    caminho = getattr(settings, "RASTREIO_JSONL", "")
+    if caminho:
+        try:
+            with open(caminho, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(s, ensure_ascii=False, default=str) + "\n" for s in spans)
+        except OSError:
+            logger.exception("Falha ao gravar %s span(s) em %s", len(spans), caminho)
+
+    url = getattr(settings, "RASTREIO_OTLP_URL", "")
+    if url:
+        try:
+            req = urllib.request.Request(
+                url,
+                data=json.dumps(_otlp(spans), default=str).encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            urllib.request.urlopen(req, timeout=2).close()
+        except Exception as e:
+            logger.warning("Falha ao enviar %s span(s) para %s: %s", len(spans), url, e)
+    return len(spans)
+
+
+def _loop_exportador():
+    while True:
+        time.sleep(getattr(settings, "RASTREIO_FLUSH_S", 1.0))
+        descarregar()
+
+
+def _garantir_exportador():
+    global _exportador
+    if _exportador is not None:
+        return
+    with _exportador_lock:
+        if _exportador is not None:
+            return
+        _exportador = threading.Thread(target=_loop_exportador, daemon=True, name="rastreio-exportador")
+        _exportador.start()
+        atexit.register(descarregar)
+
+
+# ---------- logs ----------
+
+class FiltroRastreio(logging.Filter):
+    """
+    Acrescenta trace_id/span_id ("-" fora de um span) ao registro; usado
+    nos handlers de settings.LOGGING.
+    """
+
+    def filter(self, record):
+        s = _atual.get()
+        record.trace_id = s.trace_id if s else "-"
+        record.span_id = s.span_id if s else "-"
+        return True
+
+
+# ---------- requisições ----------
+
+class RastreioMiddleware:
+    """
+    Span por requisição ligada a uma sessão (kwarg sessao_id na rota) ou
+    que chegou com "traceparent". As demais (polling de status, estáticos)
+    não geram span.
+
+    Sob o ASGI, process_view (que pode consultar o registro de sessões)
+    roda numa thread pelo próprio Django; o resto não bloqueia.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self._encerrar(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self._encerrar(request, await self.get_response(request))
+
+    def _encerrar(self, request, response):
+        ctx = getattr(request, "_rastreio", None)
+        if ctx is not None:
+            gerenciador, s = ctx
+            s.atributos["http.status"] = response.status_code
+            gerenciador.__exit__(None, None, None)
+            response["traceparent"] = f"00-{s.trace_id}-{s.span_id}-01"
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not _ativo():
+            return None
+
+        trace_id, parent_id = ler_traceparent(request.headers.get("traceparent"))
+        sessao_id = view_kwargs.get("sessao_id")
+        if trace_id is None and sessao_id is not None:
+            from operacoes import registro
+
+            r = registro.sessao(sessao_id)
+            trace_id = (r or {}).get("trace_id") or None
+        if trace_id is None and sessao_id is None:
+            return None
+
+        atributos = {"http.method": request.method, "http.path": request.path}
+        if sessao_id is not None:
+            atributos["sessao_id"] = sessao_id
+        nome = getattr(request.resolver_match, "view_name", None) or request.path
+        gerenciador = span(f"http {nome}", trace_id=trace_id, parent_id=parent_id, **atributos)
+        request._rastreio = (gerenciador, gerenciador.__enter__())
+        return None
+
+    def process_exception(self, request, exception):
+        ctx = getattr(request, "_rastreio", None)
+        if ctx is not None:
+            ctx[1].status = "erro"
+            ctx[1].atributos["erro"] = f"{type(exception).__name__}: {exception}"
+        return None
+
+
+# ---------- leitura ----------
+
+def de_otlp(corpo):
+    """
+    Spans (no formato do JSONL) de um corpo OTLP/HTTP JSON.
+    """
+    def valor(v):
+        for tipo in ("stringValue", "boolValue", "doubleValue"):
+            if tipo in v:
+                return v[tipo]
+        if "intValue" in v:
+            return int(v["intValue"])
+        return None
+
+    spans = []
+    for rs in corpo.get("resourceSpans", []):
+        recurso = {a["key"]: valor(a["value"]) for a in rs.get("resource", {}).get("attributes", [])}
+        for ss in rs.get("scopeSpans", []):
+            for s in ss.get("spans", []):
+                atributos = {a["key"]: valor(a["value"]) for a in s.get("attributes", [])}
+                inicio, fim = int(s["startTimeUnixNano"]), int(s["endTimeUnixNano"])
+                spans.append({
+                    "trace_id": s["traceId"],
+                    "span_id": s["spanId"],
+                    "parent_id": s.get("parentSpanId") or None,
+                    "nome": s["name"],
+                    "inicio_ns": inicio,
+                    "fim_ns": fim,
+                    "duracao_ms": round((fim - inicio) / 1e6, 3),
+                    "status": "erro" if s.get("status", {}).get("code") == 2 else "ok",
+                    "atributos": atributos,
+                    "servico": recurso.get("service.name", ""),
+                    "pid": atributos.pop("process.pid", None),
+                })
+    return spans
+
+
+def ler_spans(caminho, trace_id):
+    """
+    Spans do trace no JSONL, em ordem de início.
+    """
+    spans = []
+    with open(caminho, encoding="utf-8") as f:
+        for linha in f:
+            if trace_id not in linha:
+                continue
+            try:
+                s = json.loads(linha)
+            except ValueError:
+                continue
+            if s.get("trace_id") == trace_id:
+                spans.append(s)
+    return sorted(spans, key=lambda s: s["inicio_ns"])
+
+
+def cascata(spans, largura=40):
+    """
+    Linhas de texto com a cascata do trace: cada span indentado sob o pai,
+    com início relativo, duração e uma barra na escala do trace.
+    """
+    if not spans:
+        return []
+    ids = {s["span_id"] for s in spans}
+    filhos = {}
+    for s in spans:
+        pai = s["parent_id"] if s["parent_id"] in ids else None
+        filhos.setdefault(pai, []).append(s)
+
+    t0 = min(s["inicio_ns"] for s in spans)
+    total = max(max(s["fim_ns"] for s in spans) - t0, 1)
+    linhas = []
+
+    def visitar(s, nivel):
+        ini = (s["inicio_ns"] - t0) / total
+        fim = (s["fim_ns"] - t0) / total
+        a = int(ini * largura)
+        b = max(int(fim * largura), a + 1)
+        barra = " " * a + "█" * (b - a) + " " * (largura - b)
+        nome = ("  " * nivel + s["nome"])[:48]
+        erro = "  ERRO" if s["status"] == "erro" else ""
+        linhas.append(
+            f"{nome:<48} {(s['inicio_ns'] - t0) / 1e6:>9.1f} ms {s['duracao_ms']:>9.1f} ms |{barra}|{erro}"
+        )
+        for f in filhos.get(s["span_id"], []):
+            visitar(f, nivel + 1)
+
+    for raiz in filhos.get(None, []):
+        visitar(raiz, 0)
+    return linhas
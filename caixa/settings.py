@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 from dotenv import load_dotenv
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -63,6 +64,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # primeiro, para medir todo o resto (caixa/metricas.py)
+    'caixa.metricas.MetricasMiddleware',
+    'caixa.rastreio.RastreioMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -70,6 +74,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # depois da autenticação: só staff pode pedir perfil (caixa/perfil.py)
+    'caixa.perfil.PerfilMiddleware',
 ]
 
 ROOT_URLCONF = 'caixa.urls'
@@ -167,9 +173,144 @@ MQTT_USERNAME = MQTT_CONFIG['USER']
 MQTT_PASSWORD = MQTT_CONFIG['PASS']
 MQTT_RFID_TOPIC = f"{MQTT_CONFIG['BASE']}/+/rfid/uid"
 
+# Leitor padrão: caixa dos toques sem reader_id e das gavetas cadastradas
+# sem caixa. Com várias caixas, cada uma é um inventario.Caixa e os
+# comandos MQTT vão para o leitor da caixa da sessão.
 READER_ID = os.getenv('READER_ID', 'rasp-01')
 CAMERA_INDEX = int(os.getenv('CAMERA_INDEX', '0'))
 
+# Idempotency-Key nos POST da API (api/idempotencia.py)
+IDEMPOTENCIA_TTL_S = int(os.getenv('IDEMPOTENCIA_TTL_S', str(24 * 3600)))  # quanto tempo a resposta fica guardada
+IDEMPOTENCIA_ESPERA_S = int(os.getenv('IDEMPOTENCIA_ESPERA_S', '60'))      # quanto uma duplicata espera a original
+IDEMPOTENCIA_RESERVA_S = int(os.getenv('IDEMPOTENCIA_RESERVA_S', '900'))  # reserva de uma original que não terminou (processo morto)
+
+# Confirmação de gaveta em fila (api/jobs.py): o endpoint responde 202 e o
+# worker "python manage.py worker_confirmacoes" roda captura/visão/MQTT
+CONFIRMACAO_ASSINCRONA = os.getenv('CONFIRMACAO_ASSINCRONA', 'False') == 'True'
+CONFIRMACAO_MAX_TENTATIVAS = int(os.getenv('CONFIRMACAO_MAX_TENTATIVAS', '3'))
+
+# Visão em paralelo com o fechamento da gaveta e a abertura da próxima
+# (api/confirmacao.py); o resultado é gravado depois em visao_confere
+VISAO_EM_PARALELO = os.getenv('VISAO_EM_PARALELO', 'True') == 'True'
+VISAO_THREADS = int(os.getenv('VISAO_THREADS', '2'))
+
+# Intervalo do ping no canal SSE /api/eventos/ (segundos)
+EVENTOS_HEARTBEAT_S = int(os.getenv('EVENTOS_HEARTBEAT_S', '15'))
+
+# Registro das sessões em andamento (operacoes/registro.py). Precisa ser
+# compartilhado entre os processos (web, worker_confirmacoes, bridge MQTT):
+# o padrão é FileBasedCache em cache/sessoes; com mais de uma máquina, use
+# SESSOES_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache (ou
+# memcached) e SESSOES_CACHE_LOCATION. LocMem (um por processo) só com
+# DEBUG ou nos testes: fora deles o "manage.py check" recusa
+# (operacoes/checks.py). Os testes usam LocMem para não ler nem sujar o
+# cache da instalação.
+TESTING = sys.argv[1:2] == ['test']
+CACHES = {
+    # catálogo de ferramentas (inventario/catalogo.py), caixas
+    # (inventario/caixas.py) e autorização dos cartões
+    # (usuarios/autorizacao.py): também compartilhado, para uma edição no
+    # admin valer em todos os processos
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', str(BASE_DIR / 'cache' / 'default')),
+    },
+    'sessoes': {
+        'BACKEND': os.getenv('SESSOES_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('SESSOES_CACHE_LOCATION', str(BASE_DIR / 'cache' / 'sessoes')),
+        'OPTIONS': {'MAX_ENTRIES': 2000},
+    },
+}
+if TESTING:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'sessoes': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'sessoes-ativas',
+        },
+    }
+SESSOES_CACHE = 'sessoes'
+
+# Repasse dos eventos entre processos pelo broker MQTT (operacoes/eventos.py)
+EVENTOS_MQTT = os.getenv('EVENTOS_MQTT', 'False' if TESTING else 'True') == 'True'
+
+# Sessão em andamento há mais que isso é expirada por
+# "python manage.py expirar_sessoes" (operacoes/expiracao.py)
+SESSAO_TTL_S = int(os.getenv('SESSAO_TTL_S', str(30 * 60)))
+SESSOES_CACHE_TTL_NENHUMA_S = int(os.getenv('SESSOES_CACHE_TTL_NENHUMA_S', '60'))
+
+# Catálogo de ferramentas no cache 'default' (inventario/catalogo.py),
+# invalidado pelos signals de Gaveta/Ferramenta; o TTL é só uma rede de segurança
+CATALOGO_CACHE_TTL_S = int(os.getenv('CATALOGO_CACHE_TTL_S', '3600'))
+
+# Caixas (leitores) cadastradas no cache 'default' (inventario/caixas.py),
+# invalidadas pelos signals de Caixa; o TTL é só uma rede de segurança
+CAIXAS_CACHE_TTL_S = int(os.getenv('CAIXAS_CACHE_TTL_S', '300'))
+
+# Autorização dos cartões NFC no cache 'default' (usuarios/autorizacao.py)
+# e gravação em lote do ultimo_uso_em
+AUTORIZACAO_CACHE_TTL_S = int(os.getenv('AUTORIZACAO_CACHE_TTL_S', '300'))
+AUTORIZACAO_FLUSH_S = float(os.getenv('AUTORIZACAO_FLUSH_S', '5'))
+
+# Sessões encerradas há mais que isso vão para o arquivo
+# ("python manage.py arquivar_historico", operacoes/arquivo.py)
+ARQUIVO_HORIZONTE_DIAS = int(os.getenv('ARQUIVO_HORIZONTE_DIAS', '90'))
+
+# Métricas Prometheus em /metrics (caixa/metricas.py). Cada processo que
+# atende (web, worker_confirmacoes, expirar_sessoes) grava um retrato em
+# METRICAS_DIR e o /metrics soma os dos processos vivos; vazio = só o
+# processo que respondeu. METRICAS_AMOSTRAGEM: fração das requisições com
+# contagem de consultas/tempo de banco (0 = desligado). METRICAS_LENTO_MS:
+# requisições mais lentas que isso vão para o log, com SQL se amostradas
+# (0 = desligado).
+METRICAS_ATIVAS = os.getenv('METRICAS_ATIVAS', 'True') == 'True'
+METRICAS_DIR = os.getenv('METRICAS_DIR', '' if TESTING else str(BASE_DIR / 'cache' / 'metricas'))
+METRICAS_FLUSH_S = float(os.getenv('METRICAS_FLUSH_S', '5'))
+METRICAS_AMOSTRAGEM = float(os.getenv('METRICAS_AMOSTRAGEM', '0'))
+METRICAS_LENTO_MS = int(os.getenv('METRICAS_LENTO_MS', '0'))
+METRICAS_TOKEN = os.getenv('METRICAS_TOKEN', '')
+
+# Rastreio de ponta a ponta das sessões (caixa/rastreio.py). Os spans vão
+# para o JSONL de RASTREIO_JSONL e/ou para um coletor OTLP/HTTP em
+# RASTREIO_OTLP_URL (ex.: http://127.0.0.1:4318/v1/traces, o endereço
+# padrão de "python manage.py coletor_rastros"); vazios = não exporta.
+RASTREIO_ATIVO = os.getenv('RASTREIO_ATIVO', 'True') == 'True'
+RASTREIO_SERVICO = os.getenv('RASTREIO_SERVICO', 'caixa')
+RASTREIO_JSONL = os.getenv('RASTREIO_JSONL', '')
+RASTREIO_OTLP_URL = os.getenv('RASTREIO_OTLP_URL', '')
+RASTREIO_FLUSH_S = float(os.getenv('RASTREIO_FLUSH_S', '1'))
+
+# Perfil de requisição sob demanda (caixa/perfil.py): com PERFIL_ATIVO, um
+# staff manda "X-Perfil: 1" ou ?perfil=1 e o perfil vai para PERFIL_DIR
+# ("python manage.py perfis" lista/apaga)
+PERFIL_ATIVO = os.getenv('PERFIL_ATIVO', 'False') == 'True'
+PERFIL_DIR = os.getenv('PERFIL_DIR', os.path.join(MEDIA_ROOT, 'perfis'))
+PERFIL_INTERVALO_MS = float(os.getenv('PERFIL_INTERVALO_MS', '5'))
+
+# trace_id/span_id em todo registro de log (caixa.rastreio.FiltroRastreio)
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'rastreio': {'()': 'caixa.rastreio.FiltroRastreio'},
+    },
+    'formatters': {
+        'rastreio': {
+            'format': '%(asctime)s %(levelname)s %(name)s [trace=%(trace_id)s span=%(span_id)s] %(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'rastreio',
+            'filters': ['rastreio'],
+        },
+    },
+    'root': {'handlers': ['console'], 'level': os.getenv('LOG_LEVEL', 'WARNING')},
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
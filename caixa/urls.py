@@ -1,8 +1,11 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from caixa import metricas
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include("api.urls")),   # suas APIs
+    path("metrics", metricas.metrics, name="metrics"),   # Prometheus
     path("", include("web.urls")),       # tudo do front vai para o app 'web'
 ]
@@ -0,0 +1,241 @@
+# hardware/broker_local.py
+"""
+Broker MQTT 3.1.1 mínimo, em asyncio, para testar publish_run_command,
+o bridge de RFID e a Rock Pi simulada (hardware/rockpi_simulada.py) sem
+mosquitto:
+
+    python manage.py broker_local --porta 1883
+
+Suporta CONNECT (usuário/senha são aceitos sem checar), SUBSCRIBE com
+"+" e "#", PUBLISH QoS 0/1 (QoS 2 é respondido no protocolo e repassado
+como QoS 1), mensagens retidas, PINGREQ e keepalive. Não guarda sessão
+(clean session sempre) nem reenvia QoS 1 sem PUBACK: é um dublê de
+teste, não um broker de produção.
+
+Nos testes: BrokerLocal(porta=0).iniciar() sobe numa thread e numa porta
+livre (broker.porta); parar()/reiniciar() simulam a queda do broker,
+derrubando todas as conexões.
+"""
+
+import asyncio
+import logging
+import struct
+import threading
+
+from .mqtt_protocolo import (
+    CONNACK, CONNECT, DISCONNECT, PINGREQ, PINGRESP, PUBACK, PUBCOMP, PUBLISH, PUBREC, PUBREL,
+    SUBACK, SUBSCRIBE, UNSUBACK, UNSUBSCRIBE, Leitor, ler_pacote, pacote, texto,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def casa_topico(filtro, topico):
+    """
+    True se o tópico casa com o filtro de assinatura ("+" e "#").
+    """
+    f, t = filtro.split("/"), topico.split("/")
+    for i, parte in enumerate(f):
+        if parte == "#":
+            return True
+        if i >= len(t) or (parte != "+" and parte != t[i]):
+            return False
+    return len(f) == len(t)
+
+
+class _Cliente:
+    def __init__(self, broker, reader, writer):
+        self.broker = broker
+        self.reader = reader
+        self.writer = writer
+        self.id = None
+        self.assinaturas = {}    # filtro -> qos
+        self.proximo_id = 0
+
+    def enviar(self, dados):
+        if not self.writer.is_closing():
+            self.writer.write(dados)
+
+    def entregar(self, topico, payload, qos, retain=False):
+        flags = (qos << 1) | (1 if retain else 0)
+        corpo = texto(topico)
+        if qos:
+            self.proximo_id = self.proximo_id % 65535 + 1
+            corpo += struct.pack("!H", self.proximo_id)
+        self.enviar(pacote(PUBLISH, flags, corpo + payload))
+
+
+class BrokerLocal:
+    def __init__(self, host="127.0.0.1", porta=1883):
+        self.host = host
+        self.porta = porta
+        self.clientes = {}
+        self.retidas = {}
+        self.estatisticas = {"conexoes": 0, "publicacoes": 0, "entregas": 0}
+        self._loop = None
+        self._thread = None
+        self._servidor = None
+        self._pronto = threading.Event()
+
+    # ---------- protocolo ----------
+
+    async def _atender(self, reader, writer):
+        cliente = _Cliente(self, reader, writer)
+        try:
+            tipo, _, corpo = await ler_pacote(reader, 10)
+            if tipo != CONNECT:
+                return
+            keepalive = self._conectar(cliente, corpo)
+            # keepalive: 1,5x o combinado sem pacote nenhum derruba o cliente
+            limite = keepalive * 1.5 if keepalive else None
+            while True:
+                tipo, flags, corpo = await ler_pacote(reader, limite)
+                if tipo == DISCONNECT:
+                    break
+                self._tratar(cliente, tipo, flags, corpo)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception:
+            logger.exception("Broker local: erro no cliente %s", cliente.id)
+        finally:
+            if cliente.id is not None and self.clientes.get(cliente.id) is cliente:
+                del self.clientes[cliente.id]
+            writer.close()
+
+    def _conectar(self, cliente, corpo):
+        leitor = Leitor(corpo)
+        leitor.str_()                        # "MQTT" / "MQIsdp"
+        leitor.u8()                          # nível do protocolo
+        flags = leitor.u8()
+        keepalive = leitor.u16()
+        cliente.id = leitor.str_() or f"anonimo-{id(cliente)}"
+        if flags & 0x04:                     # will: lido e ignorado
+            leitor.str_()
+            leitor.bytes_()
+
+        anterior = self.clientes.get(cliente.id)
+        if anterior is not None:
+            anterior.writer.close()
+        self.clientes[cliente.id] = cliente
+        self.estatisticas["conexoes"] += 1
+        cliente.enviar(pacote(CONNACK, 0, b"\x00\x00"))
+        return keepalive
+
+    def _tratar(self, cliente, tipo, flags, corpo):
+        leitor = Leitor(corpo)
+        if tipo == PUBLISH:
+            qos, retain = (flags >> 1) & 0x03, flags & 0x01
+            topico = leitor.str_()
+            pid = leitor.u16() if qos else None
+            payload = leitor.resto()
+            if qos == 1:
+                cliente.enviar(pacote(PUBACK, 0, struct.pack("!H", pid)))
+            elif qos == 2:
+                cliente.enviar(pacote(PUBREC, 0, struct.pack("!H", pid)))
+            self.publicar(topico, payload, min(qos, 1), retain)
+        elif tipo == PUBREL:
+            cliente.enviar(pacote(PUBCOMP, 0, corpo[:2]))
+        elif tipo == SUBSCRIBE:
+            pid = leitor.u16()
+            concedidos = []
+            novos = []
+            while leitor.pos < len(corpo):
+                filtro = leitor.str_()
+                qos = min(leitor.u8() & 0x03, 1)
+                cliente.assinaturas[filtro] = qos
+                concedidos.append(qos)
+                novos.append((filtro, qos))
+            cliente.enviar(pacote(SUBACK, 0, struct.pack("!H", pid) + bytes(concedidos)))
+            for filtro, qos in novos:
+                for topico, (payload, qos_msg) in self.retidas.items():
+                    if casa_topico(filtro, topico):
+                        cliente.entregar(topico, payload, min(qos, qos_msg), retain=True)
+        elif tipo == UNSUBSCRIBE:
+            pid = leitor.u16()
+            while leitor.pos < len(corpo):
+                cliente.assinaturas.pop(leitor.str_(), None)
+            cliente.enviar(pacote(UNSUBACK, 0, struct.pack("!H", pid)))
+        elif tipo == PINGREQ:
+            cliente.enviar(pacote(PINGRESP, 0))
+        # PUBACK/PUBREC/PUBCOMP dos clientes: sem reenvio, nada a fazer
+
+    def publicar(self, topico, payload, qos=0, retain=False):
+        self.estatisticas["publicacoes"] += 1
+        if retain:
+            if payload:
+                self.retidas[topico] = (payload, qos)
+            else:
+                self.retidas.pop(topico, None)
+        for cliente in list(self.clientes.values()):
+            qos_sub = max(
+                (q for f, q in cliente.assinaturas.items() if casa_topico(f, topico)),
+                default=None,
+            )
+            if qos_sub is not None:
+                cliente.entregar(topico, payload, min(qos, qos_sub))
+                self.estatisticas["entregas"] += 1
+
+    # ---------- ciclo de vida ----------
+
+    async def _subir(self):
+        self._servidor = await asyncio.start_server(self._atender, self.host, self.porta)
+        self.porta = self._servidor.sockets[0].getsockname()[1]
+        logger.info("Broker local ouvindo em %s:%s", self.host, self.porta)
+
+    async def _descer(self):
+        self._servidor.close()
+        for cliente in list(self.clientes.values()):
+            cliente.writer.close()
+        self.clientes.clear()
+        await self._servidor.wait_closed()
+
+    def servir(self):
+        """
+        Roda na thread atual até Ctrl+C (usado pelo comando broker_local).
+        """
+        async def principal():
+            await self._subir()
+            await self._servidor.serve_forever()
+
+        asyncio.run(principal())
+
+    def iniciar(self):
+        """
+        Sobe numa thread própria e volta quando já está aceitando conexões.
+        """
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, daemon=True, name="broker-local")
+            self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._subir(), self._loop).result(5)
+        return self
+
+    def parar(self):
+        """
+        Derruba o servidor e todas as conexões (como uma queda do broker).
+        """
+        if self._servidor is not None:
+            asyncio.run_coroutine_threadsafe(self._descer(), self._loop).result(5)
+            self._servidor = None
+
+    def reiniciar(self, pausa_s=0.0):
+        self.parar()
+        if pausa_s:
+            threading.Event().wait(pausa_s)
+        self.iniciar()
+
+    async def _cancelar_tarefas(self):
+        tarefas = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for t in tarefas:
+            t.cancel()
+        await asyncio.gather(*tarefas, return_exceptions=True)
+
+    def encerrar(self):
+        self.parar()
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._cancelar_tarefas(), self._loop).result(5)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(5)
+            self._loop.close()
+            self._loop = None
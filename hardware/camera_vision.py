@@ -1,12 +1,17 @@
+import asyncio
 import os
 import json
 import logging
 import subprocess
 import sys
+import time
 
 import cv2 as cv
+from asgiref.sync import sync_to_async
 from django.conf import settings
 
+from caixa import rastreio
+
 logger = logging.getLogger(__name__)
 # Config da câmera 
 CAMERA_INDEX = int(os.getenv("CAMERA_INDEX", "0"))
@@ -20,6 +25,11 @@ TARGET_H = int(os.getenv("VISION_TARGET_HEIGHT", "1080"))
 def _ensure_dir(path: str):
     os.makedirs(path, exist_ok=True)
 
+
+def _ms(inicio):
+    # duração desde `inicio` (time.monotonic), em ms
+    return round((time.monotonic() - inicio) * 1000, 1)
+
 def capture_and_process(sessao_id: int, gaveta_numero: int):
     """
     Captura uma imagem da câmera, força para TARGET_W x TARGET_H,
@@ -27,6 +37,20 @@ def capture_and_process(sessao_id: int, gaveta_numero: int):
     e também força a imagem de saída para a mesma resolução.
     Retorna (caminho_relativo_da_imagem_sessao, visao_ok, debug_dict).
     """
+    image_rel, meta = capture_frame(sessao_id, gaveta_numero)
+    visao_ok, debug = process_frame(sessao_id, gaveta_numero, meta)
+    return image_rel, visao_ok, debug
+
+
+def capture_frame(sessao_id: int, gaveta_numero: int):
+    """
+    Só a parte da câmera: captura, redimensiona e salva o frame em
+    media/sessoes/<sessao_id>/. Depois disso a gaveta já pode fechar;
+    a visão (process_frame) trabalha sobre o arquivo salvo.
+    Retorna (caminho_relativo_da_imagem_sessao, meta); meta["tempos_ms"]
+    traz a duração de cada passo (abrir a câmera, warmup, leitura, JPEG).
+    """
+    tempos = {}
 
     media_root = settings.MEDIA_ROOT
     sessao_dir = os.path.join(media_root, "sessoes", str(sessao_id))
@@ -37,6 +61,7 @@ def capture_and_process(sessao_id: int, gaveta_numero: int):
     image_abs = os.path.join(sessao_dir, image_name)
 
     # ---------- ABRE A CÂMERA ----------
+    inicio = time.monotonic()
     cap = cv.VideoCapture(CAMERA_INDEX, cv.CAP_DSHOW)
     if not cap.isOpened():
         cap = cv.VideoCapture(CAMERA_INDEX)
@@ -55,12 +80,18 @@ def capture_and_process(sessao_id: int, gaveta_numero: int):
     cap.set(cv.CAP_PROP_FRAME_WIDTH, TARGET_W)
     cap.set(cv.CAP_PROP_FRAME_HEIGHT, TARGET_H)
 
+    tempos["camera_abrir"] = _ms(inicio)
+
     # warmup: lê alguns frames para estabilizar exposição/foco
+    inicio = time.monotonic()
     for _ in range(CAMERA_WARMUP_FRAMES):
         cap.read()
+    tempos["camera_warmup"] = _ms(inicio)
 
+    inicio = time.monotonic()
     ok, frame = cap.read()
     cap.release()
+    tempos["camera_leitura"] = _ms(inicio)
 
     if not ok or frame is None:
         raise RuntimeError("Falha ao capturar frame da câmera")
@@ -69,16 +100,95 @@ def capture_and_process(sessao_id: int, gaveta_numero: int):
     h0, w0 = frame.shape[:2]
 
     # ---------- FORÇA RESIZE PARA TARGET_W x TARGET_H ANTES DE SALVAR ----------
+    inicio = time.monotonic()
     frame_resized = cv.resize(frame, (TARGET_W, TARGET_H), interpolation=cv.INTER_CUBIC)
     cv.imwrite(image_abs, frame_resized)
+    tempos["jpeg_gravar"] = _ms(inicio)
 
     # Confere o que realmente foi salvo em disco
+    inicio = time.monotonic()
     check = cv.imread(image_abs)
+    tempos["jpeg_conferir"] = _ms(inicio)
     if check is not None:
         hc, wc = check.shape[:2]
     else:
         hc, wc = None, None
 
+    image_rel = os.path.join("sessoes", str(sessao_id), image_name)
+
+    # ---------- META DE DEBUG: RESOLUÇÕES ----------
+    meta = {
+        "camera_original": {"width": w0, "height": h0},
+        "sessao_salva": {"width": wc, "height": hc},
+        "target": {"width": TARGET_W, "height": TARGET_H},
+        "tempos_ms": tempos,
+    }
+    return image_rel, meta
+
+
+async def capture_frame_async(sessao_id: int, gaveta_numero: int):
+    """
+    capture_frame para as views assíncronas. O OpenCV bloqueia, então a
+    captura roda numa thread do executor (não na thread única do ORM) e o
+    event loop segue atendendo as outras caixas enquanto isso.
+    """
+    return await sync_to_async(capture_frame, thread_sensitive=False)(sessao_id, gaveta_numero)
+
+
+def process_frame(sessao_id: int, gaveta_numero: int, meta: dict):
+    """
+    Roda gaveta_detect.py sobre o frame salvo por capture_frame e força a
+    imagem de saída para TARGET_W x TARGET_H.
+    Retorna (visao_ok, debug_dict); debug_dict["tempos_ms"] traz a duração
+    do subprocesso de visão e da regravação da imagem de saída.
+    """
+    tempos = {}
+    cmd, env, saida_abs = _comando_visao(sessao_id, gaveta_numero)
+
+    inicio = time.monotonic()
+    p = subprocess.run(cmd, capture_output=True, text=True, timeout=30, env=env)
+    tempos["subprocesso"] = _ms(inicio)
+    return _resultado_visao(p.returncode, p.stdout or "", p.stderr or "", saida_abs, meta, tempos)
+
+
+async def process_frame_async(sessao_id: int, gaveta_numero: int, meta: dict):
+    """
+    process_frame para as views assíncronas: o gaveta_detect.py roda como
+    subprocesso asyncio (o loop não fica parado esperando por ele) e só a
+    regravação da imagem de saída vai para uma thread.
+    """
+    tempos = {}
+    cmd, env, saida_abs = _comando_visao(sessao_id, gaveta_numero)
+
+    inicio = time.monotonic()
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, env=env
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), 30)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise subprocess.TimeoutExpired(cmd, 30)
+    tempos["subprocesso"] = _ms(inicio)
+
+    return await sync_to_async(_resultado_visao, thread_sensitive=False)(
+        proc.returncode,
+        stdout.decode("utf-8", errors="replace"),
+        stderr.decode("utf-8", errors="replace"),
+        saida_abs,
+        meta,
+        tempos,
+    )
+
+
+def _comando_visao(sessao_id, gaveta_numero):
+    """
+    (cmd, env, saida_abs) do gaveta_detect.py para o frame da gaveta.
+    """
+    sessao_dir = os.path.join(settings.MEDIA_ROOT, "sessoes", str(sessao_id))
+    image_abs = os.path.join(sessao_dir, f"sessao{sessao_id}_gaveta{gaveta_numero}.jpg")
+
     # ---------- RODA O SCRIPT DE VISÃO ----------
     gaveta_detect_path = os.path.join(settings.BASE_DIR, "visao", "gaveta_detect.py")
     ref_path = os.path.join(settings.BASE_DIR, "visao", f"ref_vazia_gaveta{gaveta_numero}.jpg")
@@ -96,10 +206,22 @@ def capture_and_process(sessao_id: int, gaveta_numero: int):
         "--save", saida_abs,
     ]
 
-    p = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-    stdout = p.stdout or ""
-    stderr = p.stderr or ""
-    visao_ok = (p.returncode == 0)
+    # o gaveta_detect.py herda o trace (W3C traceparent) pelo ambiente
+    env = None
+    if rastreio.traceparent():
+        env = {
+            **os.environ,
+            "TRACEPARENT": rastreio.traceparent(),
+            "RASTREIO_JSONL": getattr(settings, "RASTREIO_JSONL", ""),
+        }
+    return cmd, env, saida_abs
+
+
+def _resultado_visao(returncode, stdout, stderr, saida_abs, meta, tempos):
+    """
+    (visao_ok, debug_dict) a partir da saída do gaveta_detect.py.
+    """
+    visao_ok = (returncode == 0)
 
     # ---------- GARANTE QUE A IMAGEM DE SAÍDA TAMBÉM SEJA TARGET_W x TARGET_H ----------
     saida_before_w = None
@@ -107,6 +229,7 @@ def capture_and_process(sessao_id: int, gaveta_numero: int):
     saida_after_w = None
     saida_after_h = None
 
+    inicio = time.monotonic()
     if os.path.exists(saida_abs):
         out_img = cv.imread(saida_abs)
         if out_img is not None:
@@ -119,6 +242,7 @@ def capture_and_process(sessao_id: int, gaveta_numero: int):
                 saida_after_w, saida_after_h = TARGET_W, TARGET_H
             else:
                 saida_after_w, saida_after_h = ow, oh
+    tempos["saida_jpeg"] = _ms(inicio)
 
     # ---------- TENTA LER O JSON DISPONIBILIZADO PELO GAVETA_DETECT ----------
     json_out = None
@@ -128,18 +252,14 @@ def capture_and_process(sessao_id: int, gaveta_numero: int):
     except Exception:
         json_out = None
 
-    image_rel = os.path.join("sessoes", str(sessao_id), image_name)
-
     # ---------- META DE DEBUG: RESOLUÇÕES ----------
     meta = {
-        "camera_original": {"width": w0, "height": h0},
-        "sessao_salva": {"width": wc, "height": hc},
+        **meta,
         "saida_before": {"width": saida_before_w, "height": saida_before_h},
         "saida_after": {"width": saida_after_w, "height": saida_after_h},
-        "target": {"width": TARGET_W, "height": TARGET_H},
     }
 
-    return image_rel, visao_ok, {
+    return visao_ok, {
         "ok": visao_ok,
         "raw": {
             "stdout": stdout[-1000:],
@@ -147,6 +267,7 @@ def capture_and_process(sessao_id: int, gaveta_numero: int):
             "json": json_out,
             "meta": meta,
         },
+        "tempos_ms": tempos,
     }
 
 def run_gaveta_detect(image_path: str, gaveta_numero: int) -> dict:
@@ -0,0 +1,231 @@
+# hardware/carga_mqtt.py
+"""
+Carga sobre o caminho MQTT: publish_run_command -> broker -> runner da
+Rock Pi -> ACK, e toques de RFID Rock Pi -> broker -> assinante.
+
+Threads chamam o publish_run_command de verdade (MQTT_CONFIG apontando
+para o broker da carga) e esperam o ACK que a Rock Pi simulada publica em
+{base}/{reader_id}/run/ack (hardware/rockpi_simulada.py), casando pelo
+req_id. Com um BrokerLocal embutido, dá para reiniciar o broker no meio
+da carga e medir quantos comandos se perdem e quanto tempo o sistema
+leva para voltar a responder.
+
+    python manage.py carga_mqtt --embutir --comandos 500 --threads 8
+    python manage.py carga_mqtt --embutir --por-s 20 --reiniciar-a-cada 5 --toques 200
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import paho.mqtt.client as mqtt
+from django.test.utils import override_settings
+
+from api.views import _percentil
+
+from .mqtt_client import publish_run_command
+
+ALIASES = ("led_on", "abrir_gaveta_1", "fechar_gaveta_1", "abrir_gaveta_2", "fechar_gaveta_2", "led_off")
+
+
+def _resumo(valores):
+    ordenados = sorted(valores)
+    return {
+        "n": len(ordenados),
+        "p50_ms": _arredondar(_percentil(ordenados, 50)),
+        "p90_ms": _arredondar(_percentil(ordenados, 90)),
+        "p99_ms": _arredondar(_percentil(ordenados, 99)),
+        "max_ms": _arredondar(ordenados[-1] if ordenados else None),
+    }
+
+
+def _arredondar(v):
+    return round(v, 1) if v is not None else None
+
+
+class _Ouvinte:
+    """
+    Assina os ACKs e os toques de RFID e anota quando cada um chegou.
+    """
+
+    def __init__(self, host, porta, base, usuario, senha):
+        self.base = base
+        self.acks = {}           # req_id -> (instante, ack)
+        self.toques = []         # latência de cada toque recebido (ms)
+        self.conectado = threading.Event()
+        self._cond = threading.Condition()
+
+        self.client = mqtt.Client(client_id=f"carga-mqtt-{id(self)}")
+        if usuario:
+            self.client.username_pw_set(usuario, senha)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = lambda *a: self.conectado.clear()
+        self.client.on_message = self._on_message
+        self.client.reconnect_delay_set(min_delay=0.1, max_delay=1)
+        self.client.connect_async(host, porta, keepalive=30)
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        if rc == 0:
+            client.subscribe([(f"{self.base}/+/run/ack", 1), (f"{self.base}/+/rfid/uid", 1)])
+            self.conectado.set()
+
+    def _on_message(self, client, userdata, msg):
+        agora = time.time()
+        try:
+            dados = json.loads(msg.payload.decode("utf-8"))
+        except ValueError:
+            return
+        with self._cond:
+            if msg.topic.endswith("/run/ack"):
+                self.acks[dados.get("req_id")] = (time.perf_counter(), dados)
+                self._cond.notify_all()
+            elif "enviado_em" in dados:
+                self.toques.append((agora - dados["enviado_em"]) * 1000)
+
+    def esperar_ack(self, req_id, timeout_s):
+        with self._cond:
+            self._cond.wait_for(lambda: req_id in self.acks, timeout_s)
+            return self.acks.get(req_id)
+
+    def iniciar(self, esperar_s=5.0):
+        self.client.loop_start()
+        self.conectado.wait(esperar_s)
+
+    def parar(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+def _reiniciador(broker, intervalo_s, pausa_s, parar, reinicios):
+    while not parar.wait(intervalo_s):
+        broker.parar()
+        queda = time.perf_counter()
+        time.sleep(pausa_s)
+        broker.iniciar()
+        reinicios.append(queda)
+
+
+def rodar(
+    host,
+    porta,
+    reader_ids=("rasp-01",),
+    threads=4,
+    comandos=100,
+    por_s=0,
+    timeout_ack_s=5.0,
+    broker=None,
+    reiniciar_a_cada_s=0,
+    pausa_reinicio_s=0.5,
+    rockpis=(),
+    toques=0,
+    usuario=None,
+    senha="",
+    base="tcc/caixa",
+):
+    """
+    Dispara `comandos` publish_run_command em `threads` threads, alternando
+    leitoras e aliases (com por_s, no máximo por_s comandos por segundo,
+    para a carga atravessar as quedas do broker), e devolve o relatório (vazão, latência de
+    publicação e ponta a ponta, perdas, reinícios e recuperação, RFID).
+
+    reiniciar_a_cada_s exige `broker` (um BrokerLocal já iniciado); toques
+    exige `rockpis` (RockPiSimulada já conectadas), que publicam os UIDs.
+    """
+    if reiniciar_a_cada_s and broker is None:
+        raise ValueError("Reiniciar o broker só funciona com o broker embutido.")
+    if toques and not rockpis:
+        raise ValueError("Toques de RFID precisam de ao menos uma Rock Pi simulada.")
+
+    ouvinte = _Ouvinte(host, porta, base, usuario, senha)
+    ouvinte.iniciar()
+
+    publicacao, ponta_a_ponta = [], []
+    resultados = {"publicados": 0, "falhas_publicacao": 0, "acks": 0, "acks_com_falha": 0, "sem_ack": 0}
+    acks_em = []                 # instante de cada ACK bem-sucedido (recuperação)
+    lock = threading.Lock()
+
+    def comando(i):
+        if por_s:
+            atraso = inicio + i / por_s - time.perf_counter()
+            if atraso > 0:
+                time.sleep(atraso)
+        reader_id = reader_ids[i % len(reader_ids)]
+        alias = ALIASES[i % len(ALIASES)]
+        comeco = time.perf_counter()
+        r = publish_run_command(reader_id=reader_id, alias=alias, args=[], mode="fg", timeout_s=timeout_ack_s)
+        publicado = time.perf_counter()
+
+        if not r["ok"]:
+            with lock:
+                resultados["falhas_publicacao"] += 1
+            return
+        chegada = ouvinte.esperar_ack(r["payload"]["req_id"], timeout_ack_s)
+        with lock:
+            resultados["publicados"] += 1
+            publicacao.append((publicado - comeco) * 1000)
+            if chegada is None:
+                resultados["sem_ack"] += 1
+                return
+            instante, ack = chegada
+            resultados["acks"] += 1
+            if not ack.get("ok"):
+                resultados["acks_com_falha"] += 1
+            ponta_a_ponta.append((instante - comeco) * 1000)
+            acks_em.append(instante)
+
+    def tocar():
+        for i in range(toques):
+            rockpi = rockpis[i % len(rockpis)]
+            if rockpi.conectada.is_set():
+                rockpi.tocar(f"CARGA{i:06d}")
+            time.sleep(0.005)
+
+    cfg = {"HOST": host, "PORT": porta, "USER": usuario or "", "PASS": senha, "BASE": base}
+    parar = threading.Event()
+    reinicios = []
+    auxiliares = []
+    if reiniciar_a_cada_s:
+        auxiliares.append(threading.Thread(
+            target=_reiniciador,
+            args=(broker, reiniciar_a_cada_s, pausa_reinicio_s, parar, reinicios),
+            daemon=True,
+        ))
+    if toques:
+        auxiliares.append(threading.Thread(target=tocar, daemon=True))
+
+    # span ativo: o req_id vira trace-span, único por comando
+    with override_settings(MQTT_CONFIG=cfg, RASTREIO_ATIVO=True):
+        inicio = time.perf_counter()
+        for t in auxiliares:
+            t.start()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(comando, range(comandos)))
+        duracao = time.perf_counter() - inicio
+        parar.set()
+        for t in auxiliares:
+            t.join()
+
+    time.sleep(0.2)              # últimos toques em trânsito
+    ouvinte.parar()
+
+    # recuperação: da queda até o primeiro ACK depois dela
+    recuperacao = []
+    for queda in reinicios:
+        depois = [t for t in acks_em if t > queda]
+        if depois:
+            recuperacao.append((min(depois) - queda) * 1000)
+
+    return {
+        "comandos": comandos,
+        "threads": threads,
+        "leitoras": len(reader_ids),
+        **resultados,
+        "duracao_s": round(duracao, 3),
+        "comandos_por_s": round(resultados["acks"] / duracao, 1) if duracao else None,
+        "publicacao": _resumo(publicacao),
+        "ponta_a_ponta": _resumo(ponta_a_ponta),
+        "reinicios": len(reinicios),
+        "recuperacao": _resumo(recuperacao),
+        "rfid": {"toques": toques, **_resumo(ouvinte.toques)},
+    }
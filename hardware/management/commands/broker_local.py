@@ -0,0 +1,30 @@
+# hardware/management/commands/broker_local.py
+"""
+Broker MQTT mínimo para a bancada sem mosquitto (hardware/broker_local.py).
+
+    python manage.py broker_local
+    python manage.py broker_local --host 0.0.0.0 --porta 1883
+"""
+
+import logging
+
+from django.core.management.base import BaseCommand
+
+from hardware.broker_local import BrokerLocal
+
+
+class Command(BaseCommand):
+    help = "Sobe um broker MQTT 3.1.1 local (QoS 0/1, curingas, retidas) para testes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--porta", type=int, default=1883)
+
+    def handle(self, *args, **options):
+        logging.getLogger("hardware.broker_local").setLevel(logging.INFO)
+        broker = BrokerLocal(options["host"], options["porta"])
+        self.stdout.write(f"[BROKER] Ouvindo em {options['host']}:{options['porta']} (Ctrl+C encerra)")
+        try:
+            broker.servir()
+        except KeyboardInterrupt:
+            self.stdout.write(f"\n[BROKER] Encerrado: {broker.estatisticas}")
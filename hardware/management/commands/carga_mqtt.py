@@ -0,0 +1,98 @@
+# hardware/management/commands/carga_mqtt.py
+"""
+Carga no caminho MQTT (hardware/carga_mqtt.py).
+
+Com --embutir, sobe um broker local e uma Rock Pi simulada por leitora no
+próprio processo; sem ele, usa o broker do MQTT_CONFIG e espera que as
+Rock Pis (reais ou "simular_rockpi") já estejam conectadas.
+
+    python manage.py carga_mqtt --embutir --comandos 500 --threads 8 -o carga.json
+    python manage.py carga_mqtt --embutir --leitoras 3 --latencia-ms 50 --falhas 0.02
+    python manage.py carga_mqtt --embutir --por-s 20 --reiniciar-a-cada 5 --toques 200
+"""
+
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from hardware import carga_mqtt
+from hardware.broker_local import BrokerLocal
+from hardware.rockpi_simulada import RockPiSimulada
+
+
+class Command(BaseCommand):
+    help = "Mede vazão, latência ponta a ponta e perdas dos comandos MQTT, inclusive com o broker reiniciando."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--comandos", type=int, default=100)
+        parser.add_argument("--threads", type=int, default=4)
+        parser.add_argument("--por-s", type=float, default=0, help="Limite de comandos por segundo (0 = sem limite).")
+        parser.add_argument("--leitoras", type=int, default=1, help="rasp-01, rasp-02, ...")
+        parser.add_argument("--timeout-ack", type=float, default=5.0, help="Segundos esperando cada ACK.")
+        parser.add_argument("--embutir", action="store_true", help="Broker local e Rock Pis simuladas no processo.")
+        parser.add_argument("--latencia-ms", type=float, default=0, help="(--embutir) tempo de cada comando.")
+        parser.add_argument("--falhas", type=float, default=0, help="(--embutir) fração de comandos que falham.")
+        parser.add_argument("--reiniciar-a-cada", type=float, default=0, help="(--embutir) segundos entre quedas do broker.")
+        parser.add_argument("--pausa-reinicio", type=float, default=0.5, help="Segundos com o broker fora do ar.")
+        parser.add_argument("--toques", type=int, default=0, help="(--embutir) toques de RFID durante a carga.")
+        parser.add_argument("-o", "--saida", help="Grava o relatório JSON neste arquivo.")
+
+    def handle(self, *args, **options):
+        if options["comandos"] < 1 or options["threads"] < 1 or options["leitoras"] < 1:
+            raise CommandError("--comandos, --threads e --leitoras precisam ser >= 1.")
+        if not options["embutir"] and (options["reiniciar_a_cada"] or options["toques"]):
+            raise CommandError("--reiniciar-a-cada e --toques precisam de --embutir.")
+
+        cfg = getattr(settings, "MQTT_CONFIG", {})
+        base = cfg.get("BASE", "tcc/caixa").rstrip("/")
+        reader_ids = [f"rasp-{i + 1:02d}" for i in range(options["leitoras"])]
+        broker, rockpis = None, []
+
+        if options["embutir"]:
+            broker = BrokerLocal(porta=0).iniciar()
+            host, porta, usuario, senha = broker.host, broker.porta, None, ""
+            rockpis = [
+                RockPiSimulada(
+                    host, porta, reader_id=r, base=base,
+                    latencia_ms=options["latencia_ms"], taxa_falha=options["falhas"],
+                ).iniciar()
+                for r in reader_ids
+            ]
+        else:
+            host, porta = cfg.get("HOST", "127.0.0.1"), int(cfg.get("PORT", 1883))
+            usuario, senha = cfg.get("USER") or None, cfg.get("PASS") or ""
+
+        try:
+            relatorio = carga_mqtt.rodar(
+                host, porta,
+                reader_ids=reader_ids,
+                threads=options["threads"],
+                comandos=options["comandos"],
+                por_s=options["por_s"],
+                timeout_ack_s=options["timeout_ack"],
+                broker=broker,
+                reiniciar_a_cada_s=options["reiniciar_a_cada"],
+                pausa_reinicio_s=options["pausa_reinicio"],
+                rockpis=rockpis,
+                toques=options["toques"],
+                usuario=usuario,
+                senha=senha,
+                base=base,
+            )
+        finally:
+            for rockpi in rockpis:
+                rockpi.parar()
+            if broker is not None:
+                broker.encerrar()
+
+        texto = json.dumps(relatorio, ensure_ascii=False, indent=2)
+        if options["saida"]:
+            with open(options["saida"], "w", encoding="utf-8") as f:
+                f.write(texto + "\n")
+            self.stdout.write(
+                f"{relatorio['acks']}/{relatorio['comandos']} comandos confirmados em {relatorio['duracao_s']} s "
+                f"({relatorio['comandos_por_s']} cmd/s, p99 {relatorio['ponta_a_ponta']['p99_ms']} ms) -> {options['saida']}"
+            )
+        else:
+            self.stdout.write(texto)
@@ -0,0 +1,57 @@
+# hardware/management/commands/simular_rockpi.py
+"""
+Rock Pi simulada (hardware/rockpi_simulada.py) contra o broker do
+MQTT_CONFIG (ou --host/--porta).
+
+    python manage.py simular_rockpi --latencia-ms 200 --falhas 0.05
+    python manage.py simular_rockpi --reader-id rasp-02 --tocar 04A1B2C3 --tocar-a-cada 10
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from hardware.rockpi_simulada import RockPiSimulada
+
+
+class Command(BaseCommand):
+    help = "Atende os comandos de {base}/{reader_id}/run como a Rock Pi e publica toques de RFID."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", help="Padrão: MQTT_CONFIG['HOST'].")
+        parser.add_argument("--porta", type=int, help="Padrão: MQTT_CONFIG['PORT'].")
+        parser.add_argument("--reader-id", default=getattr(settings, "READER_ID", "rasp-01"))
+        parser.add_argument("--latencia-ms", type=float, default=0, help="Tempo de cada comando.")
+        parser.add_argument("--jitter-ms", type=float, default=0, help="Variação somada à latência.")
+        parser.add_argument("--falhas", type=float, default=0, help="Fração de comandos que falham (0 a 1).")
+        parser.add_argument("--tocar", action="append", default=[], help="UID a tocar (pode repetir).")
+        parser.add_argument("--tocar-a-cada", type=float, default=0, help="Segundos entre toques (0 = só no início).")
+
+    def handle(self, *args, **options):
+        cfg = getattr(settings, "MQTT_CONFIG", {})
+        rockpi = RockPiSimulada(
+            host=options["host"] or cfg.get("HOST", "127.0.0.1"),
+            porta=options["porta"] or int(cfg.get("PORT", 1883)),
+            reader_id=options["reader_id"],
+            latencia_ms=options["latencia_ms"],
+            jitter_ms=options["jitter_ms"],
+            taxa_falha=options["falhas"],
+            usuario=cfg.get("USER") or None,
+            senha=cfg.get("PASS") or "",
+        ).iniciar()
+        self.stdout.write(f"[ROCKPI] {options['reader_id']} atendendo {rockpi.topico_run} (Ctrl+C encerra)")
+
+        uids = options["tocar"]
+        try:
+            for uid in uids:
+                rockpi.tocar(uid)
+            i = 0
+            while True:
+                time.sleep(options["tocar_a_cada"] or 1)
+                if uids and options["tocar_a_cada"]:
+                    rockpi.tocar(uids[i % len(uids)])
+                    i += 1
+        except KeyboardInterrupt:
+            rockpi.parar()
+            self.stdout.write(f"\n[ROCKPI] Encerrada: {rockpi.estatisticas}")
@@ -0,0 +1,196 @@
+# hardware/mqtt_assincrono.py
+"""
+Conexão MQTT em asyncio para as views assíncronas (api/views_assincronas.py).
+
+publish_run_command abre uma conexão paho por comando, espera o envio e
+ainda dorme 0,1 s antes de desconectar, tudo segurando a thread do
+worker. Aqui cada event loop mantém uma conexão só com o broker;
+publicar() manda o PUBLISH QoS 1 e espera o PUBACK sem bloquear o loop,
+então um processo ASGI atende várias caixas ao mesmo tempo.
+
+Fala MQTT 3.1.1 direto (pacotes em hardware/mqtt_protocolo.py): CONNECT,
+PUBLISH QoS 1/PUBACK e PINGREQ/PINGRESP de keepalive. Se a conexão cair,
+ou o broker parar de responder ao PINGREQ (conexão meio aberta, sem
+erro no socket), a próxima publicação reconecta.
+"""
+
+import asyncio
+import itertools
+import logging
+import struct
+import uuid
+import weakref
+
+from django.conf import settings
+
+from .mqtt_protocolo import (
+    CONNACK, CONNECT, DISCONNECT, PINGREQ, PINGRESP, PUBACK, PUBLISH, ler_pacote, pacote, texto,
+)
+
+logger = logging.getLogger(__name__)
+
+KEEPALIVE_S = 60
+# sem PINGRESP nesse prazo depois do PINGREQ, a conexão é dada como morta
+ESPERA_PINGRESP_S = 10
+
+_conexoes = weakref.WeakKeyDictionary()   # event loop -> ConexaoMqtt
+
+
+class ConexaoMqtt:
+    """
+    Uma conexão com o broker, usada por todas as corrotinas de um event
+    loop. Os PUBLISH em voo esperam cada um o seu PUBACK (pelo packet id).
+    """
+
+    def __init__(self, host, porta, usuario=None, senha="", keepalive=KEEPALIVE_S,
+                 espera_ping=ESPERA_PINGRESP_S):
+        self.host = host
+        self.porta = porta
+        self.usuario = usuario
+        self.senha = senha
+        self.keepalive = keepalive
+        self.espera_ping = espera_ping
+        self.client_id = f"caixa-asgi-{uuid.uuid4().hex[:12]}"
+        self._reader = None
+        self._writer = None
+        self._tarefas = []
+        self._pendentes = {}     # packet id -> future do PUBACK
+        self._ids = itertools.cycle(range(1, 65536))
+        self._lock = asyncio.Lock()
+        self._pingresp = asyncio.Event()
+
+    @property
+    def conectada(self):
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def conectar(self, timeout=5.0):
+        async with self._lock:
+            if self.conectada:
+                return
+
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.porta), timeout
+            )
+            flags = 0x02                                  # clean session
+            payload = texto(self.client_id)
+            if self.usuario:
+                flags |= 0xC0
+                payload += texto(self.usuario) + texto(self.senha or "")
+            corpo = texto("MQTT") + bytes([4, flags]) + struct.pack("!H", self.keepalive) + payload
+            writer.write(pacote(CONNECT, 0, corpo))
+            await writer.drain()
+
+            try:
+                tipo, _, resposta = await asyncio.wait_for(ler_pacote(reader), timeout)
+            except Exception:
+                writer.close()
+                raise
+            if tipo != CONNACK or len(resposta) < 2 or resposta[1] != 0:
+                writer.close()
+                raise ConnectionError(f"Broker recusou a conexão (CONNACK {resposta[1:2].hex()}).")
+
+            self._reader, self._writer = reader, writer
+            self._tarefas = [
+                asyncio.create_task(self._ler()),
+                asyncio.create_task(self._manter()),
+            ]
+            logger.info("MQTT (asyncio) conectado em %s:%s como %s", self.host, self.porta, self.client_id)
+
+    async def _ler(self):
+        try:
+            while True:
+                tipo, _, corpo = await ler_pacote(self._reader)
+                if tipo == PUBACK:
+                    futuro = self._pendentes.get(struct.unpack("!H", corpo[:2])[0])
+                    if futuro is not None and not futuro.done():
+                        futuro.set_result(None)
+                elif tipo == PINGRESP:
+                    self._pingresp.set()
+                # o resto: nada a fazer
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            logger.warning("MQTT (asyncio): conexão com %s:%s caiu.", self.host, self.porta)
+        finally:
+            self._derrubar(ConnectionError("Conexão MQTT caiu antes do PUBACK."))
+
+    async def _manter(self):
+        while True:
+            await asyncio.sleep(self.keepalive / 2)
+            if not self.conectada:
+                continue
+            self._pingresp.clear()
+            self._writer.write(pacote(PINGREQ, 0))
+            try:
+                await asyncio.wait_for(self._pingresp.wait(), self.espera_ping)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    "MQTT (asyncio): %s:%s não respondeu ao PINGREQ em %ss; derrubando a conexão.",
+                    self.host, self.porta, self.espera_ping,
+                )
+                self._derrubar(ConnectionError("Broker não respondeu ao PINGREQ."))
+                return
+
+    def _derrubar(self, erro):
+        if self._writer is not None:
+            self._writer.close()
+        for futuro in self._pendentes.values():
+            if not futuro.done():
+                futuro.set_exception(erro)
+        for tarefa in self._tarefas:
+            if tarefa is not asyncio.current_task():
+                tarefa.cancel()
+        self._tarefas = []
+
+    async def publicar(self, topico, payload, timeout=2.0):
+        """
+        PUBLISH QoS 1; volta quando o broker confirmar (PUBACK). Uma conexão
+        que caiu é refeita uma vez antes de desistir.
+        """
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+
+        for tentativa in (1, 2):
+            if not self.conectada:
+                await self.conectar()
+            pid = next(self._ids)
+            futuro = asyncio.get_running_loop().create_future()
+            self._pendentes[pid] = futuro
+            try:
+                self._writer.write(
+                    pacote(PUBLISH, 0x02, texto(topico) + struct.pack("!H", pid) + payload)
+                )
+                await self._writer.drain()
+                await asyncio.wait_for(futuro, timeout)
+                return
+            except (ConnectionError, OSError):
+                if tentativa == 2:
+                    raise
+                self._derrubar(ConnectionError("Conexão MQTT caiu antes do PUBACK."))
+            finally:
+                self._pendentes.pop(pid, None)
+
+    async def fechar(self):
+        if self.conectada:
+            self._writer.write(pacote(DISCONNECT, 0))
+            try:
+                await self._writer.drain()
+            except (ConnectionError, OSError):
+                pass
+        self._derrubar(ConnectionError("Conexão MQTT fechada."))
+
+
+def conexao():
+    """
+    ConexaoMqtt do event loop atual (criada na primeira chamada, com o
+    MQTT_CONFIG do settings).
+    """
+    loop = asyncio.get_running_loop()
+    c = _conexoes.get(loop)
+    if c is None:
+        cfg = getattr(settings, "MQTT_CONFIG", {})
+        c = _conexoes[loop] = ConexaoMqtt(
+            cfg.get("HOST", "127.0.0.1"),
+            int(cfg.get("PORT", 1883)),
+            cfg.get("USER") or None,
+            cfg.get("PASS") or "",
+        )
+    return c
@@ -5,6 +5,10 @@ import time
 import paho.mqtt.client as mqtt
 from django.conf import settings
 
+from caixa import metricas, rastreio
+
+from . import mqtt_assincrono
+
 logger = logging.getLogger(__name__)
 
 
@@ -33,8 +37,59 @@ def publish_run_command(
 
     topic = f"tcc/caixa/{reader_id}/run"
 
-    # req_id pode ser qualquer string única pra log/ACK
-    req_id = f"sessao-{alias}-{int(time.time())}"
+    with rastreio.span("mqtt.run", reader_id=reader_id, alias=alias, mode=mode) as span:
+        resultado = _publicar(topic, alias, args, mode, timeout_s, host, port, user, password)
+        if span is not None and not resultado["ok"]:
+            span.status = "erro"
+            span.atributos["erro"] = resultado["error"]
+        return resultado
+
+
+async def publish_run_command_async(
+    reader_id: str,
+    alias: str,
+    args=None,
+    mode: str = "fg",
+    timeout_s: float = 45.0,
+):
+    """
+    Mesmo comando (e mesmo retorno) de publish_run_command, pela conexão
+    asyncio do event loop atual (hardware/mqtt_assincrono.py): espera o
+    PUBACK do broker em vez de conectar, dormir e desconectar, sem
+    segurar thread.
+    """
+    if args is None:
+        args = []
+
+    topic = f"tcc/caixa/{reader_id}/run"
+
+    with rastreio.span("mqtt.run", reader_id=reader_id, alias=alias, mode=mode) as span:
+        payload = _payload(alias, args, mode, timeout_s)
+        comando = _comando(alias)
+        inicio = time.perf_counter()
+        try:
+            await mqtt_assincrono.conexao().publicar(topic, json.dumps(payload), timeout=2)
+            logger.info("MQTT RUN publicado em %s: %s", topic, payload)
+            resultado = {"ok": True, "topic": topic, "payload": payload}
+        except Exception as e:
+            logger.error("Erro ao publicar MQTT RUN em %s: %s", topic, e or type(e).__name__)
+            resultado = {"ok": False, "topic": topic, "error": str(e) or type(e).__name__, "payload": payload}
+        metricas.incrementar(
+            "caixa_mqtt_publicacoes_total", comando=comando, resultado="ok" if resultado["ok"] else "erro"
+        )
+        metricas.observar("caixa_mqtt_publicacao_segundos", time.perf_counter() - inicio, comando=comando)
+
+        if span is not None and not resultado["ok"]:
+            span.status = "erro"
+            span.atributos["erro"] = resultado["error"]
+        return resultado
+
+
+def _payload(alias, args, mode, timeout_s):
+    # req_id identifica o comando no log/ACK do runner: é o próprio span
+    # (trace_id-span_id); "traceparent" deixa o runner continuar o trace
+    span = rastreio.atual()
+    req_id = f"{span.trace_id}-{span.span_id}" if span else f"sessao-{alias}-{int(time.time())}"
 
     payload = {
         "req_id": req_id,
@@ -43,6 +98,20 @@ def publish_run_command(
         "mode": mode,         # "fg" ou "bg"
         "timeout_s": timeout_s,
     }
+    if span:
+        payload["traceparent"] = rastreio.traceparent()
+    return payload
+
+
+def _comando(alias):
+    # métrica por comando, sem o número da gaveta (fechar_gaveta_3 -> fechar_gaveta)
+    return alias.rstrip("0123456789").rstrip("_") or alias
+
+
+def _publicar(topic, alias, args, mode, timeout_s, host, port, user, password):
+    payload = _payload(alias, args, mode, timeout_s)
+    comando = _comando(alias)
+    inicio = time.perf_counter()
 
     client = mqtt.Client()
     if user:
@@ -67,9 +136,13 @@ def publish_run_command(
         client.disconnect()
 
         logger.info("MQTT RUN publicado em %s: %s", topic, payload)
+        metricas.incrementar("caixa_mqtt_publicacoes_total", comando=comando, resultado="ok")
+        metricas.observar("caixa_mqtt_publicacao_segundos", time.perf_counter() - inicio, comando=comando)
         return {"ok": True, "topic": topic, "payload": payload}
     except Exception as e:
         logger.error("Erro ao publicar MQTT RUN em %s: %s", topic, e)
+        metricas.incrementar("caixa_mqtt_publicacoes_total", comando=comando, resultado="erro")
+        metricas.observar("caixa_mqtt_publicacao_segundos", time.perf_counter() - inicio, comando=comando)
         try:
             client.loop_stop()
             client.disconnect()
@@ -0,0 +1,85 @@
+# hardware/mqtt_protocolo.py
+"""
+Codificação dos pacotes MQTT 3.1.1, compartilhada pela conexão asyncio das
+views (hardware/mqtt_assincrono.py) e pelo broker de teste
+(hardware/broker_local.py).
+
+Só o necessário para os dois: cabeçalho fixo com o tamanho variável,
+strings com prefixo de 2 bytes, leitura do corpo (Leitor) e leitura de um
+pacote inteiro de um asyncio.StreamReader.
+"""
+
+import asyncio
+import struct
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+
+def tamanho(n):
+    """
+    Tamanho restante do cabeçalho fixo (1 a 4 bytes, 7 bits por byte).
+    """
+    saida = bytearray()
+    while True:
+        byte, n = n % 128, n // 128
+        saida.append(byte | (0x80 if n else 0))
+        if not n:
+            return bytes(saida)
+
+
+def texto(valor):
+    """
+    String UTF-8 com o tamanho em 2 bytes na frente.
+    """
+    dados = valor.encode("utf-8")
+    return struct.pack("!H", len(dados)) + dados
+
+
+def pacote(tipo, flags, corpo=b""):
+    return bytes([tipo << 4 | flags]) + tamanho(len(corpo)) + corpo
+
+
+async def ler_pacote(reader, timeout=None):
+    """
+    (tipo, flags, corpo) do próximo pacote. `timeout` vale para a chegada
+    do primeiro byte (o keepalive); o resto do pacote já está a caminho.
+    """
+    cabecalho = await asyncio.wait_for(reader.readexactly(1), timeout)
+    multiplicador, restante = 1, 0
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        restante += (byte & 0x7F) * multiplicador
+        if not byte & 0x80:
+            break
+        multiplicador *= 128
+    corpo = await reader.readexactly(restante) if restante else b""
+    return cabecalho[0] >> 4, cabecalho[0] & 0x0F, corpo
+
+
+class Leitor:
+    """
+    Lê os campos do corpo de um pacote, em ordem.
+    """
+
+    def __init__(self, dados):
+        self.dados, self.pos = dados, 0
+
+    def u8(self):
+        self.pos += 1
+        return self.dados[self.pos - 1]
+
+    def u16(self):
+        self.pos += 2
+        return struct.unpack("!H", self.dados[self.pos - 2:self.pos])[0]
+
+    def bytes_(self):
+        n = self.u16()
+        self.pos += n
+        return self.dados[self.pos - n:self.pos]
+
+    def str_(self):
+        return self.bytes_().decode("utf-8")
+
+    def resto(self):
+        return self.dados[self.pos:]
@@ -0,0 +1,189 @@
+# hardware/rockpi_simulada.py
+"""
+Rock Pi simulada: faz o papel do runner da caixa num broker qualquer
+(o mosquitto da bancada ou o hardware/broker_local.py), para exercitar
+publish_run_command e o bridge de RFID sem o hardware.
+
+  - assina {base}/{reader_id}/run e "executa" os aliases que o servidor
+    publica (led_on, led_off, abrir_gaveta_N, fechar_gaveta_N) com uma
+    latência e uma taxa de falha configuráveis;
+  - responde cada comando em {base}/{reader_id}/run/ack com
+    {"req_id", "alias", "ok", "erro", "duracao_ms", "traceparent"}
+    (o ACK é convenção do simulador; o servidor não o consome, quem lê é
+    o script de carga, hardware/carga_mqtt.py);
+  - tocar(uid) publica um toque de cartão em {base}/{reader_id}/rfid/uid,
+    como a Rock Pi real faz.
+
+Reconecta sozinha se o broker cair.
+
+    python manage.py simular_rockpi --latencia-ms 200 --falhas 0.05
+"""
+
+import json
+import logging
+import random
+import re
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+logger = logging.getLogger(__name__)
+
+ALIAS_GAVETA = re.compile(r"^(abrir|fechar)_gaveta_(\d+)$")
+
+
+class RockPiSimulada:
+    def __init__(
+        self,
+        host="127.0.0.1",
+        porta=1883,
+        reader_id="rasp-01",
+        base="tcc/caixa",
+        latencia_ms=0.0,
+        jitter_ms=0.0,
+        taxa_falha=0.0,
+        usuario=None,
+        senha="",
+        semente=None,
+    ):
+        self.host = host
+        self.porta = porta
+        self.reader_id = reader_id
+        self.base = base.rstrip("/")
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self.taxa_falha = taxa_falha
+        self.usuario = usuario
+        self.senha = senha
+
+        self.gavetas = {}        # numero -> "aberta"/"fechada"
+        self.led = False
+        self.estatisticas = {"comandos": 0, "falhas": 0, "invalidos": 0, "conexoes": 0, "toques": 0}
+        self.conectada = threading.Event()
+
+        self._random = random.Random(semente)
+        self._lock = threading.Lock()
+        self._client = None
+
+    @property
+    def topico_run(self):
+        return f"{self.base}/{self.reader_id}/run"
+
+    @property
+    def topico_ack(self):
+        return f"{self.topico_run}/ack"
+
+    @property
+    def topico_rfid(self):
+        return f"{self.base}/{self.reader_id}/rfid/uid"
+
+    # ---------- MQTT ----------
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        if rc != 0:
+            logger.warning("Rock Pi simulada: conexão recusada (rc=%s)", rc)
+            return
+        client.subscribe(self.topico_run, qos=1)
+        with self._lock:
+            self.estatisticas["conexoes"] += 1
+        self.conectada.set()
+        logger.info("Rock Pi simulada %s conectada, assinando %s", self.reader_id, self.topico_run)
+
+    def _on_disconnect(self, client, userdata, *args):
+        self.conectada.clear()
+        logger.info("Rock Pi simulada %s desconectada; o paho tenta reconectar.", self.reader_id)
+
+    def _on_message(self, client, userdata, msg):
+        try:
+            comando = json.loads(msg.payload.decode("utf-8"))
+            alias = comando["alias"]
+        except (ValueError, KeyError, UnicodeDecodeError):
+            with self._lock:
+                self.estatisticas["invalidos"] += 1
+            logger.warning("Rock Pi simulada: comando inválido em %s: %r", msg.topic, msg.payload)
+            return
+        logger.debug("Rock Pi simulada %s: comando %s recebido.", self.reader_id, alias)
+        # cada comando na sua thread: um "fg" lento não segura a rede do paho
+        threading.Thread(target=self._executar, args=(comando,), daemon=True).start()
+
+    def _executar(self, comando):
+        alias = comando["alias"]
+        inicio = time.perf_counter()
+
+        espera = self.latencia_ms + self._random.uniform(0, self.jitter_ms)
+        if espera > 0:
+            time.sleep(espera / 1000)
+
+        erro = None
+        if self._random.random() < self.taxa_falha:
+            erro = "falha simulada"
+        else:
+            erro = self._aplicar(alias)
+
+        with self._lock:
+            self.estatisticas["comandos"] += 1
+            if erro:
+                self.estatisticas["falhas"] += 1
+
+        ack = {
+            "req_id": comando.get("req_id"),
+            "alias": alias,
+            "ok": erro is None,
+            "erro": erro,
+            "duracao_ms": round((time.perf_counter() - inicio) * 1000, 1),
+            "traceparent": comando.get("traceparent"),
+        }
+        self._client.publish(self.topico_ack, json.dumps(ack), qos=1)
+
+    def _aplicar(self, alias):
+        if alias == "led_on":
+            self.led = True
+            return None
+        if alias == "led_off":
+            self.led = False
+            return None
+        m = ALIAS_GAVETA.match(alias)
+        if m:
+            with self._lock:
+                self.gavetas[int(m.group(2))] = "aberta" if m.group(1) == "abrir" else "fechada"
+            return None
+        return f"alias desconhecido: {alias}"
+
+    # ---------- ciclo de vida ----------
+
+    def iniciar(self, esperar_s=5.0):
+        """
+        Conecta e começa a atender comandos em background. Retorna a própria
+        instância; com esperar_s, só volta depois de conectada (ou do tempo).
+        """
+        client = mqtt.Client(client_id=f"rockpi-simulada-{self.reader_id}")
+        if self.usuario:
+            client.username_pw_set(self.usuario, self.senha)
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_message = self._on_message
+        client.reconnect_delay_set(min_delay=0.1, max_delay=2)
+        self._client = client
+
+        client.connect_async(self.host, self.porta, keepalive=30)
+        client.loop_start()
+        if esperar_s:
+            self.conectada.wait(esperar_s)
+        return self
+
+    def parar(self):
+        if self._client is not None:
+            self._client.loop_stop()
+            self._client.disconnect()
+            self._client = None
+        self.conectada.clear()
+
+    def tocar(self, uid):
+        """
+        Publica o toque de um cartão, no formato da Rock Pi real.
+        """
+        payload = {"uid": uid, "reader_id": self.reader_id, "enviado_em": time.time()}
+        with self._lock:
+            self.estatisticas["toques"] += 1
+        return self._client.publish(self.topico_rfid, json.dumps(payload), qos=1)
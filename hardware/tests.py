@@ -1,3 +1,181 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+import time
+import warnings
 
-# Create your tests here.
+import paho.mqtt.client as mqtt
+from django.test import SimpleTestCase, override_settings
+
+from . import carga_mqtt, mqtt_assincrono
+from .broker_local import BrokerLocal, casa_topico
+from .mqtt_protocolo import PINGREQ
+from .mqtt_client import publish_run_command, publish_run_command_async
+from .rockpi_simulada import RockPiSimulada
+
+
+class BrokerLocalRockPiTests(SimpleTestCase):
+    def setUp(self):
+        # mqtt.Client() na API de callbacks v1, como no resto do projeto
+        warnings.simplefilter("ignore", DeprecationWarning)
+        self.addCleanup(warnings.resetwarnings)
+
+        self.broker = BrokerLocal(porta=0).iniciar()
+        self.addCleanup(self.broker.encerrar)
+        cfg = {"HOST": "127.0.0.1", "PORT": self.broker.porta, "USER": "", "PASS": "", "BASE": "tcc/caixa"}
+        configuracao = override_settings(MQTT_CONFIG=cfg, RASTREIO_ATIVO=True)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+        self.acks = {}
+        self.chegou = threading.Condition()
+        self.ouvinte = self._assinar("tcc/caixa/+/run/ack", self._anotar_ack)
+
+    def _assinar(self, topico, callback):
+        client = mqtt.Client()
+        pronto = threading.Event()
+
+        def on_connect(c, u, f, rc, p=None):
+            c.subscribe(topico, qos=1)
+
+        client.on_connect = on_connect
+        client.on_subscribe = lambda *a: pronto.set()
+        client.on_message = lambda c, u, msg: callback(msg)
+        client.connect("127.0.0.1", self.broker.porta, 30)
+        client.loop_start()
+        self.addCleanup(client.loop_stop)
+        self.assertTrue(pronto.wait(5))
+        return client
+
+    def _anotar_ack(self, msg):
+        ack = json.loads(msg.payload)
+        with self.chegou:
+            self.acks[ack["req_id"]] = ack
+            self.chegou.notify_all()
+
+    def _esperar_ack(self, req_id, timeout=5):
+        with self.chegou:
+            self.chegou.wait_for(lambda: req_id in self.acks, timeout)
+            return self.acks.get(req_id)
+
+    def _rockpi(self, **kwargs):
+        rockpi = RockPiSimulada("127.0.0.1", self.broker.porta, **kwargs).iniciar()
+        self.addCleanup(rockpi.parar)
+        self.assertTrue(rockpi.conectada.is_set())
+        return rockpi
+
+    def test_casa_topico(self):
+        self.assertTrue(casa_topico("tcc/caixa/+/rfid/uid", "tcc/caixa/rasp-01/rfid/uid"))
+        self.assertTrue(casa_topico("tcc/#", "tcc/caixa/rasp-01/run"))
+        self.assertFalse(casa_topico("tcc/caixa/+/run", "tcc/caixa/rasp-01/run/ack"))
+        self.assertFalse(casa_topico("tcc/caixa/+/run/ack", "tcc/caixa/rasp-01/run"))
+
+    def test_publish_run_command_executado_e_confirmado(self):
+        rockpi = self._rockpi(latencia_ms=10)
+
+        r = publish_run_command(reader_id="rasp-01", alias="abrir_gaveta_3")
+
+        self.assertTrue(r["ok"])
+        ack = self._esperar_ack(r["payload"]["req_id"])
+        self.assertIsNotNone(ack)
+        self.assertTrue(ack["ok"])
+        self.assertEqual(ack["alias"], "abrir_gaveta_3")
+        self.assertEqual(ack["traceparent"], r["payload"]["traceparent"])
+        self.assertEqual(rockpi.gavetas, {3: "aberta"})
+
+    async def test_publish_async_espera_o_puback_e_reconecta(self):
+        rockpi = self._rockpi(latencia_ms=10)
+
+        try:
+            r = await publish_run_command_async(reader_id="rasp-01", alias="abrir_gaveta_2")
+            self.assertTrue(r["ok"])
+            self.assertTrue(self._esperar_ack(r["payload"]["req_id"])["ok"])
+
+            self.broker.reiniciar(pausa_s=0.2)
+            self.assertTrue(_esperar(lambda: rockpi.estatisticas["conexoes"] == 2))
+            self.assertTrue(_esperar(lambda: self.ouvinte.is_connected()))
+
+            # a conexão do loop caiu junto com o broker: reconecta sozinha
+            r = await publish_run_command_async(reader_id="rasp-01", alias="fechar_gaveta_2")
+            self.assertTrue(r["ok"])
+            self.assertTrue(self._esperar_ack(r["payload"]["req_id"])["ok"])
+            self.assertEqual(rockpi.gavetas, {2: "fechada"})
+        finally:
+            await mqtt_assincrono.conexao().fechar()
+
+    async def test_conexao_sem_pingresp_cai_e_reconecta(self):
+        # broker que recebe o PINGREQ mas não responde (conexão meio aberta)
+        tratar = self.broker._tratar
+
+        def sem_pingresp(cliente, tipo, flags, corpo):
+            if tipo != PINGREQ:
+                tratar(cliente, tipo, flags, corpo)
+
+        self.broker._tratar = sem_pingresp
+
+        c = mqtt_assincrono.ConexaoMqtt("127.0.0.1", self.broker.porta, keepalive=1, espera_ping=0.2)
+        try:
+            await c.publicar("tcc/caixa/rasp-01/run", "{}")
+            self.assertEqual(self.broker.estatisticas["conexoes"], 2)   # ouvinte + c
+
+            await asyncio.sleep(0.9)   # PINGREQ em 0,5 s, desiste em 0,7 s
+            self.assertFalse(c.conectada)
+
+            await c.publicar("tcc/caixa/rasp-01/run", "{}")
+            self.assertTrue(c.conectada)
+            self.assertEqual(self.broker.estatisticas["conexoes"], 3)
+        finally:
+            await c.fechar()
+
+    def test_falha_simulada_e_alias_desconhecido_voltam_no_ack(self):
+        self._rockpi(reader_id="rasp-02", taxa_falha=1.0)
+        self._rockpi(reader_id="rasp-03")
+
+        falha = publish_run_command(reader_id="rasp-02", alias="led_on")
+        desconhecido = publish_run_command(reader_id="rasp-03", alias="buzina")
+
+        self.assertEqual(self._esperar_ack(falha["payload"]["req_id"])["erro"], "falha simulada")
+        self.assertFalse(self._esperar_ack(desconhecido["payload"]["req_id"])["ok"])
+
+    def test_rockpi_reconecta_depois_de_reiniciar_o_broker(self):
+        rockpi = self._rockpi()
+        self.broker.reiniciar(pausa_s=0.2)
+
+        self.assertTrue(_esperar(lambda: rockpi.estatisticas["conexoes"] == 2))
+        self.assertTrue(_esperar(lambda: self.ouvinte.is_connected()))
+        r = publish_run_command(reader_id="rasp-01", alias="fechar_gaveta_1")
+        self.assertTrue(self._esperar_ack(r["payload"]["req_id"])["ok"])
+
+    def test_toque_de_rfid_chega_no_topico_do_bridge(self):
+        rockpi = self._rockpi()
+        toques = []
+        self._assinar("tcc/caixa/+/rfid/uid", lambda msg: toques.append((msg.topic, json.loads(msg.payload))))
+
+        rockpi.tocar("04A1B2C3")
+
+        self.assertTrue(_esperar(lambda: toques))
+        topico, payload = toques[0]
+        self.assertEqual(topico, "tcc/caixa/rasp-01/rfid/uid")
+        self.assertEqual((payload["uid"], payload["reader_id"]), ("04A1B2C3", "rasp-01"))
+
+    def test_carga_confirma_todos_os_comandos(self):
+        rockpis = [self._rockpi(reader_id="rasp-01"), self._rockpi(reader_id="rasp-02")]
+
+        relatorio = carga_mqtt.rodar(
+            "127.0.0.1", self.broker.porta,
+            reader_ids=("rasp-01", "rasp-02"), threads=4, comandos=8,
+            rockpis=rockpis, toques=4,
+        )
+
+        self.assertEqual((relatorio["acks"], relatorio["sem_ack"], relatorio["falhas_publicacao"]), (8, 0, 0))
+        self.assertEqual(relatorio["ponta_a_ponta"]["n"], 8)
+        self.assertEqual(relatorio["rfid"]["n"], 4)
+
+
+def _esperar(condicao, timeout=5):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if condicao():
+            return True
+        time.sleep(0.02)
+    return False
@@ -1,16 +1,27 @@
 from django.contrib import admin
-from .models import Gaveta, Ferramenta
+
+from api.admin import ImportacaoAdminMixin
+
+from .models import Caixa, Gaveta, Ferramenta
+
+
+@admin.register(Caixa)
+class CaixaAdmin(admin.ModelAdmin):
+    list_display = ("reader_id", "nome", "ativa", "criado_em")
+    list_filter = ("ativa",)
+    search_fields = ("reader_id", "nome")
 
 
 @admin.register(Gaveta)
 class GavetaAdmin(admin.ModelAdmin):
-    list_display = ("numero", "nome", "ativa", "criado_em")
-    list_filter = ("ativa",)
+    list_display = ("numero", "nome", "caixa", "ativa", "criado_em")
+    list_filter = ("caixa", "ativa")
     search_fields = ("nome", "descricao")
 
 
 @admin.register(Ferramenta)
-class FerramentaAdmin(admin.ModelAdmin):
+class FerramentaAdmin(ImportacaoAdminMixin, admin.ModelAdmin):
+    tipo_importacao = "ferramentas"
     list_display = ("nome", "gaveta", "posicao", "quantidade", "ativa")
-    list_filter = ("gaveta", "ativa")
+    list_filter = ("gaveta__caixa", "gaveta", "ativa")
     search_fields = ("nome", "codigo", "descricao")
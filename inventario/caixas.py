@@ -0,0 +1,104 @@
+# inventario/caixas.py
+"""
+Caixas cadastradas em cache.
+
+Todo toque de cartão precisa saber qual caixa tem aquele leitor, e cada
+tela/comando precisa do reader_id da caixa da sessão. Aqui ficam dois
+dicionários (reader_id -> caixa e id -> caixa), carregados de uma vez e
+guardados no cache 'default', compartilhado entre os processos (web,
+worker, bridge MQTT). Como em usuarios/autorizacao.py, a chave leva uma
+geração que invalidar() troca, chamada pelos signals de Caixa
+(inventario/signals.py): uma caixa cadastrada ou desativada no admin vale
+para todos os processos na hora. O TTL (CAIXAS_CACHE_TTL_S) é só uma rede
+de segurança para alterações feitas sem signals.
+"""
+
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Caixa, caixa_padrao
+
+DadosCaixa = namedtuple("DadosCaixa", ["id", "reader_id", "nome"])
+
+CHAVE_GERACAO = "inventario:caixas:geracao"
+CHAVE = "inventario:caixas:{}"
+
+
+def _carregar():
+    caixas = [
+        DadosCaixa(c.id, c.reader_id, c.nome)
+        for c in Caixa.objects.filter(ativa=True)
+    ]
+    return {
+        "por_leitor": {c.reader_id: c for c in caixas},
+        "por_id": {c.id: c for c in caixas},
+    }
+
+
+def _geracao():
+    geracao = cache.get(CHAVE_GERACAO)
+    if geracao is None:
+        # cache frio: o primeiro processo a chegar define a geração
+        cache.add(CHAVE_GERACAO, uuid.uuid4().hex, None)
+        geracao = cache.get(CHAVE_GERACAO)
+    return geracao
+
+
+def _mapas():
+    # a geração é lida antes do banco: se invalidar() rodar no meio, o
+    # que for carregado aqui fica na geração velha
+    chave = CHAVE.format(_geracao())
+    mapas = cache.get(chave)
+    if mapas is None:
+        mapas = _carregar()
+        cache.set(chave, mapas, getattr(settings, "CAIXAS_CACHE_TTL_S", 300))
+    return mapas
+
+
+def leitor_padrao():
+    return getattr(settings, "READER_ID", "rasp-01")
+
+
+def do_leitor(reader_id):
+    """
+    DadosCaixa da caixa ativa com esse leitor, ou None.
+    """
+    return _mapas()["por_leitor"].get(reader_id)
+
+
+def por_id(caixa_id):
+    """
+    DadosCaixa da caixa ativa com esse id, ou None.
+    """
+    return _mapas()["por_id"].get(caixa_id)
+
+
+def ids():
+    return list(_mapas()["por_id"])
+
+
+def resolver(reader_id=None):
+    """
+    Caixa de um toque/pedido: a do reader_id informado ou, sem reader_id,
+    a do leitor padrão (criada na primeira vez, ver caixa_padrao()).
+    None se o leitor não estiver cadastrado ou a caixa estiver desativada.
+    """
+    reader_id = reader_id or leitor_padrao()
+    caixa = do_leitor(reader_id)
+    if caixa is None and reader_id == leitor_padrao():
+        c = caixa_padrao()
+        if c.ativa:
+            invalidar()
+            caixa = DadosCaixa(c.id, c.reader_id, c.nome)
+    return caixa
+
+
+def invalidar():
+    """
+    Troca a geração; o próximo acesso, em qualquer processo, recarrega do
+    banco.
+    """
+    cache.set(CHAVE_GERACAO, uuid.uuid4().hex, None)
@@ -0,0 +1,94 @@
+# inventario/catalogo.py
+"""
+Catálogo de ferramentas de uma caixa (gavetas ativas e suas ferramentas
+ativas), montado com prefetch e guardado em cache, uma chave por caixa.
+
+O catálogo quase nunca muda, mas é lido em toda tela de retirada. Ele é
+invalidado pelos signals de Gaveta/Ferramenta (inventario/signals.py).
+O cache 'default' é compartilhado entre os processos (ver CACHES no
+settings), então uma edição no admin vale para todos na hora, ETag
+incluída. Quem alterar o inventário com queryset.update()/bulk_* precisa
+chamar invalidar() por conta própria, já que esses métodos não disparam
+signals.
+"""
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import Caixa, Gaveta, Ferramenta
+
+CHAVE = "inventario:catalogo:{}"
+CHAVE_ALTERADO_EM = "inventario:catalogo:alterado_em"
+
+
+def _montar(caixa_id):
+    gavetas = (
+        Gaveta.objects
+        .filter(caixa_id=caixa_id, ativa=True)
+        .order_by("numero")
+        .prefetch_related(
+            Prefetch(
+                "ferramentas",
+                queryset=Ferramenta.objects.filter(ativa=True).order_by("posicao", "nome"),
+            )
+        )
+    )
+
+    gavetas_data = []
+    modificado_em = cache.get(CHAVE_ALTERADO_EM)
+    for gaveta in gavetas:
+        ferramentas_data = []
+        for f in gaveta.ferramentas.all():
+            ferramentas_data.append({
+                "id": f.id,
+                "nome": f.nome,
+                "codigo": f.codigo,
+                "posicao": f.posicao,
+                "quantidade": f.quantidade,
+                "descricao": f.descricao,
+            })
+            modificado_em = max(filter(None, [modificado_em, f.atualizado_em]))
+
+        gavetas_data.append({
+            "id": gaveta.id,
+            "numero": gaveta.numero,
+            "nome": gaveta.nome,
+            "descricao": gaveta.descricao,
+            "ferramentas": ferramentas_data,
+        })
+        modificado_em = max(filter(None, [modificado_em, gaveta.atualizado_em]))
+
+    corpo = json.dumps(gavetas_data, sort_keys=True, ensure_ascii=False)
+    return {
+        "gavetas": gavetas_data,
+        "etag": hashlib.sha1(corpo.encode("utf-8")).hexdigest(),
+        "modificado_em": modificado_em or timezone.now(),
+    }
+
+
+def obter(caixa_id):
+    """
+    Catálogo atual da caixa: {"gavetas": [...], "etag": str,
+    "modificado_em": datetime}.
+    """
+    chave = CHAVE.format(caixa_id)
+    catalogo = cache.get(chave)
+    if catalogo is None:
+        catalogo = _montar(caixa_id)
+        cache.set(chave, catalogo, getattr(settings, "CATALOGO_CACHE_TTL_S", 3600))
+    return catalogo
+
+
+def invalidar():
+    """
+    Descarta o catálogo em cache de todas as caixas (uma gaveta pode ter
+    trocado de caixa). Guarda o instante da alteração para o
+    Last-Modified continuar andando mesmo quando algo é apagado.
+    """
+    cache.set(CHAVE_ALTERADO_EM, timezone.now(), None)
+    cache.delete_many([CHAVE.format(i) for i in Caixa.objects.values_list("id", flat=True)])
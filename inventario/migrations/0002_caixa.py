@@ -0,0 +1,64 @@
+# Generated by Django 5.1.15 on 2026-10-19 18:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def caixa_padrao_para_gavetas(apps, schema_editor):
+    """
+    Gavetas já cadastradas ficam na caixa do leitor padrão (READER_ID).
+    """
+    Caixa = apps.get_model("inventario", "Caixa")
+    Gaveta = apps.get_model("inventario", "Gaveta")
+
+    if not Gaveta.objects.exists():
+        return
+    caixa, _ = Caixa.objects.get_or_create(reader_id=getattr(settings, "READER_ID", "rasp-01"))
+    Gaveta.objects.filter(caixa__isnull=True).update(caixa=caixa)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Caixa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reader_id', models.CharField(help_text='Identificador do leitor da caixa (ex: rasp-01)', max_length=50, unique=True)),
+                ('nome', models.CharField(blank=True, help_text='Nome amigável (ex: Caixa da manutenção)', max_length=100)),
+                ('ativa', models.BooleanField(default=True, help_text='Se desmarcado, toques de cartão neste leitor são recusados')),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Caixa',
+                'verbose_name_plural': 'Caixas',
+                'ordering': ['reader_id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='gaveta',
+            name='caixa',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='gavetas', to='inventario.caixa'),
+        ),
+        migrations.RunPython(caixa_padrao_para_gavetas, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='gaveta',
+            name='caixa',
+            field=models.ForeignKey(blank=True, help_text='Caixa onde a gaveta fica (vazio = caixa do leitor padrão)', on_delete=django.db.models.deletion.PROTECT, related_name='gavetas', to='inventario.caixa'),
+        ),
+        migrations.AlterField(
+            model_name='gaveta',
+            name='numero',
+            field=models.PositiveSmallIntegerField(help_text='Número físico da gaveta na caixa (ex: 1, 2, 3...)'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='gaveta',
+            unique_together={('caixa', 'numero')},
+        ),
+    ]
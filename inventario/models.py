@@ -1,10 +1,60 @@
+from django.conf import settings
 from django.db import models
 
 
+class Caixa(models.Model):
+    """
+    Uma caixa de ferramentas, identificada pelo leitor (Rock Pi) instalado
+    nela. O reader_id é o mesmo dos tópicos MQTT (tcc/caixa/<reader_id>/...)
+    e do payload do toque do cartão.
+    """
+    reader_id = models.CharField(
+        max_length=50,
+        unique=True,
+        help_text="Identificador do leitor da caixa (ex: rasp-01)"
+    )
+    nome = models.CharField(
+        max_length=100,
+        blank=True,
+        help_text="Nome amigável (ex: Caixa da manutenção)"
+    )
+    ativa = models.BooleanField(
+        default=True,
+        help_text="Se desmarcado, toques de cartão neste leitor são recusados"
+    )
+
+    criado_em = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["reader_id"]
+        verbose_name = "Caixa"
+        verbose_name_plural = "Caixas"
+
+    def __str__(self):
+        return self.nome or f"Caixa {self.reader_id}"
+
+
+def caixa_padrao():
+    """
+    Caixa do leitor padrão (settings.READER_ID), criada na primeira vez.
+    Instalações com uma caixa só continuam cadastrando gavetas sem
+    escolher a caixa.
+    """
+    caixa, _ = Caixa.objects.get_or_create(reader_id=getattr(settings, "READER_ID", "rasp-01"))
+    return caixa
+
+
 class Gaveta(models.Model):
+    caixa = models.ForeignKey(
+        Caixa,
+        on_delete=models.PROTECT,
+        related_name="gavetas",
+        blank=True,
+        help_text="Caixa onde a gaveta fica (vazio = caixa do leitor padrão)"
+    )
     numero = models.PositiveSmallIntegerField(
-        unique=True,
-        help_text="Número físico da gaveta (ex: 1, 2, 3...)"
+        help_text="Número físico da gaveta na caixa (ex: 1, 2, 3...)"
     )
     nome = models.CharField(
         max_length=50,
@@ -21,6 +71,8 @@ class Gaveta(models.Model):
     atualizado_em = models.DateTimeField(auto_now=True)
 
     class Meta:
+        # o número só é único dentro da caixa
+        unique_together = ("caixa", "numero")
         ordering = ["numero"]
         verbose_name = "Gaveta"
         verbose_name_plural = "Gavetas"
@@ -28,6 +80,11 @@ class Gaveta(models.Model):
     def __str__(self):
         return self.nome or f"Gaveta {self.numero}"
 
+    def save(self, *args, **kwargs):
+        if self.caixa_id is None:
+            self.caixa = caixa_padrao()
+        super().save(*args, **kwargs)
+
 
 class Ferramenta(models.Model):
     nome = models.CharField(max_length=100)
@@ -0,0 +1,20 @@
+# inventario/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import caixas, catalogo
+from .models import Caixa, Gaveta, Ferramenta
+
+
+@receiver(post_save, sender=Gaveta)
+@receiver(post_delete, sender=Gaveta)
+@receiver(post_save, sender=Ferramenta)
+@receiver(post_delete, sender=Ferramenta)
+def invalidar_catalogo(sender, **kwargs):
+    catalogo.invalidar()
+
+
+@receiver(post_save, sender=Caixa)
+@receiver(post_delete, sender=Caixa)
+def invalidar_caixas(sender, **kwargs):
+    caixas.invalidar()
@@ -1,3 +1,111 @@
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from operacoes import fluxo, registro
+from operacoes.models import MovimentacaoFerramenta
+from usuarios.models import Colaborador
+
+from . import caixas, catalogo
+from .models import Caixa, Gaveta, Ferramenta
+
+
+class CatalogoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        registro.limpar()
+        caixas.invalidar()
+        self.gavetas = [
+            Gaveta.objects.create(numero=i, nome=f"Gaveta {i}") for i in (1, 2, 3)
+        ]
+        for i in range(12):
+            Ferramenta.objects.create(
+                nome=f"Ferramenta {i}", gaveta=self.gavetas[i % 3], posicao=i
+            )
+        self.url = reverse("ferramentas_disponiveis")
+
+    def test_monta_com_queries_constantes_e_depois_usa_cache(self):
+        with self.assertNumQueries(3):   # caixas + gavetas + prefetch das ferramentas
+            resp = self.client.get(self.url)
+        self.assertEqual(len(resp.json()["gavetas"]), 3)
+        self.assertEqual(len(resp.json()["gavetas"][0]["ferramentas"]), 4)
+
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+    def test_get_condicional_responde_304(self):
+        resp = self.client.get(self.url)
+
+        self.assertEqual(
+            self.client.get(self.url, HTTP_IF_NONE_MATCH=resp["ETag"]).status_code, 304
+        )
+        self.assertEqual(
+            self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=resp["Last-Modified"]).status_code,
+            304,
+        )
+
+    def test_alteracao_invalida_catalogo(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        f = Ferramenta.objects.first()
+        f.ativa = False
+        f.save()
+
+        resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        nomes = [x["nome"] for g in resp.json()["gavetas"] for x in g["ferramentas"]]
+        self.assertNotIn(f.nome, nomes)
+
+        Ferramenta.objects.filter(gaveta=self.gavetas[2]).delete()
+        self.gavetas[2].delete()
+        self.assertEqual(len(catalogo.obter(self.gavetas[0].caixa_id)["gavetas"]), 2)
+
+    def test_tela_retirar_usa_catalogo(self):
+        colaborador = Colaborador.objects.create(nome="Fulano", matricula="1")
+        sessao = fluxo.abrir_sessao(colaborador, None, {})
+        fora = Ferramenta.objects.get(nome="Ferramenta 0")
+        MovimentacaoFerramenta.objects.create(
+            sessao=sessao, ferramenta=fora, tipo="R",
+            gaveta_numero=fora.gaveta.numero, confirmado_visao=True,
+        )
+        catalogo.obter(sessao.caixa_id)
+        registro.sessao(sessao.id)
+
+        with self.assertNumQueries(1):   # só as ferramentas fora da caixa
+            resp = self.client.get(reverse("retirar", args=[sessao.id]))
+
+        nomes = [item["nome"] for _, itens in resp.context["gavetas"] for item in itens]
+        self.assertEqual(len(nomes), 11)
+        self.assertNotIn("Ferramenta 0", nomes)
+
+
+class CaixasTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.caixa = Caixa.objects.create(reader_id="rasp-02", nome="Oficina")
+
+    def test_carrega_uma_vez_para_todos_os_processos(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(caixas.do_leitor("rasp-02").id, self.caixa.id)
+
+        # as leituras seguintes, neste ou em outro processo, vêm do cache
+        with self.assertNumQueries(0):
+            self.assertEqual(caixas.por_id(self.caixa.id).reader_id, "rasp-02")
+            self.assertIsNone(caixas.do_leitor("rasp-09"))
+
+    def test_invalidacao_vale_para_os_outros_processos(self):
+        self.assertIsNotNone(caixas.do_leitor("rasp-02"))
+
+        # outro processo desativa a caixa: só o cache compartilhado muda aqui
+        Caixa.objects.filter(id=self.caixa.id).update(ativa=False)
+        cache.set(caixas.CHAVE_GERACAO, "outra")
+
+        with self.assertNumQueries(1):
+            self.assertIsNone(caixas.do_leitor("rasp-02"))
+
+    def test_alteracao_no_admin_invalida(self):
+        self.assertIsNone(caixas.do_leitor("rasp-03"))
+
+        Caixa.objects.create(reader_id="rasp-03")
+
+        self.assertIsNotNone(caixas.do_leitor("rasp-03"))
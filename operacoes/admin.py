@@ -1,5 +1,11 @@
 from django.contrib import admin
-from .models import SessaoUso, MovimentacaoFerramenta
+from .models import (
+    MovimentacaoArquivada,
+    MovimentacaoFerramenta,
+    SessaoArquivada,
+    SessaoUso,
+    UsoDiario,
+)
 
 
 class MovimentacaoFerramentaInline(admin.TabularInline):
@@ -9,8 +15,8 @@ class MovimentacaoFerramentaInline(admin.TabularInline):
 
 @admin.register(SessaoUso)
 class SessaoUsoAdmin(admin.ModelAdmin):
-    list_display = ("id", "colaborador", "status", "iniciado_em", "finalizado_em")
-    list_filter = ("status", "iniciado_em")
+    list_display = ("id", "colaborador", "caixa", "status", "etapa", "gaveta_atual", "iniciado_em", "finalizado_em")
+    list_filter = ("caixa", "status", "etapa", "iniciado_em")
     search_fields = ("colaborador__nome", "colaborador__matricula")
     inlines = [MovimentacaoFerramentaInline]
 
@@ -25,6 +31,48 @@ class MovimentacaoFerramentaAdmin(admin.ModelAdmin):
         "quantidade",
         "criado_em",
         "confirmado_visao",
+        "visao_confere",
     )
-    list_filter = ("tipo", "gaveta_numero", "confirmado_visao")
+    list_filter = ("tipo", "gaveta_numero", "confirmado_visao", "visao_confere")
     search_fields = ("ferramenta__nome", "sessao__colaborador__nome")
+
+
+class MovimentacaoArquivadaInline(admin.TabularInline):
+    model = MovimentacaoArquivada
+    extra = 0
+    can_delete = False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(SessaoArquivada)
+class SessaoArquivadaAdmin(admin.ModelAdmin):
+    list_display = ("id", "colaborador_nome", "status", "iniciado_em", "finalizado_em", "arquivado_em")
+    list_filter = ("status", "iniciado_em")
+    search_fields = ("colaborador_nome", "colaborador_matricula", "cartao_uid")
+    inlines = [MovimentacaoArquivadaInline]
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(UsoDiario)
+class UsoDiarioAdmin(admin.ModelAdmin):
+    list_display = ("dia", "ferramenta", "colaborador", "gaveta_numero", "retiradas", "devolucoes")
+    list_filter = ("dia", "gaveta_numero")
+    search_fields = ("ferramenta__nome", "colaborador__nome")
+
+    # mantido só pelo operacoes/rollups.py
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_add_permission(self, request):
+        return False
+
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class OperacoesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'operacoes'
+
+    def ready(self):
+        # caches que precisam ser compartilhados entre os processos
+        from . import checks  # noqa: F401
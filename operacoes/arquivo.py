@@ -0,0 +1,176 @@
+# operacoes/arquivo.py
+"""
+Arquivamento do histórico: sessões encerradas há mais de
+ARQUIVO_HORIZONTE_DIAS saem de SessaoUso/MovimentacaoFerramenta e vão
+para SessaoArquivada/MovimentacaoArquivada, mantendo as tabelas quentes
+(consultadas pelo quiosque) pequenas.
+
+Posse de ferramenta é sempre "o último movimento confirmado" da
+ferramenta (retirar) ou da ferramenta para o colaborador (devolver).
+Como o último de uma ferramenta também é o último dela para aquele
+colaborador, basta nunca arquivar uma sessão que contenha o último
+movimento confirmado de algum par (ferramenta, colaborador): essas
+sessões ficam nas tabelas quentes até um movimento mais novo aparecer.
+
+Também só sai do quente o que os rollups (operacoes/rollups.py) já
+somaram; arquivar() atualiza os rollups antes de começar (também com
+simular=True, já que isso não tira nada do quente).
+
+    python manage.py arquivar_historico [--dias N] [--simular]
+
+Leitura do arquivo: /api/arquivo/sessoes/ (api/views.py).
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Prefetch, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from . import rollups
+from .models import (
+    MovimentacaoArquivada,
+    MovimentacaoFerramenta,
+    SessaoArquivada,
+    SessaoUso,
+)
+
+logger = logging.getLogger(__name__)
+
+STATUS_ENCERRADOS = ("F", "C", "E")
+
+
+def sessoes_com_posse():
+    """
+    Ids das sessões que contêm o último movimento confirmado de algum par
+    (ferramenta, colaborador).
+    """
+    ultimos = (
+        MovimentacaoFerramenta.objects
+        .filter(confirmado_visao=True)
+        .annotate(
+            ordem=Window(
+                RowNumber(),
+                partition_by=[F("ferramenta_id"), F("sessao__colaborador_id")],
+                order_by=[F("criado_em").desc(), F("id").desc()],
+            )
+        )
+        .filter(ordem=1)
+        .values_list("sessao_id", flat=True)
+    )
+    return set(ultimos)
+
+
+def _arquivaveis(corte, protegidas, marca):
+    return (
+        SessaoUso.objects
+        .filter(status__in=STATUS_ENCERRADOS, finalizado_em__lt=corte)
+        .exclude(id__in=protegidas)
+        # movimentação que os rollups ainda não somaram
+        .exclude(movimentacoes__id__gt=marca)
+    )
+
+
+def _candidatas(corte, protegidas, marca, lote):
+    return list(
+        _arquivaveis(corte, protegidas, marca)
+        .select_related("colaborador", "cartao")
+        .prefetch_related(
+            Prefetch(
+                "movimentacoes",
+                queryset=MovimentacaoFerramenta.objects.select_related("ferramenta"),
+            )
+        )
+        .order_by("id")[:lote]
+    )
+
+
+def _copiar(sessoes):
+    SessaoArquivada.objects.bulk_create(
+        [
+            SessaoArquivada(
+                id=s.id,
+                colaborador_id=s.colaborador_id,
+                colaborador_nome=s.colaborador.nome,
+                colaborador_matricula=s.colaborador.matricula,
+                cartao_uid=s.cartao.uid if s.cartao else "",
+                status=s.status,
+                iniciado_em=s.iniciado_em,
+                finalizado_em=s.finalizado_em,
+                payload_inicial=s.payload_inicial,
+            )
+            for s in sessoes
+        ],
+        ignore_conflicts=True,   # reexecução depois de uma falha no meio
+    )
+    MovimentacaoArquivada.objects.bulk_create(
+        [
+            MovimentacaoArquivada(
+                id=m.id,
+                sessao_id=s.id,
+                ferramenta_id=m.ferramenta_id,
+                ferramenta_nome=m.ferramenta.nome,
+                tipo=m.tipo,
+                gaveta_numero=m.gaveta_numero,
+                quantidade=m.quantidade,
+                imagem_path=m.imagem_path,
+                confirmado_visao=m.confirmado_visao,
+                visao_confere=m.visao_confere,
+                criado_em=m.criado_em,
+            )
+            for s in sessoes
+            for m in s.movimentacoes.all()
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def arquivar(horizonte_dias=None, lote=500, simular=False, agora=None):
+    """
+    Move as sessões encerradas antes do horizonte (e suas movimentações)
+    para o arquivo, em transações de até `lote` sessões. Com simular=True
+    só conta. Retorna {"sessoes", "movimentacoes", "protegidas"}.
+    """
+    if horizonte_dias is None:
+        horizonte_dias = getattr(settings, "ARQUIVO_HORIZONTE_DIAS", 90)
+    agora = agora or timezone.now()
+    corte = agora - timedelta(days=horizonte_dias)
+
+    # inclusive ao simular, para a contagem bater com a execução real
+    rollups.atualizar_rollups()
+    marca = rollups.marca_atual()
+    protegidas = sessoes_com_posse()
+    resumo = {"sessoes": 0, "movimentacoes": 0, "protegidas": len(protegidas)}
+
+    if simular:
+        qs = _arquivaveis(corte, protegidas, marca)
+        resumo["sessoes"] = qs.count()
+        resumo["movimentacoes"] = MovimentacaoFerramenta.objects.filter(sessao__in=qs).count()
+        return resumo
+
+    while True:
+        with transaction.atomic():
+            sessoes = _candidatas(corte, protegidas, marca, lote)
+            if not sessoes:
+                break
+
+            _copiar(sessoes)
+            ids = [s.id for s in sessoes]
+            n_movs = sum(len(s.movimentacoes.all()) for s in sessoes)
+            MovimentacaoFerramenta.objects.filter(sessao_id__in=ids).delete()
+            SessaoUso.objects.filter(id__in=ids).delete()
+
+        resumo["sessoes"] += len(sessoes)
+        resumo["movimentacoes"] += n_movs
+        if len(sessoes) < lote:
+            break
+
+    logger.info(
+        "Arquivo: %(sessoes)s sessão(ões) e %(movimentacoes)s movimentação(ões) "
+        "arquivadas; %(protegidas)s sessão(ões) mantidas por guardarem a posse atual.",
+        resumo,
+    )
+    return resumo
@@ -0,0 +1,43 @@
+# operacoes/checks.py
+"""
+Checagens do "manage.py check" (e do runserver/migrate) para a instalação.
+
+Os caches abaixo são lidos e invalidados por processos diferentes (web,
+worker_confirmacoes, bridge MQTT). Com LocMemCache cada processo teria a
+sua cópia e só o que fez a alteração veria a mudança; fora do DEBUG (e
+dos testes) isso é recusado.
+"""
+
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+LOCMEM = "django.core.cache.backends.locmem.LocMemCache"
+
+
+def _compartilhados():
+    """
+    {alias do cache: quem depende dele ser compartilhado}.
+    """
+    return {
+        "default": "catálogo de ferramentas (inventario/catalogo.py), pelas caixas "
+                   "(inventario/caixas.py) e pela autorização dos cartões NFC "
+                   "(usuarios/autorizacao.py)",
+        getattr(settings, "SESSOES_CACHE", "sessoes"): "registro das sessões em andamento (operacoes/registro.py)",
+    }
+
+
+@register(Tags.caches)
+def caches_compartilhados(app_configs, **kwargs):
+    if settings.DEBUG or getattr(settings, "TESTING", False):
+        return []
+
+    erros = []
+    for alias, uso in _compartilhados().items():
+        if settings.CACHES.get(alias, {}).get("BACKEND") == LOCMEM:
+            erros.append(Error(
+                f"O cache '{alias}' é LocMemCache, um por processo.",
+                hint=f"Usado pelo {uso}; configure um backend compartilhado "
+                     "(FileBasedCache, redis ou memcached).",
+                id="operacoes.E001",
+            ))
+    return erros
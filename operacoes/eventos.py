@@ -0,0 +1,203 @@
+# operacoes/eventos.py
+"""
+Eventos do ciclo de vida da sessão, entregues em tempo real às telas do
+quiosque (SSE em /api/eventos/, ver api/views.eventos_sessao).
+
+Cada processo entrega os eventos às próprias conexões SSE na hora e os
+repassa pelo broker MQTT (tópico <BASE>/eventos, QoS 1): o
+worker_confirmacoes, o expirar_sessoes e os outros workers do servidor
+ASGI publicam ali, e o processo que tem conexões SSE assina o tópico e
+entrega o que veio de outro processo. Os eventos só saem depois do commit
+da transação que os gerou. Com o broker fora do ar os eventos de outros
+processos se perdem; o home.js volta ao polling de /api/status-frontend/
+quando o canal cai. EVENTOS_MQTT=False desliga o repasse.
+
+Eventos:
+    sessao   mesmo formato de /api/status-frontend/ (abriu / encerrou)
+    gaveta   uma gaveta da sessão foi confirmada
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import uuid
+
+import paho.mqtt.client as mqtt
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# Eventos acumulados por assinante antes de ele ser considerado travado
+TAMANHO_FILA = 100
+
+# identifica este processo nas mensagens repassadas pelo MQTT
+ORIGEM = uuid.uuid4().hex
+
+_assinantes = set()
+_lock = threading.Lock()
+
+_mqtt = None             # cliente paho do repasse (loop numa thread própria)
+_ouvindo = False         # este processo tem (ou teve) conexões SSE
+_mqtt_lock = threading.Lock()
+
+
+class Assinatura:
+    """
+    Uma conexão SSE: a fila asyncio dela e o loop que a consome.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.fila = asyncio.Queue(maxsize=TAMANHO_FILA)
+
+    def _entregar(self, evento):
+        try:
+            self.fila.put_nowait(evento)
+        except asyncio.QueueFull:
+            logger.warning("Assinante de eventos travado; evento %s descartado.", evento[0])
+
+    async def proximo(self, timeout):
+        """
+        Próximo evento (tipo, dados) ou None se nada chegar em `timeout` s.
+        """
+        try:
+            return await asyncio.wait_for(self.fila.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+def assinar():
+    """
+    Registra uma nova assinatura. Chamar de dentro do loop asyncio que vai
+    consumir os eventos; sempre terminar com cancelar().
+    """
+    assinatura = Assinatura()
+    with _lock:
+        _assinantes.add(assinatura)
+    _ouvir()
+    return assinatura
+
+
+def cancelar(assinatura):
+    with _lock:
+        _assinantes.discard(assinatura)
+
+
+def _entregar(tipo, dados):
+    with _lock:
+        assinantes = list(_assinantes)
+
+    for assinatura in assinantes:
+        try:
+            assinatura.loop.call_soon_threadsafe(assinatura._entregar, (tipo, dados))
+        except RuntimeError:
+            # loop já fechado: a conexão caiu sem passar por cancelar()
+            cancelar(assinatura)
+
+
+def publicar(tipo, dados):
+    """
+    Entrega o evento a todas as assinaturas deste processo e o repassa aos
+    outros pelo MQTT. Pode ser chamada de qualquer thread (views
+    síncronas, threads do pool de visão...).
+    """
+    _entregar(tipo, dados)
+
+    cliente = _cliente()
+    if cliente is not None:
+        mensagem = json.dumps({"origem": ORIGEM, "tipo": tipo, "dados": dados}, default=str)
+        # QoS 1: o paho guarda a mensagem até conectar, se ainda não conectou
+        cliente.publish(_topico(), mensagem, qos=1)
+
+
+def _topico():
+    base = getattr(settings, "MQTT_CONFIG", {}).get("BASE", "tcc/caixa").rstrip("/")
+    return f"{base}/eventos"
+
+
+def _cliente():
+    """
+    Cliente MQTT do repasse, criado na primeira chamada (o paho reconecta
+    sozinho), ou None com EVENTOS_MQTT=False.
+    """
+    global _mqtt
+    if not getattr(settings, "EVENTOS_MQTT", True):
+        return None
+
+    with _mqtt_lock:
+        if _mqtt is None:
+            cfg = getattr(settings, "MQTT_CONFIG", {})
+            cliente = mqtt.Client(client_id=f"caixa-eventos-{ORIGEM[:12]}")
+            if cfg.get("USER"):
+                cliente.username_pw_set(cfg["USER"], cfg.get("PASS") or None)
+            cliente.on_connect = _on_connect
+            cliente.on_message = _on_message
+            cliente.connect_async(cfg.get("HOST", "127.0.0.1"), int(cfg.get("PORT", 1883)), keepalive=60)
+            cliente.loop_start()
+            _mqtt = cliente
+        return _mqtt
+
+
+def _ouvir():
+    """
+    Passa a receber os eventos dos outros processos (na primeira conexão
+    SSE deste processo).
+    """
+    global _ouvindo
+    if _ouvindo:
+        return
+    _ouvindo = True
+    cliente = _cliente()
+    if cliente is not None and cliente.is_connected():
+        cliente.subscribe(_topico(), qos=1)
+
+
+def _on_connect(client, userdata, flags, rc, *args):
+    if rc != 0:
+        logger.warning("Eventos: broker MQTT recusou a conexão (rc=%s).", rc)
+        return
+    # a cada (re)conexão: clean session, a assinatura precisa ser refeita
+    if _ouvindo:
+        client.subscribe(_topico(), qos=1)
+
+
+def _on_message(client, userdata, msg):
+    try:
+        mensagem = json.loads(msg.payload.decode("utf-8"))
+        origem, tipo, dados = mensagem["origem"], mensagem["tipo"], mensagem["dados"]
+    except (ValueError, KeyError, TypeError, UnicodeDecodeError):
+        logger.warning("Eventos: mensagem inválida em %s: %r", msg.topic, msg.payload)
+        return
+    if origem != ORIGEM:
+        _entregar(tipo, dados)
+
+
+def publicar_no_commit(tipo, dados):
+    """
+    Publica quando a transação atual for confirmada (na hora, se não
+    houver transação aberta).
+    """
+    transaction.on_commit(lambda: publicar(tipo, dados))
+
+
+def status_sessao(retrato):
+    """
+    Corpo do evento "sessao" (e de /api/status-frontend/) para o retrato
+    da sessão (operacoes/registro.py), ou para "nenhuma sessão ativa" se
+    retrato for None ou a sessão já tiver sido encerrada.
+    """
+    if retrato is None or retrato["status"] != "A":
+        return {
+            "ok": True,
+            "sessao_ativa": False,
+        }
+
+    return {
+        "ok": True,
+        "sessao_ativa": True,
+        "sessao_id": retrato["id"],
+        "colaborador": retrato["colaborador"],
+        "reader_id": retrato["reader_id"],
+    }
@@ -0,0 +1,164 @@
+# operacoes/expiracao.py
+"""
+Expiração de sessões abandonadas.
+
+Sessão em andamento ("A") iniciada há mais de SESSAO_TTL_S vira
+"Expirada / Timeout" ("E") em lote: as movimentações ainda não
+confirmadas são canceladas e, se a sessão tinha uma gaveta aberta, a
+Rock Pi recebe o comando para fechá-la.
+
+Roda periodicamente pelo comando:
+
+    python manage.py expirar_sessoes
+"""
+
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from caixa import metricas as metricas_caixa
+from hardware.mqtt_client import publish_run_command
+
+from . import eventos, registro
+from .models import SessaoUso, MovimentacaoFerramenta
+
+logger = logging.getLogger(__name__)
+
+# Totais desde que o processo subiu (lidos pelo comando); os mesmos números
+# vão para /metrics como caixa_expiracao_* (caixa/metricas.py)
+metricas = {
+    "execucoes": 0,
+    "sessoes_expiradas": 0,
+    "movimentacoes_canceladas": 0,
+    "gavetas_fechadas": 0,
+    "falhas_mqtt": 0,
+    "ultima_execucao_em": None,
+    "ultima_duracao_ms": None,
+}
+_metricas_lock = threading.Lock()
+
+# Tamanho do lote por transação
+LOTE = 200
+
+
+def _fechar_gaveta(sessao, gaveta_numero):
+    try:
+        publish_run_command(
+            reader_id=registro.reader_da_sessao(sessao),
+            alias=f"fechar_gaveta_{int(gaveta_numero)}",
+            args=[],
+            mode="fg",
+            timeout_s=10.0,
+        )
+        return True
+    except Exception:
+        logger.exception(
+            "Sessão %s expirada: falha ao fechar a gaveta %s.", sessao.id, gaveta_numero
+        )
+        return False
+
+
+def _expirar_lote(corte, corte_validando, agora):
+    """
+    Expira até LOTE sessões. Retorna (sessoes, movimentacoes_canceladas,
+    gavetas_a_fechar).
+    """
+    with transaction.atomic():
+        sessoes = list(
+            SessaoUso.objects
+            .select_for_update(skip_locked=True)
+            .select_related("colaborador")
+            .filter(status="A", iniciado_em__lt=corte)
+            # confirmação em andamento: dá mais um TTL para ela terminar
+            .exclude(etapa="V", iniciado_em__gte=corte_validando)
+            .order_by("iniciado_em")[:LOTE]
+        )
+        if not sessoes:
+            return [], 0, []
+
+        ids = [s.id for s in sessoes]
+        canceladas, _ = MovimentacaoFerramenta.objects.filter(
+            sessao_id__in=ids,
+            confirmado_visao=False,
+        ).delete()
+
+        gavetas = [
+            (s, s.gaveta_atual)
+            for s in sessoes
+            if s.etapa in ("G", "V") and s.gaveta_atual is not None
+        ]
+
+        SessaoUso.objects.filter(id__in=ids).update(
+            status="E",
+            etapa="X",
+            finalizado_em=agora,
+            gaveta_atual=None,
+            gavetas_pendentes=[],
+        )
+
+        for s in sessoes:
+            s.status, s.etapa, s.finalizado_em = "E", "X", agora
+            s.gaveta_atual, s.gavetas_pendentes = None, []
+            r = registro.atualizar(s, itens={})
+            eventos.publicar_no_commit("sessao", eventos.status_sessao(r))
+
+    return sessoes, canceladas, gavetas
+
+
+def expirar_sessoes(agora=None):
+    """
+    Expira todas as sessões vencidas. Retorna um resumo da execução.
+    """
+    inicio = time.monotonic()
+    agora = agora or timezone.now()
+    ttl = timedelta(seconds=getattr(settings, "SESSAO_TTL_S", 30 * 60))
+    corte = agora - ttl
+    corte_validando = corte - ttl
+
+    resumo = {"sessoes_expiradas": 0, "movimentacoes_canceladas": 0, "gavetas_fechadas": 0, "falhas_mqtt": 0}
+    while True:
+        sessoes, canceladas, gavetas = _expirar_lote(corte, corte_validando, agora)
+        if not sessoes:
+            break
+
+        resumo["sessoes_expiradas"] += len(sessoes)
+        resumo["movimentacoes_canceladas"] += canceladas
+
+        # MQTT fora da transação: a sessão já está expirada de qualquer jeito
+        for sessao, gaveta_numero in gavetas:
+            if _fechar_gaveta(sessao, gaveta_numero):
+                resumo["gavetas_fechadas"] += 1
+            else:
+                resumo["falhas_mqtt"] += 1
+
+        if len(sessoes) < LOTE:
+            break
+
+    resumo["duracao_ms"] = round((time.monotonic() - inicio) * 1000, 1)
+
+    with _metricas_lock:
+        metricas["execucoes"] += 1
+        for chave in ("sessoes_expiradas", "movimentacoes_canceladas", "gavetas_fechadas", "falhas_mqtt"):
+            metricas[chave] += resumo[chave]
+        metricas["ultima_execucao_em"] = agora
+        metricas["ultima_duracao_ms"] = resumo["duracao_ms"]
+
+    metricas_caixa.incrementar("caixa_expiracao_execucoes_total")
+    for chave in ("sessoes_expiradas", "movimentacoes_canceladas", "gavetas_fechadas", "falhas_mqtt"):
+        if resumo[chave]:
+            metricas_caixa.incrementar(f"caixa_expiracao_{chave}_total", resumo[chave])
+    metricas_caixa.observar("caixa_expiracao_duracao_segundos", resumo["duracao_ms"] / 1000)
+
+    if resumo["sessoes_expiradas"]:
+        logger.info(
+            "Expiração: %(sessoes_expiradas)s sessão(ões), %(movimentacoes_canceladas)s "
+            "movimentação(ões) cancelada(s), %(gavetas_fechadas)s gaveta(s) fechada(s), "
+            "%(falhas_mqtt)s falha(s) MQTT em %(duracao_ms)s ms",
+            resumo,
+        )
+    return resumo
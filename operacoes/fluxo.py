@@ -0,0 +1,287 @@
+# operacoes/fluxo.py
+"""
+Máquina de estados da sessão de uso.
+
+Toda mudança de etapa da sessão passa por aqui, sempre dentro de
+transaction.atomic() e com a linha da sessão travada (select_for_update),
+para que dois fronts (ou um duplo clique) não confirmem a mesma gaveta
+duas vezes nem encerrem a sessão em duplicidade.
+
+Etapas (SessaoUso.etapa):
+    S  selecionando ferramentas
+    G  gaveta aberta, aguardando o colaborador confirmar
+    V  validando a gaveta (captura + visão em andamento)
+    X  encerrada
+
+A sessão guarda a gaveta atual e a lista de gavetas pendentes, então as
+telas não precisam recalcular "a primeira gaveta pendente" a cada acesso.
+"""
+
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+
+from caixa import rastreio
+from inventario import caixas
+
+from . import eventos, registro
+from .models import SessaoUso, MovimentacaoFerramenta
+
+logger = logging.getLogger(__name__)
+
+
+# etapa atual -> etapas permitidas a seguir
+TRANSICOES = {
+    "S": {"G", "X"},
+    "G": {"G", "V", "X"},   # G -> G: nova seleção substitui a anterior
+    "V": {"G", "X"},        # próxima gaveta, fim da sessão ou falha na captura
+    "X": set(),
+}
+
+
+class TransicaoInvalida(Exception):
+    """
+    A sessão não está numa etapa que permita a operação pedida.
+    `status` é o código HTTP sugerido para a resposta.
+    """
+
+    def __init__(self, mensagem, status=409):
+        super().__init__(mensagem)
+        self.status = status
+
+
+def _travar(sessao_id):
+    """
+    Busca a sessão com a linha travada até o fim da transação.
+    Levanta SessaoUso.DoesNotExist se não existir.
+    """
+    return (
+        SessaoUso.objects
+        .select_for_update()
+        .select_related("colaborador")
+        .get(id=sessao_id)
+    )
+
+
+def _exigir_em_andamento(sessao):
+    if sessao.status != "A":
+        raise TransicaoInvalida("Sessão não está em andamento.", status=400)
+
+
+def _mudar_etapa(sessao, nova_etapa):
+    if nova_etapa not in TRANSICOES[sessao.etapa]:
+        raise TransicaoInvalida(
+            f"Transição inválida: {sessao.get_etapa_display()} -> "
+            f"{dict(SessaoUso.ETAPA_CHOICES)[nova_etapa]}."
+        )
+    sessao.etapa = nova_etapa
+
+
+def abrir_sessao(colaborador, cartao, payload, caixa=None):
+    """
+    Cria uma sessão em andamento para o colaborador que passou o cartão,
+    presa à caixa do leitor do toque (`caixa`, um caixas.DadosCaixa; sem
+    ela, a do reader_id do payload, se estiver cadastrada).
+    """
+    if caixa is None:
+        caixa = caixas.resolver((payload or {}).get("reader_id"))
+    sessao = SessaoUso.objects.create(
+        colaborador=colaborador,
+        cartao=cartao,
+        caixa_id=caixa.id if caixa else None,
+        status="A",
+        etapa="S",
+        payload_inicial=payload,
+        trace_id=rastreio.trace_id_atual() or "",
+    )
+    r = registro.atualizar(sessao, itens={})
+    eventos.publicar_no_commit("sessao", eventos.status_sessao(r))
+    return sessao
+
+
+def iniciar_operacao(sessao_id, tipo, ferramentas):
+    """
+    Registra as movimentações (tipo "R" ou "D") das ferramentas escolhidas
+    e aponta a sessão para a primeira gaveta envolvida.
+
+    Movimentações pendentes de uma seleção anterior da mesma sessão são
+    descartadas. Retorna (sessao, gavetas_ordenadas).
+    """
+    with transaction.atomic():
+        sessao = _travar(sessao_id)
+        _exigir_em_andamento(sessao)
+        if sessao.etapa == "V":
+            raise TransicaoInvalida("Há uma confirmação de gaveta em andamento.")
+
+        MovimentacaoFerramenta.objects.filter(
+            sessao=sessao,
+            confirmado_visao=False,
+        ).delete()
+
+        MovimentacaoFerramenta.objects.bulk_create([
+            MovimentacaoFerramenta(
+                sessao=sessao,
+                ferramenta=f,
+                tipo=tipo,
+                gaveta_numero=f.gaveta.numero,
+                quantidade=1,             # por enquanto 1 unidade por ferramenta
+                confirmado_visao=False,
+            )
+            for f in ferramentas
+        ])
+
+        gavetas = sorted({f.gaveta.numero for f in ferramentas})
+
+        _mudar_etapa(sessao, "G")
+        sessao.operacao = tipo
+        sessao.gavetas_pendentes = gavetas
+        sessao.gaveta_atual = gavetas[0] if gavetas else None
+        sessao.save(update_fields=["etapa", "operacao", "gavetas_pendentes", "gaveta_atual"])
+
+        itens = {}
+        for f in ferramentas:
+            itens.setdefault(f.gaveta.numero, []).append(f.nome)
+        registro.atualizar(sessao, itens)
+
+    return sessao, gavetas
+
+
+def iniciar_confirmacao(sessao_id, tipo, gaveta_numero):
+    """
+    Reserva a confirmação da gaveta atual (G -> V) e devolve as
+    movimentações pendentes dela. Uma segunda chamada concorrente para a
+    mesma gaveta recebe TransicaoInvalida em vez de repetir o processo.
+
+    Retorna (sessao, movs).
+    """
+    with transaction.atomic():
+        sessao = _travar(sessao_id)
+        _exigir_em_andamento(sessao)
+
+        if sessao.etapa == "V":
+            raise TransicaoInvalida(
+                f"Confirmação da gaveta {sessao.gaveta_atual} já está em andamento."
+            )
+
+        movs = []
+        if sessao.operacao == tipo and sessao.gaveta_atual == gaveta_numero:
+            movs = list(
+                MovimentacaoFerramenta.objects.filter(
+                    sessao=sessao,
+                    tipo=tipo,
+                    gaveta_numero=gaveta_numero,
+                    confirmado_visao=False,
+                ).select_related("ferramenta")
+            )
+
+        if not movs:
+            nome = "retirada" if tipo == "R" else "devolução"
+            raise TransicaoInvalida(
+                f"Não há movimentações de {nome} pendentes para "
+                f"a gaveta {gaveta_numero} nesta sessão.",
+                status=400,
+            )
+
+        _mudar_etapa(sessao, "V")
+        sessao.save(update_fields=["etapa"])
+        registro.atualizar(sessao)
+
+    return sessao, movs
+
+
+def carregar_confirmacao(sessao_id, tipo, gaveta_numero):
+    """
+    Para quem executa uma confirmação já reservada (worker de jobs):
+    devolve (sessao, movs) se a gaveta ainda estiver em validação.
+    """
+    sessao = SessaoUso.objects.select_related("colaborador").get(id=sessao_id)
+    if (
+        sessao.status != "A"
+        or sessao.etapa != "V"
+        or sessao.operacao != tipo
+        or sessao.gaveta_atual != gaveta_numero
+    ):
+        raise TransicaoInvalida(
+            f"A confirmação da gaveta {gaveta_numero} não está mais reservada."
+        )
+
+    movs = list(
+        MovimentacaoFerramenta.objects.filter(
+            sessao=sessao,
+            tipo=tipo,
+            gaveta_numero=gaveta_numero,
+            confirmado_visao=False,
+        ).select_related("ferramenta")
+    )
+    return sessao, movs
+
+
+def concluir_confirmacao(sessao_id, movs, imagem_rel):
+    """
+    Marca as movimentações da gaveta como confirmadas e avança o ponteiro
+    para a próxima gaveta pendente (V -> G) ou encerra a sessão (V -> X).
+
+    Retorna (sessao, proxima_gaveta); proxima_gaveta é None quando a
+    sessão foi encerrada.
+    """
+    with transaction.atomic():
+        sessao = _travar(sessao_id)
+        if sessao.etapa != "V":
+            raise TransicaoInvalida("Nenhuma confirmação de gaveta em andamento.")
+
+        for mov in movs:
+            mov.imagem_path = imagem_rel
+            mov.confirmado_visao = True
+        MovimentacaoFerramenta.objects.bulk_update(
+            movs, ["imagem_path", "confirmado_visao"]
+        )
+
+        confirmada = sessao.gaveta_atual
+        pendentes = [g for g in sessao.gavetas_pendentes if g != confirmada]
+        proxima_gaveta = pendentes[0] if pendentes else None
+
+        sessao.gavetas_pendentes = pendentes
+        sessao.gaveta_atual = proxima_gaveta
+        campos = ["etapa", "gavetas_pendentes", "gaveta_atual"]
+
+        if proxima_gaveta is None:
+            _mudar_etapa(sessao, "X")
+            sessao.status = "F"
+            sessao.finalizado_em = timezone.now()
+            campos += ["status", "finalizado_em"]
+        else:
+            _mudar_etapa(sessao, "G")
+
+        sessao.save(update_fields=campos)
+        r = registro.atualizar(sessao)
+
+        eventos.publicar_no_commit("gaveta", {
+            "sessao_id": sessao.id,
+            "operacao": sessao.operacao,
+            "gaveta_numero": confirmada,
+            "proxima_gaveta": proxima_gaveta,
+        })
+        if proxima_gaveta is None:
+            eventos.publicar_no_commit("sessao", eventos.status_sessao(r))
+
+    logger.info(
+        "Sessão %s: gaveta confirmada, proxima_gaveta=%s status=%s",
+        sessao.id, proxima_gaveta, sessao.status,
+    )
+    return sessao, proxima_gaveta
+
+
+def abortar_confirmacao(sessao_id):
+    """
+    Devolve a sessão para "gaveta aberta" (V -> G) quando a captura ou a
+    visão falham, permitindo que o colaborador tente de novo.
+    """
+    with transaction.atomic():
+        sessao = _travar(sessao_id)
+        if sessao.etapa != "V":
+            return sessao
+        _mudar_etapa(sessao, "G")
+        sessao.save(update_fields=["etapa"])
+        registro.atualizar(sessao)
+    return sessao
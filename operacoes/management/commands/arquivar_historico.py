@@ -0,0 +1,47 @@
+# operacoes/management/commands/arquivar_historico.py
+"""
+Move sessões encerradas antigas para o arquivo (operacoes/arquivo.py).
+
+    python manage.py arquivar_historico
+    python manage.py arquivar_historico --dias 30 --simular
+"""
+
+from django.core.management.base import BaseCommand
+
+from operacoes.arquivo import arquivar
+
+
+class Command(BaseCommand):
+    help = "Arquiva sessões encerradas (e suas movimentações) mais antigas que o horizonte."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dias",
+            type=int,
+            default=None,
+            help="Horizonte em dias (padrão: settings.ARQUIVO_HORIZONTE_DIAS).",
+        )
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=500,
+            help="Sessões por transação (padrão: 500).",
+        )
+        parser.add_argument(
+            "--simular",
+            action="store_true",
+            help="Só conta o que seria arquivado.",
+        )
+
+    def handle(self, *args, **options):
+        resumo = arquivar(
+            horizonte_dias=options["dias"],
+            lote=options["lote"],
+            simular=options["simular"],
+        )
+        prefixo = "[ARQUIVO] (simulação) " if options["simular"] else "[ARQUIVO] "
+        self.stdout.write(
+            f"{prefixo}{resumo['sessoes']} sessão(ões), "
+            f"{resumo['movimentacoes']} movimentação(ões); "
+            f"{resumo['protegidas']} sessão(ões) mantidas por guardarem a posse atual."
+        )
@@ -0,0 +1,49 @@
+# operacoes/management/commands/atualizar_rollups.py
+"""
+Mantém os rollups diários de uso (operacoes/rollups.py).
+
+    python manage.py atualizar_rollups
+    python manage.py atualizar_rollups --uma-vez   # processa o que houver e sai
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from operacoes.rollups import atualizar_rollups
+
+
+class Command(BaseCommand):
+    help = "Soma nos rollups diários as movimentações confirmadas desde a última execução."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--intervalo",
+            type=float,
+            default=300,
+            help="Segundos entre execuções (padrão: 300).",
+        )
+        parser.add_argument(
+            "--uma-vez",
+            action="store_true",
+            help="Processa as movimentações novas e termina.",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("[ROLLUPS] Atualizando rollups de uso...")
+
+        while True:
+            close_old_connections()
+            resumo = atualizar_rollups()
+
+            if resumo["movimentacoes"] or options["uma_vez"]:
+                self.stdout.write(
+                    f"[ROLLUPS] {resumo['movimentacoes']} movimentação(ões) somada(s); "
+                    f"marca em #{resumo['marca']}"
+                )
+
+            if options["uma_vez"]:
+                break
+
+            time.sleep(options["intervalo"])
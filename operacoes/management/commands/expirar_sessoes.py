@@ -0,0 +1,55 @@
+# operacoes/management/commands/expirar_sessoes.py
+"""
+Expira periodicamente as sessões abandonadas (operacoes/expiracao.py).
+
+    python manage.py expirar_sessoes
+    python manage.py expirar_sessoes --uma-vez   # uma varredura e sai
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from caixa import metricas as metricas_caixa
+from operacoes.expiracao import expirar_sessoes, metricas
+
+
+class Command(BaseCommand):
+    help = "Marca como expiradas as sessões em andamento há mais de SESSAO_TTL_S."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--intervalo",
+            type=float,
+            default=60,
+            help="Segundos entre varreduras (padrão: 60).",
+        )
+        parser.add_argument(
+            "--uma-vez",
+            action="store_true",
+            help="Faz uma varredura e termina.",
+        )
+
+    def handle(self, *args, **options):
+        metricas_caixa.servir()
+        self.stdout.write("[EXPIRACAO] Varrendo sessões abandonadas...")
+
+        while True:
+            close_old_connections()
+            resumo = expirar_sessoes()
+            metricas_caixa.descarregar(forcar=True)
+
+            if resumo["sessoes_expiradas"] or options["uma_vez"]:
+                self.stdout.write(
+                    f"[EXPIRACAO] {resumo['sessoes_expiradas']} sessão(ões) expirada(s), "
+                    f"{resumo['movimentacoes_canceladas']} movimentação(ões) cancelada(s), "
+                    f"{resumo['gavetas_fechadas']} gaveta(s) fechada(s), "
+                    f"{resumo['falhas_mqtt']} falha(s) MQTT em {resumo['duracao_ms']} ms "
+                    f"(total desde o início: {metricas['sessoes_expiradas']})"
+                )
+
+            if options["uma_vez"]:
+                break
+
+            time.sleep(options["intervalo"])
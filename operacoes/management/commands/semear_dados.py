@@ -0,0 +1,54 @@
+# operacoes/management/commands/semear_dados.py
+"""
+Semeia cadastros e histórico sintéticos (operacoes/semeadura.py).
+
+    python manage.py semear_dados
+    python manage.py semear_dados --anos 3 --sessoes-por-dia 1500 --ferramentas 300
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from operacoes.semeadura import semear
+from usuarios.models import Colaborador
+
+
+class Command(BaseCommand):
+    help = "Cria dados sintéticos (gavetas, ferramentas, colaboradores, anos de sessões)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--anos", type=float, default=1)
+        parser.add_argument("--sessoes-por-dia", type=int, default=50)
+        parser.add_argument("--gavetas", type=int, default=3)
+        parser.add_argument("--ferramentas", type=int, default=60)
+        parser.add_argument("--colaboradores", type=int, default=100)
+        parser.add_argument(
+            "--prefixo",
+            default="SEED",
+            help="Prefixo de matrículas/cartões/códigos criados (padrão: SEED).",
+        )
+        parser.add_argument("--reader-id", default="rasp-01")
+        parser.add_argument("--semente", type=int, help="Semente do gerador (reprodutível).")
+
+    def handle(self, *args, **options):
+        prefixo = options["prefixo"]
+        if Colaborador.objects.filter(matricula__startswith=prefixo).exists():
+            raise CommandError(
+                f"Já existem colaboradores com o prefixo {prefixo!r}; use outro --prefixo."
+            )
+
+        resumo = semear(
+            anos=options["anos"],
+            sessoes_por_dia=options["sessoes_por_dia"],
+            gavetas=options["gavetas"],
+            ferramentas=options["ferramentas"],
+            colaboradores=options["colaboradores"],
+            prefixo=prefixo,
+            reader_id=options["reader_id"],
+            semente=options["semente"],
+            progresso=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            "{ferramentas} ferramenta(s), {colaboradores} colaborador(es), "
+            "{sessoes} sessão(ões), {movimentacoes} movimentação(ões) criadas.".format(**resumo)
+        ))
+        self.stdout.write("Rode 'python manage.py atualizar_rollups' para os relatórios.")
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.15 on 2026-10-19 16:53
+
+from django.db import migrations, models
+
+
+def preencher_fluxo(apps, schema_editor):
+    """
+    Sessões antigas: calcula etapa e ponteiro de gaveta a partir das
+    movimentações pendentes que já existem no banco.
+    """
+    SessaoUso = apps.get_model("operacoes", "SessaoUso")
+    MovimentacaoFerramenta = apps.get_model("operacoes", "MovimentacaoFerramenta")
+
+    SessaoUso.objects.exclude(status="A").update(etapa="X")
+
+    pendentes = {}
+    for sessao_id, tipo, gaveta in (
+        MovimentacaoFerramenta.objects
+        .filter(sessao__status="A", confirmado_visao=False)
+        .values_list("sessao_id", "tipo", "gaveta_numero")
+    ):
+        info = pendentes.setdefault(sessao_id, {"tipo": tipo, "gavetas": set()})
+        info["gavetas"].add(gaveta)
+
+    for sessao_id, info in pendentes.items():
+        gavetas = sorted(info["gavetas"])
+        SessaoUso.objects.filter(id=sessao_id).update(
+            etapa="G",
+            operacao=info["tipo"],
+            gavetas_pendentes=gavetas,
+            gaveta_atual=gavetas[0],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operacoes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sessaouso',
+            name='etapa',
+            field=models.CharField(choices=[('S', 'Selecionando ferramentas'), ('G', 'Gaveta aberta'), ('V', 'Validando gaveta'), ('X', 'Encerrada')], default='S', max_length=1),
+        ),
+        migrations.AddField(
+            model_name='sessaouso',
+            name='gaveta_atual',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Gaveta aberta/aguardando confirmação no momento', null=True),
+        ),
+        migrations.AddField(
+            model_name='sessaouso',
+            name='gavetas_pendentes',
+            field=models.JSONField(blank=True, default=list, help_text='Números das gavetas ainda não confirmadas, em ordem'),
+        ),
+        migrations.AddField(
+            model_name='sessaouso',
+            name='operacao',
+            field=models.CharField(blank=True, choices=[('R', 'Retirada'), ('D', 'Devolução')], help_text='Operação em curso na sessão (retirada ou devolução)', max_length=1),
+        ),
+        migrations.RunPython(preencher_fluxo, migrations.RunPython.noop),
+    ]
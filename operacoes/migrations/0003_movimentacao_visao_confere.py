@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-19 17:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operacoes', '0002_sessaouso_fluxo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimentacaoferramenta',
+            name='visao_confere',
+            field=models.BooleanField(blank=True, help_text='Resultado da visão para esta ferramenta (vazio enquanto a visão não terminou ou se falhou)', null=True),
+        ),
+    ]
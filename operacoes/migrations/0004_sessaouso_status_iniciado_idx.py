@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-19 17:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operacoes', '0003_movimentacao_visao_confere'),
+        ('usuarios', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sessaouso',
+            index=models.Index(fields=['status', 'iniciado_em'], name='operacoes_s_status_fe5169_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.15 on 2026-10-19 17:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0001_initial'),
+        ('operacoes', '0004_sessaouso_status_iniciado_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimentacaoArquivada',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('ferramenta_id', models.BigIntegerField(db_index=True)),
+                ('ferramenta_nome', models.CharField(max_length=100)),
+                ('tipo', models.CharField(choices=[('R', 'Retirada'), ('D', 'Devolução')], max_length=1)),
+                ('gaveta_numero', models.PositiveSmallIntegerField()),
+                ('quantidade', models.PositiveIntegerField(default=1)),
+                ('imagem_path', models.CharField(blank=True, max_length=255)),
+                ('confirmado_visao', models.BooleanField(default=False)),
+                ('visao_confere', models.BooleanField(blank=True, null=True)),
+                ('criado_em', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Movimentação arquivada',
+                'verbose_name_plural': 'Movimentações arquivadas',
+                'ordering': ['criado_em', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SessaoArquivada',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('colaborador_id', models.BigIntegerField(db_index=True)),
+                ('colaborador_nome', models.CharField(max_length=150)),
+                ('colaborador_matricula', models.CharField(max_length=50)),
+                ('cartao_uid', models.CharField(blank=True, max_length=32)),
+                ('status', models.CharField(choices=[('A', 'Em andamento'), ('F', 'Finalizada'), ('C', 'Cancelada'), ('E', 'Expirada / Timeout')], max_length=1)),
+                ('iniciado_em', models.DateTimeField(db_index=True)),
+                ('finalizado_em', models.DateTimeField(blank=True, null=True)),
+                ('payload_inicial', models.JSONField(blank=True, null=True)),
+                ('arquivado_em', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Sessão arquivada',
+                'verbose_name_plural': 'Sessões arquivadas',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='movimentacaoferramenta',
+            index=models.Index(fields=['ferramenta', 'confirmado_visao', 'criado_em'], name='operacoes_m_ferrame_137505_idx'),
+        ),
+        migrations.AddField(
+            model_name='movimentacaoarquivada',
+            name='sessao',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimentacoes', to='operacoes.sessaoarquivada'),
+        ),
+    ]
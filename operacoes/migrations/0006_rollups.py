@@ -0,0 +1,69 @@
+# Generated by Django 5.1.15 on 2026-10-19 17:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0001_initial'),
+        ('operacoes', '0005_arquivo'),
+        ('usuarios', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarcaRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=50, unique=True)),
+                ('ultimo_id', models.BigIntegerField(default=0)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Marca de rollup',
+                'verbose_name_plural': 'Marcas de rollup',
+            },
+        ),
+        migrations.CreateModel(
+            name='RetiradaEmAberto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('retirado_em', models.DateTimeField()),
+                ('colaborador', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='usuarios.colaborador')),
+                ('ferramenta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='inventario.ferramenta')),
+            ],
+            options={
+                'verbose_name': 'Retirada em aberto',
+                'verbose_name_plural': 'Retiradas em aberto',
+                'unique_together': {('ferramenta', 'colaborador')},
+            },
+        ),
+        migrations.CreateModel(
+            name='UsoDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('gaveta_numero', models.PositiveSmallIntegerField()),
+                ('retiradas', models.PositiveIntegerField(default=0)),
+                ('devolucoes', models.PositiveIntegerField(default=0)),
+                ('devolucoes_pareadas', models.PositiveIntegerField(default=0)),
+                ('tempo_fora_total_s', models.PositiveBigIntegerField(default=0)),
+                ('tempo_fora_max_s', models.PositiveBigIntegerField(default=0)),
+                ('fora_ate_15min', models.PositiveIntegerField(default=0)),
+                ('fora_ate_1h', models.PositiveIntegerField(default=0)),
+                ('fora_ate_4h', models.PositiveIntegerField(default=0)),
+                ('fora_ate_1d', models.PositiveIntegerField(default=0)),
+                ('fora_mais_1d', models.PositiveIntegerField(default=0)),
+                ('colaborador', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usos_diarios', to='usuarios.colaborador')),
+                ('ferramenta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usos_diarios', to='inventario.ferramenta')),
+            ],
+            options={
+                'verbose_name': 'Uso diário',
+                'verbose_name_plural': 'Usos diários',
+                'indexes': [models.Index(fields=['dia'], name='operacoes_u_dia_003a4b_idx')],
+                'unique_together': {('dia', 'ferramenta', 'colaborador', 'gaveta_numero')},
+            },
+        ),
+    ]
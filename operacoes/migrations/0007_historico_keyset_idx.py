@@ -0,0 +1,23 @@
+# Generated by Django 5.1.15 on 2026-10-19 17:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0001_initial'),
+        ('operacoes', '0006_rollups'),
+        ('usuarios', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movimentacaoferramenta',
+            index=models.Index(fields=['criado_em', 'id'], name='operacoes_m_criado__62d849_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sessaouso',
+            index=models.Index(fields=['iniciado_em', 'id'], name='operacoes_s_iniciad_93a71b_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-19 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operacoes', '0007_historico_keyset_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sessaouso',
+            name='trace_id',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.15 on 2026-10-19 18:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def vincular_caixas(apps, schema_editor):
+    """
+    Sessões antigas: caixa do reader_id do payload (ou do leitor padrão,
+    se o toque não trouxe reader_id), quando essa caixa está cadastrada.
+    """
+    Caixa = apps.get_model("inventario", "Caixa")
+    SessaoUso = apps.get_model("operacoes", "SessaoUso")
+
+    caixas = dict(Caixa.objects.values_list("reader_id", "id"))
+    if not caixas:
+        return
+    padrao = getattr(settings, "READER_ID", "rasp-01")
+
+    por_caixa = {}
+    for sessao_id, payload in SessaoUso.objects.values_list("id", "payload_inicial").iterator():
+        reader_id = (payload or {}).get("reader_id") or padrao
+        if reader_id in caixas:
+            por_caixa.setdefault(caixas[reader_id], []).append(sessao_id)
+
+    for caixa_id, ids in por_caixa.items():
+        for i in range(0, len(ids), 1000):
+            SessaoUso.objects.filter(id__in=ids[i:i + 1000]).update(caixa_id=caixa_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0002_caixa'),
+        ('operacoes', '0008_sessao_trace_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sessaouso',
+            name='caixa',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='sessoes', to='inventario.caixa'),
+        ),
+        migrations.AddIndex(
+            model_name='sessaouso',
+            index=models.Index(fields=['caixa', 'status', 'iniciado_em'], name='operacoes_s_caixa_i_158611_idx'),
+        ),
+        migrations.RunPython(vincular_caixas, migrations.RunPython.noop),
+    ]
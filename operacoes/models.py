@@ -40,7 +40,64 @@ class SessaoUso(models.Model):
     # JSON/metadata que veio da Rock Pi na abertura (opcional)
     payload_inicial = models.JSONField(blank=True, null=True)
 
+    # Caixa do leitor onde o cartão foi passado; as gavetas e os comandos
+    # MQTT da sessão são os dessa caixa. Vazio só em sessões anteriores ao
+    # cadastro de caixas.
+    caixa = models.ForeignKey(
+        "inventario.Caixa",
+        on_delete=models.PROTECT,
+        blank=True,
+        null=True,
+        related_name="sessoes"
+    )
+
+    # Trace aberto no toque do cartão (caixa/rastreio.py)
+    trace_id = models.CharField(max_length=32, blank=True, default="")
+
+    # Estado do fluxo gaveta a gaveta (ver operacoes/fluxo.py)
+    ETAPA_CHOICES = [
+        ("S", "Selecionando ferramentas"),
+        ("G", "Gaveta aberta"),
+        ("V", "Validando gaveta"),
+        ("X", "Encerrada"),
+    ]
+
+    OPERACAO_CHOICES = [
+        ("R", "Retirada"),
+        ("D", "Devolução"),
+    ]
+
+    etapa = models.CharField(
+        max_length=1,
+        choices=ETAPA_CHOICES,
+        default="S"
+    )
+    operacao = models.CharField(
+        max_length=1,
+        choices=OPERACAO_CHOICES,
+        blank=True,
+        help_text="Operação em curso na sessão (retirada ou devolução)"
+    )
+    gaveta_atual = models.PositiveSmallIntegerField(
+        blank=True,
+        null=True,
+        help_text="Gaveta aberta/aguardando confirmação no momento"
+    )
+    gavetas_pendentes = models.JSONField(
+        default=list,
+        blank=True,
+        help_text="Números das gavetas ainda não confirmadas, em ordem"
+    )
+
     class Meta:
+        indexes = [
+            # sessão ativa mais recente / varredura de expiração
+            models.Index(fields=["status", "iniciado_em"]),
+            # sessão ativa mais recente de uma caixa
+            models.Index(fields=["caixa", "status", "iniciado_em"]),
+            # paginação por chave de /api/sessoes/
+            models.Index(fields=["iniciado_em", "id"]),
+        ]
         verbose_name = "Sessão de Uso"
         verbose_name_plural = "Sessões de Uso"
 
@@ -92,12 +149,210 @@ class MovimentacaoFerramenta(models.Model):
         default=False,
         help_text="Se True, a visão computacional confirmou a movimentação"
     )
+    visao_confere = models.BooleanField(
+        blank=True,
+        null=True,
+        help_text="Resultado da visão para esta ferramenta (vazio enquanto a visão não terminou ou se falhou)"
+    )
 
     criado_em = models.DateTimeField(auto_now_add=True)
 
     class Meta:
+        indexes = [
+            # "último movimento confirmado da ferramenta" (posse)
+            models.Index(fields=["ferramenta", "confirmado_visao", "criado_em"]),
+            # paginação por chave de /api/movimentacoes/
+            models.Index(fields=["criado_em", "id"]),
+        ]
         verbose_name = "Movimentação de Ferramenta"
         verbose_name_plural = "Movimentações de Ferramenta"
 
     def __str__(self):
         return f"{self.get_tipo_display()} - {self.ferramenta.nome} (sessão {self.sessao_id})"
+
+
+class SessaoArquivada(models.Model):
+    """
+    Sessão encerrada movida para o arquivo (operacoes/arquivo.py).
+    Guarda o mesmo id da SessaoUso original e os dados do colaborador
+    copiados, para não depender das tabelas quentes.
+    """
+    id = models.BigIntegerField(primary_key=True)
+
+    colaborador_id = models.BigIntegerField(db_index=True)
+    colaborador_nome = models.CharField(max_length=150)
+    colaborador_matricula = models.CharField(max_length=50)
+    cartao_uid = models.CharField(max_length=32, blank=True)
+
+    status = models.CharField(max_length=1, choices=SessaoUso.STATUS_CHOICES)
+    iniciado_em = models.DateTimeField(db_index=True)
+    finalizado_em = models.DateTimeField(blank=True, null=True)
+    payload_inicial = models.JSONField(blank=True, null=True)
+
+    arquivado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Sessão arquivada"
+        verbose_name_plural = "Sessões arquivadas"
+
+    def __str__(self):
+        return f"Sessão #{self.id} - {self.colaborador_nome} - {self.get_status_display()} (arquivo)"
+
+    def como_dict(self, movimentacoes=True):
+        dados = {
+            "id": self.id,
+            "colaborador": {
+                "id": self.colaborador_id,
+                "nome": self.colaborador_nome,
+                "matricula": self.colaborador_matricula,
+            },
+            "cartao_uid": self.cartao_uid,
+            "status": self.status,
+            "iniciado_em": self.iniciado_em.isoformat(),
+            "finalizado_em": self.finalizado_em.isoformat() if self.finalizado_em else None,
+            "arquivado_em": self.arquivado_em.isoformat() if self.arquivado_em else None,
+        }
+        if movimentacoes:
+            dados["movimentacoes"] = [m.como_dict() for m in self.movimentacoes.all()]
+        return dados
+
+
+class MovimentacaoArquivada(models.Model):
+    """
+    Movimentação de uma SessaoArquivada (mesmo id da original).
+    """
+    id = models.BigIntegerField(primary_key=True)
+
+    sessao = models.ForeignKey(
+        SessaoArquivada,
+        on_delete=models.CASCADE,
+        related_name="movimentacoes"
+    )
+    ferramenta_id = models.BigIntegerField(db_index=True)
+    ferramenta_nome = models.CharField(max_length=100)
+
+    tipo = models.CharField(max_length=1, choices=MovimentacaoFerramenta.TIPO_CHOICES)
+    gaveta_numero = models.PositiveSmallIntegerField()
+    quantidade = models.PositiveIntegerField(default=1)
+    imagem_path = models.CharField(max_length=255, blank=True)
+    confirmado_visao = models.BooleanField(default=False)
+    visao_confere = models.BooleanField(blank=True, null=True)
+    criado_em = models.DateTimeField()
+
+    class Meta:
+        ordering = ["criado_em", "id"]
+        verbose_name = "Movimentação arquivada"
+        verbose_name_plural = "Movimentações arquivadas"
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} - {self.ferramenta_nome} (sessão {self.sessao_id}, arquivo)"
+
+    def como_dict(self):
+        return {
+            "id": self.id,
+            "ferramenta_id": self.ferramenta_id,
+            "ferramenta_nome": self.ferramenta_nome,
+            "tipo": self.tipo,
+            "gaveta_numero": self.gaveta_numero,
+            "quantidade": self.quantidade,
+            "imagem_path": self.imagem_path,
+            "confirmado_visao": self.confirmado_visao,
+            "visao_confere": self.visao_confere,
+            "criado_em": self.criado_em.isoformat(),
+        }
+
+
+class UsoDiario(models.Model):
+    """
+    Rollup diário das movimentações confirmadas, por ferramenta,
+    colaborador e gaveta (operacoes/rollups.py). Os relatórios somam estas
+    linhas em vez de varrer MovimentacaoFerramenta.
+
+    O tempo fora da caixa é contado no dia da devolução.
+    """
+    # (campo, limite superior em segundos) da distribuição do tempo fora
+    FAIXAS_TEMPO_FORA = [
+        ("fora_ate_15min", 15 * 60),
+        ("fora_ate_1h", 60 * 60),
+        ("fora_ate_4h", 4 * 60 * 60),
+        ("fora_ate_1d", 24 * 60 * 60),
+        ("fora_mais_1d", None),
+    ]
+
+    dia = models.DateField()
+    ferramenta = models.ForeignKey(
+        "inventario.Ferramenta",
+        on_delete=models.CASCADE,
+        related_name="usos_diarios"
+    )
+    colaborador = models.ForeignKey(
+        "usuarios.Colaborador",
+        on_delete=models.CASCADE,
+        related_name="usos_diarios"
+    )
+    gaveta_numero = models.PositiveSmallIntegerField()
+
+    retiradas = models.PositiveIntegerField(default=0)
+    devolucoes = models.PositiveIntegerField(default=0)
+
+    # devoluções que fecharam uma retirada conhecida, e o tempo somado delas
+    devolucoes_pareadas = models.PositiveIntegerField(default=0)
+    tempo_fora_total_s = models.PositiveBigIntegerField(default=0)
+    tempo_fora_max_s = models.PositiveBigIntegerField(default=0)
+
+    fora_ate_15min = models.PositiveIntegerField(default=0)
+    fora_ate_1h = models.PositiveIntegerField(default=0)
+    fora_ate_4h = models.PositiveIntegerField(default=0)
+    fora_ate_1d = models.PositiveIntegerField(default=0)
+    fora_mais_1d = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("dia", "ferramenta", "colaborador", "gaveta_numero")
+        indexes = [
+            models.Index(fields=["dia"]),
+        ]
+        verbose_name = "Uso diário"
+        verbose_name_plural = "Usos diários"
+
+    def __str__(self):
+        return f"{self.dia} - ferramenta {self.ferramenta_id} / colaborador {self.colaborador_id}"
+
+
+class RetiradaEmAberto(models.Model):
+    """
+    Última retirada ainda não devolvida de cada (ferramenta, colaborador),
+    para o rollup parear a devolução sem reler o histórico.
+    """
+    ferramenta = models.ForeignKey(
+        "inventario.Ferramenta",
+        on_delete=models.CASCADE,
+        related_name="+"
+    )
+    colaborador = models.ForeignKey(
+        "usuarios.Colaborador",
+        on_delete=models.CASCADE,
+        related_name="+"
+    )
+    retirado_em = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("ferramenta", "colaborador")
+        verbose_name = "Retirada em aberto"
+        verbose_name_plural = "Retiradas em aberto"
+
+
+class MarcaRollup(models.Model):
+    """
+    Até qual MovimentacaoFerramenta.id o rollup já processou.
+    """
+    nome = models.CharField(max_length=50, unique=True)
+    ultimo_id = models.BigIntegerField(default=0)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Marca de rollup"
+        verbose_name_plural = "Marcas de rollup"
+
+    def __str__(self):
+        return f"{self.nome}: até #{self.ultimo_id}"
+
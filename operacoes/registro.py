@@ -0,0 +1,226 @@
+# operacoes/registro.py
+"""
+Registro em cache das sessões em andamento.
+
+As telas mais acessadas (status_frontend, painel_sem_sessao, painel,
+retirar_confirmar) só precisam saber "qual é a sessão ativa" e "qual a
+gaveta atual e o que sai dela". Este módulo guarda um retrato (dict) de
+cada sessão e um ponteiro para a sessão ativa de cada leitor, então essas
+telas respondem sem ir ao banco no caso comum.
+
+Quem mantém o registro é o fluxo.py: toda mudança de etapa regrava o
+retrato da sessão depois do commit. O banco só é consultado quando a
+chave não está no cache (processo reiniciado, TTL vencido...).
+
+Chaves (cache settings.SESSOES_CACHE):
+    sessao:<id>             retrato da sessão
+    ativa:<reader_id>       id da sessão ativa do leitor (0 = nenhuma)
+    ativa:*                 id da sessão ativa mais recente de qualquer leitor
+
+Com várias caixas, cada quiosque pergunta pelo próprio leitor
+(?reader_id=); "*" só serve a instalações com uma caixa.
+
+O cache "sessoes" é compartilhado entre os processos (FileBasedCache por
+padrão, SESSOES_CACHE_BACKEND para redis/memcached): o ponteiro gravado
+pelo processo que fez o commit é o mesmo que os outros leem. Um LocMem
+(um por processo) deixaria os outros com o ponteiro velho até o TTL, por
+isso só é aceito com DEBUG (operacoes/checks.py).
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+
+from .models import SessaoUso, MovimentacaoFerramenta
+
+logger = logging.getLogger(__name__)
+
+QUALQUER_LEITOR = "*"
+
+_AUSENTE = object()
+
+
+def _cache():
+    return caches[getattr(settings, "SESSOES_CACHE", "sessoes")]
+
+
+def _ttl_sessao():
+    # mesmo limite que o status_frontend sempre usou para "sessão velha"
+    return getattr(settings, "SESSAO_TTL_S", 30 * 60)
+
+
+def _ttl_nenhuma():
+    return getattr(settings, "SESSOES_CACHE_TTL_NENHUMA_S", 60)
+
+
+def reader_da_sessao(sessao):
+    """
+    Leitor onde o cartão foi passado (payload da Rock Pi), que é o da caixa
+    da sessão; sem reader_id no payload, o leitor padrão.
+    """
+    payload = sessao.payload_inicial or {}
+    return payload.get("reader_id") or getattr(settings, "READER_ID", "rasp-01")
+
+
+def _expira_em(retrato):
+    return retrato["iniciado_em"] + timedelta(seconds=_ttl_sessao())
+
+
+def _em_andamento(retrato):
+    # quem tira do ar as sessões vencidas é o expirar_sessoes
+    # (operacoes/expiracao.py); aqui basta o status
+    return retrato is not None and retrato["status"] == "A"
+
+
+def _timeout(retrato):
+    """
+    Retrato de sessão em andamento vive até a sessão "vencer" (quando o
+    expirar_sessoes a encerra); de sessão encerrada, o bastante para as
+    telas finais ainda o encontrarem.
+    """
+    restante = (_expira_em(retrato) - timezone.now()).total_seconds()
+    return max(int(restante), _ttl_nenhuma())
+
+
+def _itens_pendentes(sessao):
+    """
+    {gaveta: [nomes]} da operação em curso, direto do banco (cache frio).
+    """
+    itens = {}
+    if not sessao.operacao:
+        return itens
+
+    movs = (
+        MovimentacaoFerramenta.objects
+        .filter(sessao=sessao, tipo=sessao.operacao, confirmado_visao=False)
+        .select_related("ferramenta")
+        .order_by("gaveta_numero", "id")
+    )
+    for m in movs:
+        itens.setdefault(m.gaveta_numero, []).append(m.ferramenta.nome)
+    return itens
+
+
+def retrato(sessao, itens=None):
+    """
+    Dicionário com o que as telas precisam da sessão. `itens` é
+    {gaveta: [nomes das ferramentas pendentes]}.
+    """
+    return {
+        "id": sessao.id,
+        "status": sessao.status,
+        "etapa": sessao.etapa,
+        "operacao": sessao.operacao,
+        "gaveta_atual": sessao.gaveta_atual,
+        "gavetas_pendentes": list(sessao.gavetas_pendentes or []),
+        "colaborador": sessao.colaborador.nome,
+        "reader_id": reader_da_sessao(sessao),
+        "caixa_id": sessao.caixa_id,
+        "iniciado_em": sessao.iniciado_em,
+        "trace_id": sessao.trace_id,
+        "itens": itens if itens is not None else {},
+    }
+
+
+def _gravar(r):
+    cache = _cache()
+    timeout = _timeout(r)
+    cache.set(f"sessao:{r['id']}", r, timeout)
+
+    for leitor in (r["reader_id"], QUALQUER_LEITOR):
+        chave = f"ativa:{leitor}"
+        atual = cache.get(chave)
+        if r["status"] == "A":
+            # uma sessão mais antiga ainda aberta não toma o lugar da mais nova
+            if not atual or atual <= r["id"]:
+                cache.set(chave, r["id"], timeout)
+        elif atual == r["id"]:
+            # era a sessão ativa deste leitor e acabou de sair de "A"
+            cache.set(chave, 0, _ttl_nenhuma())
+
+
+def atualizar(sessao, itens=_AUSENTE):
+    """
+    Regrava o retrato da sessão depois do commit da transação atual.
+    Sem `itens`, mantém os do retrato anterior (tirando as gavetas que já
+    saíram da lista de pendentes). Retorna o novo retrato.
+    """
+    if itens is _AUSENTE:
+        anterior = _cache().get(f"sessao:{sessao.id}")
+        if anterior is not None and anterior["operacao"] == sessao.operacao:
+            pendentes = set(sessao.gavetas_pendentes or [])
+            itens = {g: nomes for g, nomes in anterior["itens"].items() if g in pendentes}
+        else:
+            itens = _itens_pendentes(sessao)
+
+    r = retrato(sessao, itens)
+    transaction.on_commit(lambda: _gravar(r))
+    return r
+
+
+def sessao(sessao_id):
+    """
+    Retrato da sessão (de qualquer status) ou None se ela não existir.
+    """
+    cache = _cache()
+    r = cache.get(f"sessao:{sessao_id}")
+    if r is not None:
+        return r
+
+    try:
+        obj = SessaoUso.objects.select_related("colaborador").get(id=sessao_id)
+    except SessaoUso.DoesNotExist:
+        return None
+
+    r = retrato(obj, _itens_pendentes(obj))
+    cache.set(f"sessao:{sessao_id}", r, _timeout(r))
+    return r
+
+
+def sessao_ativa(reader_id=None):
+    """
+    Retrato da sessão em andamento mais recente do leitor (ou de qualquer
+    leitor), ou None.
+    """
+    leitor = reader_id or QUALQUER_LEITOR
+    cache = _cache()
+
+    sessao_id = cache.get(f"ativa:{leitor}")
+    if sessao_id == 0:
+        return None
+    if sessao_id is not None:
+        r = sessao(sessao_id)
+        if _em_andamento(r):
+            return r
+
+    # cache frio ou sessão encerrada: procura no banco
+    qs = (
+        SessaoUso.objects
+        .filter(status="A")
+        .select_related("colaborador")
+        .order_by("-iniciado_em")
+    )
+    if reader_id:
+        # índice (caixa, status, iniciado_em): não cresce com o número de caixas
+        qs = qs.filter(caixa__reader_id=reader_id)
+    obj = qs.first()
+
+    if obj is None:
+        cache.set(f"ativa:{leitor}", 0, _ttl_nenhuma())
+        return None
+
+    r = retrato(obj, _itens_pendentes(obj))
+    cache.set(f"sessao:{obj.id}", r, _timeout(r))
+    cache.set(f"ativa:{leitor}", obj.id, _timeout(r))
+    return r
+
+
+def limpar():
+    """
+    Esvazia o registro (testes, ou depois de mexer nas sessões direto no banco).
+    """
+    _cache().clear()
@@ -0,0 +1,229 @@
+# operacoes/rollups.py
+"""
+Rollups diários de uso (UsoDiario), mantidos de forma incremental.
+
+Cada execução só lê as movimentações confirmadas com id acima da marca
+(MarcaRollup) e soma nelas as retiradas, devoluções e o tempo fora da
+caixa por (dia, ferramenta, colaborador, gaveta). A marca nunca passa de
+uma movimentação ainda não confirmada de sessão em andamento: ela pode
+ser confirmada depois, e seria perdida se o rollup já tivesse andado por
+cima dela. A não confirmada de sessão encerrada (cancelada, expirada)
+não vai mais mudar: fica de fora da soma e a marca passa por ela.
+
+O tempo fora é medido da retirada até a devolução do mesmo par
+(ferramenta, colaborador); a retirada ainda não devolvida fica em
+RetiradaEmAberto entre uma execução e outra.
+
+    python manage.py atualizar_rollups [--uma-vez]
+
+Os relatórios (/api/relatorios/..., api/views.py) leem só UsoDiario.
+"""
+
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Sum, Max
+from django.utils import timezone
+
+from .models import MarcaRollup, MovimentacaoFerramenta, RetiradaEmAberto, UsoDiario
+
+logger = logging.getLogger(__name__)
+
+MARCA = "uso_diario"
+LOTE = 1000
+
+CONTADORES = [
+    "retiradas",
+    "devolucoes",
+    "devolucoes_pareadas",
+    "tempo_fora_total_s",
+] + [campo for campo, _ in UsoDiario.FAIXAS_TEMPO_FORA]
+
+
+def marca_atual():
+    """
+    Último MovimentacaoFerramenta.id já somado nos rollups (0 se nenhum).
+    """
+    return (
+        MarcaRollup.objects
+        .filter(nome=MARCA)
+        .values_list("ultimo_id", flat=True)
+        .first()
+    ) or 0
+
+
+def _faixa(segundos):
+    for campo, limite in UsoDiario.FAIXAS_TEMPO_FORA:
+        if limite is None or segundos <= limite:
+            return campo
+
+
+def _proximo_lote(ultimo_id, lote):
+    """
+    Até `lote` movimentações depois da marca, parando antes da primeira
+    não confirmada de sessão em andamento. Inclui as não confirmadas de
+    sessões encerradas, para a marca passar por elas; quem soma as ignora.
+    """
+    pendente = (
+        MovimentacaoFerramenta.objects
+        .filter(id__gt=ultimo_id, confirmado_visao=False, sessao__status="A")
+        .order_by("id")
+        .values_list("id", flat=True)
+        .first()
+    )
+    qs = MovimentacaoFerramenta.objects.filter(id__gt=ultimo_id)
+    if pendente is not None:
+        qs = qs.filter(id__lt=pendente)
+    return list(
+        qs.order_by("id").values(
+            "id", "tipo", "ferramenta_id", "gaveta_numero", "criado_em",
+            "sessao__colaborador_id", "confirmado_visao",
+        )[:lote]
+    )
+
+
+def _somar(movs):
+    """
+    Soma o lote em memória. Retorna (somas por chave, retiradas em aberto
+    atualizadas, pares tocados).
+    """
+    pares = {(m["ferramenta_id"], m["sessao__colaborador_id"]) for m in movs}
+    abertas = {
+        (r.ferramenta_id, r.colaborador_id): r.retirado_em
+        for r in RetiradaEmAberto.objects.filter(
+            ferramenta_id__in={f for f, _ in pares},
+            colaborador_id__in={c for _, c in pares},
+        )
+    }
+
+    somas = defaultdict(lambda: dict.fromkeys(CONTADORES + ["tempo_fora_max_s"], 0))
+    for m in movs:
+        par = (m["ferramenta_id"], m["sessao__colaborador_id"])
+        chave = (timezone.localdate(m["criado_em"]),) + par + (m["gaveta_numero"],)
+        s = somas[chave]
+
+        if m["tipo"] == "R":
+            s["retiradas"] += 1
+            abertas[par] = m["criado_em"]
+            continue
+
+        s["devolucoes"] += 1
+        retirado_em = abertas.pop(par, None)
+        if retirado_em is None:
+            # retirada anterior ao primeiro rollup (ou já arquivada sem par)
+            continue
+        segundos = max(int((m["criado_em"] - retirado_em).total_seconds()), 0)
+        s["devolucoes_pareadas"] += 1
+        s["tempo_fora_total_s"] += segundos
+        s["tempo_fora_max_s"] = max(s["tempo_fora_max_s"], segundos)
+        s[_faixa(segundos)] += 1
+
+    return somas, abertas, pares
+
+
+def _gravar(somas, abertas, pares):
+    existentes = {
+        (u.dia, u.ferramenta_id, u.colaborador_id, u.gaveta_numero): u
+        for u in UsoDiario.objects.filter(
+            dia__in={k[0] for k in somas},
+            ferramenta_id__in={k[1] for k in somas},
+            colaborador_id__in={k[2] for k in somas},
+        )
+    }
+
+    novos, alterados = [], []
+    for (dia, ferramenta_id, colaborador_id, gaveta), s in somas.items():
+        uso = existentes.get((dia, ferramenta_id, colaborador_id, gaveta))
+        if uso is None:
+            novos.append(UsoDiario(
+                dia=dia,
+                ferramenta_id=ferramenta_id,
+                colaborador_id=colaborador_id,
+                gaveta_numero=gaveta,
+                **s,
+            ))
+            continue
+        for campo in CONTADORES:
+            setattr(uso, campo, getattr(uso, campo) + s[campo])
+        uso.tempo_fora_max_s = max(uso.tempo_fora_max_s, s["tempo_fora_max_s"])
+        alterados.append(uso)
+
+    UsoDiario.objects.bulk_create(novos)
+    UsoDiario.objects.bulk_update(alterados, CONTADORES + ["tempo_fora_max_s"])
+
+    # mesmo recorte usado na leitura de _somar: apaga e regrava o estado atual
+    RetiradaEmAberto.objects.filter(
+        ferramenta_id__in={f for f, _ in pares},
+        colaborador_id__in={c for _, c in pares},
+    ).delete()
+    RetiradaEmAberto.objects.bulk_create([
+        RetiradaEmAberto(ferramenta_id=f, colaborador_id=c, retirado_em=quando)
+        for (f, c), quando in abertas.items()
+    ])
+
+
+def atualizar_rollups(lote=LOTE):
+    """
+    Soma nos rollups as movimentações confirmadas novas, em transações de
+    até `lote` movimentações. Retorna {"movimentacoes", "marca"}.
+    """
+    MarcaRollup.objects.get_or_create(nome=MARCA)
+    resumo = {"movimentacoes": 0, "marca": 0}
+
+    while True:
+        with transaction.atomic():
+            # trava a marca: duas execuções simultâneas não somam o mesmo lote
+            marca = MarcaRollup.objects.select_for_update().get(nome=MARCA)
+            lidas = _proximo_lote(marca.ultimo_id, lote)
+            movs = [m for m in lidas if m["confirmado_visao"]]
+            if movs:
+                _gravar(*_somar(movs))
+            if lidas:
+                marca.ultimo_id = lidas[-1]["id"]
+                marca.save(update_fields=["ultimo_id", "atualizado_em"])
+
+        resumo["movimentacoes"] += len(movs)
+        resumo["marca"] = marca.ultimo_id
+        if len(lidas) < lote:
+            break
+
+    if resumo["movimentacoes"]:
+        logger.info(
+            "Rollups: %(movimentacoes)s movimentação(ões) somada(s), marca em #%(marca)s.",
+            resumo,
+        )
+    return resumo
+
+
+def resumir(qs, *agrupar):
+    """
+    Agrega linhas de UsoDiario por `agrupar` (campos de values()),
+    acrescentando tempo médio fora e a distribuição por faixa.
+    """
+    linhas = (
+        qs.values(*agrupar)
+        .annotate(
+            tempo_fora_max_s_=Max("tempo_fora_max_s"),
+            **{f"{c}_": Sum(c) for c in CONTADORES},
+        )
+        .order_by(*agrupar)
+    )
+
+    resultado = []
+    for linha in linhas:
+        item = {campo: linha[campo] for campo in agrupar}
+        total = {c: linha[f"{c}_"] or 0 for c in CONTADORES}
+        pareadas = total["devolucoes_pareadas"]
+        item.update({
+            "retiradas": total["retiradas"],
+            "devolucoes": total["devolucoes"],
+            "tempo_fora": {
+                "devolucoes_medidas": pareadas,
+                "medio_s": round(total["tempo_fora_total_s"] / pareadas, 1) if pareadas else None,
+                "max_s": linha["tempo_fora_max_s_"] if pareadas else None,
+                "distribuicao": {c: total[c] for c, _ in UsoDiario.FAIXAS_TEMPO_FORA},
+            },
+        })
+        resultado.append(item)
+    return resultado
@@ -0,0 +1,249 @@
+# operacoes/semeadura.py
+"""
+Dados sintéticos em volume para testes de carga (api/benchmark.py) e para
+ver as consultas com tabelas grandes:
+
+    python manage.py semear_dados --anos 3 --sessoes-por-dia 1500
+
+Cria a caixa do leitor (--reader-id) e as gavetas dela (reaproveita as
+que já existem com o mesmo número),
+ferramentas, colaboradores com cartão e o histórico: sessões de retirada
+e, depois de algumas horas/dias, a devolução das mesmas ferramentas pelo
+mesmo colaborador; uma parte das sessões expira ou é cancelada sem
+movimentação. Tudo em bulk_create com ids atribuídos aqui (o MySQL não
+devolve os ids de um bulk_create) e datas no passado.
+
+Cadastros e sessões levam o prefixo (--prefixo), para não colidir com os
+dados reais. Depois de semear, rode "python manage.py atualizar_rollups".
+"""
+
+import heapq
+import itertools
+import logging
+import random
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from inventario import catalogo
+from inventario.models import Caixa, Ferramenta, Gaveta
+from usuarios import autorizacao
+from usuarios.models import CartaoNFC, Colaborador
+
+from .models import MovimentacaoFerramenta, SessaoUso
+
+logger = logging.getLogger(__name__)
+
+LOTE = 5000
+
+NOMES = ["Ana", "Bruno", "Carla", "Diego", "Elisa", "Fábio", "Gabriela", "Heitor", "Isabel", "João"]
+SOBRENOMES = ["Silva", "Souza", "Oliveira", "Santos", "Lima", "Pereira", "Costa", "Almeida"]
+TIPOS_FERRAMENTA = [
+    "Chave de fenda", "Chave Phillips", "Alicate universal", "Alicate de corte",
+    "Martelo", "Trena", "Chave inglesa", "Multímetro", "Estilete", "Nível",
+]
+
+
+@contextmanager
+def _datas_explicitas(*campos):
+    """
+    Desliga o auto_now_add dos campos para gravar as datas do histórico.
+    """
+    for campo in campos:
+        campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        for campo in campos:
+            campo.auto_now_add = True
+
+
+def _cadastros(caixa, prefixo, n_gavetas, n_ferramentas, n_colaboradores, rnd):
+    existentes = set(caixa.gavetas.values_list("numero", flat=True))
+    Gaveta.objects.bulk_create([
+        Gaveta(caixa=caixa, numero=n, nome=f"Gaveta {n}")
+        for n in range(1, n_gavetas + 1) if n not in existentes
+    ])
+    gavetas = list(caixa.gavetas.filter(numero__lte=n_gavetas).order_by("numero"))
+
+    Ferramenta.objects.bulk_create([
+        Ferramenta(
+            nome=f"{rnd.choice(TIPOS_FERRAMENTA)} {prefixo}-{i:05d}",
+            codigo=f"{prefixo}-{i:05d}",
+            gaveta=gavetas[i % len(gavetas)],
+            posicao=i // len(gavetas),
+        )
+        for i in range(n_ferramentas)
+    ], batch_size=LOTE)
+
+    Colaborador.objects.bulk_create([
+        Colaborador(
+            nome=f"{rnd.choice(NOMES)} {rnd.choice(SOBRENOMES)} {i}",
+            matricula=f"{prefixo}{i:06d}",
+        )
+        for i in range(n_colaboradores)
+    ], batch_size=LOTE)
+    colaboradores = list(
+        Colaborador.objects.filter(matricula__startswith=prefixo).values_list("id", "matricula")
+    )
+    CartaoNFC.objects.bulk_create(
+        [CartaoNFC(uid=matricula, colaborador_id=cid) for cid, matricula in colaboradores],
+        batch_size=LOTE,
+    )
+
+    ferramentas = list(
+        Ferramenta.objects.filter(codigo__startswith=f"{prefixo}-")
+        .values_list("id", "gaveta__numero")
+    )
+    cartoes = dict(
+        CartaoNFC.objects.filter(colaborador_id__in=[c for c, _ in colaboradores])
+        .values_list("colaborador_id", "id")
+    )
+    return ferramentas, cartoes
+
+
+class _Historico:
+    """
+    Acumula sessões/movimentações com ids próprios e grava em lote.
+    """
+
+    def __init__(self, caixa):
+        self.caixa = caixa
+        self.proxima_sessao = (SessaoUso.objects.aggregate(m=Max("id"))["m"] or 0) + 1
+        self.proxima_mov = (MovimentacaoFerramenta.objects.aggregate(m=Max("id"))["m"] or 0) + 1
+        self.sessoes, self.movs = [], []
+        self.total_sessoes = self.total_movs = 0
+        self.livre_em = None
+
+    def sessao(self, colaborador_id, cartao_id, inicio, status, operacao, itens):
+        """
+        Registra a sessão no primeiro momento livre a partir de `inicio` (um
+        quiosque atende uma sessão por vez, e assim os ids seguem o tempo).
+        """
+        if self.livre_em and inicio < self.livre_em:
+            inicio = self.livre_em
+        sid = self.proxima_sessao
+        self.proxima_sessao += 1
+        fim = inicio + timedelta(seconds=10 + 15 * len(itens))
+        self.livre_em = fim + timedelta(seconds=1)
+        self.sessoes.append(SessaoUso(
+            id=sid,
+            colaborador_id=colaborador_id,
+            cartao_id=cartao_id,
+            iniciado_em=inicio,
+            finalizado_em=fim,
+            status=status,
+            etapa="X",
+            operacao=operacao,
+            caixa_id=self.caixa.id,
+            payload_inicial={"reader_id": self.caixa.reader_id, "semeado": True},
+        ))
+        for i, (fid, gaveta) in enumerate(itens):
+            self.movs.append(MovimentacaoFerramenta(
+                id=self.proxima_mov,
+                sessao_id=sid,
+                ferramenta_id=fid,
+                tipo=operacao,
+                gaveta_numero=gaveta,
+                quantidade=1,
+                imagem_path=f"sessoes/{sid}/sessao{sid}_gaveta{gaveta}.jpg",
+                confirmado_visao=True,
+                visao_confere=True,
+                criado_em=inicio + timedelta(seconds=8 + 15 * i),
+            ))
+            self.proxima_mov += 1
+        if len(self.sessoes) + len(self.movs) >= LOTE:
+            self.gravar()
+
+    def gravar(self):
+        if not self.sessoes:
+            return
+        with transaction.atomic():
+            SessaoUso.objects.bulk_create(self.sessoes, batch_size=LOTE)
+            MovimentacaoFerramenta.objects.bulk_create(self.movs, batch_size=LOTE)
+        self.total_sessoes += len(self.sessoes)
+        self.total_movs += len(self.movs)
+        self.sessoes, self.movs = [], []
+
+
+def semear(
+    anos=1,
+    sessoes_por_dia=50,
+    gavetas=3,
+    ferramentas=60,
+    colaboradores=100,
+    prefixo="SEED",
+    reader_id="rasp-01",
+    semente=None,
+    progresso=None,
+):
+    """
+    Cria os cadastros e `anos` de histórico terminando ontem. Retorna
+    {"ferramentas", "colaboradores", "sessoes", "movimentacoes"}.
+    """
+    rnd = random.Random(semente)
+    caixa, _ = Caixa.objects.get_or_create(reader_id=reader_id)
+    ferramentas_, cartoes = _cadastros(caixa, prefixo, gavetas, ferramentas, colaboradores, rnd)
+    colaboradores_ = list(cartoes)
+
+    devolucoes = []     # heap (quando, seq, colaborador_id, [ferramentas])
+    seq = itertools.count()
+    livres = set(f for f, _ in ferramentas_)
+    gaveta_de = dict(ferramentas_)
+    historico = _Historico(caixa)
+
+    hoje = timezone.localdate()
+    inicio = hoje - timedelta(days=int(anos * 365))
+    tz = timezone.get_current_timezone()
+
+    campos = (SessaoUso._meta.get_field("iniciado_em"), MovimentacaoFerramenta._meta.get_field("criado_em"))
+    with _datas_explicitas(*campos):
+        dia = inicio
+        while dia < hoje:
+            base = timezone.make_aware(datetime.combine(dia, time(7)), tz)
+            # expediente de 07h às 18h, com variação de movimento entre os dias
+            n = max(1, int(rnd.gauss(sessoes_por_dia, sessoes_por_dia * 0.2)))
+            horarios = sorted(base + timedelta(seconds=rnd.uniform(0, 11 * 3600)) for _ in range(n))
+
+            for quando in horarios:
+                # devoluções que já venceram
+                while devolucoes and devolucoes[0][0] <= quando:
+                    devolver_em, _, cid, itens = heapq.heappop(devolucoes)
+                    historico.sessao(cid, cartoes[cid], devolver_em, "F", "D", [(f, gaveta_de[f]) for f in itens])
+                    livres.update(itens)
+
+                cid = rnd.choice(colaboradores_)
+                if rnd.random() < 0.05 or not livres:
+                    historico.sessao(cid, cartoes[cid], quando, rnd.choice("EC"), "", [])
+                    continue
+
+                itens = rnd.sample(sorted(livres), min(len(livres), rnd.choice((1, 1, 1, 2, 2, 3))))
+                historico.sessao(cid, cartoes[cid], quando, "F", "R", [(f, gaveta_de[f]) for f in itens])
+                livres.difference_update(itens)
+                # a maioria volta no mesmo dia; algumas ficam dias fora
+                fora = timedelta(hours=rnd.choice((1, 2, 4, 8, 30, 72)) * rnd.uniform(0.5, 1.5))
+                heapq.heappush(devolucoes, (quando + fora, next(seq), cid, itens))
+
+            dia += timedelta(days=1)
+            if progresso and dia.day == 1:
+                progresso(f"{dia:%Y-%m}: {historico.total_sessoes} sessões gravadas")
+
+        # o que ainda estaria fora "hoje" fica com o colaborador
+        agora = timezone.now()
+        while devolucoes and devolucoes[0][0] < agora:
+            devolver_em, _, cid, itens = heapq.heappop(devolucoes)
+            historico.sessao(cid, cartoes[cid], devolver_em, "F", "D", [(f, gaveta_de[f]) for f in itens])
+        historico.gravar()
+
+    # bulk_create não dispara os signals que invalidam os caches
+    catalogo.invalidar()
+    autorizacao.invalidar()
+    return {
+        "ferramentas": len(ferramentas_),
+        "colaboradores": len(colaboradores_),
+        "sessoes": historico.total_sessoes,
+        "movimentacoes": historico.total_movs,
+    }
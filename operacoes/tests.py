@@ -1,3 +1,489 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from inventario import caixas
+from inventario.models import Caixa, Gaveta, Ferramenta
+from django.contrib.auth.models import User
+from usuarios.models import Colaborador
+
+from . import arquivo, checks, expiracao, fluxo, registro, rollups, semeadura
+from .models import SessaoArquivada, SessaoUso, MovimentacaoFerramenta, UsoDiario
+
+
+class FluxoSessaoTests(TestCase):
+    def setUp(self):
+        registro.limpar()
+        self.colaborador = Colaborador.objects.create(nome="Fulano", matricula="1")
+        g1 = Gaveta.objects.create(numero=1)
+        g3 = Gaveta.objects.create(numero=3)
+        self.ferramentas = [
+            Ferramenta.objects.create(nome="Alicate", gaveta=g3, posicao=1),
+            Ferramenta.objects.create(nome="Chave", gaveta=g1, posicao=1),
+            Ferramenta.objects.create(nome="Martelo", gaveta=g1, posicao=2),
+        ]
+        self.sessao = fluxo.abrir_sessao(self.colaborador, None, {})
+
+    def test_iniciar_operacao_aponta_para_primeira_gaveta(self):
+        sessao, gavetas = fluxo.iniciar_operacao(self.sessao.id, "R", self.ferramentas)
+
+        self.assertEqual(gavetas, [1, 3])
+        self.assertEqual(
+            (sessao.etapa, sessao.operacao, sessao.gaveta_atual, sessao.gavetas_pendentes),
+            ("G", "R", 1, [1, 3]),
+        )
+
+    def test_nova_selecao_substitui_pendentes(self):
+        fluxo.iniciar_operacao(self.sessao.id, "R", self.ferramentas)
+        fluxo.iniciar_operacao(self.sessao.id, "R", self.ferramentas[:1])
+
+        self.assertEqual(
+            MovimentacaoFerramenta.objects.filter(sessao=self.sessao).count(), 1
+        )
+
+    def test_confirmacao_concorrente_recusada(self):
+        fluxo.iniciar_operacao(self.sessao.id, "R", self.ferramentas)
+        fluxo.iniciar_confirmacao(self.sessao.id, "R", 1)
+
+        with self.assertRaises(fluxo.TransicaoInvalida) as ctx:
+            fluxo.iniciar_confirmacao(self.sessao.id, "R", 1)
+        self.assertEqual(ctx.exception.status, 409)
+
+        with self.assertRaises(fluxo.TransicaoInvalida):
+            fluxo.iniciar_operacao(self.sessao.id, "R", self.ferramentas)
+
+    def test_concluir_avanca_e_encerra(self):
+        fluxo.iniciar_operacao(self.sessao.id, "D", self.ferramentas)
+
+        _, movs = fluxo.iniciar_confirmacao(self.sessao.id, "D", 1)
+        sessao, proxima = fluxo.concluir_confirmacao(self.sessao.id, movs, "img1.jpg")
+        self.assertEqual((proxima, sessao.etapa, sessao.status), (3, "G", "A"))
+
+        _, movs = fluxo.iniciar_confirmacao(self.sessao.id, "D", 3)
+        sessao, proxima = fluxo.concluir_confirmacao(self.sessao.id, movs, "img3.jpg")
+        self.assertIsNone(proxima)
+        self.assertEqual((sessao.etapa, sessao.status), ("X", "F"))
+        self.assertIsNotNone(sessao.finalizado_em)
+
+        self.assertFalse(
+            MovimentacaoFerramenta.objects.filter(confirmado_visao=False).exists()
+        )
+
+    def test_sessao_encerrada_nao_aceita_operacao(self):
+        SessaoUso.objects.filter(id=self.sessao.id).update(status="C", etapa="X")
+
+        with self.assertRaises(fluxo.TransicaoInvalida) as ctx:
+            fluxo.iniciar_operacao(self.sessao.id, "R", self.ferramentas)
+        self.assertEqual(ctx.exception.status, 400)
+
+    def test_abortar_volta_para_gaveta_aberta(self):
+        fluxo.iniciar_operacao(self.sessao.id, "R", self.ferramentas)
+        fluxo.iniciar_confirmacao(self.sessao.id, "R", 1)
+
+        sessao = fluxo.abortar_confirmacao(self.sessao.id)
+
+        self.assertEqual((sessao.etapa, sessao.gaveta_atual), ("G", 1))
+
+
+@mock.patch("operacoes.eventos.publicar")
+class EventosSessaoTests(TestCase):
+    def setUp(self):
+        registro.limpar()
+        self.colaborador = Colaborador.objects.create(nome="Fulano", matricula="1")
+        self.ferramenta = Ferramenta.objects.create(
+            nome="Chave", gaveta=Gaveta.objects.create(numero=1), posicao=1
+        )
+
+    def test_eventos_so_saem_no_commit(self, publicar):
+        with self.captureOnCommitCallbacks(execute=True):
+            sessao = fluxo.abrir_sessao(self.colaborador, None, {})
+            publicar.assert_not_called()
+
+        publicar.assert_called_once_with("sessao", {
+            "ok": True,
+            "sessao_ativa": True,
+            "sessao_id": sessao.id,
+            "colaborador": "Fulano",
+            "reader_id": "rasp-01",
+        })
+
+    def test_ultima_gaveta_publica_fim_da_sessao(self, publicar):
+        sessao = fluxo.abrir_sessao(self.colaborador, None, {})
+        fluxo.iniciar_operacao(sessao.id, "R", [self.ferramenta])
+        _, movs = fluxo.iniciar_confirmacao(sessao.id, "R", 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            fluxo.concluir_confirmacao(sessao.id, movs, "")
+
+        self.assertEqual(
+            [c.args for c in publicar.call_args_list[-2:]],
+            [
+                ("gaveta", {"sessao_id": sessao.id, "operacao": "R",
+                            "gaveta_numero": 1, "proxima_gaveta": None}),
+                ("sessao", {"ok": True, "sessao_ativa": False}),
+            ],
+        )
+
+
+class RegistroSessoesTests(TestCase):
+    """
+    Telas quentes respondendo do registro em cache, sem ir ao banco.
+    """
+
+    def setUp(self):
+        registro.limpar()
+        caixas.invalidar()
+        self.colaborador = Colaborador.objects.create(nome="Fulano", matricula="1")
+        caixa = Caixa.objects.create(reader_id="rasp-02")
+        gaveta = Gaveta.objects.create(numero=2, caixa=caixa)
+        self.ferramentas = [
+            Ferramenta.objects.create(nome="Chave", gaveta=gaveta, posicao=1),
+            Ferramenta.objects.create(nome="Martelo", gaveta=gaveta, posicao=2),
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sessao = fluxo.abrir_sessao(
+                self.colaborador, None, {"reader_id": "rasp-02"}
+            )
+
+    def test_telas_quentes_sem_query(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            fluxo.iniciar_operacao(self.sessao.id, "R", self.ferramentas)
+
+        with self.assertNumQueries(0):
+            status = self.client.get(reverse("status_frontend")).json()
+            por_leitor = self.client.get(
+                reverse("status_frontend"), {"reader_id": "rasp-02"}
+            ).json()
+            painel = self.client.get(reverse("painel_sem_sessao"))
+            confirmar = self.client.get(reverse("retirar_confirmar", args=[self.sessao.id]))
+            self.client.get(reverse("painel", args=[self.sessao.id]))
+
+        self.assertEqual(status["sessao_id"], self.sessao.id)
+        self.assertEqual(por_leitor["sessao_id"], self.sessao.id)
+        self.assertRedirects(painel, reverse("painel", args=[self.sessao.id]))
+        self.assertEqual(confirmar.context["gaveta_atual"], 2)
+        self.assertEqual(
+            [i["nome"] for i in confirmar.context["grupos"][0]["itens"]],
+            ["Chave", "Martelo"],
+        )
+
+    def test_encerrar_invalida_sessao_ativa(self):
+        fluxo.iniciar_operacao(self.sessao.id, "R", self.ferramentas)
+        _, movs = fluxo.iniciar_confirmacao(self.sessao.id, "R", 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            fluxo.concluir_confirmacao(self.sessao.id, movs, "")
+
+        with self.assertNumQueries(0):
+            status = self.client.get(reverse("status_frontend")).json()
+        self.assertFalse(status["sessao_ativa"])
+
+    def test_cache_frio_vai_ao_banco_uma_vez(self):
+        registro.limpar()
+
+        with self.assertNumQueries(1):   # sem operação: nada pendente a buscar
+            self.assertEqual(registro.sessao_ativa("rasp-02")["itens"], {})
+
+        fluxo.iniciar_operacao(self.sessao.id, "R", self.ferramentas)
+        registro.limpar()
+        with self.assertNumQueries(2):   # sessão + itens pendentes
+            self.assertEqual(registro.sessao_ativa("rasp-02")["id"], self.sessao.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(registro.sessao_ativa("rasp-02")["id"], self.sessao.id)
+        with self.assertNumQueries(1):
+            self.assertIsNone(registro.sessao_ativa("rasp-09"))
+        with self.assertNumQueries(0):
+            self.assertIsNone(registro.sessao_ativa("rasp-09"))
+
+    @override_settings(SESSAO_TTL_S=60)
+    @mock.patch("operacoes.expiracao.publish_run_command")
+    def test_sessao_velha_sai_do_registro_quando_expira(self, _publish):
+        SessaoUso.objects.filter(id=self.sessao.id).update(
+            iniciado_em=self.sessao.iniciado_em - timedelta(minutes=5)
+        )
+        self.assertEqual(registro.sessao_ativa()["id"], self.sessao.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            expiracao.expirar_sessoes()
+
+        with self.assertNumQueries(0):
+            self.assertIsNone(registro.sessao_ativa())
+            self.assertIsNone(registro.sessao_ativa("rasp-02"))
+
+
+@override_settings(SESSAO_TTL_S=60)
+@mock.patch("operacoes.expiracao.publish_run_command")
+class ExpiracaoTests(TestCase):
+    def setUp(self):
+        registro.limpar()
+        colaborador = Colaborador.objects.create(nome="Fulano", matricula="1")
+        g1 = Gaveta.objects.create(numero=1)
+        self.ferramenta = Ferramenta.objects.create(nome="Chave", gaveta=g1, posicao=1)
+
+        self.velhas = [fluxo.abrir_sessao(colaborador, None, {}) for _ in range(3)]
+        fluxo.iniciar_operacao(self.velhas[0].id, "R", [self.ferramenta])
+        SessaoUso.objects.filter(id__in=[s.id for s in self.velhas]).update(
+            iniciado_em=timezone.now() - timedelta(minutes=5)
+        )
+        self.nova = fluxo.abrir_sessao(colaborador, None, {})
+
+    def test_expira_em_lote_e_cancela_pendentes(self, publish):
+        resumo = expiracao.expirar_sessoes()
+
+        self.assertEqual(resumo["sessoes_expiradas"], 3)
+        self.assertEqual(resumo["movimentacoes_canceladas"], 1)
+        self.assertEqual(
+            set(SessaoUso.objects.filter(status="E").values_list("id", flat=True)),
+            {s.id for s in self.velhas},
+        )
+        self.assertEqual(SessaoUso.objects.get(id=self.nova.id).status, "A")
+        self.assertFalse(MovimentacaoFerramenta.objects.exists())
+
+        velha = SessaoUso.objects.get(id=self.velhas[0].id)
+        self.assertEqual((velha.etapa, velha.gaveta_atual), ("X", None))
+        self.assertIsNotNone(velha.finalizado_em)
+
+    def test_fecha_gaveta_aberta(self, publish):
+        resumo = expiracao.expirar_sessoes()
+
+        self.assertEqual(resumo["gavetas_fechadas"], 1)
+        publish.assert_called_once()
+        self.assertEqual(publish.call_args.kwargs["alias"], "fechar_gaveta_1")
+
+    def test_confirmacao_em_andamento_ganha_mais_tempo(self, publish):
+        fluxo.iniciar_confirmacao(self.velhas[0].id, "R", 1)
+        # vencida, mas há menos de dois TTLs
+        SessaoUso.objects.filter(id=self.velhas[0].id).update(
+            iniciado_em=timezone.now() - timedelta(seconds=90)
+        )
+
+        resumo = expiracao.expirar_sessoes()
+
+        self.assertEqual(resumo["sessoes_expiradas"], 2)
+        self.assertEqual(SessaoUso.objects.get(id=self.velhas[0].id).status, "A")
+
+    def test_metricas_acumulam(self, publish):
+        antes = dict(expiracao.metricas)
+
+        expiracao.expirar_sessoes()
+        expiracao.expirar_sessoes()
+
+        self.assertEqual(expiracao.metricas["execucoes"], antes["execucoes"] + 2)
+        self.assertEqual(
+            expiracao.metricas["sessoes_expiradas"], antes["sessoes_expiradas"] + 3
+        )
+
+
+class ArquivoTests(TestCase):
+    def setUp(self):
+        self.colaborador = Colaborador.objects.create(nome="Fulano", matricula="1")
+        g1 = Gaveta.objects.create(numero=1)
+        self.chave = Ferramenta.objects.create(nome="Chave", gaveta=g1, posicao=1)
+        self.martelo = Ferramenta.objects.create(nome="Martelo", gaveta=g1, posicao=2)
+        self.antigo = timezone.now() - timedelta(days=200)
+
+        # retirou e devolveu a chave; retirou o martelo e ainda está com ele
+        self.s_retirada = self._sessao_encerrada([("R", self.chave), ("R", self.martelo)])
+        self.s_devolucao = self._sessao_encerrada([("D", self.chave)])
+
+    def _sessao_encerrada(self, movs):
+        sessao = SessaoUso.objects.create(
+            colaborador=self.colaborador, status="F", etapa="X", finalizado_em=self.antigo
+        )
+        for tipo, ferramenta in movs:
+            MovimentacaoFerramenta.objects.create(
+                sessao=sessao, ferramenta=ferramenta, tipo=tipo,
+                gaveta_numero=1, confirmado_visao=True,
+            )
+        return sessao
+
+    def _posse(self):
+        registro.limpar()
+        sessao = fluxo.abrir_sessao(self.colaborador, None, {})
+        resp = self.client.get(reverse("devolver", args=[sessao.id]))
+        sessao.delete()
+        return [i["nome"] for g in resp.context["grupos"] for i in g["itens"]]
+
+    def test_mantem_sessoes_que_guardam_a_posse(self):
+        self.assertEqual(self._posse(), ["Martelo"])
+
+        resumo = arquivo.arquivar(horizonte_dias=90)
+
+        # a sessão de retirada guarda o último movimento do martelo
+        self.assertEqual((resumo["sessoes"], resumo["movimentacoes"]), (0, 0))
+        self.assertEqual(self._posse(), ["Martelo"])
+
+        # devolveu o martelo: agora as duas sessões antigas podem sair
+        self._sessao_encerrada([("D", self.martelo)])
+        resumo = arquivo.arquivar(horizonte_dias=90)
+
+        self.assertEqual((resumo["sessoes"], resumo["movimentacoes"]), (1, 2))
+        self.assertFalse(SessaoUso.objects.filter(id=self.s_retirada.id).exists())
+        self.assertEqual(self._posse(), [])
+
+    def test_simular_nao_move_nada(self):
+        self._sessao_encerrada([("D", self.martelo)])
+
+        resumo = arquivo.arquivar(horizonte_dias=90, simular=True)
+
+        self.assertEqual(resumo["sessoes"], 1)
+        self.assertFalse(SessaoArquivada.objects.exists())
+
+    def test_leitura_do_arquivo(self):
+        self._sessao_encerrada([("D", self.martelo)])
+        arquivo.arquivar(horizonte_dias=90)
+        url = reverse("arquivo_sessoes")
+
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(User.objects.create_user("adm", is_staff=True))
+        dados = self.client.get(url, {"ferramenta_id": self.martelo.id}).json()
+
+        self.assertEqual([s["id"] for s in dados["sessoes"]], [self.s_retirada.id])
+        self.assertEqual(
+            [m["ferramenta_nome"] for m in dados["sessoes"][0]["movimentacoes"]],
+            ["Chave", "Martelo"],
+        )
+        detalhe = self.client.get(reverse("arquivo_sessao", args=[self.s_retirada.id]))
+        self.assertEqual(detalhe.json()["colaborador"]["nome"], "Fulano")
+
+
+class RollupsTests(TestCase):
+    def setUp(self):
+        self.colaborador = Colaborador.objects.create(nome="Fulano", matricula="1")
+        g1 = Gaveta.objects.create(numero=1)
+        g2 = Gaveta.objects.create(numero=2)
+        self.chave = Ferramenta.objects.create(nome="Chave", gaveta=g1, posicao=1)
+        self.alicate = Ferramenta.objects.create(nome="Alicate", gaveta=g2, posicao=1)
+        self.inicio = timezone.now() - timedelta(days=3)
+
+    def _mov(self, tipo, ferramenta, minutos, confirmado=True, status="F"):
+        sessao = SessaoUso.objects.create(colaborador=self.colaborador, status=status, etapa="X")
+        mov = MovimentacaoFerramenta.objects.create(
+            sessao=sessao, ferramenta=ferramenta, tipo=tipo,
+            gaveta_numero=ferramenta.gaveta.numero, confirmado_visao=confirmado,
+        )
+        MovimentacaoFerramenta.objects.filter(id=mov.id).update(
+            criado_em=self.inicio + timedelta(minutes=minutos)
+        )
+        return mov
+
+    def test_incremental_pareia_retirada_e_devolucao_entre_execucoes(self):
+        self._mov("R", self.chave, 0)
+        self._mov("R", self.alicate, 0)
+        self.assertEqual(rollups.atualizar_rollups()["movimentacoes"], 2)
+
+        self._mov("D", self.chave, 30)
+        resumo = rollups.atualizar_rollups()
+
+        # só a devolução nova foi lida
+        self.assertEqual(resumo["movimentacoes"], 1)
+        uso = UsoDiario.objects.get(ferramenta=self.chave)
+        self.assertEqual((uso.retiradas, uso.devolucoes, uso.devolucoes_pareadas), (1, 1, 1))
+        self.assertEqual((uso.tempo_fora_total_s, uso.fora_ate_1h), (1800, 1))
+
+        # nada novo: não mexe em nada
+        self.assertEqual(rollups.atualizar_rollups()["movimentacoes"], 0)
+        self.assertEqual(UsoDiario.objects.get(ferramenta=self.chave).devolucoes, 1)
+
+    def test_marca_para_antes_de_movimentacao_nao_confirmada(self):
+        pendente = self._mov("R", self.chave, 0, confirmado=False, status="A")
+        self._mov("R", self.alicate, 1)
+
+        self.assertEqual(rollups.atualizar_rollups()["movimentacoes"], 0)
+
+        # confirmada depois: entra na próxima execução, junto com a seguinte
+        MovimentacaoFerramenta.objects.filter(id=pendente.id).update(confirmado_visao=True)
+        self.assertEqual(rollups.atualizar_rollups()["movimentacoes"], 2)
+
+    def test_nao_confirmada_de_sessao_encerrada_nao_trava_a_marca(self):
+        self._mov("R", self.chave, 0, confirmado=False, status="C")
+        seguinte = self._mov("R", self.alicate, 1)
+
+        resumo = rollups.atualizar_rollups()
+
+        self.assertEqual(resumo, {"movimentacoes": 1, "marca": seguinte.id})
+        self.assertFalse(UsoDiario.objects.filter(ferramenta=self.chave).exists())
+        self.assertEqual(rollups.marca_atual(), MovimentacaoFerramenta.objects.latest("id").id)
+
+    def test_relatorio_le_os_rollups(self):
+        self._mov("R", self.chave, 0)
+        self._mov("D", self.chave, 10)
+        self._mov("R", self.chave, 20)
+        self._mov("D", self.chave, 20 + 3 * 60)
+        self._mov("R", self.alicate, 0)
+        rollups.atualizar_rollups()
+
+        url = reverse("relatorio_uso", args=["ferramentas"])
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        staff = User.objects.create_user("equipe", password="x", is_staff=True)
+        self.client.force_login(staff)
+
+        with self.assertNumQueries(4):  # sessão, usuário, rollups, marca
+            dados = self.client.get(url).json()
+
+        por_nome = {l["ferramenta__nome"]: l for l in dados["linhas"]}
+        chave = por_nome["Chave"]
+        self.assertEqual((chave["retiradas"], chave["devolucoes"]), (2, 2))
+        self.assertEqual(chave["tempo_fora"]["medio_s"], (600 + 10800) / 2)
+        self.assertEqual(chave["tempo_fora"]["distribuicao"]["fora_ate_15min"], 1)
+        self.assertEqual(chave["tempo_fora"]["distribuicao"]["fora_ate_4h"], 1)
+        self.assertIsNone(por_nome["Alicate"]["tempo_fora"]["medio_s"])
+
+        gavetas = self.client.get(reverse("relatorio_uso", args=["gavetas"]), {"gaveta": 2}).json()
+        self.assertEqual([l["gaveta_numero"] for l in gavetas["linhas"]], [2])
+        self.assertEqual(
+            self.client.get(reverse("relatorio_uso", args=["turnos"])).status_code, 404
+        )
+
+
+class SemeaduraTests(TestCase):
+    def test_historico_coerente(self):
+        resumo = semeadura.semear(
+            anos=0.1, sessoes_por_dia=10, ferramentas=12, colaboradores=5, semente=1,
+        )
+
+        self.assertEqual(resumo["sessoes"], SessaoUso.objects.count())
+        self.assertEqual(resumo["movimentacoes"], MovimentacaoFerramenta.objects.count())
+        self.assertEqual(Ferramenta.objects.count(), 12)
+        primeira = SessaoUso.objects.order_by("iniciado_em").first()
+        self.assertLess(primeira.iniciado_em, timezone.now() - timedelta(days=30))
+
+        # toda devolução é de uma ferramenta que o mesmo colaborador retirou
+        # antes, e os ids seguem a ordem do tempo (marca dos rollups)
+        movs = MovimentacaoFerramenta.objects.select_related("sessao").order_by("id")
+        com = {}
+        anterior = None
+        for m in movs:
+            if anterior is not None:
+                self.assertGreaterEqual(m.criado_em, anterior)
+            anterior = m.criado_em
+            if m.tipo == "R":
+                self.assertNotIn(m.ferramenta_id, com)
+                com[m.ferramenta_id] = m.sessao.colaborador_id
+            else:
+                self.assertEqual(com.pop(m.ferramenta_id), m.sessao.colaborador_id)
+
+        rollups.atualizar_rollups()
+        self.assertEqual(rollups.marca_atual(), movs.last().id)
+
+
+class ChecksTests(TestCase):
+    LOCMEM = {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+
+    def test_locmem_recusado_fora_do_debug(self):
+        with override_settings(DEBUG=False, TESTING=False, CACHES={"default": self.LOCMEM, "sessoes": self.LOCMEM}):
+            erros = checks.caches_compartilhados(None)
+        self.assertEqual([e.id for e in erros], ["operacoes.E001", "operacoes.E001"])
+
+        with override_settings(DEBUG=True, TESTING=False, CACHES={"default": self.LOCMEM, "sessoes": self.LOCMEM}):
+            self.assertEqual(checks.caches_compartilhados(None), [])
+
+    def test_backend_compartilhado_aceito(self):
+        arquivo_ = {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": "/tmp/x"}
+        with override_settings(DEBUG=False, TESTING=False, CACHES={"default": arquivo_, "sessoes": arquivo_}):
+            self.assertEqual(checks.caches_compartilhados(None), [])
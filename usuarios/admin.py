@@ -1,17 +1,22 @@
 # Register your models here.
 from django.contrib import admin
+
+from api.admin import ImportacaoAdminMixin
+
 from .models import Colaborador, CartaoNFC
 
 
 @admin.register(Colaborador)
-class ColaboradorAdmin(admin.ModelAdmin):
+class ColaboradorAdmin(ImportacaoAdminMixin, admin.ModelAdmin):
+    tipo_importacao = "colaboradores"
     list_display = ("nome", "matricula", "email", "ativo", "criado_em")
     search_fields = ("nome", "matricula", "email")
     list_filter = ("ativo",)
 
 
 @admin.register(CartaoNFC)
-class CartaoNFCAdmin(admin.ModelAdmin):
+class CartaoNFCAdmin(ImportacaoAdminMixin, admin.ModelAdmin):
+    tipo_importacao = "cartoes"
     list_display = ("uid", "colaborador", "ativo", "ultimo_uso_em", "criado_em")
     search_fields = ("uid", "colaborador__nome", "colaborador__matricula")
     list_filter = ("ativo",)
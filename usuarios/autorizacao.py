@@ -0,0 +1,170 @@
+# usuarios/autorizacao.py
+"""
+Autorização de cartões NFC em cache.
+
+Cada toque de cartão consultava CartaoNFC + Colaborador e gravava
+ultimo_uso_em antes mesmo de abrir a sessão. Aqui:
+
+  - autorizar(uid) responde do cache 'default', compartilhado entre os
+    processos (web, worker, bridge MQTT), com uma entrada por UID (um
+    toque lê só o próprio cartão, não a lista inteira); um UID sem cartão
+    ativo também fica guardado, para um cartão desconhecido insistindo no
+    leitor não ir ao banco a cada toque. As chaves levam uma geração que
+    invalidar() troca, chamada pelos signals de CartaoNFC/Colaborador
+    (usuarios/signals.py): um cartão desativado deixa de abrir sessão em
+    todos os processos na hora, e um processo que estava lendo o cartão
+    antigo grava numa geração que ninguém mais lê;
+  - registrar_uso() só anota o horário; uma thread em segundo plano junta
+    os usos (o último de cada cartão) e grava tudo num bulk_update a cada
+    AUTORIZACAO_FLUSH_S segundos.
+"""
+
+import atexit
+import logging
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from .models import CartaoNFC, Colaborador
+
+logger = logging.getLogger(__name__)
+
+Autorizacao = namedtuple(
+    "Autorizacao",
+    ["cartao_id", "uid", "colaborador_id", "nome", "matricula"],
+)
+
+CHAVE_GERACAO = "usuarios:autorizacao:geracao"
+CHAVE_CARTAO = "usuarios:autorizacao:{}:{}"
+
+# guardado no lugar da Autorizacao quando o UID não tem cartão ativo
+_SEM_CARTAO = False
+
+_usos = {}               # cartao_id -> datetime do último toque ainda não gravado
+_usos_lock = threading.Lock()
+_writer = None
+
+
+def _carregar(uid):
+    c = (
+        CartaoNFC.objects
+        .filter(uid=uid, ativo=True)
+        .select_related("colaborador")
+        .first()
+    )
+    if c is None:
+        return _SEM_CARTAO
+    return Autorizacao(c.id, c.uid, c.colaborador_id, c.colaborador.nome, c.colaborador.matricula)
+
+
+def _geracao():
+    geracao = cache.get(CHAVE_GERACAO)
+    if geracao is None:
+        # cache frio: o primeiro processo a chegar define a geração
+        cache.add(CHAVE_GERACAO, uuid.uuid4().hex, None)
+        geracao = cache.get(CHAVE_GERACAO)
+    return geracao
+
+
+def autorizar(uid):
+    """
+    Autorizacao do cartão ativo com esse UID, ou None.
+    """
+    # a geração é lida antes do banco: se invalidar() rodar no meio, o
+    # cartão lido aqui fica na geração velha
+    chave = CHAVE_CARTAO.format(_geracao(), uid)
+    aut = cache.get(chave)
+    if aut is None:
+        aut = _carregar(uid)
+        cache.set(chave, aut, getattr(settings, "AUTORIZACAO_CACHE_TTL_S", 300))
+    return aut or None
+
+
+def invalidar():
+    """
+    Troca a geração; o próximo toque, em qualquer processo, recarrega do banco.
+    """
+    cache.set(CHAVE_GERACAO, uuid.uuid4().hex, None)
+
+
+def instancias(autorizacao):
+    """
+    (colaborador, cartao) montados a partir do cache, sem consulta, para
+    quem só precisa deles como chave estrangeira/dados de exibição.
+    """
+    colaborador = Colaborador(
+        id=autorizacao.colaborador_id,
+        nome=autorizacao.nome,
+        matricula=autorizacao.matricula,
+    )
+    cartao = CartaoNFC(
+        id=autorizacao.cartao_id,
+        uid=autorizacao.uid,
+        colaborador=colaborador,
+    )
+    return colaborador, cartao
+
+
+def registrar_uso(cartao_id, quando):
+    """
+    Anota o uso do cartão para a próxima gravação em lote.
+    """
+    with _usos_lock:
+        anterior = _usos.get(cartao_id)
+        if anterior is None or quando > anterior:
+            _usos[cartao_id] = quando
+    _garantir_writer()
+
+
+def descarregar():
+    """
+    Grava agora os usos pendentes (um bulk_update). Retorna quantos
+    cartões foram atualizados.
+    """
+    global _usos
+    with _usos_lock:
+        pendentes, _usos = _usos, {}
+
+    if not pendentes:
+        return 0
+
+    try:
+        CartaoNFC.objects.bulk_update(
+            [CartaoNFC(id=cid, ultimo_uso_em=quando) for cid, quando in pendentes.items()],
+            ["ultimo_uso_em"],
+        )
+    except Exception:
+        logger.exception("Falha ao gravar ultimo_uso_em de %s cartões; tentando de novo depois.", len(pendentes))
+        with _usos_lock:
+            for cid, quando in pendentes.items():
+                if cid not in _usos or quando > _usos[cid]:
+                    _usos[cid] = quando
+        return 0
+    return len(pendentes)
+
+
+def _loop_writer(intervalo):
+    while True:
+        time.sleep(intervalo)
+        close_old_connections()
+        descarregar()
+
+
+def _garantir_writer():
+    global _writer
+    if _writer is not None:
+        return
+    with _usos_lock:
+        if _writer is not None:
+            return
+        intervalo = getattr(settings, "AUTORIZACAO_FLUSH_S", 5)
+        _writer = threading.Thread(
+            target=_loop_writer, args=(intervalo,), daemon=True, name="ultimo-uso-writer"
+        )
+        _writer.start()
+        atexit.register(descarregar)
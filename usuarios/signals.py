@@ -0,0 +1,14 @@
+# usuarios/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import autorizacao
+from .models import CartaoNFC, Colaborador
+
+
+@receiver(post_save, sender=CartaoNFC)
+@receiver(post_delete, sender=CartaoNFC)
+@receiver(post_save, sender=Colaborador)
+@receiver(post_delete, sender=Colaborador)
+def invalidar_autorizacao(sender, **kwargs):
+    autorizacao.invalidar()
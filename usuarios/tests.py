@@ -1,3 +1,105 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from inventario import caixas
+from inventario.models import caixa_padrao
+from operacoes import registro
+
+from . import autorizacao
+from .models import Colaborador, CartaoNFC
+
+
+@mock.patch("usuarios.autorizacao._garantir_writer")
+class AutorizacaoTests(TestCase):
+    def setUp(self):
+        registro.limpar()
+        autorizacao.invalidar()
+        autorizacao.descarregar()
+        caixas.invalidar()
+        self.colaborador = Colaborador.objects.create(nome="Fulano", matricula="1")
+        self.cartao = CartaoNFC.objects.create(uid="AABB", colaborador=self.colaborador)
+
+    def _tap(self, uid="AABB"):
+        return self.client.post(
+            reverse("nfc_tap"),
+            data={"uid": uid, "reader_id": "rasp-01"},
+            content_type="application/json",
+        )
+
+    def test_tap_autoriza_sem_consultar_cartao(self, _writer):
+        caixa_padrao()
+        autorizacao.autorizar("AABB")   # aquece os caches
+        autorizacao.autorizar("XXXX")
+        caixas.resolver()
+
+        with self.assertNumQueries(1):   # só o INSERT da sessão
+            resp = self._tap()
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.json()["colaborador"]["nome"], "Fulano")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self._tap("XXXX").status_code, 403)
+
+    def test_alteracao_no_cartao_ou_colaborador_invalida(self, _writer):
+        self.assertIsNotNone(autorizacao.autorizar("AABB"))
+
+        self.cartao.ativo = False
+        self.cartao.save()
+        self.assertIsNone(autorizacao.autorizar("AABB"))
+
+        self.cartao.ativo = True
+        self.cartao.save()
+        self.colaborador.nome = "Fulano de Tal"
+        self.colaborador.save()
+        self.assertEqual(autorizacao.autorizar("AABB").nome, "Fulano de Tal")
+
+    def test_invalidacao_vale_para_os_outros_processos(self, _writer):
+        self.assertIsNotNone(autorizacao.autorizar("AABB"))
+
+        # outro processo desativa o cartão: só o cache compartilhado muda aqui
+        CartaoNFC.objects.filter(id=self.cartao.id).update(ativo=False)
+        cache.set(autorizacao.CHAVE_GERACAO, "outra")
+
+        with self.assertNumQueries(1):
+            self.assertIsNone(autorizacao.autorizar("AABB"))
+
+    def test_cache_por_uid(self, _writer):
+        CartaoNFC.objects.create(uid="CCDD", colaborador=self.colaborador)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(autorizacao.autorizar("AABB").cartao_id, self.cartao.id)
+        with self.assertNumQueries(1):   # outro cartão: outra entrada
+            self.assertEqual(autorizacao.autorizar("CCDD").uid, "CCDD")
+        with self.assertNumQueries(1):
+            self.assertIsNone(autorizacao.autorizar("XXXX"))
+
+        with self.assertNumQueries(0):   # desconhecido também fica no cache
+            self.assertIsNotNone(autorizacao.autorizar("AABB"))
+            self.assertIsNotNone(autorizacao.autorizar("CCDD"))
+            self.assertIsNone(autorizacao.autorizar("XXXX"))
+
+    def test_ultimo_uso_gravado_em_lote(self, writer):
+        outro = CartaoNFC.objects.create(uid="CCDD", colaborador=self.colaborador)
+        agora = timezone.now()
+
+        autorizacao.registrar_uso(self.cartao.id, agora - timedelta(seconds=5))
+        autorizacao.registrar_uso(self.cartao.id, agora)
+        autorizacao.registrar_uso(self.cartao.id, agora - timedelta(seconds=9))
+        autorizacao.registrar_uso(outro.id, agora)
+        writer.assert_called()
+
+        self.cartao.refresh_from_db()
+        self.assertIsNone(self.cartao.ultimo_uso_em)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(autorizacao.descarregar(), 2)
 
-# Create your tests here.
+        self.cartao.refresh_from_db()
+        self.assertEqual(self.cartao.ultimo_uso_em, agora)
+        self.assertEqual(autorizacao.descarregar(), 0)
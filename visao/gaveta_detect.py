@@ -19,6 +19,35 @@ HIST_CORR_EMPTY  = 0.990
 def log(m): 
     print(f"[LOG] {m}", flush=True)
 
+def gravar_span(inicio_ns, status, **atributos):
+    """
+    Quando chamado pelo Django com TRACEPARENT (caixa/rastreio.py), grava o
+    próprio span no mesmo JSONL (RASTREIO_JSONL) como filho do span da visão.
+    """
+    partes = os.environ.get("TRACEPARENT", "").split("-")
+    caminho = os.environ.get("RASTREIO_JSONL", "")
+    if len(partes) != 4 or not caminho:
+        return
+    fim_ns = time.time_ns()
+    span = {
+        "trace_id": partes[1],
+        "span_id": os.urandom(8).hex(),
+        "parent_id": partes[2],
+        "nome": "visao.gaveta_detect",
+        "inicio_ns": inicio_ns,
+        "fim_ns": fim_ns,
+        "duracao_ms": round((fim_ns - inicio_ns) / 1e6, 3),
+        "status": status,
+        "atributos": atributos,
+        "servico": "gaveta_detect",
+        "pid": os.getpid(),
+    }
+    try:
+        with open(caminho, "a", encoding="utf-8") as f:
+            f.write(json.dumps(span, ensure_ascii=False) + "\n")
+    except OSError as e:
+        log(f"[WARN] Falha ao gravar span: {e}")
+
 def clamp_roi(roi, W, H):
     x, y, w, h = roi
     x = max(0, min(x, W-1))
@@ -127,6 +156,7 @@ def main():
     # Envio para API
     ap.add_argument("--post", help="URL da API Flask para registrar o evento (POST JSON)")
     args = ap.parse_args()
+    inicio_ns = time.time_ns()
 
     try:
         for p in [args.ref, args.rois, args.image]:
@@ -175,6 +205,7 @@ def main():
             json.dump(result, f, ensure_ascii=False, indent=2)
         log(f"STATUS FINAL JSON: {json_out}")
         print(json.dumps(result, ensure_ascii=False))
+        gravar_span(inicio_ns, "ok", gaveta_id=args.gaveta_id or "", retiradas=len(retiradas))
 
         # POST opcional para API
         if args.post:
@@ -189,6 +220,7 @@ def main():
     except Exception as e:
         print("[ERRO]", e)
         traceback.print_exc()
+        gravar_span(inicio_ns, "erro", erro=f"{type(e).__name__}: {e}")
         sys.exit(1)
 
 if __name__ == "__main__":
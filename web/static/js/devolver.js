@@ -9,10 +9,14 @@ document.addEventListener("DOMContentLoaded", () => {
   // Conjunto com os IDs selecionados
   const selecionadas = new Set();
 
+  // a chave vale enquanto a seleção não mudar
+  let idempotencyKey = null;
+
   // Toggle de seleção visual + lógica
   function toggleCard(card) {
     const id = card.getAttribute("data-id");
     if (!id) return;
+    idempotencyKey = null;
 
     if (selecionadas.has(id)) {
       selecionadas.delete(id);
@@ -50,11 +54,14 @@ document.addEventListener("DOMContentLoaded", () => {
         return;
       }
 
+      idempotencyKey = idempotencyKey || novaChaveIdempotencia();
+
       try {
         const resp = await fetch(`/devolver/selecionar?sessao_id=${sessaoId}`, {
           method: "POST",
           headers: {
             "Content-Type": "application/json",
+            "Idempotency-Key": idempotencyKey,
           },
           body: JSON.stringify({ ferramentas_ids: ids }),
         });
@@ -4,6 +4,10 @@ document.addEventListener("DOMContentLoaded", () => {
   const form = document.getElementById("formConfirmar");
   if (!form) return;
 
+  // uma chave por tentativa de confirmação (sessão + gaveta); trocada
+  // depois de uma falha, senão o reenvio recebe a falha guardada
+  let idempotencyKey = novaChaveIdempotencia();
+
   form.addEventListener("submit", async (e) => {
     e.preventDefault();
 
@@ -24,19 +28,27 @@ document.addEventListener("DOMContentLoaded", () => {
           headers: {
             "Accept": "application/json",
             "Content-Type": "application/json",
+            "Idempotency-Key": idempotencyKey,
           },
           body: JSON.stringify({}),
         }
       );
 
-      if (!resp.ok) {
-        const errData = await resp.json().catch(() => ({}));
-        console.error("Erro ao confirmar devolução:", resp.status, errData);
+      let status = resp.status;
+      let data = await resp.json().catch(() => ({}));
+
+      if (status === 202 && data.status_url) {
+        console.log("Confirmação de devolução em fila, job", data.job_id);
+        ({ status, data } = await aguardarJob(data.status_url));
+      }
+
+      if (status < 200 || status >= 300) {
+        idempotencyKey = novaChaveIdempotencia();
+        console.error("Erro ao confirmar devolução:", status, data);
         alert("Falha ao confirmar devolução. Veja o console para detalhes.");
         return;
       }
 
-      const data = await resp.json();
       console.log("Resposta confirmar devolução:", data);
 
       if (data.redirect_url) {
@@ -1,7 +1,11 @@
 // web/static/js/home.js
 
 document.addEventListener("DOMContentLoaded", () => {
-  const STATUS_URL = "/api/status-frontend/";
+  // Quiosque de uma caixa específica: /?reader_id=rasp-02
+  const readerId = document.body.dataset.readerId;
+  const filtro = readerId ? `?reader_id=${encodeURIComponent(readerId)}` : "";
+  const STATUS_URL = "/api/status-frontend/" + filtro;
+  const EVENTOS_URL = "/api/eventos/" + filtro;
 
   async function checkSession() {
     try {
@@ -19,19 +23,50 @@ document.addEventListener("DOMContentLoaded", () => {
 
       const data = await resp.json();
       console.log("Status sessão:", data);
-
-      // Se houver sessão ativa, manda direto pro painel
-      if (data.ok && data.sessao_ativa && data.sessao_id) {
-        window.location.href = `/painel/${data.sessao_id}/`;
-      }
+      tratarStatus(data);
     } catch (err) {
       console.error("Erro ao consultar status da sessão:", err);
     }
   }
 
-  // chama logo que carrega
-  checkSession();
+  function tratarStatus(data) {
+    // Se houver sessão ativa, manda direto pro painel
+    if (data.ok && data.sessao_ativa && data.sessao_id) {
+      window.location.href = `/painel/${data.sessao_id}/`;
+    }
+  }
+
+  // Fallback: polling a cada 1.5s (servidor sem ASGI ou sem EventSource)
+  let pollingId = null;
+  function iniciarPolling() {
+    if (pollingId !== null) return;
+    console.warn("Canal de eventos indisponível; usando polling.");
+    checkSession();
+    pollingId = setInterval(checkSession, 1500);
+  }
 
-  // e repete a cada 1.5s
-  setInterval(checkSession, 1500);
+  if (!window.EventSource) {
+    iniciarPolling();
+    return;
+  }
+
+  // Canal SSE: o servidor avisa assim que o cartão é passado
+  const fonte = new EventSource(EVENTOS_URL);
+  let conectou = false;
+
+  fonte.addEventListener("sessao", (ev) => {
+    conectou = true;
+    const data = JSON.parse(ev.data);
+    console.log("Status sessão:", data);
+    tratarStatus(data);
+  });
+
+  fonte.onerror = () => {
+    // Antes do primeiro evento: o servidor não tem SSE (ex.: 503 no WSGI).
+    // Depois: o EventSource reconecta sozinho e recebe o estado de novo.
+    if (!conectou) {
+      fonte.close();
+      iniciarPolling();
+    }
+  };
 });
@@ -0,0 +1,12 @@
+// web/static/js/idempotencia.js
+//
+// Idempotency-Key dos POST da API (api/idempotencia.py): reenvios da mesma
+// ação usam a mesma chave e recebem a resposta já processada pelo servidor
+// (sem nova captura/visão/MQTT). Incluído antes do JS de cada tela.
+
+function novaChaveIdempotencia() {
+  if (window.crypto && typeof window.crypto.randomUUID === "function") {
+    return window.crypto.randomUUID();
+  }
+  return `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+}
@@ -0,0 +1,20 @@
+// web/static/js/jobs.js
+//
+// Confirmação em fila (HTTP 202, api/jobs.py): consulta o job até terminar
+// e devolve o mesmo corpo que a confirmação síncrona devolveria.
+
+async function aguardarJob(statusUrl) {
+  while (true) {
+    await new Promise((r) => setTimeout(r, 1000));
+    try {
+      const resp = await fetch(statusUrl, { headers: { "Accept": "application/json" } });
+      if (!resp.ok) continue;
+      const job = await resp.json();
+      if (job.status === "C" || job.status === "F") {
+        return { status: job.resposta_status, data: job.resultado };
+      }
+    } catch (err) {
+      console.warn("Falha ao consultar job de confirmação:", err);
+    }
+  }
+}
@@ -13,9 +13,13 @@ document.addEventListener("DOMContentLoaded", function () {
     }
   }
 
+  // a chave vale enquanto a seleção não mudar
+  let idempotencyKey = null;
+
   // Toggle seleção dos cards
   cards.forEach((card) => {
     card.addEventListener("click", () => {
+      idempotencyKey = null;
       const pressed = card.getAttribute("aria-pressed") === "true";
       card.setAttribute("aria-pressed", (!pressed).toString());
       card.classList.toggle("tool-card--selected", !pressed);
@@ -45,6 +49,7 @@ document.addEventListener("DOMContentLoaded", function () {
       }
 
       const ids = selecionadas.map((card) => parseInt(card.dataset.id, 10));
+      idempotencyKey = idempotencyKey || novaChaveIdempotencia();
 
       try {
         const resp = await fetch(`/api/sessoes/${sessaoId}/retiradas/`, {
@@ -52,6 +57,7 @@ document.addEventListener("DOMContentLoaded", function () {
           headers: {
             "Content-Type": "application/json",
             "X-CSRFToken": getCookie("csrftoken"),
+            "Idempotency-Key": idempotencyKey,
           },
           body: JSON.stringify({
             ferramentas_ids: ids,
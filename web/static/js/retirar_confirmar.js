@@ -20,6 +20,10 @@ document.addEventListener("DOMContentLoaded", function () {
     return;
   }
 
+  // uma chave por tentativa de confirmação (sessão + gaveta atual);
+  // trocada depois de uma falha, senão o reenvio recebe a falha guardada
+  let idempotencyKey = novaChaveIdempotencia();
+
   function getCookie(name) {
     const value = `; ${document.cookie}`;
     const parts = value.split(`; ${name}=`);
@@ -40,6 +44,7 @@ document.addEventListener("DOMContentLoaded", function () {
         method: "POST",
         headers: {
           "X-CSRFToken": getCookie("csrftoken") || "",
+          "Idempotency-Key": idempotencyKey,
         },
       });
 
@@ -54,6 +59,15 @@ document.addEventListener("DOMContentLoaded", function () {
           e
         );
       }
+
+      let status = resp.status;
+      if (status === 202 && data && data.status_url) {
+        console.log("[retirar_confirmar.js] Confirmação em fila, job", data.job_id);
+        ({ status, data } = await aguardarJob(data.status_url));
+      }
+      if (status < 200 || status >= 300) {
+        idempotencyKey = novaChaveIdempotencia();
+      }
     } catch (err) {
       console.error(
         "[retirar_confirmar.js] Falha de comunicação ao confirmar retirada:",
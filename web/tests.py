@@ -1,3 +1,57 @@
+import json
+from unittest import mock
+
 from django.test import TestCase
+from django.urls import reverse
+
+from api.tests import OrcamentoConsultasMixin, preparar_operacao
+
+
+class OrcamentoConsultasWebTests(OrcamentoConsultasMixin, TestCase):
+    """
+    Teto de consultas por tela de web/views.py com 1, 10 e 100
+    ferramentas (api.tests.cenario_consultas).
+    """
+
+    def setUp(self):
+        patcher = mock.patch("web.views.publish_run_command", return_value={"ok": True})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _get(self, nome, *args):
+        return lambda d: self.client.get(reverse(nome, args=[a(d) if callable(a) else a for a in args]))
+
+    def test_home(self):
+        self.assertOrcamento(0, self._get("home"))
+
+    def test_painel_sem_sessao(self):
+        self.assertOrcamento(2, self._get("painel_sem_sessao"))
+
+    def test_painel(self):
+        self.assertOrcamento(2, self._get("painel", lambda d: d["sessao"].id))
+
+    def test_retirar(self):
+        self.assertOrcamento(5, self._get("retirar", lambda d: d["sessao"].id))
+
+    def test_retirar_confirmar(self):
+        self.assertOrcamento(
+            2, self._get("retirar_confirmar", lambda d: d["sessao"].id), preparar=preparar_operacao("R")
+        )
+
+    def test_retirar_confirmar_legacy(self):
+        self.assertOrcamento(2, self._get("retirar_confirmar_legacy", lambda d: d["sessao"].id))
+
+    def test_devolver(self):
+        self.assertOrcamento(5, self._get("devolver", lambda d: d["sessao"].id))
+
+    def test_devolver_selecionar(self):
+        self.assertOrcamento(8, lambda d: self.client.post(
+            reverse("devolver_selecionar") + f"?sessao_id={d['sessao'].id}",
+            data=json.dumps({"ferramentas_ids": [f.id for f in d["com"]]}),
+            content_type="application/json",
+        ))
 
-# Create your tests here.
+    def test_devolver_confirmar(self):
+        self.assertOrcamento(4, self._get(
+            "devolver_confirmar", lambda d: d["sessao"].id, lambda d: d["gaveta"],
+        ), preparar=preparar_operacao("D"))
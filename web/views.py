@@ -1,45 +1,58 @@
 import json
 
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.http import Http404, HttpRequest, HttpResponse, JsonResponse
 from django.urls import reverse
-from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 
+from inventario import caixas, catalogo
 from inventario.models import Ferramenta, Gaveta
 from operacoes.models import SessaoUso, MovimentacaoFerramenta
-from django.db import models
+from operacoes import fluxo, registro
 from django.db.models import Exists, OuterRef, Subquery
 
 from hardware.mqtt_client import publish_run_command
+from api.idempotencia import idempotente
 from django.views.decorators.http import require_POST
 from django.contrib import messages
 
 
+def _caixa_id(sessao):
+    """
+    Caixa da sessão (retrato do registro ou SessaoUso). Sessões anteriores
+    ao cadastro de caixas ficam com a caixa do leitor delas.
+    """
+    if isinstance(sessao, dict):
+        caixa_id, reader_id = sessao.get("caixa_id"), sessao["reader_id"]
+    else:
+        caixa_id, reader_id = sessao.caixa_id, registro.reader_da_sessao(sessao)
+    if caixa_id is None:
+        caixa = caixas.resolver(reader_id)
+        caixa_id = caixa.id if caixa else None
+    return caixa_id
+
+
 def home(request: HttpRequest) -> HttpResponse:
     """
     Tela inicial (home.html).
     Fica perguntando /api/status-frontend pra saber se existe sessão ativa.
+    Com várias caixas, o quiosque de cada uma abre /?reader_id=<leitor> e
+    só segue as sessões daquele leitor.
     """
-    return render(request, "web/home.html")
+    return render(request, "web/home.html", {"reader_id": request.GET.get("reader_id", "")})
 
 
 def painel_sem_sessao(request: HttpRequest) -> HttpResponse:
     """
-    /painel/ sem ID:
+    /painel/ sem ID (?reader_id= restringe ao leitor do quiosque):
       - se existir alguma sessão "A" em andamento, redireciona para /painel/<id>/
       - se não existir, volta pra home.
     Evita 404 e redireções estranhas.
     """
-    sessao = (
-        SessaoUso.objects
-        .filter(status="A")
-        .order_by("-iniciado_em")
-        .first()
-    )
+    sessao = registro.sessao_ativa(request.GET.get("reader_id"))
 
     if sessao:
-        return redirect("painel", sessao_id=sessao.id)
+        return redirect("painel", sessao_id=sessao["id"])
 
     return redirect("home")
 
@@ -51,26 +64,16 @@ def painel(request: HttpRequest, sessao_id: int) -> HttpResponse:
       - nome do colaborador
       - botão RETIRAR / DEVOLVER
     """
-    sessao = get_object_or_404(
-        SessaoUso.objects.select_related("colaborador"),
-        id=sessao_id,
-    )
+    sessao = registro.sessao(sessao_id)
+    if sessao is None:
+        raise Http404("Sessão não encontrada.")
 
-    proxima_gaveta = (
-        MovimentacaoFerramenta.objects
-        .filter(
-            sessao=sessao,
-            tipo="R",               # retirada
-            confirmado_visao=False  # ainda não confirmada pela visão
-        )
-        .order_by("gaveta_numero")
-        .values_list("gaveta_numero", flat=True)
-        .first()
-    )
+    # gaveta com retirada pendente: vem do ponteiro guardado na sessão
+    proxima_gaveta = sessao["gaveta_atual"] if sessao["operacao"] == "R" else None
 
     context = {
-        "sessao_id": sessao.id,
-        "funcionario": sessao.colaborador.nome,
+        "sessao_id": sessao["id"],
+        "funcionario": sessao["colaborador"],
         "gaveta_atual": proxima_gaveta,
     }
 
@@ -86,7 +89,9 @@ def retirar(request: HttpRequest, sessao_id: int) -> HttpResponse:
       NÃO for uma retirada (ou seja, está na gaveta).
       last_tipo in [None, "D"]
     """
-    sessao = get_object_or_404(SessaoUso, id=sessao_id)
+    sessao = registro.sessao(sessao_id)
+    if sessao is None:
+        raise Http404("Sessão não encontrada.")
 
     # Subquery: último movimento confirmado (R ou D) dessa ferramenta
     last_mov_qs = (
@@ -98,28 +103,30 @@ def retirar(request: HttpRequest, sessao_id: int) -> HttpResponse:
         .order_by("-criado_em")
     )
 
-    qs = (
+    caixa_id = _caixa_id(sessao)
+
+    # ferramentas fora da caixa (último movimento foi retirada)
+    fora = set(
         Ferramenta.objects
-        .select_related("gaveta")
-        .filter(ativa=True)
-        .annotate(
-            last_tipo=Subquery(last_mov_qs.values("tipo")[:1]),
-        )
-        .filter(
-            models.Q(last_tipo__isnull=True) | models.Q(last_tipo="D")
-        )
-        .order_by("gaveta__numero", "posicao", "nome")
+        .filter(ativa=True, gaveta__caixa_id=caixa_id)
+        .annotate(last_tipo=Subquery(last_mov_qs.values("tipo")[:1]))
+        .filter(last_tipo="R")
+        .values_list("id", flat=True)
     )
 
+    # catálogo (gavetas + ferramentas) vem do cache; aqui só tiramos as
+    # que estão fora da caixa
     gavetas_dict = {}
-    for f in qs:
-        nome_gaveta = f.gaveta.nome if f.gaveta else "Sem gaveta"
-        gavetas_dict.setdefault(nome_gaveta, []).append(f)
+    for gaveta in catalogo.obter(caixa_id)["gavetas"]:
+        itens = [f for f in gaveta["ferramentas"] if f["id"] not in fora]
+        if itens:
+            nome_gaveta = gaveta["nome"] or f"Gaveta {gaveta['numero']}"
+            gavetas_dict.setdefault(nome_gaveta, []).extend(itens)
 
     gavetas = sorted(gavetas_dict.items(), key=lambda item: item[0])
 
     context = {
-        "sessao_id": sessao.id,
+        "sessao_id": sessao["id"],
         "gavetas": gavetas,
     }
     return render(request, "web/retirar.html", context)
@@ -147,11 +154,11 @@ def devolver(request: HttpRequest, sessao_id: int) -> HttpResponse:
         .order_by("-criado_em")
     )
 
-    # ferramentas cujo último movimento foi "R" (retirada)
+    # ferramentas desta caixa cujo último movimento foi "R" (retirada)
     ferramentas = (
         Ferramenta.objects
         .select_related("gaveta")
-        .filter(ativa=True)
+        .filter(ativa=True, gaveta__caixa_id=_caixa_id(sessao))
         .annotate(last_tipo=Subquery(last_mov_qs.values("tipo")[:1]))
         .filter(last_tipo="R")
         .order_by("gaveta__numero", "nome")
@@ -185,6 +192,7 @@ def devolver(request: HttpRequest, sessao_id: int) -> HttpResponse:
 
 @csrf_exempt
 @require_POST
+@idempotente
 def devolver_selecionar(request):
     """
     Recebe via POST (JSON) a lista de ferramentas selecionadas para devolução.
@@ -211,11 +219,11 @@ def devolver_selecionar(request):
             status=400,
         )
 
-    # Busca as ferramentas selecionadas (junto com a gaveta)
+    # Busca as ferramentas selecionadas (junto com a gaveta), só da caixa da sessão
     ferramentas = (
         Ferramenta.objects
         .select_related("gaveta")
-        .filter(id__in=ids, ativa=True)
+        .filter(id__in=ids, ativa=True, gaveta__caixa_id=_caixa_id(sessao))
     )
 
     # Agrupa por número da gaveta
@@ -233,23 +241,16 @@ def devolver_selecionar(request):
             status=400,
         )
 
-    # Cria as movimentações de devolução e manda abrir as gavetas
-    for numero, lista in por_gaveta.items():
-        for f in lista:
-            MovimentacaoFerramenta.objects.create(
-                sessao=sessao,
-                ferramenta=f,
-                tipo="D",
-                gaveta_numero=numero,
-                confirmado_visao=False,
-            )
-
-        # Comando para abrir a gaveta via MQTT
-        # (mesma função que você já está usando no fluxo de retirada)
-        publish_run_command("abrir_gaveta", {"gaveta": numero})
+    # Cria as movimentações de devolução (em lote) pelo fluxo da sessão
+    try:
+        sessao, gavetas = fluxo.iniciar_operacao(
+            sessao.id, "D", [f for lista in por_gaveta.values() for f in lista]
+        )
+    except fluxo.TransicaoInvalida as e:
+        return JsonResponse({"error": str(e)}, status=e.status)
 
     # Define qual gaveta vai aparecer primeiro na tela de confirmação
-    proxima_gaveta = sorted(por_gaveta.keys())[0]
+    proxima_gaveta = sessao.gaveta_atual
 
     next_url = reverse(
         "devolver_confirmar",
@@ -276,8 +277,8 @@ def devolver_confirmar(request, sessao_id, gaveta_numero):
     if not movs:
         return redirect("painel", sessao_id=sessao.id)
 
-    # 🔹 AQUI: manda ABRIR a gaveta para devolução
-    device_alias = getattr(settings, "READER_ID", "rasp-01")
+    # 🔹 AQUI: manda ABRIR a gaveta para devolução, no leitor da caixa da sessão
+    device_alias = registro.reader_da_sessao(sessao)
     publish_run_command(device_alias, f"abrir_gaveta_{int(gaveta_numero)}")
 
     grupo = {
@@ -304,49 +305,28 @@ def retirar_confirmar(request: HttpRequest, sessao_id: int) -> HttpResponse:
     Tela que mostra as ferramentas selecionadas e permite confirmar
     a retirada da gaveta atual (a próxima gaveta com movimentação pendente).
     """
-    sessao = get_object_or_404(
-        SessaoUso.objects.select_related("colaborador"),
-        id=sessao_id,
-    )
+    sessao = registro.sessao(sessao_id)
+    if sessao is None:
+        raise Http404("Sessão não encontrada.")
 
-    # próxima gaveta com retirada pendente
-    proxima_gaveta = (
-        MovimentacaoFerramenta.objects
-        .filter(
-            sessao=sessao,
-            tipo="R",
-            confirmado_visao=False,
-        )
-        .order_by("gaveta_numero")
-        .values_list("gaveta_numero", flat=True)
-        .first()
-    )
+    # próxima gaveta com retirada pendente (ponteiro guardado na sessão)
+    proxima_gaveta = sessao["gaveta_atual"] if sessao["operacao"] == "R" else None
 
     # se não tiver mais nada pra confirmar, volta pro painel
     if proxima_gaveta is None:
-        return redirect("painel", sessao_id=sessao.id)
-
-    movs = (
-        MovimentacaoFerramenta.objects
-        .filter(
-            sessao=sessao,
-            tipo="R",
-            confirmado_visao=False,
-            gaveta_numero=proxima_gaveta,
-        )
-        .select_related("ferramenta")
-    )
+        return redirect("painel", sessao_id=sessao["id"])
 
+    # ferramentas pendentes da gaveta: também vêm do registro
     grupos = [{
         "gaveta": f"Gaveta {proxima_gaveta}",
         "itens": [
-            {"nome": m.ferramenta.nome}
-            for m in movs
+            {"nome": nome}
+            for nome in sessao["itens"].get(proxima_gaveta, [])
         ],
     }]
 
     context = {
-        "sessao_id": sessao.id,
+        "sessao_id": sessao["id"],
         "gaveta_atual": proxima_gaveta,
         "grupos": grupos,
     }